@@ -9,20 +9,36 @@ API для работы с графиками от MoonBot
 и начинает/прекращает слать бинарные данные графиков.
 """
 from fastapi import Depends, Query, HTTPException
-from sqlalchemy.orm import Session
-from typing import List, Optional, Any
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session, load_only
+from typing import Dict, List, Optional, Any, Tuple
+from datetime import datetime, timezone
+import asyncio
 import json
 import math
+import sys
 
 from models import models
 from models.database import get_db
 from main import app
 from api.api_auth import get_current_user
 from services import udp
+from services.chart_parser import (
+    CompactFormatError, ChartLevelsCache, ColumnarChartData,
+    decode_chart, chart_to_dict, chart_from_dict, chart_points,
+)
+from services.chart_parser.timeconv import UNIX_EPOCH
+from utils.config_loader import get_config_value
 from utils.datetime_utils import format_iso
 from utils.logging import log
 
 
+# Уровни детализации графиков (запросы с max_points / start / end)
+_chart_levels = ChartLevelsCache(
+    max_charts=get_config_value('high_load', 'udp.charts.lod.cache_charts', default=32)
+)
+
+
 def sanitize_float_values(obj: Any) -> Any:
     """
     Рекурсивно очищает объект от невалидных float значений (inf, -inf, nan),
@@ -48,6 +64,110 @@ def sanitize_float_values(obj: Any) -> Any:
     return obj
 
 
+def _load_columnar_chart(chart: models.MoonBotChart) -> Optional[ColumnarChartData]:
+    """График записи в колоночном формате (компактный формат или старый JSON)"""
+    try:
+        if chart.chart_blob:
+            return decode_chart(chart.chart_blob)
+        if chart.chart_data:
+            return chart_from_dict(json.loads(chart.chart_data))
+    except (CompactFormatError, ValueError, TypeError, AttributeError) as e:
+        log(f"[API] Chart {chart.id} decode error: {e}", level="ERROR")
+    return None
+
+
+# Колонки списков графиков: данные графика (chart_blob / chart_data / raw_data) не читаются
+_CHART_LIST_COLUMNS = (
+    models.MoonBotChart.id,
+    models.MoonBotChart.server_id,
+    models.MoonBotChart.order_db_id,
+    models.MoonBotChart.market_name,
+    models.MoonBotChart.market_currency,
+    models.MoonBotChart.pump_channel,
+    models.MoonBotChart.start_time,
+    models.MoonBotChart.end_time,
+    models.MoonBotChart.points_count,
+    models.MoonBotChart.min_price,
+    models.MoonBotChart.max_price,
+    models.MoonBotChart.received_at,
+)
+
+
+def _chart_list(
+    db: Session,
+    server_ids: List[int],
+    limit: int,
+    before: Optional[datetime] = None,
+    before_id: Optional[int] = None
+) -> List[models.MoonBotChart]:
+    """
+    Страница списка графиков от новых к старым (только колонки метаданных).
+
+    Keyset пагинация по (received_at, id): следующая страница -
+    before / before_id последнего графика предыдущей.
+    """
+    query = db.query(models.MoonBotChart).options(load_only(*_CHART_LIST_COLUMNS)).filter(
+        models.MoonBotChart.server_id.in_(server_ids)
+    )
+    if before is not None:
+        if before_id is None:
+            query = query.filter(models.MoonBotChart.received_at < before)
+        else:
+            query = query.filter(or_(
+                models.MoonBotChart.received_at < before,
+                and_(models.MoonBotChart.received_at == before, models.MoonBotChart.id < before_id)
+            ))
+    return query.order_by(
+        models.MoonBotChart.received_at.desc(),
+        models.MoonBotChart.id.desc()
+    ).limit(limit).all()
+
+
+def _order_profits(db: Session, charts: List[models.MoonBotChart]) -> Dict[Tuple[int, int], Optional[float]]:
+    """profit_btc ордеров графиков по (server_id, moonbot_order_id) - только ордера из списка"""
+    if not charts:
+        return {}
+    rows = db.query(
+        models.MoonBotOrder.server_id,
+        models.MoonBotOrder.moonbot_order_id,
+        models.MoonBotOrder.profit_btc
+    ).filter(
+        models.MoonBotOrder.server_id.in_({c.server_id for c in charts}),
+        models.MoonBotOrder.moonbot_order_id.in_({c.order_db_id for c in charts})
+    ).all()
+    return {
+        (server_id, order_id): None if profit is None or math.isnan(profit) or math.isinf(profit) else profit
+        for server_id, order_id, profit in rows
+    }
+
+
+def _chart_list_item(chart: models.MoonBotChart, profit: Optional[float]) -> Dict[str, Any]:
+    """Элемент списка графиков"""
+    return {
+        "id": chart.id,
+        "order_db_id": chart.order_db_id,
+        "market_name": chart.market_name,
+        "market_currency": chart.market_currency,
+        "pump_channel": chart.pump_channel,
+        "start_time": format_iso(chart.start_time),
+        "end_time": format_iso(chart.end_time),
+        "points_count": chart.points_count,
+        "min_price": sanitize_float_values(chart.min_price),
+        "max_price": sanitize_float_values(chart.max_price),
+        "session_profit": profit,  # profit_btc из ордера в USDT
+        "received_at": format_iso(chart.received_at)
+    }
+
+
+def _to_epoch(value: Optional[datetime]) -> Optional[float]:
+    """datetime запроса -> секунды эпохи (naive - UTC, как время графиков)"""
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - UNIX_EPOCH).total_seconds()
+
+
 @app.post("/api/servers/{server_id}/charts/subscribe")
 async def subscribe_charts(
     server_id: int,
@@ -152,63 +272,46 @@ async def unsubscribe_charts(
 @app.get("/api/charts/all")
 async def get_all_charts(
     limit: int = Query(100, ge=1, le=1000, description="Max number of charts to return"),
+    before: Optional[datetime] = Query(None, description="Cursor: received_at of the last chart of the previous page"),
+    before_id: Optional[int] = Query(None, description="Cursor: id of the last chart of the previous page"),
     current_user: models.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
-    Получить список всех графиков пользователя (для отладки)
+    Получить список всех графиков пользователя
+    
+    Читаются только метаданные и сводка графиков (points_count, min/max цена).
+    Следующая страница - параметры из next.
     """
-    # Получаем все серверы пользователя
-    server_ids = [s.id for s in db.query(models.Server).filter(
+    # Серверы пользователя: server_id -> server_name
+    server_names = dict(db.query(models.Server.id, models.Server.name).filter(
         models.Server.user_id == current_user.id
-    ).all()]
+    ).all())
     
-    if not server_ids:
+    if not server_names:
         return []
     
-    # Создаём словарь server_id -> server_name
-    servers = db.query(models.Server).filter(
-        models.Server.id.in_(server_ids)
-    ).all()
-    server_names = {s.id: s.name for s in servers}
-    
-    charts = db.query(models.MoonBotChart).filter(
-        models.MoonBotChart.server_id.in_(server_ids)
-    ).order_by(
-        models.MoonBotChart.received_at.desc()
-    ).limit(limit).all()
+    charts = _chart_list(db, list(server_names), limit, before, before_id)
     
-    # Получаем profit_btc из связанных ордеров
-    order_ids = [(c.server_id, c.order_db_id) for c in charts]
-    order_profits = {}
-    if order_ids:
-        orders = db.query(models.MoonBotOrder).filter(
-            models.MoonBotOrder.server_id.in_(server_ids)
-        ).all()
-        for order in orders:
-            key = (order.server_id, order.moonbot_order_id)
-            order_profits[key] = order.profit_btc
+    # profit_btc из связанных ордеров (в USDT)
+    order_profits = _order_profits(db, charts)
     
     result = []
     for chart in charts:
-        # Берём profit_btc из ордера (в USDT)
-        order_key = (chart.server_id, chart.order_db_id)
-        profit = order_profits.get(order_key)
-        if profit is not None and (math.isnan(profit) or math.isinf(profit)):
-            profit = None
-        
-        result.append({
-            "id": chart.id,
-            "server_id": chart.server_id,
-            "server_name": server_names.get(chart.server_id, "Unknown"),
-            "order_db_id": chart.order_db_id,
-            "market_name": chart.market_name,
-            "market_currency": chart.market_currency,
-            "session_profit": profit,  # profit_btc из ордера в USDT
-            "received_at": format_iso(chart.received_at)
-        })
+        item = _chart_list_item(chart, order_profits.get((chart.server_id, chart.order_db_id)))
+        item["server_id"] = chart.server_id
+        item["server_name"] = server_names.get(chart.server_id, "Unknown")
+        result.append(item)
+    
+    next_page = None
+    if len(charts) == limit:
+        last = charts[-1]
+        next_page = {
+            "before": last.received_at.isoformat() if last.received_at else None,
+            "before_id": last.id
+        }
     
-    return {"total": len(result), "charts": result}
+    return {"total": len(result), "charts": result, "next": next_page}
 
 
 @app.get("/api/servers/{server_id}/charts")
@@ -230,54 +333,36 @@ async def get_charts(
     if not server:
         raise HTTPException(status_code=404, detail="Server not found")
     
-    charts = db.query(models.MoonBotChart).filter(
-        models.MoonBotChart.server_id == server_id
-    ).order_by(
-        models.MoonBotChart.received_at.desc()
-    ).limit(limit).all()
+    charts = _chart_list(db, [server_id], limit)
     
-    # Получаем profit_btc из связанных ордеров
-    order_db_ids = [c.order_db_id for c in charts]
-    order_profits = {}
-    if order_db_ids:
-        orders = db.query(models.MoonBotOrder).filter(
-            models.MoonBotOrder.server_id == server_id,
-            models.MoonBotOrder.moonbot_order_id.in_(order_db_ids)
-        ).all()
-        for order in orders:
-            order_profits[order.moonbot_order_id] = order.profit_btc
+    # profit_btc из связанных ордеров (в USDT)
+    order_profits = _order_profits(db, charts)
     
-    result = []
-    for chart in charts:
-        # Берём profit_btc из ордера (в USDT)
-        profit = order_profits.get(chart.order_db_id)
-        if profit is not None and (math.isnan(profit) or math.isinf(profit)):
-            profit = None
-        
-        result.append({
-            "id": chart.id,
-            "order_db_id": chart.order_db_id,
-            "market_name": chart.market_name,
-            "market_currency": chart.market_currency,
-            "pump_channel": chart.pump_channel,
-            "start_time": format_iso(chart.start_time),
-            "end_time": format_iso(chart.end_time),
-            "session_profit": profit,  # profit_btc из ордера в USDT
-            "received_at": format_iso(chart.received_at)
-        })
-    
-    return result
+    return [
+        _chart_list_item(chart, order_profits.get((chart.server_id, chart.order_db_id)))
+        for chart in charts
+    ]
 
 
 @app.get("/api/servers/{server_id}/charts/{order_id}")
 async def get_chart_data(
     server_id: int,
     order_id: int,
+    max_points: Optional[int] = Query(
+        None, ge=16, le=1_000_000,
+        description="Максимум точек на ряд (прореживание min/max, экстремумы и ордера сохраняются)"
+    ),
+    start: Optional[datetime] = Query(None, description="Начало окна просмотра"),
+    end: Optional[datetime] = Query(None, description="Конец окна просмотра"),
     current_user: models.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
-    Получить полные данные графика для конкретного ордера
+    Получить данные графика для конкретного ордера
+
+    Без max_points / start / end - полный график. С ними - ряды окна
+    просмотра на подходящем уровне детализации (services/chart_parser/downsample.py),
+    уровни графика строятся один раз и кэшируются.
     """
     # Проверяем доступ к серверу
     server = db.query(models.Server).filter(
@@ -296,15 +381,38 @@ async def get_chart_data(
     if not chart:
         raise HTTPException(status_code=404, detail="Chart not found")
     
-    # Парсим JSON данные
+    # Данные графика: компактный формат, старые записи - JSON
     chart_data = None
-    if chart.chart_data:
+    lod = None
+    if max_points is not None or start is not None or end is not None:
+        levels = await asyncio.to_thread(
+            _chart_levels.get, (chart.id, chart.received_at), lambda: _load_columnar_chart(chart)
+        )
+        if levels is not None:
+            view = await asyncio.to_thread(
+                levels.view, max_points or sys.maxsize, _to_epoch(start), _to_epoch(end)
+            )
+            chart_data = chart_to_dict(view)
+            lod = {
+                "max_points": max_points,
+                "start": format_iso(start),
+                "end": format_iso(end),
+                "source_points": levels.source_points(),
+                "points": chart_points(view)
+            }
+    elif chart.chart_blob:
+        try:
+            chart_data = chart_to_dict(decode_chart(chart.chart_blob))
+        except CompactFormatError as e:
+            log(f"[API] Chart {chart.id} decode error: {e}", level="ERROR")
+    elif chart.chart_data:
         try:
             chart_data = json.loads(chart.chart_data)
-            # Очищаем от невалидных float значений (inf, -inf, nan)
-            chart_data = sanitize_float_values(chart_data)
         except json.JSONDecodeError:
             chart_data = None
+    if chart_data is not None:
+        # Очищаем от невалидных float значений (inf, -inf, nan)
+        chart_data = sanitize_float_values(chart_data)
     
     # Получаем данные из связанного ордера
     strategy_name = None
@@ -333,7 +441,8 @@ async def get_chart_data(
         "end_time": format_iso(chart.end_time),
         "session_profit": session_profit,  # profit_btc из ордера в USDT
         "received_at": format_iso(chart.received_at),
-        "data": chart_data
+        "data": chart_data,
+        "lod": lod
     }
 
 
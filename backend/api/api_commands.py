@@ -4,6 +4,7 @@
 Отправка команд, просмотр истории и массовые операции.
 """
 import asyncio
+import uuid
 from fastapi import Depends, HTTPException, status
 from sqlalchemy.orm import Session, joinedload
 from typing import List, Optional, Dict, Any
@@ -16,6 +17,7 @@ from services.udp_client import UDPClient
 from services import udp
 from services import encryption
 from services.udp_helper import send_command_unified
+from services.command_fanout import fan_out_command, save_bulk_history
 from core.server_access import get_user_server
 from utils.logging import log
 
@@ -120,6 +122,7 @@ async def send_bulk_command(
         
     Returns:
         Dict с результатами отправки на каждый сервер
+        (bulk_id - для сопоставления с WebSocket сообщениями bulk_command_*)
         
     Raises:
         HTTPException: Если активные серверы не найдены
@@ -137,45 +140,33 @@ async def send_bulk_command(
     if not servers:
         raise HTTPException(status_code=404, detail="Активные серверы не найдены")
     
-    results: List[Dict[str, Any]] = []
+    # Параллельная отправка: результаты стримятся через WebSocket по мере готовности
+    bulk_id: str = uuid.uuid4().hex
+    fanout_results: List[Dict[str, Any]] = await fan_out_command(
+        servers,
+        command_data.command,
+        timeout=float(command_data.timeout or 5),
+        user_id=current_user.id,
+        bulk_id=bulk_id
+    )
     
-    # Отправка команды на каждый сервер через unified helper
-    for server in servers:
-        success: bool
-        response: str
-        try:
-            success, response = await send_command_unified(
-                server,
-                command_data.command,
-                timeout=float(command_data.timeout or 5)
-            )
-        except Exception as e:
-            log(f"[API] Error sending bulk command to server {server.id}: {e}", level="ERROR")
-            success = False
-            response = str(e)
-        
-        # Сохранение в историю
-        history_entry: models.CommandHistory = models.CommandHistory(
-            command=command_data.command,
-            response=response if success else None,
-            status="success" if success else "error",
-            user_id=current_user.id,
-            server_id=server.id
-        )
-        await asyncio.to_thread(db.add, history_entry)
-        
-        results.append({
-            "server_id": server.id,
-            "server_name": server.name,
-            "status": "success" if success else "error",
-            "response": response
-        })
+    # История - одним INSERT
+    await asyncio.to_thread(save_bulk_history, db, command_data.command, current_user.id, fanout_results)
     
-    await asyncio.to_thread(db.commit)
+    results: List[Dict[str, Any]] = [
+        {
+            "server_id": r["server_id"],
+            "server_name": r["server_name"],
+            "status": r["status"],
+            "response": r["response"]
+        }
+        for r in fanout_results
+    ]
     
     return {
         "total": len(command_data.server_ids),
         "sent": len(results),
+        "bulk_id": bulk_id,
         "results": results
     }
 
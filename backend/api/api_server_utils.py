@@ -17,12 +17,58 @@ from services.udp_client import test_connection
 from services import udp
 from services import encryption
 from services.udp_helper import send_command_unified
+from services.udp.server_state import get_server_state
 from datetime import datetime
 from core.server_access import get_user_server
 from utils.logging import log
 from utils.datetime_utils import format_iso as _format_utc_datetime
 
 
+def _load_balances(db: Session, server_ids: List[int]) -> Dict[int, Any]:
+    """
+    Последние балансы серверов: из хранилища состояния UDP (server_state),
+    из БД - только серверы, от которых после старта ещё не было acc.
+    
+    Args:
+        db: Сессия базы данных
+        server_ids: ID серверов
+        
+    Returns:
+        Dict[server_id, баланс] (BalanceState или ServerBalance)
+    """
+    balances: Dict[int, Any] = get_server_state().get_balances(server_ids)
+    missing = [sid for sid in server_ids if sid not in balances]
+    if missing:
+        for balance in db.query(models.ServerBalance).filter(
+            models.ServerBalance.server_id.in_(missing)
+        ).all():
+            balances[balance.server_id] = balance
+    return balances
+
+
+def _online_status(server_status: Optional[models.ServerStatus],
+                   last_seen: Optional[datetime]) -> Dict[str, Any]:
+    """
+    is_online/last_ping сервера с учётом данных, ещё не записанных в БД.
+    
+    Последние данные от сервера новее последнего пинга - сервер online.
+    
+    Args:
+        server_status: Строка server_status (может отсутствовать)
+        last_seen: Момент последних данных от сервера (из server_state)
+        
+    Returns:
+        Dict с is_online, last_ping
+    """
+    last_ping = server_status.last_ping if server_status else None
+    if last_seen and (last_ping is None or last_seen > last_ping):
+        return {"is_online": True, "last_ping": last_seen}
+    return {
+        "is_online": server_status.is_online if server_status else False,
+        "last_ping": last_ping,
+    }
+
+
 @app.get("/api/servers/balances")
 async def get_server_balances(
     current_user: models.User = Depends(get_current_user),
@@ -33,7 +79,7 @@ async def get_server_balances(
     
     Оптимизировано для 3000+ серверов:
     - Один запрос с joinedload вместо N+1
-    - Предзагрузка балансов и статусов
+    - Балансы и online статус - из памяти (server_state), без запроса к БД
     
     Args:
         current_user: Текущий аутентифицированный пользователь
@@ -51,21 +97,16 @@ async def get_server_balances(
         ).all()
     )
     
-    # Получаем все балансы одним запросом
+    # Последние балансы - из хранилища состояния (БД только для отсутствующих)
     server_ids = [s.id for s in servers]
-    balances_query = await asyncio.to_thread(
-        lambda: db.query(models.ServerBalance).filter(
-            models.ServerBalance.server_id.in_(server_ids)
-        ).all() if server_ids else []
-    )
-    
-    # Создаём словарь балансов для быстрого поиска
-    balances_map: Dict[int, models.ServerBalance] = {b.server_id: b for b in balances_query}
+    balances_map: Dict[int, Any] = await asyncio.to_thread(_load_balances, db, server_ids)
+    last_seen_map = get_server_state().get_last_seen(server_ids)
 
     result: List[Dict[str, Any]] = []
     for server in servers:
         balance = balances_map.get(server.id)
         server_status = server.server_status
+        online = _online_status(server_status, last_seen_map.get(server.id))
 
         # Безопасное получение новых полей (могут отсутствовать до миграции)
         is_running: Optional[bool] = None
@@ -89,8 +130,8 @@ async def get_server_balances(
             "version": version,
             "default_currency": server.default_currency or "USDT",
             "updated_at": _format_utc_datetime(balance.updated_at) if balance else None,
-            "is_online": server_status.is_online if server_status else False,
-            "last_ping": _format_utc_datetime(server_status.last_ping) if server_status else None,
+            "is_online": online["is_online"],
+            "last_ping": _format_utc_datetime(online["last_ping"]),
         })
 
     return result
@@ -231,7 +272,7 @@ async def test_server_connection(
         try:
             success: bool
             response: str
-            success, response = listener.send_command_with_response("lst", timeout=3.0)
+            success, response = await listener.send_command_async("lst", timeout=3.0)
             is_online: bool = success and not response.startswith('ERR')
             log(f"[API] Test result via listener: {is_online}")
             return {"server_id": server_id, "is_online": is_online}
@@ -258,7 +299,7 @@ async def get_servers_with_status(
     
     Оптимизировано для 3000+ серверов:
     - Один запрос с joinedload вместо N+1
-    - Предзагрузка балансов одним запросом
+    - Балансы и online статус - из памяти (server_state), без запроса к БД
     - Пагинация для защиты от перегрузки
     
     Args:
@@ -290,21 +331,16 @@ async def get_servers_with_status(
         ).limit(limit).offset(offset).all()
     )
     
-    # Получаем все балансы одним запросом (оптимизация N+1)
+    # Последние балансы - из хранилища состояния (БД только для отсутствующих)
     server_ids = [s.id for s in servers]
-    balances_query = await asyncio.to_thread(
-        lambda: db.query(models.ServerBalance).filter(
-            models.ServerBalance.server_id.in_(server_ids)
-        ).all() if server_ids else []
-    )
-    
-    # Создаём словарь балансов для быстрого поиска
-    balances_map: Dict[int, models.ServerBalance] = {b.server_id: b for b in balances_query}
+    balances_map: Dict[int, Any] = await asyncio.to_thread(_load_balances, db, server_ids)
+    last_seen_map = get_server_state().get_last_seen(server_ids)
 
     result: List[Dict[str, Any]] = []
     for server in servers:
         server_status: Optional[models.ServerStatus] = server.server_status
         balance = balances_map.get(server.id)
+        online = _online_status(server_status, last_seen_map.get(server.id))
 
         # Безопасное получение новых полей
         is_running: Optional[bool] = None
@@ -331,8 +367,8 @@ async def get_servers_with_status(
             "status": {
                 "id": server_status.id,
                 "server_id": server_status.server_id,
-                "is_online": server_status.is_online,
-                "last_ping": _format_utc_datetime(server_status.last_ping),
+                "is_online": online["is_online"],
+                "last_ping": _format_utc_datetime(online["last_ping"]),
                 "response_time": server_status.response_time,
                 "last_error": server_status.last_error,
                 "uptime_percentage": server_status.uptime_percentage,
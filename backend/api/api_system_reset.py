@@ -67,6 +67,7 @@ async def api_system_reset(
         await asyncio.to_thread(lambda: db.query(models.CommandPreset).delete())
         await asyncio.to_thread(lambda: db.query(models.QuickCommand).delete())
         await asyncio.to_thread(lambda: db.query(models.MoonBotOrder).delete())
+        await asyncio.to_thread(lambda: db.query(models.OrderStatsDaily).delete())
         await asyncio.to_thread(lambda: db.query(models.SQLCommandLog).delete())
         await asyncio.to_thread(lambda: db.query(models.UDPListenerStatus).delete())
         await asyncio.to_thread(lambda: db.query(models.ServerStatus).delete())
@@ -85,6 +86,13 @@ async def api_system_reset(
         
         log("[SYSTEM RESET] OK: All database tables wiped")
         
+        # Последние балансы/статусы в памяти иначе вернули бы удалённые строки
+        try:
+            from services.udp.server_state import get_server_state
+            get_server_state().clear()
+        except Exception as e:
+            log(f"[SYSTEM RESET] WARNING: Could not clear server state: {e}", level="WARNING")
+        
         # Останавливаем все UDP listeners
         try:
             for listener in udp.active_listeners.values():
@@ -189,6 +189,13 @@ async def get_udp_metrics(
                 "last_error": gs.last_error,
             }
         
+        # Статистика reactor'ов LOCAL/AUTO режима
+        try:
+            from services.udp.listener_reactor import get_reactor_stats
+            reactor_stats = get_reactor_stats()
+        except Exception:
+            reactor_stats = []
+        
         # Статистика worker pool (если включён)
         worker_pool_stats = {}
         queue_utilization = 0
@@ -213,6 +220,46 @@ async def get_udp_metrics(
         except Exception:
             batch_stats = {"enabled": False}
         
+        # Последние балансы/online статусы серверов (запись в БД пакетами)
+        server_state_stats = {}
+        try:
+            from services.udp.server_state import get_server_state
+            server_state_stats = get_server_state().get_stats()
+        except Exception:
+            server_state_stats = {"enabled": False}
+        
+        # Конвейер графиков (очередь разбора, задержка до commit)
+        chart_pipeline_stats = {}
+        try:
+            from services.udp.chart_pipeline import get_chart_pipeline
+            chart_pipeline_stats = get_chart_pipeline().get_stats()
+        except Exception:
+            chart_pipeline_stats = {"enabled": False}
+        
+        # Rollup статистики ордеров (сбои и очередь пересчёта бакетов)
+        order_stats_rollup_stats = {}
+        try:
+            from services.order_stats_rollup import get_rollup_stats
+            order_stats_rollup_stats = get_rollup_stats()
+        except Exception:
+            order_stats_rollup_stats = {}
+        
+        # Кэш открытых ордеров (попадания UPDATE/INSERT Orders)
+        open_order_cache_stats = {}
+        try:
+            from services.udp.open_order_cache import get_open_order_cache
+            open_order_cache_stats = get_open_order_cache().get_stats()
+        except Exception:
+            open_order_cache_stats = {"enabled": False}
+        
+        # asyncio endpoint'ы UDP клиента команд (пул этого event loop)
+        udp_client_stats = {}
+        try:
+            from services.udp_endpoint_pool import get_endpoint_pool
+            udp_client_stats = get_endpoint_pool().get_stats()
+        except Exception:
+            udp_client_stats = {}
+        
         # Определяем уровень нагрузки и алерты
         alerts = []
         load_level = "normal"
@@ -234,6 +281,12 @@ async def get_udp_metrics(
                 load_level = "high"
             alerts.append(f"Worker pool queue at {queue_utilization}%")
         
+        # Проверяем перекос шардов (один "шумный" сервер забивает свой шард)
+        shard_capacity = worker_pool_stats.get("shard_queue_size", 0)
+        max_shard_depth = worker_pool_stats.get("max_shard_depth", 0)
+        if shard_capacity and max_shard_depth > shard_capacity * 0.8:
+            alerts.append(f"Worker pool shard queue at {round(max_shard_depth / shard_capacity * 100, 1)}%")
+        
         # Проверяем dropped messages
         dropped = worker_pool_stats.get("messages_dropped", 0)
         if dropped > 0:
@@ -244,11 +297,22 @@ async def get_udp_metrics(
         if errors > 100:
             alerts.append(f"Processing errors: {errors}")
         
+        # Проверяем rollup статистики ордеров
+        rollup_pending = order_stats_rollup_stats.get("pending_repair", 0)
+        if rollup_pending > 0:
+            alerts.append(f"Order stats rollup: {rollup_pending} changes waiting for repair")
+        
         return {
             "active_listeners": active_listeners,
             "global_socket": global_socket_stats,
+            "listener_reactors": reactor_stats,
+            "udp_client": udp_client_stats,
             "worker_pool": worker_pool_stats,
             "batch_processor": batch_stats,
+            "open_order_cache": open_order_cache_stats,
+            "order_stats_rollup": order_stats_rollup_stats,
+            "server_state": server_state_stats,
+            "chart_pipeline": chart_pipeline_stats,
             "load_level": load_level,  # normal, high, critical
             "queue_utilization_percent": queue_utilization,
             "packets_per_second": packets_per_second,
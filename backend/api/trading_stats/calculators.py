@@ -4,7 +4,6 @@
 Функции расчёта различных торговых метрик
 """
 from typing import List, Tuple
-from models import models
 
 
 def calculate_profit_factor(total_wins: float, total_losses: float) -> float:
@@ -14,58 +13,99 @@ def calculate_profit_factor(total_wins: float, total_losses: float) -> float:
     return 999.99 if total_wins > 0 else 0.0
 
 
-def calculate_max_drawdown(closed_orders: List[models.MoonBotOrder]) -> float:
-    """Рассчитать максимальную просадку"""
+def calculate_max_drawdown(buckets: List) -> float:
+    """
+    Рассчитать максимальную просадку по бакетам rollup
+    
+    Бакет хранит кривую капитала относительно своего начала
+    (equity_min/equity_max/max_drawdown), поэтому бакеты склеиваются
+    последовательно: просадка либо внутри бакета, либо от пика до него.
+    Бакеты идут по времени первого закрытия; если сделки бакетов
+    перемешаны по времени (см. are_buckets_sequential), результат приближённый.
+    """
     cumulative_profit = 0.0
     peak_profit = 0.0
     max_drawdown = 0.0
     
-    for order in closed_orders:
-        cumulative_profit += (order.profit_btc or 0.0)
-        if cumulative_profit > peak_profit:
-            peak_profit = cumulative_profit
-        drawdown = peak_profit - cumulative_profit
-        if drawdown > max_drawdown:
-            max_drawdown = drawdown
+    for bucket in buckets:
+        max_drawdown = max(
+            max_drawdown,
+            bucket.max_drawdown or 0.0,
+            peak_profit - (cumulative_profit + (bucket.equity_min or 0.0))
+        )
+        peak_profit = max(peak_profit, cumulative_profit + (bucket.equity_max or 0.0))
+        cumulative_profit += (bucket.gross_profit or 0.0) - (bucket.gross_loss or 0.0)
     
     return max_drawdown
 
 
-def calculate_avg_duration(orders_with_times: List[models.MoonBotOrder]) -> float:
+def calculate_avg_duration(duration_sum: float, duration_count: int) -> float:
     """Рассчитать среднюю длительность сделок в часах"""
-    if not orders_with_times:
+    if not duration_count:
         return 0.0
     
-    total_duration_seconds = sum([
-        (order.closed_at - order.opened_at).total_seconds()
-        for order in orders_with_times
-    ])
-    return (total_duration_seconds / len(orders_with_times)) / 3600
-
-
-def calculate_streaks(all_orders: List[models.MoonBotOrder]) -> Tuple[int, int]:
-    """Рассчитать максимальные серии побед и поражений"""
+    return (float(duration_sum or 0.0) / duration_count) / 3600
+
+
+def _join_streak(current: int, best: int, decisive: int,
+                 head: int, tail: int, bucket_max: int) -> Tuple[int, int]:
+    """Продолжить серию бакетом: (текущая серия, максимум)"""
+    if decisive == 0:
+        # Только сделки с нулевой прибылью - серия не прерывается
+        return current, best
+    if head == decisive:
+        # Весь бакет - одна серия, текущая продолжается
+        current += decisive
+    else:
+        best = max(best, current + head)
+        current = tail
+    return current, max(best, bucket_max, current)
+
+
+def calculate_streaks(buckets: List) -> Tuple[int, int]:
+    """
+    Рассчитать максимальные серии побед и поражений по бакетам rollup
+    
+    Бакет хранит серии в начале (head), в конце (tail) и максимальную;
+    сделки с нулевой прибылью серии не прерывают.
+    """
     current_win_streak = 0
     current_loss_streak = 0
     max_win_streak = 0
     max_loss_streak = 0
     
-    for order in all_orders:
-        profit = order.profit_btc or 0.0
-        if profit > 0:
-            current_win_streak += 1
-            current_loss_streak = 0
-            if current_win_streak > max_win_streak:
-                max_win_streak = current_win_streak
-        elif profit < 0:
-            current_loss_streak += 1
-            current_win_streak = 0
-            if current_loss_streak > max_loss_streak:
-                max_loss_streak = current_loss_streak
+    for bucket in buckets:
+        decisive = (bucket.wins or 0) + (bucket.losses or 0)
+        current_win_streak, max_win_streak = _join_streak(
+            current_win_streak, max_win_streak, decisive,
+            bucket.win_streak_head, bucket.win_streak_tail, bucket.win_streak_max
+        )
+        current_loss_streak, max_loss_streak = _join_streak(
+            current_loss_streak, max_loss_streak, decisive,
+            bucket.loss_streak_head, bucket.loss_streak_tail, bucket.loss_streak_max
+        )
     
     return max_win_streak, max_loss_streak
 
 
+def are_buckets_sequential(buckets: List) -> bool:
+    """
+    Не пересекаются ли бакеты по времени закрытия сделок
+    
+    Тогда склейка бакетов даёт ту же последовательность сделок, что и
+    ордера по closed_at, и просадка/серии точные. Иначе (несколько
+    серверов/стратегий торгуют в один день) - приближение.
+    """
+    last_closed_at = None
+    for bucket in buckets:
+        if last_closed_at is not None and bucket.first_closed_at is not None \
+                and bucket.first_closed_at < last_closed_at:
+            return False
+        if bucket.last_closed_at is not None:
+            last_closed_at = max(last_closed_at or bucket.last_closed_at, bucket.last_closed_at)
+    return True
+
+
 def calculate_cumulative_profit(profit_by_date: List) -> List[dict]:
     """Рассчитать накопительную прибыль по времени"""
     cumulative_profit = 0.0
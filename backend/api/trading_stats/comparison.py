@@ -4,11 +4,9 @@
 Функции расчёта статистики за предыдущий период для сравнения
 """
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 from datetime import datetime, timedelta
 from typing import Optional, Dict
-from models import models
-from .filters import apply_server_filter, apply_strategy_filter, apply_emulator_filter
+from .queries import get_period_summary
 
 
 def calculate_previous_period_stats(
@@ -25,43 +23,27 @@ def calculate_previous_period_stats(
     """Рассчитать статистику за предыдущий период для сравнения"""
     
     # Используем ЛОКАЛЬНОЕ время сервера!
-    now = datetime.now()
+    today = datetime.now().date()
     
-    # Определяем границы предыдущего периода
+    # Границы предыдущего периода в днях закрытия (как и текущий период в rollup)
     if time_period == "today":
-        prev_start = now.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1)
-        prev_end = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        prev_start = today - timedelta(days=1)
+        prev_end = today
     elif time_period == "week":
-        prev_start = now - timedelta(days=14)
-        prev_end = now - timedelta(days=7)
+        prev_start = today - timedelta(days=14)
+        prev_end = today - timedelta(days=7)
     elif time_period == "month":
-        prev_start = now - timedelta(days=60)
-        prev_end = now - timedelta(days=30)
+        prev_start = today - timedelta(days=60)
+        prev_end = today - timedelta(days=30)
     else:
         return None
     
-    # Базовый запрос для предыдущего периода
-    prev_query = db.query(models.MoonBotOrder).join(
-        models.Server,
-        models.MoonBotOrder.server_id == models.Server.id
-    ).filter(
-        models.Server.user_id == user_id,
-        models.MoonBotOrder.opened_at >= prev_start,
-        models.MoonBotOrder.opened_at < prev_end
-    )
+    # Один запрос к дневному rollup вместо выборки всех ордеров периода
+    prev = get_period_summary(db, user_id, prev_start, prev_end, server_ids, strategies, emulator)
     
-    # Применяем фильтры
-    prev_query = apply_server_filter(prev_query, server_ids)
-    prev_query = apply_strategy_filter(prev_query, strategies)
-    prev_query = apply_emulator_filter(prev_query, emulator)
-    
-    # Считаем метрики
-    prev_total_orders = prev_query.count()
-    prev_total_profit = db.query(func.sum(models.MoonBotOrder.profit_btc)).filter(
-        models.MoonBotOrder.id.in_([o.id for o in prev_query.all()])
-    ).scalar() or 0.0
-    
-    prev_profitable_count = prev_query.filter(models.MoonBotOrder.profit_btc > 0).count()
+    prev_total_orders = int(prev.total or 0)
+    prev_total_profit = float(prev.gross_profit or 0.0) - float(prev.gross_loss or 0.0)
+    prev_profitable_count = int(prev.wins or 0)
     prev_winrate = (prev_profitable_count / prev_total_orders * 100) if prev_total_orders > 0 else 0.0
     
     # Вычисляем изменения
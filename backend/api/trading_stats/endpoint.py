@@ -5,29 +5,30 @@ Trading Stats API - Refactored
 """
 from fastapi import Depends, HTTPException
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 from typing import Optional
-from datetime import datetime, timedelta
 from models import models
 from models.database import get_db
 from services.auth import get_current_user
 
-from .filters import apply_all_filters
 from .calculators import (
     calculate_profit_factor,
     calculate_max_drawdown,
     calculate_avg_duration,
     calculate_streaks,
+    are_buckets_sequential,
     calculate_cumulative_profit,
     calculate_winrate_timeline
 )
 from .queries import (
-    build_base_query,
+    get_overall_stats,
+    get_equity_buckets,
+    get_top_orders,
+    get_open_orders_count,
+    get_open_orders_by_server,
     get_strategy_stats,
     get_server_stats,
     get_symbol_stats,
-    get_profit_by_date,
-    get_winrate_by_date,
+    get_daily_stats,
     get_available_strategies,
     get_available_servers
 )
@@ -65,118 +66,79 @@ def register_endpoint(app):
         - date_to: конечная дата для кастомного периода (YYYY-MM-DD)
         """
         
-        # Базовый запрос (только закрытые ордера для статистики)
+        # Суммы закрытых ордеров читаются из дневного rollup (order_stats_daily):
+        # O(дней) строк вместо O(ордеров), без загрузки ORM объектов ордеров
         import asyncio
-        base_query = build_base_query(db, current_user.id)
-        base_query = apply_all_filters(base_query, server_ids, strategies, emulator, time_period, date_from, date_to)
-        
-        # Запрос для открытых ордеров (отдельно, без фильтра по статусу)
-        all_orders_query = db.query(models.MoonBotOrder).join(
-            models.Server,
-            models.MoonBotOrder.server_id == models.Server.id
-        ).filter(models.Server.user_id == current_user.id)
-        all_orders_query = apply_all_filters(all_orders_query, server_ids, strategies, emulator, time_period, date_from, date_to)
-        
-        # Общая статистика
-        closed_orders = await asyncio.to_thread(base_query.count)
-        open_orders = await asyncio.to_thread(
-            lambda: all_orders_query.filter(models.MoonBotOrder.status == "Open").count()
+        
+        # Общая статистика (один запрос к rollup)
+        overall = await asyncio.to_thread(
+            get_overall_stats, db, current_user.id, server_ids, strategies, emulator,
+            time_period, date_from, date_to
         )
+        closed_orders = int(overall.total or 0)
         total_orders = closed_orders  # Для статистики считаем только закрытые
         
-        total_profit = await asyncio.to_thread(
-            lambda: base_query.with_entities(func.sum(models.MoonBotOrder.profit_btc)).scalar() or 0.0
+        # Открытые ордера (отдельно, из moonbot_orders)
+        open_orders = await asyncio.to_thread(
+            get_open_orders_count, db, current_user.id, server_ids, strategies, emulator,
+            time_period, date_from, date_to
         )
+        
+        total_wins = float(overall.gross_profit or 0.0)
+        total_losses = float(overall.gross_loss or 0.0)
+        total_profit = total_wins - total_losses
         avg_profit = total_profit / total_orders if total_orders > 0 else 0.0
         
-        profitable_count = await asyncio.to_thread(
-            lambda: base_query.filter(models.MoonBotOrder.profit_btc > 0).count()
-        )
-        losing_count = await asyncio.to_thread(
-            lambda: base_query.filter(models.MoonBotOrder.profit_btc < 0).count()
-        )
+        profitable_count = int(overall.wins or 0)
+        losing_count = int(overall.losses or 0)
         winrate = (profitable_count / total_orders * 100) if total_orders > 0 else 0.0
         
         # Расширенные метрики
-        total_wins = await asyncio.to_thread(
-            lambda: base_query.filter(models.MoonBotOrder.profit_btc > 0).with_entities(
-                func.sum(models.MoonBotOrder.profit_btc)
-            ).scalar() or 0.0
-        )
-        
-        total_losses = abs(await asyncio.to_thread(
-            lambda: base_query.filter(models.MoonBotOrder.profit_btc < 0).with_entities(
-                func.sum(models.MoonBotOrder.profit_btc)
-            ).scalar() or 0.0
-        ))
-        
         profit_factor = calculate_profit_factor(total_wins, total_losses)
         
-        closed_orders_list = await asyncio.to_thread(
-            lambda: base_query.filter(
-                models.MoonBotOrder.status == "Closed"
-            ).order_by(models.MoonBotOrder.closed_at.asc()).all()
-        )
-        
-        max_drawdown = calculate_max_drawdown(closed_orders_list)
-        
-        closed_with_times = await asyncio.to_thread(
-            lambda: base_query.filter(
-                models.MoonBotOrder.status == "Closed",
-                models.MoonBotOrder.opened_at.isnot(None),
-                models.MoonBotOrder.closed_at.isnot(None)
-            ).all()
+        # Просадка и серии - склейка бакетов rollup по времени закрытия
+        # (точно, если сделки бакетов не перемешаны по времени)
+        equity_buckets = await asyncio.to_thread(
+            get_equity_buckets, db, current_user.id, server_ids, strategies, emulator,
+            time_period, date_from, date_to
         )
+        max_drawdown = calculate_max_drawdown(equity_buckets)
+        max_win_streak, max_loss_streak = calculate_streaks(equity_buckets)
+        drawdown_exact = are_buckets_sequential(equity_buckets)
         
-        avg_duration_hours = calculate_avg_duration(closed_with_times)
+        avg_duration_hours = calculate_avg_duration(overall.duration_sum, int(overall.duration_count or 0))
         
-        total_spent = await asyncio.to_thread(
-            lambda: base_query.with_entities(func.sum(models.MoonBotOrder.spent_btc)).scalar() or 0.0
-        )
+        total_spent = float(overall.spent or 0.0)
         roi = ((total_profit / total_spent) * 100) if total_spent > 0 else 0.0
         
-        all_orders_sorted = await asyncio.to_thread(
-            lambda: base_query.filter(
-                models.MoonBotOrder.status == "Closed"
-            ).order_by(models.MoonBotOrder.closed_at.asc()).all()
-        )
-        
-        max_win_streak, max_loss_streak = calculate_streaks(all_orders_sorted)
-        
         # Статистика по группам
         strategy_stats = await asyncio.to_thread(get_strategy_stats, db, current_user.id, server_ids, strategies, emulator)
         server_stats = await asyncio.to_thread(get_server_stats, db, current_user.id, server_ids, strategies)
         symbol_stats = await asyncio.to_thread(get_symbol_stats, db, current_user.id, server_ids, strategies)
+        open_by_server = await asyncio.to_thread(get_open_orders_by_server, db, current_user.id)
         
         # Топ сделок
         top_profitable = await asyncio.to_thread(
-            lambda: base_query.filter(
-                models.MoonBotOrder.profit_btc > 0
-            ).order_by(models.MoonBotOrder.profit_btc.desc()).limit(10).all()
+            get_top_orders, db, current_user.id, server_ids, strategies, emulator,
+            time_period, date_from, date_to, True
         )
         
         top_losing = await asyncio.to_thread(
-            lambda: base_query.filter(
-                models.MoonBotOrder.profit_btc < 0
-            ).order_by(models.MoonBotOrder.profit_btc.asc()).limit(10).all()
+            get_top_orders, db, current_user.id, server_ids, strategies, emulator,
+            time_period, date_from, date_to, False
         )
         
         # Списки
         all_strategies = await asyncio.to_thread(get_available_strategies, db, current_user.id)
         all_servers = await asyncio.to_thread(get_available_servers, db, current_user.id)
         
-        # Графики
-        profit_by_date = await asyncio.to_thread(
-            get_profit_by_date, db, current_user.id, server_ids, strategies, emulator, 
-            time_period, date_from, date_to
-        )
-        profit_timeline = calculate_cumulative_profit(profit_by_date)
-        
-        winrate_by_date = await asyncio.to_thread(
-            get_winrate_by_date, db, current_user.id, server_ids, strategies, emulator,
+        # Графики (прибыль и винрейт по дням - один запрос)
+        daily_stats = await asyncio.to_thread(
+            get_daily_stats, db, current_user.id, server_ids, strategies, emulator,
             time_period, date_from, date_to
         )
-        winrate_timeline = calculate_winrate_timeline(winrate_by_date)
+        profit_timeline = calculate_cumulative_profit(daily_stats)
+        winrate_timeline = calculate_winrate_timeline(daily_stats)
         
         # Сравнение с предыдущим периодом
         previous_stats = None
@@ -204,12 +166,15 @@ def register_endpoint(app):
                 "roi": round(roi, 2),
                 "max_win_streak": max_win_streak,
                 "max_loss_streak": max_loss_streak,
+                # False - сделки разных серверов/стратегий перемешаны во времени,
+                # max_drawdown и серии посчитаны по бакетам приближённо
+                "drawdown_exact": drawdown_exact,
                 "total_wins": round(total_wins, 2),
                 "total_losses": round(total_losses, 2)
             },
-            "by_strategy": await asyncio.to_thread(format_strategy_stats, strategy_stats, base_query),
-            "by_server": await asyncio.to_thread(format_server_stats, server_stats, db),
-            "by_symbol": await asyncio.to_thread(format_symbol_stats, symbol_stats, base_query),
+            "by_strategy": format_strategy_stats(strategy_stats),
+            "by_server": format_server_stats(server_stats, open_by_server),
+            "by_symbol": format_symbol_stats(symbol_stats),
             "top_profitable": format_top_orders(top_profitable),
             "top_losing": format_top_orders(top_losing),
             "available_strategies": [s.strategy for s in all_strategies if s.strategy],
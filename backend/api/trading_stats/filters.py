@@ -5,32 +5,32 @@
 """
 from sqlalchemy.orm import Query
 from fastapi import HTTPException
-from datetime import datetime, timedelta
-from typing import Optional
+from datetime import date, datetime, timedelta
+from typing import Optional, Tuple
 from models import models
 from utils.query_filters import apply_emulator_filter as apply_emulator_filter_util
 
 
-def apply_server_filter(query: Query, server_ids: Optional[str]) -> Query:
-    """Применить фильтр по серверам"""
+def apply_server_filter(query: Query, server_ids: Optional[str], model=models.MoonBotOrder) -> Query:
+    """Применить фильтр по серверам (model - MoonBotOrder или OrderStatsDaily)"""
     if server_ids and server_ids != "all":
         try:
             server_id_list = [int(sid.strip()) for sid in server_ids.split(',')]
-            query = query.filter(models.MoonBotOrder.server_id.in_(server_id_list))
+            query = query.filter(model.server_id.in_(server_id_list))
         except (ValueError, AttributeError):
             raise HTTPException(status_code=400, detail="Неверный формат server_ids")
     return query
 
 
-def apply_strategy_filter(query: Query, strategies: Optional[str]) -> Query:
+def apply_strategy_filter(query: Query, strategies: Optional[str], model=models.MoonBotOrder) -> Query:
     """Применить фильтр по стратегиям"""
     if strategies and strategies != "all":
         strategy_list = [s.strip() for s in strategies.split(',')]
-        query = query.filter(models.MoonBotOrder.strategy.in_(strategy_list))
+        query = query.filter(model.strategy.in_(strategy_list))
     return query
 
 
-def apply_emulator_filter(query: Query, emulator: Optional[str]) -> Query:
+def apply_emulator_filter(query: Query, emulator: Optional[str], model=models.MoonBotOrder) -> Query:
     """Применить фильтр по эмулятору (используется общая утилита)"""
     # Преобразуем формат фильтра: 'true'/'false' -> 'emulator'/'real'
     emulator_filter = None
@@ -39,7 +39,7 @@ def apply_emulator_filter(query: Query, emulator: Optional[str]) -> Query:
     elif emulator and emulator.lower() == 'false':
         emulator_filter = 'real'
     
-    return apply_emulator_filter_util(query, emulator_filter, models.MoonBotOrder.is_emulator)
+    return apply_emulator_filter_util(query, emulator_filter, model.is_emulator)
 
 
 def apply_time_period_filter(query: Query, time_period: Optional[str], 
@@ -87,3 +87,57 @@ def apply_all_filters(query: Query, server_ids: Optional[str], strategies: Optio
     return query
 
 
+def get_period_days(time_period: Optional[str], date_from: Optional[str],
+                    date_to: Optional[str]) -> Tuple[Optional[date], Optional[date]]:
+    """
+    Границы периода в днях (для дневного rollup order_stats_daily)
+    
+    Периоды "week"/"month" округляются до начала дня: день, в который
+    попадает граница, учитывается целиком.
+    
+    Returns:
+        (первый день, последний день) - None означает без ограничения
+    """
+    if not time_period:
+        return None, None
+    
+    # Используем ЛОКАЛЬНОЕ время сервера!
+    now = datetime.now()
+    
+    if time_period == "today":
+        return now.date(), None
+    if time_period == "week":
+        return (now - timedelta(days=7)).date(), None
+    if time_period == "month":
+        return (now - timedelta(days=30)).date(), None
+    if time_period == "custom" and date_from and date_to:
+        try:
+            return (
+                datetime.strptime(date_from, "%Y-%m-%d").date(),
+                datetime.strptime(date_to, "%Y-%m-%d").date()
+            )
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Неверный формат даты. Используйте YYYY-MM-DD")
+    
+    return None, None
+
+
+def apply_day_filter(query: Query, start_day: Optional[date], end_day: Optional[date]) -> Query:
+    """Применить фильтр по дню закрытия к rollup запросу"""
+    if start_day is not None:
+        query = query.filter(models.OrderStatsDaily.day >= start_day)
+    if end_day is not None:
+        query = query.filter(models.OrderStatsDaily.day <= end_day)
+    return query
+
+
+def apply_all_rollup_filters(query: Query, server_ids: Optional[str], strategies: Optional[str],
+                             emulator: Optional[str], time_period: Optional[str],
+                             date_from: Optional[str], date_to: Optional[str]) -> Query:
+    """Применить все фильтры к запросу по order_stats_daily"""
+    rollup = models.OrderStatsDaily
+    query = apply_server_filter(query, server_ids, rollup)
+    query = apply_strategy_filter(query, strategies, rollup)
+    query = apply_emulator_filter(query, emulator, rollup)
+    start_day, end_day = get_period_days(time_period, date_from, date_to)
+    return apply_day_filter(query, start_day, end_day)
@@ -3,32 +3,37 @@
 
 Функции форматирования данных для API ответов
 """
-from typing import List
+from typing import Dict, List
 from models import models
-from sqlalchemy.orm import Session, Query
-from sqlalchemy import func
 
 
-def format_strategy_stats(strategy_stats, base_query: Query) -> List[dict]:
+def _winrate(wins, total) -> float:
+    """Винрейт группы в процентах"""
+    return round((wins or 0) / total * 100, 2) if total else 0.0
+
+
+def _avg_profit_percent(group) -> float:
+    """Средний профит в процентах (по ордерам, где он известен)"""
+    if not group.profit_percent_count:
+        return 0.0
+    return round(group.profit_percent_sum / group.profit_percent_count, 2)
+
+
+def format_strategy_stats(strategy_stats) -> List[dict]:
     """Форматировать статистику по стратегиям"""
     return [
         {
             "strategy": s.strategy or "Unknown",
             "total_orders": s.total or 0,
             "total_profit": round(s.profit or 0, 2),
-            "avg_profit_percent": round(s.avg_profit_percent or 0, 2),
-            "winrate": round(
-                (base_query.filter(
-                    models.MoonBotOrder.strategy == s.strategy,
-                    models.MoonBotOrder.profit_btc > 0
-                ).count() / s.total * 100) if s.total > 0 else 0.0, 2
-            )
+            "avg_profit_percent": _avg_profit_percent(s),
+            "winrate": _winrate(s.wins, s.total)
         }
         for s in strategy_stats
     ]
 
 
-def format_server_stats(server_stats, db: Session) -> List[dict]:
+def format_server_stats(server_stats, open_by_server: Dict[int, int]) -> List[dict]:
     """Форматировать статистику по серверам"""
     return [
         {
@@ -36,35 +41,22 @@ def format_server_stats(server_stats, db: Session) -> List[dict]:
             "server_name": s.name,
             "total_orders": s.total or 0,
             "total_profit": round(s.profit or 0, 2),
-            "open_orders": db.query(func.count(models.MoonBotOrder.id)).filter(
-                models.MoonBotOrder.server_id == s.id,
-                models.MoonBotOrder.status == "Open"
-            ).scalar() or 0,
-            "winrate": round(
-                (db.query(func.count(models.MoonBotOrder.id)).filter(
-                    models.MoonBotOrder.server_id == s.id,
-                    models.MoonBotOrder.profit_btc > 0
-                ).scalar() / s.total * 100) if s.total > 0 else 0.0, 2
-            )
+            "open_orders": open_by_server.get(s.id, 0),
+            "winrate": _winrate(s.wins, s.total)
         }
         for s in server_stats
     ]
 
 
-def format_symbol_stats(symbol_stats, base_query: Query) -> List[dict]:
+def format_symbol_stats(symbol_stats) -> List[dict]:
     """Форматировать статистику по символам"""
     return [
         {
             "symbol": s.symbol or "UNKNOWN",
             "total_orders": s.total or 0,
             "total_profit": round(s.profit or 0, 2),
-            "avg_profit_percent": round(s.avg_profit_percent or 0, 2),
-            "winrate": round(
-                (base_query.filter(
-                    models.MoonBotOrder.symbol == s.symbol,
-                    models.MoonBotOrder.profit_btc > 0
-                ).count() / s.total * 100) if s.total > 0 else 0.0, 2
-            )
+            "avg_profit_percent": _avg_profit_percent(s),
+            "winrate": _winrate(s.wins, s.total)
         }
         for s in symbol_stats
     ]
@@ -1,13 +1,18 @@
 """
 Запросы к БД для trading stats
 
-Функции построения SQL запросов для статистики
+Функции построения SQL запросов для статистики.
+
+Агрегаты закрытых ордеров читаются из дневного rollup (order_stats_daily),
+поэтому запросы возвращают O(дней) строк вместо O(ордеров), в том числе
+для просадки и серий (склейка бакетов по времени закрытия).
+Из moonbot_orders читаются только открытые ордера и топ сделок.
 """
 from sqlalchemy.orm import Session, Query
-from sqlalchemy import func, case
-from typing import Optional
+from sqlalchemy import func
+from typing import Optional, Dict, List
 from models import models
-from .filters import apply_all_filters
+from .filters import apply_all_filters, apply_all_rollup_filters
 
 
 def build_base_query(db: Session, user_id: int) -> Query:
@@ -21,40 +26,122 @@ def build_base_query(db: Session, user_id: int) -> Query:
     )
 
 
-def get_strategy_stats(db: Session, user_id: int, server_ids: Optional[str],
-                      strategies: Optional[str], emulator: Optional[str]):
-    """Получить статистику по стратегиям (только закрытые ордера)"""
-    query = db.query(
-        models.MoonBotOrder.strategy,
-        func.count(models.MoonBotOrder.id).label('total'),
-        func.sum(models.MoonBotOrder.profit_btc).label('profit'),
-        func.avg(models.MoonBotOrder.profit_percent).label('avg_profit_percent')
-    ).join(
+def build_rollup_query(db: Session, user_id: int, *columns) -> Query:
+    """Построить запрос к дневным агрегатам серверов пользователя"""
+    return db.query(*columns).select_from(models.OrderStatsDaily).join(
         models.Server,
-        models.MoonBotOrder.server_id == models.Server.id
+        models.OrderStatsDaily.server_id == models.Server.id
     ).filter(
         models.Server.user_id == user_id,
-        models.MoonBotOrder.status == "Closed"
+        models.OrderStatsDaily.user_id == user_id
     )
-    
-    query = apply_all_filters(query, server_ids, strategies, emulator, None, None, None)
-    return query.group_by(models.MoonBotOrder.strategy).all()
+
+
+def _summary_columns():
+    """Суммы агрегатов (общие для overall и сравнения периодов)"""
+    rollup = models.OrderStatsDaily
+    return (
+        func.coalesce(func.sum(rollup.orders_count), 0).label('total'),
+        func.coalesce(func.sum(rollup.wins), 0).label('wins'),
+        func.coalesce(func.sum(rollup.losses), 0).label('losses'),
+        func.coalesce(func.sum(rollup.gross_profit), 0.0).label('gross_profit'),
+        func.coalesce(func.sum(rollup.gross_loss), 0.0).label('gross_loss'),
+        func.coalesce(func.sum(rollup.spent_sum), 0.0).label('spent'),
+        func.coalesce(func.sum(rollup.duration_sum), 0.0).label('duration_sum'),
+        func.coalesce(func.sum(rollup.duration_count), 0).label('duration_count'),
+    )
+
+
+def get_overall_stats(db: Session, user_id: int, server_ids: Optional[str],
+                      strategies: Optional[str], emulator: Optional[str],
+                      time_period: Optional[str], date_from: Optional[str],
+                      date_to: Optional[str]):
+    """Получить общие суммы по закрытым ордерам (один запрос к rollup)"""
+    query = build_rollup_query(db, user_id, *_summary_columns())
+    query = apply_all_rollup_filters(query, server_ids, strategies, emulator, time_period, date_from, date_to)
+    return query.one()
+
+
+def get_period_summary(db: Session, user_id: int, start_day, end_day,
+                       server_ids: Optional[str], strategies: Optional[str],
+                       emulator: Optional[str]):
+    """Получить суммы за диапазон дней [start_day, end_day)"""
+    query = build_rollup_query(db, user_id, *_summary_columns()).filter(
+        models.OrderStatsDaily.day >= start_day,
+        models.OrderStatsDaily.day < end_day
+    )
+    query = apply_all_rollup_filters(query, server_ids, strategies, emulator, None, None, None)
+    return query.one()
+
+
+def get_equity_buckets(db: Session, user_id: int, server_ids: Optional[str],
+                       strategies: Optional[str], emulator: Optional[str],
+                       time_period: Optional[str], date_from: Optional[str],
+                       date_to: Optional[str]):
+    """Получить бакеты в порядке первого закрытия (для просадки и серий)"""
+    rollup = models.OrderStatsDaily
+    query = build_rollup_query(
+        db, user_id,
+        rollup.gross_profit, rollup.gross_loss,
+        rollup.equity_min, rollup.equity_max, rollup.max_drawdown,
+        rollup.wins, rollup.losses,
+        rollup.win_streak_head, rollup.win_streak_tail, rollup.win_streak_max,
+        rollup.loss_streak_head, rollup.loss_streak_tail, rollup.loss_streak_max,
+        rollup.first_closed_at, rollup.last_closed_at
+    )
+    query = apply_all_rollup_filters(query, server_ids, strategies, emulator, time_period, date_from, date_to)
+    return query.order_by(rollup.day.asc(), rollup.first_closed_at.asc(), rollup.id.asc()).all()
+
+
+def get_top_orders(db: Session, user_id: int, server_ids: Optional[str],
+                   strategies: Optional[str], emulator: Optional[str],
+                   time_period: Optional[str], date_from: Optional[str],
+                   date_to: Optional[str], profitable: bool, limit: int = 10):
+    """Получить самые прибыльные (или убыточные) закрытые сделки"""
+    query = build_base_query(db, user_id)
+    query = apply_all_filters(query, server_ids, strategies, emulator, time_period, date_from, date_to)
+    if profitable:
+        query = query.filter(models.MoonBotOrder.profit_btc > 0).order_by(models.MoonBotOrder.profit_btc.desc())
+    else:
+        query = query.filter(models.MoonBotOrder.profit_btc < 0).order_by(models.MoonBotOrder.profit_btc.asc())
+    return query.limit(limit).all()
+
+
+def _group_columns():
+    """Колонки групповой статистики"""
+    rollup = models.OrderStatsDaily
+    return (
+        func.sum(rollup.orders_count).label('total'),
+        func.sum(rollup.wins).label('wins'),
+        func.sum(rollup.gross_profit - rollup.gross_loss).label('profit'),
+        func.sum(rollup.profit_percent_sum).label('profit_percent_sum'),
+        func.sum(rollup.profit_percent_count).label('profit_percent_count'),
+    )
+
+
+def get_strategy_stats(db: Session, user_id: int, server_ids: Optional[str],
+                      strategies: Optional[str], emulator: Optional[str]):
+    """Получить статистику по стратегиям (только закрытые ордера)"""
+    rollup = models.OrderStatsDaily
+    query = build_rollup_query(db, user_id, rollup.strategy, *_group_columns())
+    query = apply_all_rollup_filters(query, server_ids, strategies, emulator, None, None, None)
+    return query.group_by(rollup.strategy).all()
 
 
 def get_server_stats(db: Session, user_id: int, server_ids: Optional[str],
                     strategies: Optional[str]):
     """Получить статистику по серверам (только закрытые ордера)"""
+    rollup = models.OrderStatsDaily
     query = db.query(
         models.Server.id,
         models.Server.name,
-        func.count(models.MoonBotOrder.id).label('total'),
-        func.sum(models.MoonBotOrder.profit_btc).label('profit')
+        *_group_columns()
     ).join(
-        models.MoonBotOrder,
-        models.Server.id == models.MoonBotOrder.server_id
+        rollup,
+        models.Server.id == rollup.server_id
     ).filter(
         models.Server.user_id == user_id,
-        models.MoonBotOrder.status == "Closed"
+        rollup.user_id == user_id
     )
     
     if server_ids and server_ids != "all":
@@ -66,7 +153,7 @@ def get_server_stats(db: Session, user_id: int, server_ids: Optional[str],
     
     if strategies and strategies != "all":
         strategy_list = [s.strip() for s in strategies.split(',')]
-        query = query.filter(models.MoonBotOrder.strategy.in_(strategy_list))
+        query = query.filter(rollup.strategy.in_(strategy_list))
     
     return query.group_by(models.Server.id, models.Server.name).all()
 
@@ -74,89 +161,90 @@ def get_server_stats(db: Session, user_id: int, server_ids: Optional[str],
 def get_symbol_stats(db: Session, user_id: int, server_ids: Optional[str],
                     strategies: Optional[str]):
     """Получить статистику по символам (только закрытые ордера)"""
-    query = db.query(
-        models.MoonBotOrder.symbol,
-        func.count(models.MoonBotOrder.id).label('total'),
-        func.sum(models.MoonBotOrder.profit_btc).label('profit'),
-        func.avg(models.MoonBotOrder.profit_percent).label('avg_profit_percent')
-    ).join(
-        models.Server,
-        models.MoonBotOrder.server_id == models.Server.id
-    ).filter(
-        models.Server.user_id == user_id,
-        models.MoonBotOrder.status == "Closed"
-    )
+    rollup = models.OrderStatsDaily
+    query = build_rollup_query(db, user_id, rollup.symbol, *_group_columns())
     
     if server_ids and server_ids != "all":
         try:
             server_id_list = [int(sid.strip()) for sid in server_ids.split(',')]
-            query = query.filter(models.MoonBotOrder.server_id.in_(server_id_list))
+            query = query.filter(rollup.server_id.in_(server_id_list))
         except (ValueError, AttributeError):
             pass  # Неверный формат - игнорируем фильтр
     
     if strategies and strategies != "all":
         strategy_list = [s.strip() for s in strategies.split(',')]
-        query = query.filter(models.MoonBotOrder.strategy.in_(strategy_list))
+        query = query.filter(rollup.strategy.in_(strategy_list))
     
-    return query.group_by(models.MoonBotOrder.symbol).order_by(
-        func.sum(models.MoonBotOrder.profit_btc).desc()
+    return query.group_by(rollup.symbol).order_by(
+        func.sum(rollup.gross_profit - rollup.gross_loss).desc()
     ).all()
 
 
-def get_profit_by_date(db: Session, user_id: int, server_ids: Optional[str],
-                      strategies: Optional[str], emulator: Optional[str],
-                      time_period: Optional[str], date_from: Optional[str],
-                      date_to: Optional[str]):
-    """Получить прибыль по датам"""
-    from datetime import datetime, timedelta
-    
-    query = db.query(
-        func.date(models.MoonBotOrder.closed_at).label('date'),
-        func.sum(models.MoonBotOrder.profit_btc).label('profit')
-    ).join(
+def get_daily_stats(db: Session, user_id: int, server_ids: Optional[str],
+                    strategies: Optional[str], emulator: Optional[str],
+                    time_period: Optional[str], date_from: Optional[str],
+                    date_to: Optional[str]):
+    """Получить прибыль и винрейт по датам (для обоих графиков)"""
+    rollup = models.OrderStatsDaily
+    query = build_rollup_query(
+        db, user_id,
+        rollup.day.label('date'),
+        func.sum(rollup.gross_profit - rollup.gross_loss).label('profit'),
+        func.sum(rollup.orders_count).label('total'),
+        func.sum(rollup.wins).label('wins')
+    )
+    query = apply_all_rollup_filters(query, server_ids, strategies, emulator, time_period, date_from, date_to)
+    return query.group_by(rollup.day).order_by(rollup.day).all()
+
+
+def get_open_orders_count(db: Session, user_id: int, server_ids: Optional[str],
+                          strategies: Optional[str], emulator: Optional[str],
+                          time_period: Optional[str], date_from: Optional[str],
+                          date_to: Optional[str]) -> int:
+    """Получить количество открытых ордеров"""
+    query = db.query(func.count(models.MoonBotOrder.id)).join(
         models.Server,
         models.MoonBotOrder.server_id == models.Server.id
     ).filter(
         models.Server.user_id == user_id,
-        models.MoonBotOrder.status == "Closed",
-        models.MoonBotOrder.closed_at.isnot(None)
+        models.MoonBotOrder.status == "Open"
     )
-    
     query = apply_all_filters(query, server_ids, strategies, emulator, time_period, date_from, date_to)
-    return query.group_by(func.date(models.MoonBotOrder.closed_at)).order_by('date').all()
+    return query.scalar() or 0
 
 
-def get_winrate_by_date(db: Session, user_id: int, server_ids: Optional[str],
-                       strategies: Optional[str], emulator: Optional[str],
-                       time_period: Optional[str], date_from: Optional[str],
-                       date_to: Optional[str]):
-    """Получить винрейт по датам"""
-    query = db.query(
-        func.date(models.MoonBotOrder.closed_at).label('date'),
-        func.count(models.MoonBotOrder.id).label('total'),
-        func.sum(case((models.MoonBotOrder.profit_btc > 0, 1), else_=0)).label('wins')
+def get_open_orders_by_server(db: Session, user_id: int) -> Dict[int, int]:
+    """Получить количество открытых ордеров по серверам (один запрос)"""
+    rows = db.query(
+        models.MoonBotOrder.server_id,
+        func.count(models.MoonBotOrder.id)
     ).join(
         models.Server,
         models.MoonBotOrder.server_id == models.Server.id
     ).filter(
         models.Server.user_id == user_id,
-        models.MoonBotOrder.status == "Closed",
-        models.MoonBotOrder.closed_at.isnot(None)
-    )
-    
-    query = apply_all_filters(query, server_ids, strategies, emulator, time_period, date_from, date_to)
-    return query.group_by(func.date(models.MoonBotOrder.closed_at)).order_by('date').all()
+        models.MoonBotOrder.status == "Open"
+    ).group_by(models.MoonBotOrder.server_id).all()
+    return {server_id: count for server_id, count in rows}
 
 
 def get_available_strategies(db: Session, user_id: int):
-    """Получить список всех доступных стратегий"""
-    return db.query(models.MoonBotOrder.strategy).join(
+    """Получить список всех доступных стратегий (закрытые - из rollup, остальные - из ордеров)"""
+    closed_strategies = build_rollup_query(
+        db, user_id, models.OrderStatsDaily.strategy.label('strategy')
+    ).filter(models.OrderStatsDaily.strategy != "")
+    
+    other_strategies = db.query(models.MoonBotOrder.strategy.label('strategy')).join(
         models.Server,
         models.MoonBotOrder.server_id == models.Server.id
     ).filter(
         models.Server.user_id == user_id,
+        models.MoonBotOrder.status != "Closed",
         models.MoonBotOrder.strategy.isnot(None)
-    ).distinct().all()
+    )
+    
+    # UNION убирает дубликаты
+    return closed_strategies.union(other_strategies).all()
 
 
 def get_available_servers(db: Session, user_id: int):
@@ -165,7 +253,3 @@ def get_available_servers(db: Session, user_id: int):
         models.Server.user_id == user_id,
         models.Server.is_active == True
     ).all()
-
-
-
-
@@ -72,6 +72,28 @@ async def _init_high_load_components() -> None:
     except Exception as e:
         log(f"[STARTUP] Batch Processor init failed: {e}", level="WARNING")
     
+    # Конвейер графиков: разбор вне потоков шардов, запись через Batch Processor
+    try:
+        from services.udp.chart_pipeline import start_chart_pipeline
+        start_chart_pipeline()
+    except Exception as e:
+        log(f"[STARTUP] Chart pipeline init failed: {e}", level="WARNING")
+    
+    # Последние балансы/online статусы серверов (запись в БД пакетами)
+    try:
+        from services.udp.server_state import start_server_state
+        start_server_state()
+        log("[STARTUP] ✅ Server state store started")
+    except Exception as e:
+        log(f"[STARTUP] Server state store init failed: {e}", level="WARNING")
+    
+    # Статусы listener'ов: периодический bulk upsert udp_listener_status
+    try:
+        from services.udp.listener_status import start_status_flush_thread
+        start_status_flush_thread()
+    except Exception as e:
+        log(f"[STARTUP] Listener status flusher init failed: {e}", level="WARNING")
+    
     # Инициализация Redis кэша (с fallback на in-memory)
     try:
         from services.redis_cache import get_redis_cache
@@ -126,6 +148,92 @@ async def _init_high_load_components() -> None:
     except Exception as e:
         log(f"[STARTUP] Missing indexes migration skipped: {e}", level="DEBUG")
     
+    # Уникальный ключ strategy_cache (нужен для INSERT ... ON CONFLICT в Batch Processor)
+    try:
+        from updates.versions.add_strategy_cache_unique_key import (
+            check_migration_needed as check_strategy_key_migration,
+            run_migration as run_strategy_key_migration
+        )
+        if check_strategy_key_migration():
+            log("[STARTUP] Applying strategy_cache unique key migration...")
+            run_strategy_key_migration()
+            log("[STARTUP] ✅ strategy_cache unique key applied")
+        else:
+            log("[STARTUP] ✅ strategy_cache unique key already exists")
+    except Exception as e:
+        log(f"[STARTUP] strategy_cache unique key migration failed: {e}", level="WARNING")
+    
+    # Уникальный ключ moonbot_charts (upsert графиков в Batch Processor)
+    try:
+        from updates.versions.add_moonbot_charts_unique_key import (
+            check_migration_needed as check_chart_key_migration,
+            run_migration as run_chart_key_migration
+        )
+        if check_chart_key_migration():
+            log("[STARTUP] Applying moonbot_charts unique key migration...")
+            run_chart_key_migration()
+            log("[STARTUP] ✅ moonbot_charts unique key applied")
+        else:
+            log("[STARTUP] ✅ moonbot_charts unique key already exists")
+    except Exception as e:
+        log(f"[STARTUP] moonbot_charts unique key migration failed: {e}", level="WARNING")
+    
+    # Rollup статистики ордеров (order_stats_daily для /api/trading-stats)
+    try:
+        from updates.versions.add_order_stats_rollup import (
+            check_migration_needed as check_order_stats_migration,
+            run_migration as run_order_stats_migration
+        )
+        if check_order_stats_migration():
+            log("[STARTUP] Rebuilding order stats rollup...")
+            run_order_stats_migration()
+            log("[STARTUP] ✅ Order stats rollup rebuilt")
+        else:
+            log("[STARTUP] ✅ Order stats rollup is up to date")
+    except Exception as e:
+        log(f"[STARTUP] Order stats rollup migration failed: {e}", level="WARNING")
+    
+    # События сессий SessionLocal: rollup статистики обновляется в транзакции
+    # ордеров, кэш открытых ордеров - после commit (до старта listener'ов)
+    try:
+        from services.order_stats_rollup import install_order_stats_hooks
+        from services.udp.open_order_cache import install_open_order_cache_hooks
+        install_order_stats_hooks()
+        install_open_order_cache_hooks()
+        log("[STARTUP] ✅ Order stats rollup and open order cache hooks installed")
+    except Exception as e:
+        log(f"[STARTUP] Order session hooks failed: {e}", level="ERROR")
+    
+    # Компактное хранение графиков (moonbot_charts.chart_blob)
+    try:
+        from updates.versions.compact_chart_storage import (
+            check_migration_needed as check_chart_storage_migration,
+            run_migration as run_chart_storage_migration
+        )
+        if check_chart_storage_migration():
+            log("[STARTUP] Converting charts to compact storage...")
+            run_chart_storage_migration()
+            log("[STARTUP] ✅ Charts converted to compact storage")
+        else:
+            log("[STARTUP] ✅ Chart storage is up to date")
+    except Exception as e:
+        log(f"[STARTUP] Compact chart storage migration failed: {e}", level="WARNING")
+    
+    # Сводка графиков для списков (moonbot_charts.points_count / min_price / max_price)
+    try:
+        from updates.versions.add_moonbot_charts_summary import (
+            check_migration_needed as check_chart_summary_migration,
+            run_migration as run_chart_summary_migration
+        )
+        if check_chart_summary_migration():
+            log("[STARTUP] Summarizing charts for chart lists...")
+            run_chart_summary_migration()
+            log("[STARTUP] ✅ Chart summaries computed")
+        else:
+            log("[STARTUP] ✅ Chart summaries are up to date")
+    except Exception as e:
+        log(f"[STARTUP] Chart summary migration failed: {e}", level="WARNING")
+    
     # Применение миграции для scheduled_command_servers (group_name)
     try:
         from updates.versions.add_scheduled_command_servers_group_name import (
@@ -482,6 +590,13 @@ async def shutdown_handler() -> None:
     udp.stop_all_listeners()
     log("[SHUTDOWN] UDP listeners stopped")
     
+    # Закрываем asyncio endpoint'ы UDP клиента команд
+    try:
+        from services.udp_endpoint_pool import close_endpoint_pools
+        close_endpoint_pools()
+    except Exception as e:
+        log(f"[SHUTDOWN] UDP client endpoints close skipped: {e}", level="DEBUG")
+    
     # Останавливаем Worker Pool (обработка оставшихся сообщений)
     try:
         from services.udp.worker_pool import stop_worker_pool, get_worker_pool
@@ -494,6 +609,28 @@ async def shutdown_handler() -> None:
     except Exception as e:
         log(f"[SHUTDOWN] Worker Pool stop skipped: {e}", level="DEBUG")
     
+    # Разбираем графики из очереди (строки уходят в Batch Processor)
+    try:
+        from services.udp.chart_pipeline import stop_chart_pipeline
+        stop_chart_pipeline()
+    except Exception as e:
+        log(f"[SHUTDOWN] Chart pipeline stop skipped: {e}", level="DEBUG")
+    
+    # Финальный flush статусов listener'ов
+    try:
+        from services.udp.listener_status import stop_status_flush_thread
+        stop_status_flush_thread()
+    except Exception as e:
+        log(f"[SHUTDOWN] Listener status flush skipped: {e}", level="DEBUG")
+    
+    # Записываем последние балансы/статусы (балансы - через Batch Processor)
+    try:
+        from services.udp.server_state import stop_server_state
+        stop_server_state()
+        log("[SHUTDOWN] Server state store stopped")
+    except Exception as e:
+        log(f"[SHUTDOWN] Server state store stop skipped: {e}", level="DEBUG")
+    
     # Останавливаем Batch Processor (flush remaining data)
     try:
         from services.udp.batch_processor import stop_batch_processor, get_batch_processor
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Float, Index
+from sqlalchemy import Column, Integer, String, Boolean, Date, DateTime, ForeignKey, Text, Float, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from models.database import Base
 from utils.datetime_utils import utcnow
@@ -349,6 +349,68 @@ class MoonBotOrder(Base):
     )
 
 
+class OrderStatsDaily(Base):
+    """
+    Дневные агрегаты закрытых ордеров (rollup для /api/trading-stats)
+    
+    Одна строка на (user, server, strategy, symbol, emulator, день закрытия).
+    Обновляется инкрементально при закрытии/изменении ордеров
+    (services/order_stats_rollup.py), поэтому статистика читает O(дней)
+    строк вместо O(ордеров).
+    
+    Пустая стратегия/символ хранятся как '' (NULL не участвует в уникальном ключе).
+    """
+    __tablename__ = "order_stats_daily"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    server_id = Column(Integer, ForeignKey("servers.id", ondelete="CASCADE"), nullable=False)
+    strategy = Column(String, nullable=False, default="")
+    symbol = Column(String, nullable=False, default="")
+    is_emulator = Column(Boolean, nullable=False, default=False)
+    day = Column(Date, nullable=False)  # Дата closed_at
+    
+    # === СЧЁТЧИКИ ===
+    orders_count = Column(Integer, nullable=False, default=0)
+    wins = Column(Integer, nullable=False, default=0)  # profit_btc > 0
+    losses = Column(Integer, nullable=False, default=0)  # profit_btc < 0
+    
+    # === СУММЫ ===
+    gross_profit = Column(Float, nullable=False, default=0.0)  # Сумма прибыльных сделок
+    gross_loss = Column(Float, nullable=False, default=0.0)  # Сумма убыточных (по модулю)
+    spent_sum = Column(Float, nullable=False, default=0.0)
+    profit_percent_sum = Column(Float, nullable=False, default=0.0)
+    profit_percent_count = Column(Integer, nullable=False, default=0)
+    duration_sum = Column(Float, nullable=False, default=0.0)  # Секунды (opened_at → closed_at)
+    duration_count = Column(Integer, nullable=False, default=0)
+    
+    # === КРИВАЯ КАПИТАЛА ВНУТРИ ДНЯ (относительно начала дня) ===
+    equity_min = Column(Float, nullable=False, default=0.0)
+    equity_max = Column(Float, nullable=False, default=0.0)
+    max_drawdown = Column(Float, nullable=False, default=0.0)
+    
+    # === СЕРИИ (начало/конец/максимум) - склеиваются между днями ===
+    win_streak_head = Column(Integer, nullable=False, default=0)
+    win_streak_tail = Column(Integer, nullable=False, default=0)
+    win_streak_max = Column(Integer, nullable=False, default=0)
+    loss_streak_head = Column(Integer, nullable=False, default=0)
+    loss_streak_tail = Column(Integer, nullable=False, default=0)
+    loss_streak_max = Column(Integer, nullable=False, default=0)
+    
+    first_closed_at = Column(DateTime)
+    last_closed_at = Column(DateTime)
+    updated_at = Column(DateTime, default=utcnow, onupdate=utcnow)
+    
+    __table_args__ = (
+        Index(
+            'ix_order_stats_daily_key',
+            'user_id', 'server_id', 'strategy', 'symbol', 'is_emulator', 'day',
+            unique=True
+        ),
+        Index('ix_order_stats_daily_user_day', 'user_id', 'day'),
+    )
+
+
 class UDPListenerStatus(Base):
     """Статус UDP Listener для каждого сервера"""
     __tablename__ = "udp_listener_status"
@@ -425,9 +487,9 @@ class StrategyCache(Base):
     
     server = relationship("Server")
     
-    # Композитный индекс для быстрого поиска
+    # Уникальный композитный индекс (ключ ON CONFLICT для batch upsert)
     __table_args__ = (
-        Index('ix_strategy_cache_server_pack', 'server_id', 'pack_number'),
+        Index('ix_strategy_cache_server_pack', 'server_id', 'pack_number', unique=True),
     )
 
 
@@ -472,13 +534,20 @@ class MoonBotChart(Base):
     start_time = Column(DateTime, nullable=True)
     end_time = Column(DateTime, nullable=True)
     session_profit = Column(Float, nullable=True)  # Профит сессии
-    chart_data = Column(Text, nullable=True)  # JSON с данными графика (история цен, свечи и т.д.)
+    chart_data = Column(Text, nullable=True)  # JSON с данными графика (старый формат, до миграции compact_chart_storage)
+    chart_blob = Column(LargeBinary, nullable=True)  # Компактный колоночный формат (services/chart_parser/compact.py)
+    storage_error = Column(String, nullable=True)  # Почему chart_data не переведён в chart_blob (JSON сохранён)
     raw_data = Column(Text, nullable=True)  # Base64 закодированные сырые данные (опционально)
+    # Сводка для списков графиков (считается при разборе, список не читает данные графика)
+    points_count = Column(Integer, nullable=True)  # Точек в рядах и свечах
+    min_price = Column(Float, nullable=True)  # Минимальная цена истории и трейдов
+    max_price = Column(Float, nullable=True)  # Максимальная цена истории и трейдов
     received_at = Column(DateTime, default=utcnow)
     
     server = relationship("Server")
     
     __table_args__ = (
-        Index('ix_moonbot_charts_server_order', 'server_id', 'order_db_id'),
+        # Уникальный: upsert графиков через INSERT ... ON CONFLICT (Batch Processor)
+        Index('ix_moonbot_charts_server_order', 'server_id', 'order_db_id', unique=True),
     )
 
@@ -24,12 +24,17 @@ from .models import (
     MiniCandle,
     DeltaVolumes,
     ChartData,
+    PriceSeries,
+    OrderColumns,
+    CandleColumns,
+    ColumnarChartData,
 )
 
 from .binary_reader import BinaryReader
 
 from .parser import (
     parse_chart_binary,
+    parse_chart_columnar,
     parse_header,
     parse_chart_packet,
     is_chart_packet,
@@ -37,6 +42,23 @@ from .parser import (
 
 from .assembler import ChartFragmentAssembler
 
+from .compact import (
+    COMPACT_FORMAT_VERSION,
+    CompactFormatError,
+    encode_chart,
+    decode_chart,
+    is_compact_chart,
+    chart_to_dict,
+    chart_from_dict,
+)
+
+from .downsample import (
+    LOD_BUCKETS,
+    ChartLevels,
+    ChartLevelsCache,
+    chart_points,
+)
+
 
 __all__ = [
     # Constants
@@ -53,14 +75,32 @@ __all__ = [
     'MiniCandle',
     'DeltaVolumes',
     'ChartData',
+    'PriceSeries',
+    'OrderColumns',
+    'CandleColumns',
+    'ColumnarChartData',
     # Reader
     'BinaryReader',
     # Parser functions
     'parse_chart_binary',
+    'parse_chart_columnar',
     'parse_header',
     'parse_chart_packet',
     'is_chart_packet',
     # Assembler
     'ChartFragmentAssembler',
+    # Compact storage
+    'COMPACT_FORMAT_VERSION',
+    'CompactFormatError',
+    'encode_chart',
+    'decode_chart',
+    'is_compact_chart',
+    'chart_to_dict',
+    'chart_from_dict',
+    # Level of detail
+    'LOD_BUCKETS',
+    'ChartLevels',
+    'ChartLevelsCache',
+    'chart_points',
 ]
 
@@ -1,14 +1,29 @@
 """
 Сборщик фрагментированных пакетов графиков
 
-Thread-safe реализация для поддержки многопоточной обработки.
+Thread-safe реализация для поддержки многопоточной обработки:
+один сборщик на все серверы, незавершённые графики различаются
+по (server_id, order_id).
+
+Память ограничена:
+- общий бюджет (max_total_bytes) и бюджет сервера (max_server_bytes)
+  на распакованные данные незавершённых графиков; при превышении
+  вытесняются давно не получавшие фрагментов графики (LRU)
+- незавершённый график без новых фрагментов дольше timeout_seconds
+  вытесняется колесом таймеров (expire() - на каждом фрагменте
+  и периодически извне), поэтому потерянный последний фрагмент
+  не оставляет график в памяти
+
+Каждый фрагмент MoonBot сжат GZIP отдельно - распаковывается один
+раз при приёме (вне блокировки), с ограничением размера бюджетом.
 """
 
-import gzip
-import time
 import logging
 import threading
-from typing import Dict, Optional, Tuple
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
 
 from .constants import HEADER_SIZE, GZIP_MAGIC
 from .models import ChartHeader
@@ -16,128 +31,268 @@ from .parser import parse_header
 
 logger = logging.getLogger(__name__)
 
+ChartKey = Tuple[int, int]  # (server_id, order_id)
+
+
+class _PendingChart:
+    """Незавершённый график: фрагменты по номерам блоков"""
+
+    __slots__ = ('key', 'blocks', 'received', 'size', 'slot')
+
+    def __init__(self, key: ChartKey, blocks_count: int):
+        self.key = key
+        self.blocks: List[Optional[bytes]] = [None] * blocks_count
+        self.received = 0
+        self.size = 0
+        self.slot = 0  # Ячейка колеса таймеров (тик истечения)
+
 
 class ChartFragmentAssembler:
     """
     Сборщик фрагментированных пакетов графиков
-    
+
     Thread-safe: все операции защищены блокировкой.
+
+    Колесо таймеров: ячейка = тик (tick_seconds), график лежит в ячейке
+    тика своего истечения и переносится при каждом фрагменте. Порядок
+    внутри ячейки - порядок последнего фрагмента, поэтому обход ячеек
+    от текущего тика даёт графики в LRU порядке.
     """
 
-    def __init__(self):
-        # {order_id: {block_num: bytes}}
-        self.fragments: Dict[int, Dict[int, bytes]] = {}
-        self.expected_counts: Dict[int, int] = {}
-        self.timestamps: Dict[int, float] = {}
+    def __init__(self, max_total_bytes: int = 256 * 1024 * 1024,
+                 max_server_bytes: int = 16 * 1024 * 1024,
+                 timeout_seconds: float = 60.0, tick_seconds: float = 1.0):
+        self.max_total_bytes = max_total_bytes
+        self.max_server_bytes = max_server_bytes
+        self.timeout_seconds = timeout_seconds
+        self.tick_seconds = tick_seconds
+
+        self._wheel_size = int(timeout_seconds / tick_seconds) + 2
+        self._wheel: List[Dict[ChartKey, _PendingChart]] = [{} for _ in range(self._wheel_size)]
+        self._tick = self._now_tick()
+
+        self._pending: Dict[ChartKey, _PendingChart] = {}
+        # Незавершённые графики сервера в LRU порядке (для бюджета сервера)
+        self._servers: Dict[int, 'OrderedDict[int, _PendingChart]'] = {}
+        self._server_bytes: Dict[int, int] = {}
+        self._total_bytes = 0
+
+        self.completed = 0
+        self.expired = 0
+        self.evicted_total_budget = 0
+        self.evicted_server_budget = 0
+        self.rejected = 0  # Фрагменты, не помещающиеся в бюджет сервера / битые
         # Lock для thread-safety
         self._lock = threading.Lock()
 
-    def add_fragment(self, data: bytes) -> Optional[Tuple[ChartHeader, bytes]]:
+    def _now_tick(self) -> int:
+        return int(time.monotonic() / self.tick_seconds)
+
+    def add_fragment(self, data: bytes, server_id: int = 0) -> Optional[Tuple[ChartHeader, bytes]]:
         """
         Добавить фрагмент и попытаться собрать полный пакет
 
         Thread-safe операция.
 
+        Args:
+            data: Пакет фрагмента (заголовок + данные)
+            server_id: Сервер, от которого пришёл фрагмент
+
         Returns:
             (header, complete_data) если все фрагменты получены, иначе None
         """
         header = parse_header(data)
-        if not header:
+        if not header or header.blocks_count == 0 or header.block_num >= header.blocks_count:
             return None
 
-        order_id = header.order_id
-        block_num = header.block_num
-        blocks_count = header.blocks_count
-
-        # Сохраняем фрагмент (без заголовка)
+        # Сохраняем фрагмент (без заголовка), GZIP распаковывается вне lock'а
         fragment_data = data[HEADER_SIZE:]
-        
-        # Распаковываем GZIP если нужно
         if fragment_data[:2] == GZIP_MAGIC:
             try:
-                fragment_data = gzip.decompress(fragment_data)
-            except Exception as e:
+                # +1 байт сверх лимита - чтобы отличить "ровно лимит" от "больше"
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                fragment_data = decompressor.decompress(fragment_data, self.max_server_bytes + 1)
+            except zlib.error as e:
                 logger.error(f"[CHART-ASSEMBLER] GZIP error for fragment: {e}")
+                with self._lock:
+                    self.rejected += 1
                 return None
 
+        key = (server_id, header.order_id)
+        size = len(fragment_data)
+
         with self._lock:
-            # Инициализируем хранилище для этого ордера
-            if order_id not in self.fragments:
-                self.fragments[order_id] = {}
-                self.expected_counts[order_id] = blocks_count
-                self.timestamps[order_id] = time.time()
+            self._advance_unlocked()
 
-            self.fragments[order_id][block_num] = fragment_data
+            if size > self.max_server_bytes:
+                self._drop_unlocked(key)
+                self.rejected += 1
+                logger.warning(f"[CHART-ASSEMBLER] Fragment of order {header.order_id} (server {server_id}) "
+                               f"exceeds server budget: {size} bytes")
+                return None
 
-            logger.debug(
-                f"[CHART-ASSEMBLER] Fragment {block_num + 1}/{blocks_count} for order {order_id}, "
-                f"collected: {len(self.fragments[order_id])}"
-            )
+            chart = self._pending.get(key)
+            if chart is not None and len(chart.blocks) != header.blocks_count:
+                # Новая отправка графика с другим числом блоков - старая сборка не завершится
+                self._drop_unlocked(key)
+                chart = None
+            if chart is None:
+                chart = _PendingChart(key, header.blocks_count)
+                self._pending[key] = chart
+                self._servers.setdefault(server_id, OrderedDict())[header.order_id] = chart
+            else:
+                self._servers[server_id].move_to_end(header.order_id)
 
-            # Проверяем, все ли фрагменты получены
-            if len(self.fragments[order_id]) < self.expected_counts[order_id]:
-                return None
+            previous = chart.blocks[header.block_num]
+            if previous is None:
+                chart.received += 1
+            else:
+                self._charge_unlocked(chart, -len(previous))
+            chart.blocks[header.block_num] = fragment_data
+            self._charge_unlocked(chart, size)
 
-            # Собираем полные данные (внутри lock)
-            complete_data = self._assemble_unlocked(order_id)
-            if complete_data:
+            if chart.received == len(chart.blocks):
+                self._drop_unlocked(key)
+                self.completed += 1
+                complete_data = b''.join(chart.blocks)
+                logger.debug(f"[CHART-ASSEMBLER] Assembled {len(complete_data)} bytes for order {header.order_id}")
                 return (header, complete_data)
+
+            self._schedule_unlocked(chart)
+            self._enforce_budgets_unlocked(server_id, keep=key)
             return None
 
-    def _assemble_unlocked(self, order_id: int) -> Optional[bytes]:
+    # ==================== КОЛЕСО ТАЙМЕРОВ ====================
+
+    def _schedule_unlocked(self, chart: _PendingChart) -> None:
+        """Перенести график в ячейку тика истечения (в конец - самый свежий)"""
+        self._wheel[chart.slot % self._wheel_size].pop(chart.key, None)
+        chart.slot = self._tick + self._wheel_size - 1
+        self._wheel[chart.slot % self._wheel_size][chart.key] = chart
+
+    def _advance_unlocked(self) -> None:
+        """Провернуть колесо до текущего тика, вытеснив истёкшие графики"""
+        now_tick = self._now_tick()
+        if now_tick <= self._tick:
+            return
+
+        # Пропущено больше оборота - достаточно обойти все ячейки один раз
+        steps = min(now_tick - self._tick, self._wheel_size)
+        expired = 0
+        for step in range(1, steps + 1):
+            slot = self._wheel[(self._tick + step) % self._wheel_size]
+            if not slot:
+                continue
+            for chart in list(slot.values()):
+                if chart.slot <= now_tick:
+                    self._drop_unlocked(chart.key)
+                    expired += 1
+                    logger.debug(f"[CHART-ASSEMBLER] Expired incomplete chart: order={chart.key[1]}, "
+                                 f"server={chart.key[0]}, {chart.received}/{len(chart.blocks)} fragments")
+        self._tick = now_tick
+
+        if expired:
+            self.expired += expired
+            logger.warning(f"[CHART-ASSEMBLER] Expired {expired} incomplete charts "
+                           f"(no fragments for {self.timeout_seconds:.0f}s)")
+
+    def expire(self) -> int:
         """
-        Собрать фрагменты в полные данные.
-        
-        ВАЖНО: Вызывать только под self._lock!
+        Вытеснить графики без фрагментов дольше timeout_seconds
+
+        Returns:
+            Количество вытесненных графиков
         """
-        blocks_count = self.expected_counts[order_id]
-        fragments = []
+        with self._lock:
+            before = self.expired
+            self._advance_unlocked()
+            return self.expired - before
 
-        for i in range(blocks_count):
-            if i not in self.fragments[order_id]:
-                logger.error(f"[CHART-ASSEMBLER] Missing fragment {i} for order {order_id}")
-                self._cleanup_order_unlocked(order_id)
-                return None
-            fragments.append(self.fragments[order_id][i])
+    # ==================== БЮДЖЕТЫ ====================
+
+    def _charge_unlocked(self, chart: _PendingChart, delta: int) -> None:
+        chart.size += delta
+        server_id = chart.key[0]
+        self._server_bytes[server_id] = self._server_bytes.get(server_id, 0) + delta
+        self._total_bytes += delta
 
-        complete_data = b''.join(fragments)
+    def _enforce_budgets_unlocked(self, server_id: int, keep: ChartKey) -> None:
+        """
+        Вытеснить графики сверх бюджетов в LRU порядке.
+
+        График keep (только что получил фрагмент) вытесняется последним -
+        если он один не помещается в бюджет, он не соберётся никогда.
+        """
+        while self._server_bytes.get(server_id, 0) > self.max_server_bytes:
+            server_charts = self._servers.get(server_id)
+            if not server_charts:
+                break
+            order_id = next((o for o in server_charts if (server_id, o) != keep), keep[1])
+            self._drop_unlocked((server_id, order_id))
+            self.evicted_server_budget += 1
+            logger.debug(f"[CHART-ASSEMBLER] Server {server_id} budget exceeded, evicted order {order_id}")
 
-        # Очищаем буфер
-        self._cleanup_order_unlocked(order_id)
+        while self._total_bytes > self.max_total_bytes:
+            chart = self._oldest_unlocked(keep) or self._pending.get(keep)
+            if chart is None:
+                break
+            self._drop_unlocked(chart.key)
+            self.evicted_total_budget += 1
+            logger.debug(f"[CHART-ASSEMBLER] Total budget exceeded, evicted order {chart.key[1]} "
+                         f"(server {chart.key[0]})")
 
-        logger.info(f"[CHART-ASSEMBLER] Assembled {len(complete_data)} bytes for order {order_id}")
-        return complete_data
+    def _oldest_unlocked(self, keep: ChartKey) -> Optional[_PendingChart]:
+        """Самый давно обновлявшийся график, кроме keep (обход колеса от текущего тика)"""
+        for step in range(1, self._wheel_size + 1):
+            for key, chart in self._wheel[(self._tick + step) % self._wheel_size].items():
+                if key != keep:
+                    return chart
+        return None
 
-    def _cleanup_order_unlocked(self, order_id: int) -> None:
+    def _drop_unlocked(self, key: ChartKey) -> None:
         """
-        Очистить данные ордера.
-        
+        Удалить незавершённый график.
+
         ВАЖНО: Вызывать только под self._lock!
         """
-        self.fragments.pop(order_id, None)
-        self.expected_counts.pop(order_id, None)
-        self.timestamps.pop(order_id, None)
+        chart = self._pending.pop(key, None)
+        if chart is None:
+            return
+        server_id, order_id = key
+        self._wheel[chart.slot % self._wheel_size].pop(key, None)
+        server_charts = self._servers.get(server_id)
+        if server_charts is not None:
+            server_charts.pop(order_id, None)
+            if not server_charts:
+                del self._servers[server_id]
+        self._charge_unlocked(chart, -chart.size)
+        if not self._server_bytes.get(server_id):
+            self._server_bytes.pop(server_id, None)
 
-    def cleanup_stale(self, timeout_seconds: int = 300) -> int:
-        """Очистить незавершённые сборки (старше timeout)"""
+    def forget_server(self, server_id: int) -> None:
+        """Удалить незавершённые графики сервера"""
         with self._lock:
-            current_time = time.time()
-            stale_orders = [
-                order_id
-                for order_id, start_time in self.timestamps.items()
-                if current_time - start_time > timeout_seconds
-            ]
-
-            for order_id in stale_orders:
-                logger.warning(f"[CHART-ASSEMBLER] Cleanup stale: order={order_id}")
-                self._cleanup_order_unlocked(order_id)
-
-            return len(stale_orders)
+            for order_id in list(self._servers.get(server_id, ())):
+                self._drop_unlocked((server_id, order_id))
 
     def clear_all(self):
         """Очистить все буферы"""
         with self._lock:
-            self.fragments.clear()
-            self.expected_counts.clear()
-            self.timestamps.clear()
+            for key in list(self._pending):
+                self._drop_unlocked(key)
 
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика сборки"""
+        with self._lock:
+            return {
+                "pending_charts": len(self._pending),
+                "pending_servers": len(self._servers),
+                "pending_bytes": self._total_bytes,
+                "max_total_bytes": self.max_total_bytes,
+                "max_server_bytes": self.max_server_bytes,
+                "completed": self.completed,
+                "expired": self.expired,
+                "evicted_total_budget": self.evicted_total_budget,
+                "evicted_server_budget": self.evicted_server_budget,
+                "rejected": self.rejected,
+            }
@@ -0,0 +1,245 @@
+"""
+Бенчмарк парсеров графиков: parse_chart_binary vs parse_chart_columnar
+
+Запуск (из backend/):
+    python -m services.chart_parser.benchmark [путь ...] [--repeat N]
+
+Пути - .bin файлы или директории (рекурсивно *.bin). По умолчанию -
+записанные графики ChartStorage (data/charts, пишутся при
+charts.keep_raw_files: true в app.yaml). Если записей нет,
+используются синтетические графики разного размера.
+
+Для каждого графика проверяется эквивалентность результатов
+(те же поля, время с точностью до микросекунд, те же ISO строки).
+"""
+
+import argparse
+import logging
+import random
+import struct
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from .constants import ORDER_ID_FIXED_SIZE
+from .models import ChartData
+from .parser import parse_chart_binary, parse_chart_columnar
+from .timeconv import format_epoch_iso_column
+from utils.datetime_utils import format_iso
+
+DEFAULT_CHARTS_DIR = Path("data/charts")
+
+# (история, трейды, линия средней, свечи, ордера)
+SYNTHETIC_SIZES = [
+    ("small", 500, 2000, 200, 120, 1),
+    ("medium", 3000, 20000, 1000, 600, 3),
+    ("large", 10000, 100000, 5000, 1440, 10),
+]
+
+
+# =============================================================================
+# СИНТЕТИЧЕСКИЕ ГРАФИКИ (формат TMarket.SaveToStreamShort)
+# =============================================================================
+
+def _utf8(value: str) -> bytes:
+    raw = value.encode('utf-8')
+    return struct.pack('<H', len(raw)) + raw
+
+
+def build_chart_payload(
+    n_history: int,
+    n_trades: int,
+    n_closest: int,
+    n_candles: int,
+    n_orders: int = 1,
+    market_name: str = "BTC",
+    seed: int = 0
+) -> bytes:
+    """Собрать бинарный график (как после сборки фрагментов и GZIP)"""
+    rnd = random.Random(seed)
+    # TDateTime с миллисекундной точностью, как пишет MoonBot
+    start = 45000.0 + rnd.randint(0, 1000)
+
+    def tdt(seconds: float) -> float:
+        return start + round(seconds, 3) / 86400.0
+
+    price = 100.0
+    parts = [
+        struct.pack('<H', 5),
+        _utf8(market_name), _utf8("USDT"), _utf8("channel"), _utf8(f"{market_name}USDT"),
+        struct.pack('<dd', tdt(0), tdt(86400)),
+    ]
+
+    parts.append(struct.pack('<i', n_history))
+    parts.append(b''.join(
+        struct.pack('<dd', price + rnd.uniform(-1, 1), tdt(i * 30)) for i in range(n_history)
+    ))
+
+    parts.append(struct.pack('<i', n_orders))
+    for i in range(n_orders):
+        order_id = f"{seed}-{i}".encode('ascii')
+        shortstring = bytes([len(order_id)]) + order_id.ljust(ORDER_ID_FIXED_SIZE - 1, b'\0')
+        parts.append(shortstring + struct.pack('<4d', price, tdt(100 * i), tdt(100 * i + 5), tdt(100 * i + 600)))
+
+    parts.append(struct.pack('<i', n_trades))
+    parts.append(b''.join(
+        struct.pack('<dd', tdt(i * 0.8), rnd.choice((1, -1)) * (price + rnd.uniform(-1, 1)))
+        for i in range(n_trades)
+    ))
+
+    parts.append(struct.pack('<11dBd', *(rnd.uniform(-5, 5) for _ in range(11)), 1, rnd.uniform(-10, 10)))
+
+    parts.append(struct.pack('<i', n_closest))
+    parts.append(b''.join(
+        struct.pack('<dd', price + rnd.uniform(-1, 1), tdt(i * 10)) for i in range(n_closest)
+    ))
+
+    parts.append(struct.pack('<i', n_candles))
+    parts.append(b''.join(
+        struct.pack('<di4d', tdt(i * 60), rnd.randint(0, 500), price - 1, price + 1,
+                    rnd.uniform(0, 1000), rnd.uniform(0, 1000))
+        for i in range(n_candles)
+    ))
+    return b''.join(parts)
+
+
+def load_payloads(paths: Sequence[Path]) -> List[Tuple[str, bytes]]:
+    """Загрузить записанные графики (*.bin)"""
+    payloads = []
+    for path in paths:
+        files = sorted(path.rglob("*.bin")) if path.is_dir() else [path]
+        for file in files:
+            if file.is_file():
+                payloads.append((file.name, file.read_bytes()))
+    return payloads
+
+
+# =============================================================================
+# ПРОВЕРКА И ЗАМЕРЫ
+# =============================================================================
+
+def check_equivalence(data: bytes) -> Optional[str]:
+    """Сравнить результаты парсеров; None - совпадают, иначе описание расхождения"""
+    legacy = parse_chart_binary(data)
+    columnar = parse_chart_columnar(data)
+    if legacy is None or columnar is None:
+        return None if legacy is None and columnar is None else "one parser failed"
+
+    converted = columnar.to_chart_data()
+    for name in ("version", "market_name", "market_currency", "pump_channel", "bn_market_name", "deltas"):
+        if getattr(legacy, name) != getattr(converted, name):
+            return f"{name} differs"
+
+    def times(chart: ChartData) -> List:
+        values = [chart.start_time, chart.end_time]
+        for series in (chart.history_prices, chart.trades, chart.closest_prices, chart.candles):
+            values.extend(p.time for p in series)
+        for order in chart.orders:
+            values.extend((order.create_time, order.open_time, order.close_time))
+        return values
+
+    legacy_times, columnar_times = times(legacy), times(converted)
+    if len(legacy_times) != len(columnar_times):
+        return "point counts differ"
+    if any(abs((a - b).total_seconds()) > 1e-6 for a, b in zip(legacy_times, columnar_times)):
+        return "times differ"
+
+    for series in ("history_prices", "trades", "closest_prices"):
+        if [p.price for p in getattr(legacy, series)] != list(getattr(columnar, series).price):
+            return f"{series} prices differ"
+        if [format_iso(p.time) for p in getattr(legacy, series)] != \
+                format_epoch_iso_column(getattr(columnar, series).time):
+            return f"{series} ISO times differ"
+
+    def candle_values(chart: ChartData) -> List:
+        return [(c.count, c.min_price, c.max_price, c.buy_volume, c.sell_volume) for c in chart.candles]
+
+    if candle_values(legacy) != candle_values(converted):
+        return "candles differ"
+    if [(o.order_id, o.mean_price) for o in legacy.orders] != \
+            [(o.order_id, o.mean_price) for o in converted.orders]:
+        return "orders differ"
+    return None
+
+
+def _best_time(parse: Callable[[bytes], object], data: bytes, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(data)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _retained_bytes(parse: Callable[[bytes], object], data: bytes) -> int:
+    """Память, удерживаемая результатом парсинга"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = parse(data)
+        retained = tracemalloc.get_traced_memory()[0] - before
+        del result
+        return retained
+    finally:
+        tracemalloc.stop()
+
+
+def run_benchmark(payloads: List[Tuple[str, bytes]], repeat: int = 5) -> List[dict]:
+    """Замерить оба парсера на каждом графике"""
+    results = []
+    for name, data in payloads:
+        legacy_time = _best_time(parse_chart_binary, data, repeat)
+        columnar_time = _best_time(parse_chart_columnar, data, repeat)
+        chart = parse_chart_columnar(data)
+        results.append({
+            "name": name,
+            "size": len(data),
+            "points": (len(chart.history_prices) + len(chart.trades) + len(chart.closest_prices)
+                       + len(chart.candles)) if chart else 0,
+            "legacy_ms": legacy_time * 1000,
+            "columnar_ms": columnar_time * 1000,
+            "legacy_kb": _retained_bytes(parse_chart_binary, data) / 1024,
+            "columnar_kb": _retained_bytes(parse_chart_columnar, data) / 1024,
+            "mismatch": check_equivalence(data),
+        })
+    return results
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Chart parser benchmark")
+    parser.add_argument("paths", nargs="*", type=Path, help=".bin файлы или директории")
+    parser.add_argument("--repeat", type=int, default=5, help="Повторов на график (берётся лучший)")
+    args = parser.parse_args(argv)
+
+    # Парсеры логируют каждый график на INFO
+    logging.getLogger("services.chart_parser").setLevel(logging.WARNING)
+
+    payloads = load_payloads(args.paths or [DEFAULT_CHARTS_DIR])
+    if not payloads:
+        print("No recorded charts found - using synthetic payloads")
+        payloads = [
+            (name, build_chart_payload(*sizes, market_name=name.upper(), seed=i))
+            for i, (name, *sizes) in enumerate(SYNTHETIC_SIZES)
+        ]
+
+    results = run_benchmark(payloads, args.repeat)
+
+    print(f"{'chart':<32} {'bytes':>9} {'points':>8} {'legacy ms':>10} {'columnar ms':>12} "
+          f"{'speedup':>8} {'legacy KB':>10} {'columnar KB':>12}  check")
+    for r in results:
+        speedup = r["legacy_ms"] / r["columnar_ms"] if r["columnar_ms"] else 0.0
+        print(f"{r['name'][:32]:<32} {r['size']:>9} {r['points']:>8} {r['legacy_ms']:>10.2f} "
+              f"{r['columnar_ms']:>12.2f} {speedup:>7.1f}x {r['legacy_kb']:>10.0f} "
+              f"{r['columnar_kb']:>12.0f}  {r['mismatch'] or 'ok'}")
+
+    total_legacy = sum(r["legacy_ms"] for r in results)
+    total_columnar = sum(r["columnar_ms"] for r in results)
+    if total_columnar:
+        print(f"Total: legacy {total_legacy:.1f} ms, columnar {total_columnar:.1f} ms "
+              f"({total_legacy / total_columnar:.1f}x)")
+    return 1 if any(r["mismatch"] for r in results) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
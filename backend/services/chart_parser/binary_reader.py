@@ -3,8 +3,10 @@
 """
 
 import struct
+import sys
+from array import array
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import List, Optional, Tuple
 
 from .constants import DELPHI_EPOCH
 
@@ -100,6 +102,30 @@ class BinaryReader:
         except (OverflowError, OSError):
             return DELPHI_EPOCH
 
+    def read_double_array(self, count: int) -> array:
+        """
+        Читает count double одним копированием в array('d')
+
+        Используется для массивов записей из одних double
+        (PriceTime и т.п.) - колонки выделяются срезами [0::2], [1::2].
+        """
+        size = max(count, 0) * 8
+        self._check_bounds(size)
+        values = array('d')
+        values.frombytes(self._view[self._pos:self._pos + size])
+        if sys.byteorder != 'little':
+            values.byteswap()
+        self._pos += size
+        return values
+
+    def read_records(self, record: struct.Struct, count: int) -> List[Tuple]:
+        """Читает count записей фиксированного размера (struct.iter_unpack)"""
+        size = max(count, 0) * record.size
+        self._check_bounds(size)
+        rows = list(record.iter_unpack(self._view[self._pos:self._pos + size]))
+        self._pos += size
+        return rows
+
     def skip(self, size: int) -> None:
         """Пропускает указанное количество байт"""
         self._check_bounds(size)
@@ -0,0 +1,394 @@
+"""
+Компактный формат хранения графиков (MBC)
+
+Одна копия графика в БД вместо JSON в moonbot_charts.chart_data,
+JSON файла с отступами и сырого .bin на диске.
+
+Формат (little-endian):
+    b'MBC' + версия формата (1 байт) + zlib(тело)
+
+Тело:
+    Заголовок: <H version>, 4 × UTF-8 строки (<H длина>), <dd start/end (эпоха)>
+    Дельты: <B есть/нет> [+ <11dBd>]
+    Количества: <5I> история, ордера, трейды, линия средней, свечи
+    ID ордеров: UTF-8 строки
+    Колонки в фиксированном порядке (длина определяется количеством)
+
+Время хранится как int64 микросекунды эпохи с дельта-кодированием,
+байты каждой колонки перегруппированы по разрядам (shuffle) -
+соседние значения похожи, и zlib сжимает их в разы лучше.
+"""
+
+import struct
+import sys
+import zlib
+from array import array
+from datetime import datetime
+from itertools import accumulate
+from typing import Any, Dict, List, Optional
+
+from .models import ColumnarChartData, PriceSeries, OrderColumns, CandleColumns, DeltaVolumes
+from .timeconv import UNIX_EPOCH, format_epoch_iso, format_epoch_iso_column
+
+COMPACT_MAGIC = b'MBC'
+COMPACT_FORMAT_VERSION = 1
+
+_COUNTS = struct.Struct('<5I')
+_TIMES = struct.Struct('<dd')
+_DELTAS = struct.Struct('<11dBd')
+_DELTA_FIELDS = (
+    'last_1m_delta', 'last_5m_delta', 'last_1h_delta', 'last_3h_delta', 'last_24h_delta',
+    'pump_delta_1h', 'dump_delta_1h', 'hvol', 'hvol_fast', 'test_price_down', 'test_price_up',
+)
+
+
+class CompactFormatError(ValueError):
+    """Данные не являются графиком в компактном формате"""
+
+
+# =============================================================================
+# КОЛОНКИ
+# =============================================================================
+
+def _shuffle(raw: bytes, width: int) -> bytes:
+    """Перегруппировать байты: сначала все 0-е байты значений, затем 1-е и т.д."""
+    view = memoryview(raw)
+    return b''.join(view[i::width].tobytes() for i in range(width))
+
+
+def _unshuffle(raw: bytes, width: int) -> bytes:
+    count = len(raw) // width
+    out = bytearray(len(raw))
+    for i in range(width):
+        out[i::width] = raw[i * count:(i + 1) * count]
+    return bytes(out)
+
+
+def _pack_column(values: array) -> bytes:
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return _shuffle(values.tobytes(), values.itemsize)
+
+
+def _pack_times(epochs: array) -> bytes:
+    """Время -> int64 микросекунды с дельта-кодированием"""
+    micros = [round(t * 1e6) for t in epochs]
+    return _pack_column(array('q', [b - a for a, b in zip([0] + micros, micros)]))
+
+
+class _ColumnReader:
+    """Последовательное чтение колонок из тела"""
+
+    __slots__ = ('_data', '_pos')
+
+    def __init__(self, data: bytes, pos: int) -> None:
+        self._data = data
+        self._pos = pos
+
+    def column(self, typecode: str, count: int) -> array:
+        values = array(typecode)
+        size = count * values.itemsize
+        if self._pos + size > len(self._data):
+            raise CompactFormatError("Truncated column data")
+        values.frombytes(_unshuffle(self._data[self._pos:self._pos + size], values.itemsize))
+        if sys.byteorder != 'little':
+            values.byteswap()
+        self._pos += size
+        return values
+
+    def times(self, count: int) -> array:
+        return array('d', [us / 1e6 for us in accumulate(self.column('q', count))])
+
+
+def _pack_str(value: str) -> bytes:
+    raw = value.encode('utf-8')
+    return struct.pack('<H', len(raw)) + raw
+
+
+def _read_str(data: bytes, pos: int):
+    (length,) = struct.unpack_from('<H', data, pos)
+    pos += 2
+    return data[pos:pos + length].decode('utf-8', errors='replace'), pos + length
+
+
+# =============================================================================
+# КОДИРОВАНИЕ / ДЕКОДИРОВАНИЕ
+# =============================================================================
+
+def encode_chart(chart: ColumnarChartData, level: int = 6) -> bytes:
+    """
+    Закодировать график в компактный формат
+
+    Args:
+        chart: График в колоночном формате
+        level: Уровень zlib сжатия (1-9)
+
+    Returns:
+        Бинарные данные для moonbot_charts.chart_blob
+    """
+    parts = [
+        struct.pack('<H', chart.version),
+        _pack_str(chart.market_name),
+        _pack_str(chart.market_currency),
+        _pack_str(chart.pump_channel),
+        _pack_str(chart.bn_market_name),
+        _TIMES.pack(chart.start_time, chart.end_time),
+    ]
+
+    deltas = chart.deltas
+    if deltas is None:
+        parts.append(b'\x00')
+    else:
+        parts.append(b'\x01')
+        parts.append(_DELTAS.pack(
+            *(getattr(deltas, name) for name in _DELTA_FIELDS),
+            1 if deltas.is_moonshot else 0,
+            deltas.session_profit
+        ))
+
+    orders, candles = chart.orders, chart.candles
+    parts.append(_COUNTS.pack(
+        len(chart.history_prices), len(orders), len(chart.trades), len(chart.closest_prices), len(candles)
+    ))
+    parts.extend(_pack_str(order_id) for order_id in orders.order_id)
+
+    parts += [
+        _pack_times(chart.history_prices.time),
+        _pack_column(chart.history_prices.price),
+        _pack_column(orders.mean_price),
+        _pack_times(orders.create_time),
+        _pack_times(orders.open_time),
+        _pack_times(orders.close_time),
+    ]
+    for series in (chart.trades, chart.closest_prices):
+        parts += [_pack_times(series.time), _pack_column(series.price)]
+    parts += [
+        _pack_times(candles.time),
+        _pack_column(candles.count),
+        _pack_column(candles.min_price),
+        _pack_column(candles.max_price),
+        _pack_column(candles.buy_volume),
+        _pack_column(candles.sell_volume),
+    ]
+
+    return COMPACT_MAGIC + bytes([COMPACT_FORMAT_VERSION]) + zlib.compress(b''.join(parts), level)
+
+
+def is_compact_chart(blob: Optional[bytes]) -> bool:
+    """Быстрая проверка формата"""
+    return bool(blob) and blob[:3] == COMPACT_MAGIC
+
+
+def decode_chart(blob: bytes) -> ColumnarChartData:
+    """
+    Декодировать график из компактного формата
+
+    Raises:
+        CompactFormatError: неизвестный формат, версия или повреждённые данные
+    """
+    blob = bytes(blob) if blob is not None else b''  # PostgreSQL bytea -> memoryview
+    if not is_compact_chart(blob) or len(blob) < 4:
+        raise CompactFormatError("Not a compact chart")
+    if blob[3] != COMPACT_FORMAT_VERSION:
+        raise CompactFormatError(f"Unsupported compact chart version: {blob[3]}")
+
+    try:
+        data = zlib.decompress(blob[4:])
+
+        (version,) = struct.unpack_from('<H', data, 0)
+        pos = 2
+        market_name, pos = _read_str(data, pos)
+        market_currency, pos = _read_str(data, pos)
+        pump_channel, pos = _read_str(data, pos)
+        bn_market_name, pos = _read_str(data, pos)
+        start_time, end_time = _TIMES.unpack_from(data, pos)
+        pos += _TIMES.size
+
+        deltas = None
+        has_deltas = data[pos]
+        pos += 1
+        if has_deltas:
+            values = _DELTAS.unpack_from(data, pos)
+            pos += _DELTAS.size
+            deltas = DeltaVolumes(*values[:11], is_moonshot=values[11] == 1, session_profit=values[12])
+
+        n_history, n_orders, n_trades, n_closest, n_candles = _COUNTS.unpack_from(data, pos)
+        pos += _COUNTS.size
+        order_ids: List[str] = []
+        for _ in range(n_orders):
+            order_id, pos = _read_str(data, pos)
+            order_ids.append(order_id)
+    except (zlib.error, struct.error, IndexError) as e:
+        raise CompactFormatError(f"Corrupted compact chart: {e}") from e
+
+    reader = _ColumnReader(data, pos)
+    history = PriceSeries(time=reader.times(n_history), price=reader.column('d', n_history))
+    orders = OrderColumns(
+        order_id=order_ids,
+        mean_price=reader.column('d', n_orders),
+        create_time=reader.times(n_orders),
+        open_time=reader.times(n_orders),
+        close_time=reader.times(n_orders)
+    )
+    trades = PriceSeries(time=reader.times(n_trades), price=reader.column('d', n_trades))
+    closest = PriceSeries(time=reader.times(n_closest), price=reader.column('d', n_closest))
+    candles = CandleColumns(
+        time=reader.times(n_candles),
+        count=reader.column('i', n_candles),
+        min_price=reader.column('d', n_candles),
+        max_price=reader.column('d', n_candles),
+        buy_volume=reader.column('d', n_candles),
+        sell_volume=reader.column('d', n_candles)
+    )
+
+    return ColumnarChartData(
+        version=version,
+        market_name=market_name,
+        market_currency=market_currency,
+        pump_channel=pump_channel,
+        bn_market_name=bn_market_name,
+        start_time=start_time,
+        end_time=end_time,
+        history_prices=history,
+        orders=orders,
+        trades=trades,
+        deltas=deltas,
+        closest_prices=closest,
+        candles=candles
+    )
+
+
+# =============================================================================
+# JSON ФОРМАТ API
+# =============================================================================
+
+def _price_points(series: PriceSeries) -> List[Dict[str, Any]]:
+    return [
+        {"time": time, "price": price}
+        for time, price in zip(format_epoch_iso_column(series.time), series.price)
+    ]
+
+
+def chart_to_dict(chart: ColumnarChartData) -> Dict[str, Any]:
+    """
+    График -> JSON-совместимый словарь (формат data в /api/servers/{id}/charts/{order_id})
+    """
+    orders = chart.orders
+    candles = chart.candles
+    deltas = chart.deltas
+    return {
+        "version": chart.version,
+        "market_name": chart.market_name,
+        "market_currency": chart.market_currency,
+        "pump_channel": chart.pump_channel,
+        "bn_market_name": chart.bn_market_name,
+        "start_time": format_epoch_iso(chart.start_time),
+        "end_time": format_epoch_iso(chart.end_time),
+        "history_prices": _price_points(chart.history_prices),
+        "orders": [
+            {
+                "order_id": order_id,
+                "mean_price": mean_price,
+                "create_time": create_time,
+                "open_time": open_time,
+                "close_time": close_time
+            }
+            for order_id, mean_price, create_time, open_time, close_time in zip(
+                orders.order_id,
+                orders.mean_price,
+                format_epoch_iso_column(orders.create_time),
+                format_epoch_iso_column(orders.open_time),
+                format_epoch_iso_column(orders.close_time)
+            )
+        ],
+        "trades": _price_points(chart.trades),
+        "deltas": {
+            **{name: getattr(deltas, name) for name in _DELTA_FIELDS},
+            "is_moonshot": deltas.is_moonshot,
+            "session_profit": deltas.session_profit
+        } if deltas else None,
+        "closest_prices": _price_points(chart.closest_prices),
+        "candles": [
+            {
+                "time": time,
+                "count": count,
+                "min_price": min_price,
+                "max_price": max_price,
+                "buy_volume": buy_volume,
+                "sell_volume": sell_volume
+            }
+            for time, count, min_price, max_price, buy_volume, sell_volume in zip(
+                format_epoch_iso_column(candles.time),
+                candles.count,
+                candles.min_price,
+                candles.max_price,
+                candles.buy_volume,
+                candles.sell_volume
+            )
+        ]
+    }
+
+
+def _epoch_column(values: List[Optional[str]]) -> array:
+    """ISO строки -> колонка секунд эпохи (одинаковые строки разбираются один раз)"""
+    cache: Dict[Optional[str], float] = {}
+    result = array('d')
+    for value in values:
+        epoch = cache.get(value)
+        if epoch is None:
+            epoch = (datetime.fromisoformat(value) - UNIX_EPOCH).total_seconds() if value else 0.0
+            cache[value] = epoch
+        result.append(epoch)
+    return result
+
+
+def chart_from_dict(data: Dict[str, Any]) -> ColumnarChartData:
+    """
+    JSON словарь (старый moonbot_charts.chart_data) -> график в колоночном формате
+
+    Время в старом JSON хранилось с точностью до секунды.
+    """
+    def series(points: Optional[List[Dict[str, Any]]]) -> PriceSeries:
+        points = points or []
+        return PriceSeries(
+            time=_epoch_column([p.get("time") for p in points]),
+            price=array('d', [p.get("price") or 0.0 for p in points])
+        )
+
+    orders = data.get("orders") or []
+    candles = data.get("candles") or []
+    deltas = data.get("deltas")
+
+    return ColumnarChartData(
+        version=data.get("version") or 0,
+        market_name=data.get("market_name") or "",
+        market_currency=data.get("market_currency") or "",
+        pump_channel=data.get("pump_channel") or "",
+        bn_market_name=data.get("bn_market_name") or "",
+        start_time=_epoch_column([data.get("start_time")])[0],
+        end_time=_epoch_column([data.get("end_time")])[0],
+        history_prices=series(data.get("history_prices")),
+        orders=OrderColumns(
+            order_id=[str(o.get("order_id") or "") for o in orders],
+            mean_price=array('d', [o.get("mean_price") or 0.0 for o in orders]),
+            create_time=_epoch_column([o.get("create_time") for o in orders]),
+            open_time=_epoch_column([o.get("open_time") for o in orders]),
+            close_time=_epoch_column([o.get("close_time") for o in orders])
+        ),
+        trades=series(data.get("trades")),
+        deltas=DeltaVolumes(
+            *(deltas.get(name) or 0.0 for name in _DELTA_FIELDS),
+            is_moonshot=bool(deltas.get("is_moonshot")),
+            session_profit=deltas.get("session_profit") or 0.0
+        ) if deltas else None,
+        closest_prices=series(data.get("closest_prices")),
+        candles=CandleColumns(
+            time=_epoch_column([c.get("time") for c in candles]),
+            count=array('i', [c.get("count") or 0 for c in candles]),
+            min_price=array('d', [c.get("min_price") or 0.0 for c in candles]),
+            max_price=array('d', [c.get("max_price") or 0.0 for c in candles]),
+            buy_volume=array('d', [c.get("buy_volume") or 0.0 for c in candles]),
+            sell_volume=array('d', [c.get("sell_volume") or 0.0 for c in candles])
+        )
+    )
@@ -7,6 +7,16 @@ from datetime import datetime
 # Базовая эпоха для конвертации Delphi TDateTime
 DELPHI_EPOCH = datetime(1899, 12, 30)
 
+# Unix эпоха (1970-01-01) в днях Delphi TDateTime
+DELPHI_UNIX_EPOCH_DAYS = 25569.0
+
+# Секунд в сутках (TDateTime - дни с дробной частью)
+SECONDS_PER_DAY = 86400.0
+
+# Диапазон TDateTime, представимый в Python datetime (0001-01-01 .. 9999-12-31)
+DELPHI_MIN_DAYS = -693593.0
+DELPHI_MAX_DAYS = 2958466.0
+
 # Magic bytes для GZIP
 GZIP_MAGIC = b'\x1f\x8b'
 
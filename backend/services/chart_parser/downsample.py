@@ -0,0 +1,424 @@
+"""
+Уровни детализации графика (LOD) для API
+
+Ряды графика (история цен, трейды, линия средней) прореживаются
+min/max бакетами (M4): время графика делится на равные интервалы,
+в каждом остаются первая, минимальная, максимальная и последняя
+точки. Линия на экране шириной в число бакетов не меняется,
+экстремумы сохраняются точно.
+
+Уровни строятся один раз на график (ChartLevels) и кэшируются
+(ChartLevelsCache): LOD_BUCKETS бакетов на весь график, каждый
+уровень - из предыдущего, более подробного (границы бакетов
+совпадают, поэтому M4 от M4 равен M4 от исходного ряда).
+Запрос (max_points, start, end) выбирает для каждого ряда самый
+подробный уровень (включая исходный ряд), у которого в окне
+просмотра не больше max_points точек. Крайние бакеты окна обычно
+попадают в него частично - они пересчитываются по исходным точкам
+окна, поэтому экстремумы окна тоже точные.
+
+Без прореживания отдаются:
+- ордера (маркеры сделок на графике)
+- точки рядов, ближайшие к моментам создания/открытия/закрытия
+  ордеров - линия цены проходит через маркеры на любом уровне
+
+Свечи объединяются по тем же бакетам: count и объёмы суммируются,
+min/max - минимум и максимум свечей бакета.
+"""
+
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from .models import CandleColumns, ColumnarChartData, PriceSeries
+
+# Бакетов на весь график по уровням (от подробного к грубому).
+# M4 даёт не больше 4 точек на бакет
+LOD_BUCKETS = (4096, 1024, 256, 64)
+
+# Прореживаемые ряды ColumnarChartData
+SERIES_FIELDS = ('history_prices', 'trades', 'closest_prices')
+
+# Запас точек на пересчёт двух крайних бакетов окна (M4 - до 4 точек на бакет)
+_EDGE_POINTS = 8
+
+_CANDLE_FIELDS = ('time', 'count', 'min_price', 'max_price', 'buy_volume', 'sell_volume')
+
+
+@dataclass(slots=True)
+class _Grid:
+    """Равные бакеты времени от t0"""
+    t0: float
+    width: float
+    buckets: int
+
+    def bucket(self, t: float) -> int:
+        """Бакет точки (точки за границами - в крайние бакеты)"""
+        bucket = int((t - self.t0) / self.width) if self.width > 0 else 0
+        if bucket >= self.buckets:
+            return self.buckets - 1
+        return bucket if bucket > 0 else 0
+
+
+@dataclass(slots=True)
+class _SeriesLevel:
+    """Уровень ряда: индексы точек исходного ряда и их время (grid None - исходный ряд)"""
+    grid: Optional[_Grid]
+    indices: Optional[array]
+    times: array
+
+
+@dataclass(slots=True)
+class _CandleLevel:
+    """Уровень свечей (grid None - исходные свечи)"""
+    grid: Optional[_Grid]
+    candles: CandleColumns
+
+
+def _m4(series: PriceSeries, indices: Iterable[int], grid: _Grid) -> array:
+    """
+    M4 прореживание: индексы первой, min, max и последней точки каждого бакета
+
+    Args:
+        series: Исходный ряд
+        indices: Индексы прореживаемых точек (по возрастанию)
+        grid: Бакеты
+
+    Returns:
+        Индексы исходного ряда (по возрастанию)
+    """
+    times, prices = series.time, series.price
+    result = array('l')
+    scale = 1.0 / grid.width if grid.width > 0 else 0.0
+    t0 = grid.t0
+    last_bucket = grid.buckets - 1
+    current = -1
+    first = low = high = last = 0
+
+    for i in indices:
+        bucket = int((times[i] - t0) * scale)
+        if bucket > last_bucket:
+            bucket = last_bucket
+        elif bucket < 0:
+            bucket = 0
+
+        if bucket != current:
+            if current >= 0:
+                result.extend(sorted({first, low, high, last}))
+            current = bucket
+            first = low = high = last = i
+            continue
+
+        price = prices[i]
+        if price < prices[low]:
+            low = i
+        elif price > prices[high]:
+            high = i
+        last = i
+
+    if current >= 0:
+        result.extend(sorted({first, low, high, last}))
+    return result
+
+
+def _merge_candles(candles: CandleColumns, lo: int, hi: int, grid: _Grid,
+                   merged: Optional[CandleColumns] = None) -> CandleColumns:
+    """Объединить свечи [lo, hi) по бакетам (время свечи бакета - время первой)"""
+    if merged is None:
+        merged = CandleColumns()
+    current = -1
+
+    for i in range(lo, hi):
+        bucket = grid.bucket(candles.time[i])
+        if bucket != current:
+            current = bucket
+            merged.time.append(candles.time[i])
+            merged.count.append(candles.count[i])
+            merged.min_price.append(candles.min_price[i])
+            merged.max_price.append(candles.max_price[i])
+            merged.buy_volume.append(candles.buy_volume[i])
+            merged.sell_volume.append(candles.sell_volume[i])
+            continue
+
+        merged.count[-1] += candles.count[i]
+        merged.min_price[-1] = min(merged.min_price[-1], candles.min_price[i])
+        merged.max_price[-1] = max(merged.max_price[-1], candles.max_price[i])
+        merged.buy_volume[-1] += candles.buy_volume[i]
+        merged.sell_volume[-1] += candles.sell_volume[i]
+    return merged
+
+
+def _slice_candles(candles: CandleColumns, lo: int, hi: int,
+                   merged: Optional[CandleColumns] = None) -> CandleColumns:
+    """Свечи [lo, hi) (в конец merged, если задан)"""
+    if merged is None:
+        return CandleColumns(*(getattr(candles, name)[lo:hi] for name in _CANDLE_FIELDS))
+    for name in _CANDLE_FIELDS:
+        getattr(merged, name).extend(getattr(candles, name)[lo:hi])
+    return merged
+
+
+def _window(times: array, start: Optional[float], end: Optional[float]) -> Tuple[int, int]:
+    """Границы [lo, hi) точек окна просмотра (колонка времени по возрастанию)"""
+    lo = bisect_left(times, start) if start is not None else 0
+    hi = bisect_right(times, end) if end is not None else len(times)
+    return lo, max(lo, hi)
+
+
+def _edges(grid: _Grid, times: array, lo: int, hi: int) -> Tuple[int, int, int, int]:
+    """
+    Разбить точки окна [lo, hi) на крайние бакеты и середину.
+
+    Returns:
+        (bucket_lo, bucket_hi, left_end, right_start): бакеты крайних точек окна,
+        конец точек первого бакета и начало точек последнего
+    """
+    bucket_lo = grid.bucket(times[lo])
+    bucket_hi = grid.bucket(times[hi - 1])
+    left_end = bisect_right(times, bucket_lo, lo, hi, key=grid.bucket)
+    right_start = max(left_end, bisect_left(times, bucket_hi, lo, hi, key=grid.bucket))
+    return bucket_lo, bucket_hi, left_end, right_start
+
+
+class ChartLevels:
+    """
+    Предрасчитанные уровни детализации графика
+
+    Неизменяем после построения - один объект обслуживает
+    параллельные запросы.
+    """
+
+    def __init__(self, chart: ColumnarChartData, buckets: Tuple[int, ...] = LOD_BUCKETS):
+        """
+        Построить уровни графика.
+
+        Args:
+            chart: Полный график
+            buckets: Бакетов на весь график по уровням
+        """
+        self.chart = chart
+        self.buckets = tuple(sorted(buckets, reverse=True))
+
+        starts = [s.time[0] for s in self._series() if len(s)] + list(chart.candles.time[:1])
+        ends = [s.time[-1] for s in self._series() if len(s)] + list(chart.candles.time[-1:])
+        self.t0 = min(starts, default=chart.start_time)
+        self.t1 = max(ends, default=chart.end_time)
+
+        order_times = self._order_times()
+        self._pins: Dict[str, List[int]] = {}
+        self._series_levels: Dict[str, List[_SeriesLevel]] = {}
+        for name in SERIES_FIELDS:
+            series = getattr(chart, name)
+            self._pins[name] = _nearest_points(series.time, order_times)
+            self._series_levels[name] = self._build_series(series, self._pins[name])
+        self._candle_levels = self._build_candles(chart.candles)
+
+    def _series(self) -> List[PriceSeries]:
+        return [getattr(self.chart, name) for name in SERIES_FIELDS]
+
+    def _order_times(self) -> List[float]:
+        orders = self.chart.orders
+        return [t for column in (orders.create_time, orders.open_time, orders.close_time)
+                for t in column if self.t0 <= t <= self.t1]
+
+    def _grid(self, buckets: int) -> _Grid:
+        return _Grid(self.t0, (self.t1 - self.t0) / buckets, buckets)
+
+    def _build_series(self, series: PriceSeries, pins: List[int]) -> List[_SeriesLevel]:
+        """Исходный ряд + уровни LOD_BUCKETS (каждый - из предыдущего)"""
+        levels = [_SeriesLevel(None, None, series.time)]
+        indices: Iterable[int] = range(len(series))
+        for buckets in self.buckets:
+            if len(levels[-1].times) <= 4 * buckets:
+                # Ряд уже не длиннее уровня - прореживать нечего
+                continue
+            grid = self._grid(buckets)
+            reduced = _m4(series, indices, grid)
+            if pins:
+                reduced = array('l', sorted(set(reduced).union(pins)))
+            levels.append(_SeriesLevel(grid, reduced, array('d', [series.time[i] for i in reduced])))
+            indices = reduced
+        return levels
+
+    def _build_candles(self, candles: CandleColumns) -> List[_CandleLevel]:
+        levels = [_CandleLevel(None, candles)]
+        for buckets in self.buckets:
+            previous = levels[-1].candles
+            if len(previous) <= buckets:
+                continue
+            grid = self._grid(buckets)
+            levels.append(_CandleLevel(grid, _merge_candles(previous, 0, len(previous), grid)))
+        return levels
+
+    # ==================== ВЫБОРКА ====================
+
+    def view(self, max_points: int, start: Optional[float] = None,
+             end: Optional[float] = None) -> ColumnarChartData:
+        """
+        График для отображения.
+
+        Args:
+            max_points: Максимум точек на ряд в окне (точки у ордеров - сверх)
+            start, end: Окно просмотра (секунды эпохи), None - весь график
+
+        Returns:
+            График с рядами окна на подходящем уровне
+        """
+        max_points = max(4, max_points)
+        series = {name: self._view_series(name, max_points, start, end) for name in SERIES_FIELDS}
+        return replace(self.chart, candles=self._view_candles(max_points, start, end), **series)
+
+    def _view_series(self, name: str, max_points: int,
+                     start: Optional[float], end: Optional[float]) -> PriceSeries:
+        series = getattr(self.chart, name)
+        raw_lo, raw_hi = _window(series.time, start, end)
+        if raw_hi - raw_lo <= max_points:
+            return PriceSeries(time=series.time[raw_lo:raw_hi], price=series.price[raw_lo:raw_hi])
+
+        for level in self._series_levels[name][1:]:
+            lo, hi = _window(level.times, start, end)
+            if hi - lo + _EDGE_POINTS <= max_points:
+                indices = self._window_indices(series, level, lo, hi, raw_lo, raw_hi)
+                break
+        else:
+            # Окно не помещается даже в самый грубый уровень - M4 по нему на лету
+            coarse = self._series_levels[name][-1]
+            lo, hi = _window(coarse.times, start, end)
+            indices = self._window_indices(series, coarse, lo, hi, raw_lo, raw_hi)
+            grid = _Grid(series.time[raw_lo], (series.time[raw_hi - 1] - series.time[raw_lo]) / (max_points // 4),
+                         max_points // 4)
+            indices = _m4(series, indices, grid)
+
+        pins = [i for i in self._pins[name] if raw_lo <= i < raw_hi]
+        if pins:
+            indices = sorted(set(indices).union(pins))
+        return PriceSeries(
+            time=array('d', [series.time[i] for i in indices]),
+            price=array('d', [series.price[i] for i in indices])
+        )
+
+    def _window_indices(self, series: PriceSeries, level: _SeriesLevel,
+                        lo: int, hi: int, raw_lo: int, raw_hi: int) -> array:
+        """
+        Индексы точек окна на уровне: бакеты целиком в окне - с уровня,
+        крайние (частично в окне) - M4 исходных точек окна.
+        """
+        grid = level.grid
+        bucket_lo, bucket_hi, left_end, right_start = _edges(grid, series.time, raw_lo, raw_hi)
+        result = _m4(series, range(raw_lo, left_end), grid)
+        middle_lo = bisect_right(level.times, bucket_lo, lo, hi, key=grid.bucket)
+        middle_hi = bisect_left(level.times, bucket_hi, middle_lo, hi, key=grid.bucket)
+        result.extend(level.indices[middle_lo:middle_hi])
+        result.extend(_m4(series, range(right_start, raw_hi), grid))
+        return result
+
+    def _view_candles(self, max_points: int, start: Optional[float], end: Optional[float]) -> CandleColumns:
+        raw = self.chart.candles
+        raw_lo, raw_hi = _window(raw.time, start, end)
+        if raw_hi - raw_lo <= max_points:
+            if raw_lo == 0 and raw_hi == len(raw):
+                return raw
+            return _slice_candles(raw, raw_lo, raw_hi)
+
+        for level in self._candle_levels[1:]:
+            lo, hi = _window(level.candles.time, start, end)
+            if hi - lo + 2 <= max_points:
+                return self._window_candles(level, lo, hi, raw_lo, raw_hi)
+
+        grid = _Grid(raw.time[raw_lo], (raw.time[raw_hi - 1] - raw.time[raw_lo]) / max_points, max_points)
+        return _merge_candles(raw, raw_lo, raw_hi, grid)
+
+    def _window_candles(self, level: _CandleLevel, lo: int, hi: int,
+                        raw_lo: int, raw_hi: int) -> CandleColumns:
+        """Свечи окна на уровне (крайние бакеты - по исходным свечам окна)"""
+        raw, grid, times = self.chart.candles, level.grid, level.candles.time
+        bucket_lo, bucket_hi, left_end, right_start = _edges(grid, raw.time, raw_lo, raw_hi)
+        merged = _merge_candles(raw, raw_lo, left_end, grid)
+        middle_lo = bisect_right(times, bucket_lo, lo, hi, key=grid.bucket)
+        middle_hi = bisect_left(times, bucket_hi, middle_lo, hi, key=grid.bucket)
+        _slice_candles(level.candles, middle_lo, middle_hi, merged)
+        return _merge_candles(raw, right_start, raw_hi, grid, merged)
+
+    def source_points(self) -> int:
+        """Точек во всех рядах и свечах полного графика"""
+        return chart_points(self.chart)
+
+
+def _nearest_points(times: array, moments: List[float]) -> List[int]:
+    """Индексы точек ряда, ближайших к моментам (по возрастанию, без повторов)"""
+    count = len(times)
+    if not count:
+        return []
+    nearest = set()
+    for t in moments:
+        i = bisect_left(times, t)
+        if i == count or (i > 0 and t - times[i - 1] <= times[i] - t):
+            i -= 1
+        nearest.add(i)
+    return sorted(nearest)
+
+
+def chart_points(chart: ColumnarChartData) -> int:
+    """Точек во всех рядах и свечах графика"""
+    return chart.point_count()
+
+
+class ChartLevelsCache:
+    """
+    LRU кэш уровней детализации графиков (thread-safe)
+
+    Ключ - версия графика (например id записи и время получения):
+    новая версия получает новую запись, старая вытесняется по LRU.
+    """
+
+    def __init__(self, max_charts: int = 32):
+        self.max_charts = max_charts
+        self._levels: 'OrderedDict[Hashable, ChartLevels]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, load: Callable[[], Optional[ColumnarChartData]]) -> Optional[ChartLevels]:
+        """
+        Уровни графика из кэша или построенные по load().
+
+        Args:
+            key: Версия графика
+            load: Загрузка полного графика (None - графика нет, не кэшируется)
+        """
+        with self._lock:
+            levels = self._levels.get(key)
+            if levels is not None:
+                self._levels.move_to_end(key)
+                self.hits += 1
+                return levels
+            self.misses += 1
+
+        # Построение - вне lock'а (параллельный промах построит уровни повторно)
+        chart = load()
+        if chart is None:
+            return None
+        levels = ChartLevels(chart)
+
+        with self._lock:
+            self._levels[key] = levels
+            self._levels.move_to_end(key)
+            while len(self._levels) > self.max_charts:
+                self._levels.popitem(last=False)
+        return levels
+
+    def clear(self) -> None:
+        with self._lock:
+            self._levels.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "charts": len(self._levels),
+                "max_charts": self.max_charts,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
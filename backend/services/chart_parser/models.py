@@ -2,9 +2,13 @@
 Модели данных для парсера графиков
 """
 
+import math
+from array import array
 from datetime import datetime
 from dataclasses import dataclass, field
-from typing import List, Optional
+from typing import Iterator, List, Optional, Tuple
+
+from .timeconv import epoch_to_datetime
 
 
 @dataclass
@@ -80,3 +84,148 @@ class ChartData:
     closest_prices: List[PricePoint] = field(default_factory=list)
     candles: List[MiniCandle] = field(default_factory=list)
 
+
+
+# =============================================================================
+# КОЛОНОЧНЫЙ ФОРМАТ (parse_chart_columnar)
+# =============================================================================
+# Массивы точек хранятся колонками array('d') вместо объекта на точку,
+# время - float секунды Unix эпохи (naive UTC).
+
+
+@dataclass(slots=True)
+class PriceSeries:
+    """Ряд цен: колонки time (эпоха) и price"""
+    time: array = field(default_factory=lambda: array('d'))
+    price: array = field(default_factory=lambda: array('d'))
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    def points(self) -> Iterator[PricePoint]:
+        """Точки в формате ChartData"""
+        for time, price in zip(self.time, self.price):
+            yield PricePoint(time=epoch_to_datetime(time), price=price)
+
+
+@dataclass(slots=True)
+class OrderColumns:
+    """Ордера графика колонками"""
+    order_id: List[str] = field(default_factory=list)
+    mean_price: array = field(default_factory=lambda: array('d'))
+    create_time: array = field(default_factory=lambda: array('d'))
+    open_time: array = field(default_factory=lambda: array('d'))
+    close_time: array = field(default_factory=lambda: array('d'))
+
+    def __len__(self) -> int:
+        return len(self.order_id)
+
+    def rows(self) -> Iterator[OrderData]:
+        """Ордера в формате ChartData"""
+        for order_id, mean_price, create_time, open_time, close_time in zip(
+            self.order_id, self.mean_price, self.create_time, self.open_time, self.close_time
+        ):
+            yield OrderData(
+                order_id=order_id,
+                mean_price=mean_price,
+                create_time=epoch_to_datetime(create_time),
+                open_time=epoch_to_datetime(open_time),
+                close_time=epoch_to_datetime(close_time)
+            )
+
+
+@dataclass(slots=True)
+class CandleColumns:
+    """Мини-свечи колонками"""
+    time: array = field(default_factory=lambda: array('d'))
+    count: array = field(default_factory=lambda: array('i'))
+    min_price: array = field(default_factory=lambda: array('d'))
+    max_price: array = field(default_factory=lambda: array('d'))
+    buy_volume: array = field(default_factory=lambda: array('d'))
+    sell_volume: array = field(default_factory=lambda: array('d'))
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    def rows(self) -> Iterator[MiniCandle]:
+        """Свечи в формате ChartData"""
+        for time, count, min_price, max_price, buy_volume, sell_volume in zip(
+            self.time, self.count, self.min_price, self.max_price, self.buy_volume, self.sell_volume
+        ):
+            yield MiniCandle(
+                time=epoch_to_datetime(time),
+                count=count,
+                min_price=min_price,
+                max_price=max_price,
+                buy_volume=buy_volume,
+                sell_volume=sell_volume
+            )
+
+
+@dataclass(slots=True)
+class ColumnarChartData:
+    """Полные данные графика в колоночном формате (время - секунды эпохи)"""
+    version: int
+    market_name: str
+    market_currency: str
+    pump_channel: str
+    bn_market_name: str
+    start_time: float
+    end_time: float
+    history_prices: PriceSeries = field(default_factory=PriceSeries)
+    orders: OrderColumns = field(default_factory=OrderColumns)
+    trades: PriceSeries = field(default_factory=PriceSeries)
+    deltas: Optional[DeltaVolumes] = None
+    closest_prices: PriceSeries = field(default_factory=PriceSeries)
+    candles: CandleColumns = field(default_factory=CandleColumns)
+
+    @property
+    def start_datetime(self) -> datetime:
+        return epoch_to_datetime(self.start_time)
+
+    @property
+    def end_datetime(self) -> datetime:
+        return epoch_to_datetime(self.end_time)
+
+    def point_count(self) -> int:
+        """Точек во всех рядах и свечах графика"""
+        return (len(self.history_prices) + len(self.trades)
+                + len(self.closest_prices) + len(self.candles))
+
+    def price_range(self) -> Tuple[Optional[float], Optional[float]]:
+        """
+        Минимальная и максимальная цена истории и трейдов
+
+        Returns:
+            (min, max) конечных цен или (None, None), если цен нет
+        """
+        low = high = None
+        for prices in (self.history_prices.price, self.trades.price):
+            if not prices:
+                continue
+            if not math.isfinite(sum(prices)):
+                prices = [p for p in prices if math.isfinite(p)]
+                if not prices:
+                    continue
+            column_low, column_high = min(prices), max(prices)
+            low = column_low if low is None else min(low, column_low)
+            high = column_high if high is None else max(high, column_high)
+        return low, high
+
+    def to_chart_data(self) -> ChartData:
+        """Материализовать в ChartData (объект на точку)"""
+        return ChartData(
+            version=self.version,
+            market_name=self.market_name,
+            market_currency=self.market_currency,
+            pump_channel=self.pump_channel,
+            bn_market_name=self.bn_market_name,
+            start_time=self.start_datetime,
+            end_time=self.end_datetime,
+            history_prices=list(self.history_prices.points()),
+            orders=list(self.orders.rows()),
+            trades=list(self.trades.points()),
+            deltas=self.deltas,
+            closest_prices=list(self.closest_prices.points()),
+            candles=list(self.candles.rows())
+        )
@@ -5,14 +5,24 @@
 import struct
 import gzip
 import logging
+from array import array
 from typing import Optional, Tuple
 
 from .constants import HEADER_SIZE, GZIP_MAGIC, CHART_FLAG, CHART_KIND, ORDER_ID_FIXED_SIZE
-from .models import ChartHeader, ChartData, PricePoint, OrderData, MiniCandle, DeltaVolumes
+from .models import (
+    ChartHeader, ChartData, PricePoint, OrderData, MiniCandle, DeltaVolumes,
+    ColumnarChartData, PriceSeries, OrderColumns, CandleColumns,
+)
 from .binary_reader import BinaryReader
+from .timeconv import delphi_to_epoch, delphi_to_epoch_array
 
 logger = logging.getLogger(__name__)
 
+# Записи фиксированного размера TMarket.SaveToStreamShort
+_ORDER_RECORD = struct.Struct(f'<{ORDER_ID_FIXED_SIZE}s4d')  # string[40], MeanPrice, 3 × TDateTime
+_CANDLE_RECORD = struct.Struct('<di4d')                         # Time, Count, Min, Max, BuyVol, SellVol
+_DELTAS_RECORD = struct.Struct('<11dBd')                        # 11 дельт, IsMoonShot, SessionProfit
+
 
 def parse_chart_binary(data: bytes) -> Optional[ChartData]:
     """
@@ -131,6 +141,97 @@ def parse_chart_binary(data: bytes) -> Optional[ChartData]:
         return None
 
 
+def _read_price_series(reader: BinaryReader, price_first: bool) -> PriceSeries:
+    """Массив (Price, Time) или (Time, Price) одним копированием"""
+    values = reader.read_double_array(reader.read_int() * 2)
+    prices, times = (values[0::2], values[1::2]) if price_first else (values[1::2], values[0::2])
+    return PriceSeries(time=delphi_to_epoch_array(times), price=prices)
+
+
+def _decode_order_id(raw: bytes) -> str:
+    """ShortString string[40] (как BinaryReader.read_shortstring_fixed)"""
+    return raw[1:1 + min(raw[0], ORDER_ID_FIXED_SIZE - 1)].decode('windows-1251', errors='replace')
+
+
+def parse_chart_columnar(data: bytes) -> Optional[ColumnarChartData]:
+    """
+    Парсит бинарный файл графика в колоночный формат
+
+    Тот же формат, что и parse_chart_binary, но массивы записей
+    фиксированного размера декодируются целиком (array.frombytes /
+    struct.iter_unpack) в колонки без объекта на точку.
+
+    Returns:
+        ColumnarChartData объект или None при ошибке
+    """
+    try:
+        reader = BinaryReader(data)
+
+        # 1. Заголовок
+        chart = ColumnarChartData(
+            version=reader.read_word(),
+            market_name=reader.read_utf8_string(),
+            market_currency=reader.read_utf8_string(),
+            pump_channel=reader.read_utf8_string(),
+            bn_market_name=reader.read_utf8_string(),
+            start_time=delphi_to_epoch(reader.read_double()),
+            end_time=delphi_to_epoch(reader.read_double())
+        )
+
+        # 2. Исторические цены - (Price, Time)
+        chart.history_prices = _read_price_series(reader, price_first=True)
+
+        # 3. Ордера
+        rows = reader.read_records(_ORDER_RECORD, reader.read_int())
+        if rows:
+            order_ids, mean_prices, create_times, open_times, close_times = zip(*rows)
+            chart.orders = OrderColumns(
+                order_id=[_decode_order_id(raw) for raw in order_ids],
+                mean_price=array('d', mean_prices),
+                create_time=delphi_to_epoch_array(array('d', create_times)),
+                open_time=delphi_to_epoch_array(array('d', open_times)),
+                close_time=delphi_to_epoch_array(array('d', close_times))
+            )
+
+        # 4. Трейды - (Time, Price)
+        chart.trades = _read_price_series(reader, price_first=False)
+
+        # 5. Статистика (дельты/объёмы)
+        values = reader.read_records(_DELTAS_RECORD, 1)[0]
+        chart.deltas = DeltaVolumes(*values[:11], is_moonshot=values[11] == 1, session_profit=values[12])
+
+        # 6. Линия средней цены - (Price, Time)
+        chart.closest_prices = _read_price_series(reader, price_first=True)
+
+        # 7. Мини-свечи (бары)
+        rows = reader.read_records(_CANDLE_RECORD, reader.read_int())
+        if rows:
+            times, counts, min_prices, max_prices, buy_volumes, sell_volumes = zip(*rows)
+            chart.candles = CandleColumns(
+                time=delphi_to_epoch_array(array('d', times)),
+                count=array('i', counts),
+                min_price=array('d', min_prices),
+                max_price=array('d', max_prices),
+                buy_volume=array('d', buy_volumes),
+                sell_volume=array('d', sell_volumes)
+            )
+
+        logger.info(
+            f"[CHART-PARSER] Parsed: {chart.market_name} | "
+            f"prices={len(chart.history_prices)}, trades={len(chart.trades)}, "
+            f"orders={len(chart.orders)}, bars={len(chart.candles)}"
+        )
+
+        return chart
+
+    except EOFError as e:
+        logger.error(f"[CHART-PARSER] Unexpected EOF: {e}")
+        return None
+    except Exception as e:
+        logger.exception(f"[CHART-PARSER] Parse error: {e}")
+        return None
+
+
 def parse_header(data: bytes) -> Optional[ChartHeader]:
     """Парсит заголовок пакета (8 байт)"""
     if len(data) < HEADER_SIZE:
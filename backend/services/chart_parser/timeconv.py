@@ -0,0 +1,70 @@
+"""
+Конвертация времени для колоночного формата графиков
+
+Delphi TDateTime (дни от 1899-12-30) хранится в колонках как float
+секунды Unix эпохи (naive UTC, как и datetime парсера).
+"""
+
+import math
+from array import array
+from datetime import datetime, timedelta
+from typing import Iterable, List
+
+from .constants import DELPHI_UNIX_EPOCH_DAYS, SECONDS_PER_DAY, DELPHI_MIN_DAYS, DELPHI_MAX_DAYS
+
+UNIX_EPOCH = datetime(1970, 1, 1)
+
+ISO_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+def delphi_to_epoch(value: float) -> float:
+    """TDateTime -> секунды эпохи (вне диапазона datetime -> DELPHI_EPOCH)"""
+    if not DELPHI_MIN_DAYS <= value < DELPHI_MAX_DAYS:
+        value = 0.0
+    return (value - DELPHI_UNIX_EPOCH_DAYS) * SECONDS_PER_DAY
+
+
+def delphi_to_epoch_array(values: array) -> array:
+    """
+    Колонка TDateTime -> колонка секунд эпохи
+
+    Диапазон проверяется один раз по min/max (sum ловит NaN/inf),
+    поэлементная проверка - только если колонка содержит мусор.
+    """
+    if not values:
+        return array('d')
+    if (math.isfinite(sum(values))
+            and min(values) >= DELPHI_MIN_DAYS and max(values) < DELPHI_MAX_DAYS):
+        return array('d', [(t - DELPHI_UNIX_EPOCH_DAYS) * SECONDS_PER_DAY for t in values])
+    return array('d', [delphi_to_epoch(t) for t in values])
+
+
+def epoch_to_datetime(epoch: float) -> datetime:
+    """Секунды эпохи -> naive datetime (UTC)"""
+    return UNIX_EPOCH + timedelta(seconds=epoch)
+
+
+def format_epoch_iso(epoch: float) -> str:
+    """Секунды эпохи -> ISO строка (как utils.datetime_utils.format_iso)"""
+    return epoch_to_datetime(epoch).strftime(ISO_FORMAT)
+
+
+def format_epoch_iso_column(epochs: Iterable[float]) -> List[str]:
+    """
+    Колонка секунд эпохи -> ISO строки
+
+    Соседние точки графика обычно попадают в одну секунду -
+    строка форматируется один раз на секунду.
+    """
+    result = []
+    append = result.append
+    last_second = None
+    last_text = ""
+    for epoch in epochs:
+        # Округление до микросекунд как у timedelta, затем отбрасывание долей
+        second = round(epoch * 1e6) // 1000000
+        if second != last_second:
+            last_second = second
+            last_text = (UNIX_EPOCH + timedelta(seconds=second)).strftime(ISO_FORMAT)
+        append(last_text)
+    return result
@@ -9,17 +9,23 @@ data/charts/{год}/{месяц}/{день}/{source_id}/order_{id}_{timestamp}.
 - Автоочистка старых графиков
 - Статистика хранилища
 
+Список, статистика и очистка отвечаются по индексу файлов
+(chart_storage_index.py), который обновляется при сохранении,
+а не обходом дерева каталогов.
+
 Основано на решении от второго разработчика.
 """
 
 import json
 import shutil
+import sqlite3
 import logging
 from pathlib import Path
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional, Tuple
 
 from utils.datetime_utils import format_iso
+from services.chart_storage_index import ChartIndex
 
 logger = logging.getLogger(__name__)
 
@@ -47,6 +53,7 @@ class ChartStorage:
         """
         self.base_dir = base_dir or DEFAULT_CHARTS_DIR
         self.base_dir.mkdir(parents=True, exist_ok=True)
+        self.index = ChartIndex(self.base_dir)
         logger.info(f"[CHART-STORAGE] Инициализировано: {self.base_dir.absolute()}")
 
     def save_json(
@@ -74,6 +81,7 @@ class ChartStorage:
         try:
             with open(filepath, 'w', encoding='utf-8') as f:
                 json.dump(chart_data, f, indent=2, ensure_ascii=False, default=str)
+            self._index_file(filepath, source_id, order_id, ts, "json")
 
             logger.info(f"[CHART-STORAGE] Сохранён: {filepath.name}")
             return filepath
@@ -106,6 +114,7 @@ class ChartStorage:
         try:
             with open(filepath, 'wb') as f:
                 f.write(binary_data)
+            self._index_file(filepath, source_id, order_id, ts, "bin")
 
             logger.info(f"[CHART-STORAGE] Сохранён бинарный: {filepath.name} ({len(binary_data)} bytes)")
             return filepath
@@ -143,27 +152,20 @@ class ChartStorage:
 
     def get_stats(self) -> Dict[str, Any]:
         """
-        Получить статистику хранилища.
+        Получить статистику хранилища (по счётчикам индекса).
         
         Returns:
             Словарь со статистикой
         """
-        if not self.base_dir.exists():
-            return {'total_charts': 0, 'total_size_bytes': 0, 'sources': []}
-
         total_charts = 0
         total_size = 0
         sources = set()
 
-        for file in self.base_dir.rglob('*.json'):
-            total_charts += 1
-            total_size += file.stat().st_size
-            # Извлекаем source_id из пути
-            if len(file.parts) >= 2:
-                sources.add(file.parts[-2])
-
-        for file in self.base_dir.rglob('*.bin'):
-            total_size += file.stat().st_size
+        for source_id, kind, files, size in self.index.source_stats():
+            total_size += size
+            if kind == "json":
+                total_charts += files
+                sources.add(source_id)
 
         return {
             'total_charts': total_charts,
@@ -177,7 +179,7 @@ class ChartStorage:
         """
         Удалить старые графики (старше N дней).
         
-        Удаляет целые папки дней для эффективности.
+        Удаляет целые папки дней для эффективности; дни берутся из индекса.
         
         Args:
             days_to_keep: Количество дней для хранения
@@ -185,41 +187,24 @@ class ChartStorage:
         Returns:
             Количество удалённых файлов
         """
-        if not self.base_dir.exists():
-            return 0
-
         cutoff_date = datetime.now() - timedelta(days=days_to_keep)
         deleted_count = 0
 
-        # Обходим по годам/месяцам/дням
-        for year_dir in self.base_dir.iterdir():
-            if not year_dir.is_dir() or not year_dir.name.isdigit():
+        next_day = (cutoff_date + timedelta(days=1)).strftime("%Y-%m-%d")
+        for day in self.index.days_before(next_day):
+            folder_date = datetime.strptime(day, "%Y-%m-%d")
+            if folder_date >= cutoff_date:
                 continue
 
-            for month_dir in year_dir.iterdir():
-                if not month_dir.is_dir() or not month_dir.name.isdigit():
-                    continue
-
-                for day_dir in month_dir.iterdir():
-                    if not day_dir.is_dir() or not day_dir.name.isdigit():
-                        continue
-
-                    try:
-                        folder_date = datetime(
-                            int(year_dir.name),
-                            int(month_dir.name),
-                            int(day_dir.name)
-                        )
-
-                        if folder_date < cutoff_date:
-                            # Считаем файлы перед удалением
-                            files_count = sum(1 for _ in day_dir.rglob('*') if _.is_file())
-                            shutil.rmtree(day_dir)
-                            deleted_count += files_count
-                            logger.info(f"[CHART-STORAGE] Удалена папка: {day_dir} ({files_count} файлов)")
-
-                    except (ValueError, OSError) as e:
-                        logger.warning(f"[CHART-STORAGE] Пропуск папки {day_dir}: {e}")
+            day_dir = self.base_dir / f"{folder_date.year}" / f"{folder_date.month:02d}" / f"{folder_date.day:02d}"
+            try:
+                if day_dir.exists():
+                    shutil.rmtree(day_dir)
+                files_count = self.index.remove_day(day)
+                deleted_count += files_count
+                logger.info(f"[CHART-STORAGE] Удалена папка: {day_dir} ({files_count} файлов)")
+            except (sqlite3.Error, OSError) as e:
+                logger.warning(f"[CHART-STORAGE] Пропуск папки {day_dir}: {e}")
 
         if deleted_count > 0:
             logger.info(f"[CHART-STORAGE] Очистка завершена: {deleted_count} файлов удалено")
@@ -230,45 +215,42 @@ class ChartStorage:
         self,
         source_id: Optional[str] = None,
         days: int = 7,
-        limit: int = 100
+        limit: int = 100,
+        before: Optional[float] = None,
+        before_path: Optional[str] = None
     ) -> list:
         """
-        Получить список графиков.
+        Получить список графиков (от новых к старым).
+        
+        Keyset пагинация: для следующей страницы передаются created_at
+        и relpath последнего графика предыдущей.
         
         Args:
             source_id: Фильтр по источнику
             days: За сколько дней
             limit: Максимальное количество
+            before: created_at последнего графика предыдущей страницы
+            before_path: relpath последнего графика предыдущей страницы
             
         Returns:
             Список информации о графиках
         """
-        if not self.base_dir.exists():
-            return []
-
         cutoff_date = datetime.now() - timedelta(days=days)
-        charts = []
 
-        pattern = f"**/{source_id}/*.json" if source_id else "**/*.json"
-        
-        for file in sorted(self.base_dir.glob(pattern), key=lambda f: f.stat().st_mtime, reverse=True):
-            if len(charts) >= limit:
-                break
-                
-            try:
-                mtime = datetime.fromtimestamp(file.stat().st_mtime)
-                if mtime < cutoff_date:
-                    continue
-                    
-                charts.append({
-                    'path': str(file),
-                    'filename': file.name,
-                    'source_id': file.parent.name,
-                    'size_bytes': file.stat().st_size,
-                    'modified': format_iso(mtime),
-                })
-            except Exception:
-                continue
+        charts = []
+        for entry in self.index.list("json", cutoff_date, source_id, before, before_path, limit):
+            path = self.base_dir / entry['path']
+            charts.append({
+                'path': str(path),
+                'filename': path.name,
+                'source_id': entry['source_id'],
+                'order_id': entry['order_id'],
+                'size_bytes': entry['size'],
+                'modified': format_iso(datetime.fromtimestamp(entry['created_at'])),
+                # Курсор страницы - точные значения индекса
+                'created_at': entry['created_at'],
+                'relpath': entry['path'],
+            })
 
         return charts
 
@@ -289,6 +271,23 @@ class ChartStorage:
             logger.error(f"[CHART-STORAGE] Ошибка загрузки {filepath}: {e}")
             return None
 
+    def _index_file(
+        self,
+        filepath: Path,
+        source_id: str,
+        order_id: int,
+        timestamp: datetime,
+        kind: str
+    ) -> None:
+        """Записать сохранённый файл в индекс (ошибка индекса не теряет файл)"""
+        try:
+            self.index.add(
+                filepath.relative_to(self.base_dir).as_posix(), source_id, order_id,
+                kind, timestamp, filepath.stat().st_size
+            )
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"[CHART-STORAGE] Ошибка индекса {filepath.name}: {e}")
+
     def _get_filepath(
         self,
         source_id: str,
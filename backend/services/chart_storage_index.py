@@ -0,0 +1,261 @@
+"""
+Chart Storage Index - Индекс файлов хранилища графиков.
+
+Встроенная SQLite база рядом с файлами (data/charts/index.sqlite3):
+- charts - строка на файл (путь, источник, ордер, тип, день, время, размер)
+- source_stats - счётчики файлов и байт по источнику и типу
+
+ChartStorage обновляет индекс при каждом сохранении, поэтому список,
+статистика и очистка не обходят дерево каталогов:
+- список за период (keyset пагинация по (created_at, path)) - по индексу (created_at)
+- статистика - из source_stats (строка на источник)
+- удаление старых дней - по индексу (day)
+
+Индекс создаётся по существующим файлам при первом открытии
+(rebuild) - хранилище, заполненное до появления индекса, не теряется.
+"""
+
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = "index.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS charts (
+    path TEXT PRIMARY KEY,
+    source_id TEXT NOT NULL,
+    order_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    day TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_charts_kind_created ON charts (kind, created_at);
+CREATE INDEX IF NOT EXISTS ix_charts_source_kind_created ON charts (source_id, kind, created_at);
+CREATE INDEX IF NOT EXISTS ix_charts_day ON charts (day);
+CREATE TABLE IF NOT EXISTS source_stats (
+    source_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    files INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (source_id, kind)
+);
+"""
+
+
+class ChartIndex:
+    """
+    Индекс файлов графиков (thread-safe).
+
+    Пути хранятся относительно base_dir хранилища.
+    """
+
+    def __init__(self, base_dir: Path) -> None:
+        """
+        Открыть (или создать и заполнить по файлам) индекс.
+
+        Args:
+            base_dir: Базовая директория хранилища графиков
+        """
+        self.base_dir = base_dir
+        self.path = base_dir / INDEX_FILENAME
+        created = not self.path.exists()
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+        if created:
+            self.rebuild()
+
+    def add(self, relpath: str, source_id: str, order_id: int, kind: str,
+            timestamp: datetime, size: int) -> None:
+        """
+        Записать файл в индекс (повторное сохранение того же пути - замена).
+
+        Args:
+            relpath: Путь относительно base_dir
+            source_id: Идентификатор источника
+            order_id: ID ордера
+            kind: Тип файла ('json' / 'bin')
+            timestamp: Время сохранения (по нему путь и список)
+            size: Размер файла (bytes)
+        """
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN")
+            try:
+                row = conn.execute("SELECT size FROM charts WHERE path = ?", (relpath,)).fetchone()
+                conn.execute(
+                    "INSERT OR REPLACE INTO charts (path, source_id, order_id, kind, day, created_at, size) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (relpath, source_id, order_id, kind, timestamp.strftime("%Y-%m-%d"),
+                     timestamp.timestamp(), size)
+                )
+                if row is None:
+                    self._count_unlocked([(source_id, kind, 1, size)])
+                else:
+                    self._count_unlocked([(source_id, kind, 0, size - row[0])])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def list(self, kind: str, since: datetime, source_id: Optional[str] = None,
+             before: Optional[float] = None, before_path: Optional[str] = None,
+             limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Файлы за период, от новых к старым.
+
+        Keyset пагинация по (created_at, path): следующая страница -
+        created_at / path последней строки предыдущей (значения как есть,
+        без округления - иначе теряются файлы, сохранённые в ту же секунду).
+
+        Args:
+            kind: Тип файла
+            since: Не раньше этого времени
+            source_id: Фильтр по источнику
+            before: created_at последней строки предыдущей страницы
+            before_path: path последней строки предыдущей страницы
+            limit: Максимальное количество
+
+        Returns:
+            Строки индекса (path, source_id, order_id, created_at, size)
+        """
+        sql = "SELECT path, source_id, order_id, created_at, size FROM charts WHERE kind = ? AND created_at >= ?"
+        params: List[Any] = [kind, since.timestamp()]
+        if source_id is not None:
+            sql += " AND source_id = ?"
+            params.append(source_id)
+        if before is not None:
+            if before_path is None:
+                sql += " AND created_at < ?"
+                params.append(before)
+            else:
+                sql += " AND (created_at < ? OR (created_at = ? AND path < ?))"
+                params.extend((before, before, before_path))
+        sql += " ORDER BY created_at DESC, path DESC LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [
+            {'path': r[0], 'source_id': r[1], 'order_id': r[2], 'created_at': r[3], 'size': r[4]}
+            for r in rows
+        ]
+
+    def source_stats(self) -> List[Tuple[str, str, int, int]]:
+        """Счётчики (source_id, kind, files, size) по источникам"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT source_id, kind, files, size FROM source_stats WHERE files > 0"
+            ).fetchall()
+
+    def days_before(self, day: str) -> List[str]:
+        """Дни (YYYY-MM-DD) с файлами раньше day"""
+        with self._lock:
+            return [r[0] for r in self._conn.execute(
+                "SELECT DISTINCT day FROM charts WHERE day < ? ORDER BY day", (day,)
+            )]
+
+    def remove_day(self, day: str) -> int:
+        """
+        Удалить из индекса файлы дня.
+
+        Returns:
+            Количество удалённых записей
+        """
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN")
+            try:
+                counts = conn.execute(
+                    "SELECT source_id, kind, COUNT(*), SUM(size) FROM charts WHERE day = ? "
+                    "GROUP BY source_id, kind", (day,)
+                ).fetchall()
+                conn.execute("DELETE FROM charts WHERE day = ?", (day,))
+                self._count_unlocked([(s, k, -n, -size) for s, k, n, size in counts])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return sum(n for _, _, n, _ in counts)
+
+    def rebuild(self) -> int:
+        """
+        Пересоздать индекс по файлам на диске (один обход дерева).
+
+        Returns:
+            Количество проиндексированных файлов
+        """
+        rows = []
+        for file in self.base_dir.glob("*/*/*/*/order_*"):
+            entry = _parse_chart_path(self.base_dir, file)
+            if entry is not None:
+                rows.append(entry)
+
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN")
+            try:
+                conn.execute("DELETE FROM charts")
+                conn.execute("DELETE FROM source_stats")
+                conn.executemany(
+                    "INSERT OR REPLACE INTO charts (path, source_id, order_id, kind, day, created_at, size) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+                )
+                conn.execute(
+                    "INSERT INTO source_stats (source_id, kind, files, size) "
+                    "SELECT source_id, kind, COUNT(*), SUM(size) FROM charts GROUP BY source_id, kind"
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        if rows:
+            logger.info(f"[CHART-STORAGE] Индекс построен по файлам: {len(rows)}")
+        return len(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _count_unlocked(self, deltas: List[Tuple[str, str, int, int]]) -> None:
+        """Изменить счётчики source_stats (внутри транзакции, под self._lock)"""
+        self._conn.executemany(
+            "INSERT INTO source_stats (source_id, kind, files, size) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (source_id, kind) DO UPDATE SET "
+            "files = files + excluded.files, size = size + excluded.size",
+            deltas
+        )
+
+
+def _parse_chart_path(base_dir: Path, file: Path) -> Optional[tuple]:
+    """
+    Строка индекса по пути {год}/{месяц}/{день}/{source_id}/order_{id}_{timestamp}.{ext}
+
+    Returns:
+        (path, source_id, order_id, kind, day, created_at, size) или None
+    """
+    from services.chart_storage import DATE_FORMAT
+
+    try:
+        name, kind = file.name.rsplit('.', 1)
+        _, order_id, date_part, time_part = name.split('_')
+        timestamp = datetime.strptime(f"{date_part}_{time_part}", DATE_FORMAT)
+        size = file.stat().st_size
+    except (ValueError, OSError):
+        return None
+    return (
+        file.relative_to(base_dir).as_posix(), file.parent.name, int(order_id), kind,
+        timestamp.strftime("%Y-%m-%d"), timestamp.timestamp(), size
+    )
@@ -0,0 +1,211 @@
+"""
+Параллельная массовая отправка команд (fan-out)
+
+Используется /api/commands/send-bulk: команда уходит на N серверов
+одновременно вместо последовательного ожидания каждого (N × RTT/timeout).
+
+- Ограниченная параллельность (семафор)
+- Пейсинг: интервал между запусками и минимальный интервал между
+  командами одному серверу (общий для всех bulk запросов)
+- Результаты стримятся пользователю через WebSocket по мере готовности
+  (пачками, чтобы не упираться в rate limit ConnectionManager)
+- История команд пишется одним bulk insert в конце
+"""
+import asyncio
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from models import models
+from services.udp_helper import send_command_unified
+from services.websocket_manager import ws_manager
+from utils.config_loader import get_config_value
+from utils.datetime_utils import utcnow, format_iso
+from utils.logging import log
+
+
+# server_id -> время (monotonic), раньше которого следующую команду не отправляем
+_server_next_send: Dict[int, float] = {}
+
+
+class BulkProgressStreamer:
+    """
+    Стриминг результатов bulk команды через WebSocket
+
+    Результаты копятся и отправляются одним сообщением раз в
+    flush_interval или при накоплении max_batch результатов.
+    """
+
+    def __init__(self, user_id: int, bulk_id: str, command: str, total: int,
+                 flush_interval: float, max_batch: int):
+        self.user_id = user_id
+        self.bulk_id = bulk_id
+        self.command = command
+        self.total = total
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+
+        self.completed = 0
+        self.succeeded = 0
+        self._pending: List[Dict[str, Any]] = []
+        self._last_flush = time.monotonic()
+
+    async def _send(self, message_type: str, data: Dict[str, Any]) -> None:
+        try:
+            await ws_manager.send_personal_message({
+                "type": message_type,
+                "data": data,
+                "timestamp": format_iso(utcnow())
+            }, self.user_id)
+        except Exception as e:
+            # WebSocket не должен влиять на отправку команд
+            log(f"[BULK] WebSocket notify error: {e}", level="DEBUG")
+
+    async def started(self) -> None:
+        await self._send("bulk_command_started", {
+            "bulk_id": self.bulk_id,
+            "command": self.command,
+            "total": self.total
+        })
+
+    async def add(self, result: Dict[str, Any]) -> None:
+        self.completed += 1
+        if result["status"] == "success":
+            self.succeeded += 1
+        self._pending.append(result)
+
+        if (len(self._pending) >= self.max_batch
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            await self.flush()
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        results, self._pending = self._pending, []
+        self._last_flush = time.monotonic()
+        await self._send("bulk_command_progress", {
+            "bulk_id": self.bulk_id,
+            "completed": self.completed,
+            "total": self.total,
+            "results": results
+        })
+
+    async def finished(self, elapsed: float) -> None:
+        await self.flush()
+        await self._send("bulk_command_completed", {
+            "bulk_id": self.bulk_id,
+            "completed": self.completed,
+            "succeeded": self.succeeded,
+            "failed": self.completed - self.succeeded,
+            "total": self.total,
+            "elapsed_ms": round(elapsed * 1000)
+        })
+
+
+async def _wait_server_slot(server_id: int, min_interval: float) -> None:
+    """Пейсинг одного сервера: не чаще одной команды в min_interval"""
+    if min_interval <= 0:
+        return
+    now = time.monotonic()
+    # Резервируем слот до ожидания - параллельные bulk запросы встают в очередь
+    send_at = max(now, _server_next_send.get(server_id, 0.0))
+    _server_next_send[server_id] = send_at + min_interval
+    if send_at > now:
+        await asyncio.sleep(send_at - now)
+
+
+async def fan_out_command(
+    servers: List[models.Server],
+    command: str,
+    timeout: float,
+    user_id: int,
+    bulk_id: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Отправить команду на все серверы параллельно
+
+    Args:
+        servers: Серверы (уже проверенные на принадлежность пользователю)
+        command: Команда
+        timeout: Таймаут ответа одного сервера (секунды)
+        user_id: Пользователь (для WebSocket стриминга)
+        bulk_id: ID операции для корреляции сообщений (по умолчанию генерируется)
+
+    Returns:
+        Результаты в порядке servers: server_id, server_name, status, response
+        и execution_time (момент получения ответа)
+    """
+    max_concurrency = get_config_value('high_load', 'udp.bulk_commands.max_concurrency', default=64)
+    launch_interval = get_config_value('high_load', 'udp.bulk_commands.launch_interval_ms', default=5) / 1000.0
+    server_interval = get_config_value('high_load', 'udp.bulk_commands.per_server_interval_ms', default=100) / 1000.0
+    stream_interval = get_config_value('high_load', 'udp.bulk_commands.stream_interval_ms', default=200) / 1000.0
+    stream_batch = get_config_value('high_load', 'udp.bulk_commands.stream_batch_size', default=50)
+
+    bulk_id = bulk_id or uuid.uuid4().hex
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    streamer = BulkProgressStreamer(user_id, bulk_id, command, len(servers), stream_interval, stream_batch)
+    results: List[Optional[Dict[str, Any]]] = [None] * len(servers)
+    start = time.monotonic()
+
+    async def run_one(index: int, server: models.Server) -> None:
+        # Пейсинг запусков: index-й сервер стартует не раньше index × launch_interval
+        if launch_interval > 0:
+            delay = start + index * launch_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        async with semaphore:
+            await _wait_server_slot(server.id, server_interval)
+            try:
+                success, response = await send_command_unified(server, command, timeout=timeout)
+            except Exception as e:
+                log(f"[BULK] Error sending command to server {server.id}: {e}", level="ERROR")
+                success, response = False, str(e)
+
+        result = {
+            "server_id": server.id,
+            "server_name": server.name,
+            "status": "success" if success else "error",
+            "response": response,
+            "execution_time": utcnow()
+        }
+        results[index] = result
+        await streamer.add({k: v for k, v in result.items() if k != "execution_time"})
+
+    await streamer.started()
+    await asyncio.gather(*(run_one(i, server) for i, server in enumerate(servers)))
+    elapsed = time.monotonic() - start
+    await streamer.finished(elapsed)
+
+    log(f"[BULK] '{command}' → {len(servers)} servers: {streamer.succeeded} ok, "
+        f"{streamer.completed - streamer.succeeded} failed in {elapsed:.2f}s "
+        f"(concurrency={max_concurrency})")
+    return results
+
+
+def save_bulk_history(db: Session, command: str, user_id: int, results: List[Dict[str, Any]]) -> None:
+    """
+    Записать историю bulk команды одним INSERT
+
+    Args:
+        db: Сессия БД
+        command: Команда
+        user_id: Пользователь
+        results: Результаты fan_out_command
+    """
+    rows = [
+        {
+            "command": command,
+            "response": r["response"] if r["status"] == "success" else None,
+            "status": r["status"],
+            "execution_time": r["execution_time"],
+            "user_id": user_id,
+            "server_id": r["server_id"]
+        }
+        for r in results
+    ]
+    if rows:
+        db.bulk_insert_mappings(models.CommandHistory, rows)
+    db.commit()
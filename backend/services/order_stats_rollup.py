@@ -0,0 +1,601 @@
+"""
+Rollup статистики закрытых ордеров
+
+Поддерживает таблицу order_stats_daily - дневные агрегаты по ключу
+(user, server, strategy, symbol, emulator, день закрытия):
+количество, победы/поражения, gross profit/loss, сумма длительностей,
+min/max кривой капитала, просадка и серии внутри дня.
+
+Обновление инкрементальное через события сессии SQLAlchemy:
+- before_flush: снимок "до/после" для изменённых MoonBotOrder
+- after_flush: применение дельты в той же транзакции, что и ордер
+
+Ошибка rollup не откатывает ордера:
+- PostgreSQL (соединение на сессию): дельта применяется в SAVEPOINT -
+  после ошибки откатывается только он, иначе транзакция ордеров
+  была бы прервана (current transaction is aborted)
+- SQLite: без SAVEPOINT - соединение StaticPool общее для всех потоков
+  (чужие SAVEPOINT освобождали бы друг друга), а упавший запрос
+  SQLite транзакцию не прерывает
+
+Изменения, дельта которых не применилась, запоминаются, и после commit
+их бакеты пересчитываются в следующей транзакции с ордерами. Сбои
+и очередь пересчёта видны в get_rollup_stats() (/api/metrics/udp).
+
+Быстрый путь - ордер закрылся позже последнего ордера бакета (O(1)).
+Иначе (ордер изменён/удалён/закрыт задним числом) бакет пересчитывается
+из moonbot_orders - это ордера одного ключа за один день.
+
+/api/trading-stats читает O(дней) строк вместо O(ордеров).
+"""
+import threading
+from dataclasses import dataclass, fields
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, event, func, insert, inspect, select, update
+from sqlalchemy.engine import Connection
+
+from models import models
+from models.database import SessionLocal
+from services.user_id_cache import get_user_id_for_server, set_user_id_for_server
+from utils.datetime_utils import utcnow
+from utils.logging import log
+
+
+# Ключ бакета: (user_id, server_id, strategy, symbol, is_emulator, day)
+BucketKey = Tuple[int, int, str, str, bool, date]
+
+# Поля ордера, влияющие на rollup
+_SNAPSHOT_FIELDS = (
+    'server_id', 'status', 'strategy', 'symbol', 'is_emulator',
+    'opened_at', 'closed_at', 'profit_btc', 'profit_percent', 'spent_btc',
+)
+
+_PENDING_KEY = 'order_stats_rollup_pending'
+_FAILED_KEY = 'order_stats_rollup_failed'
+_REPAIR_KEY = 'order_stats_rollup_repair'
+_REBUILD_BATCH_SIZE = 1000
+
+_hooks_installed = False
+_hooks_lock = threading.Lock()
+
+# Изменения закоммиченных ордеров, rollup которых не применился
+_repair_lock = threading.Lock()
+_repair_queue: List[Tuple[Optional[dict], Optional[dict]]] = []
+_stats = {'applied_changes': 0, 'failures': 0, 'repaired_changes': 0}
+
+_rollup_table = models.OrderStatsDaily.__table__
+_orders_table = models.MoonBotOrder.__table__
+
+
+@dataclass
+class RollupAccumulator:
+    """
+    Агрегаты одного бакета
+
+    Все поля складываются по ордерам в порядке закрытия (add).
+    Кривая капитала и серии - внутри бакета (относительно его начала);
+    /api/trading-stats склеивает их по бакетам (см. calculators.py).
+    """
+    orders_count: int = 0
+    wins: int = 0
+    losses: int = 0
+    gross_profit: float = 0.0
+    gross_loss: float = 0.0
+    spent_sum: float = 0.0
+    profit_percent_sum: float = 0.0
+    profit_percent_count: int = 0
+    duration_sum: float = 0.0
+    duration_count: int = 0
+    equity_min: float = 0.0
+    equity_max: float = 0.0
+    max_drawdown: float = 0.0
+    win_streak_head: int = 0
+    win_streak_tail: int = 0
+    win_streak_max: int = 0
+    loss_streak_head: int = 0
+    loss_streak_tail: int = 0
+    loss_streak_max: int = 0
+    first_closed_at: Optional[datetime] = None
+    last_closed_at: Optional[datetime] = None
+
+    @classmethod
+    def from_row(cls, row) -> 'RollupAccumulator':
+        """Восстановить аккумулятор из строки order_stats_daily"""
+        mapping = row._mapping
+        return cls(**{f.name: mapping[f.name] for f in fields(cls)})
+
+    def to_values(self) -> dict:
+        """Значения для INSERT/UPDATE order_stats_daily"""
+        return {f.name: getattr(self, f.name) for f in fields(self)}
+
+    def add(self, snapshot: dict) -> None:
+        """
+        Добавить закрытый ордер в конец бакета
+
+        Args:
+            snapshot: Снимок ордера (_SNAPSHOT_FIELDS)
+        """
+        profit = snapshot['profit_btc'] or 0.0
+        decisive = self.wins + self.losses
+
+        self.orders_count += 1
+        if profit > 0:
+            self.gross_profit += profit
+            # Серия в начале бакета продолжается, только пока не было поражений
+            if self.win_streak_head == decisive:
+                self.win_streak_head += 1
+            self.win_streak_tail += 1
+            self.loss_streak_tail = 0
+            self.win_streak_max = max(self.win_streak_max, self.win_streak_tail)
+            self.wins += 1
+        elif profit < 0:
+            self.gross_loss += -profit
+            if self.loss_streak_head == decisive:
+                self.loss_streak_head += 1
+            self.loss_streak_tail += 1
+            self.win_streak_tail = 0
+            self.loss_streak_max = max(self.loss_streak_max, self.loss_streak_tail)
+            self.losses += 1
+
+        if snapshot['spent_btc']:
+            self.spent_sum += snapshot['spent_btc']
+        if snapshot['profit_percent'] is not None:
+            self.profit_percent_sum += snapshot['profit_percent']
+            self.profit_percent_count += 1
+
+        closed_at = snapshot['closed_at']
+        opened_at = snapshot['opened_at']
+        if opened_at is not None and closed_at is not None:
+            self.duration_sum += (closed_at - opened_at).total_seconds()
+            self.duration_count += 1
+
+        # Кривая капитала: equity_max - текущий пик, просадка от него
+        equity = self.gross_profit - self.gross_loss
+        self.equity_max = max(self.equity_max, equity)
+        self.equity_min = min(self.equity_min, equity)
+        self.max_drawdown = max(self.max_drawdown, self.equity_max - equity)
+
+        if self.first_closed_at is None:
+            self.first_closed_at = closed_at
+        self.last_closed_at = closed_at
+
+
+def _snapshot_new(order: models.MoonBotOrder) -> dict:
+    """Текущие значения ордера"""
+    return {name: getattr(order, name) for name in _SNAPSHOT_FIELDS}
+
+
+def _snapshot_old(order: models.MoonBotOrder) -> dict:
+    """Значения ордера на момент загрузки из БД (до изменений в сессии)"""
+    state = inspect(order)
+    snapshot = {}
+    for name in _SNAPSHOT_FIELDS:
+        history = state.attrs[name].load_history()
+        if history.deleted:
+            snapshot[name] = history.deleted[0]
+        elif history.unchanged:
+            snapshot[name] = history.unchanged[0]
+        else:
+            snapshot[name] = None
+    return snapshot
+
+
+def _contributes(snapshot: Optional[dict]) -> bool:
+    """Учитывается ли ордер в rollup (только закрытые с датой закрытия)"""
+    return bool(
+        snapshot
+        and snapshot['status'] == "Closed"
+        and snapshot['closed_at'] is not None
+        and snapshot['server_id'] is not None
+    )
+
+
+def _resolve_user_id(conn: Connection, server_id: int) -> Optional[int]:
+    """user_id сервера (глобальный кэш, затем БД)"""
+    user_id = get_user_id_for_server(server_id)
+    if user_id is not None:
+        return user_id
+
+    user_id = conn.execute(
+        select(models.Server.__table__.c.user_id).where(models.Server.__table__.c.id == server_id)
+    ).scalar()
+    if user_id is not None:
+        set_user_id_for_server(server_id, user_id)
+    return user_id
+
+
+def _bucket_key(conn: Connection, snapshot: dict) -> Optional[BucketKey]:
+    """Ключ бакета для снимка ордера (None если ордер не учитывается)"""
+    if not _contributes(snapshot):
+        return None
+
+    user_id = _resolve_user_id(conn, snapshot['server_id'])
+    if user_id is None:
+        return None
+
+    return (
+        user_id,
+        snapshot['server_id'],
+        snapshot['strategy'] or "",
+        snapshot['symbol'] or "",
+        bool(snapshot['is_emulator']),
+        snapshot['closed_at'].date(),
+    )
+
+
+def _key_filter(table, key: BucketKey) -> list:
+    """Условия WHERE для строки order_stats_daily по ключу"""
+    user_id, server_id, strategy, symbol, is_emulator, day = key
+    return [
+        table.c.user_id == user_id,
+        table.c.server_id == server_id,
+        table.c.strategy == strategy,
+        table.c.symbol == symbol,
+        table.c.is_emulator == is_emulator,
+        table.c.day == day,
+    ]
+
+
+def _key_values(key: BucketKey) -> dict:
+    """Значения ключевых колонок для INSERT"""
+    user_id, server_id, strategy, symbol, is_emulator, day = key
+    return {
+        'user_id': user_id,
+        'server_id': server_id,
+        'strategy': strategy,
+        'symbol': symbol,
+        'is_emulator': is_emulator,
+        'day': day,
+    }
+
+
+def _load_bucket(conn: Connection, key: BucketKey):
+    """Прочитать строку бакета"""
+    return conn.execute(
+        select(_rollup_table).where(*_key_filter(_rollup_table, key))
+    ).first()
+
+
+def _store_bucket(conn: Connection, key: BucketKey, row, acc: RollupAccumulator) -> None:
+    """Записать аккумулятор бакета (UPDATE существующей строки или INSERT)"""
+    values = acc.to_values()
+    values['updated_at'] = utcnow()
+    if row is not None:
+        conn.execute(update(_rollup_table).where(_rollup_table.c.id == row.id).values(**values))
+    else:
+        values.update(_key_values(key))
+        conn.execute(insert(_rollup_table).values(**values))
+
+
+def _try_append(conn: Connection, key: BucketKey, snapshot: dict) -> bool:
+    """
+    Быстрый путь: добавить ордер в конец бакета
+
+    Returns:
+        False если ордер закрыт раньше последнего ордера бакета
+        (нужен пересчёт - порядок внутри дня важен для просадки и серий)
+    """
+    row = _load_bucket(conn, key)
+    if row is None:
+        acc = RollupAccumulator()
+    else:
+        if row.last_closed_at is not None and snapshot['closed_at'] < row.last_closed_at:
+            return False
+        acc = RollupAccumulator.from_row(row)
+
+    acc.add(snapshot)
+    _store_bucket(conn, key, row, acc)
+    return True
+
+
+def _recompute_bucket(conn: Connection, key: BucketKey) -> None:
+    """Пересчитать бакет из moonbot_orders (ордера одного ключа за один день)"""
+    _, server_id, strategy, symbol, is_emulator, day = key
+    day_start = datetime.combine(day, datetime.min.time())
+    orders = _orders_table.c
+
+    result = conn.execute(
+        select(*[orders[name] for name in _SNAPSHOT_FIELDS]).where(
+            orders.server_id == server_id,
+            orders.status == "Closed",
+            orders.closed_at >= day_start,
+            orders.closed_at < day_start + timedelta(days=1),
+            func.coalesce(orders.strategy, "") == strategy,
+            func.coalesce(orders.symbol, "") == symbol,
+            func.coalesce(orders.is_emulator, False) == is_emulator,
+        ).order_by(orders.closed_at.asc(), orders.id.asc())
+    )
+
+    acc = RollupAccumulator()
+    for order_row in result:
+        acc.add(dict(order_row._mapping))
+
+    row = _load_bucket(conn, key)
+    if acc.orders_count == 0:
+        if row is not None:
+            conn.execute(delete(_rollup_table).where(_rollup_table.c.id == row.id))
+        return
+
+    _store_bucket(conn, key, row, acc)
+
+
+def apply_order_changes(conn: Connection, changes: List[Tuple[Optional[dict], Optional[dict]]]) -> None:
+    """
+    Применить изменения ордеров к rollup
+
+    Args:
+        conn: Соединение текущей транзакции
+        changes: Список пар (снимок до, снимок после); None - ордера не было/удалён
+    """
+    recompute: set = set()
+    appends: List[Tuple[BucketKey, dict]] = []
+
+    for old, new in changes:
+        old_key = _bucket_key(conn, old) if old else None
+        new_key = _bucket_key(conn, new) if new else None
+
+        # Ордер уже был учтён - его вклад нельзя "вычесть" из просадки/серий
+        if old_key is not None:
+            recompute.add(old_key)
+        if new_key is not None:
+            appends.append((new_key, new))
+
+    for key, snapshot in appends:
+        if key in recompute:
+            continue
+        if not _try_append(conn, key, snapshot):
+            recompute.add(key)
+
+    for key in recompute:
+        _recompute_bucket(conn, key)
+
+
+def _before_flush(session, flush_context, instances) -> None:
+    """Собрать снимки изменённых ордеров до записи в БД"""
+    changes = session.info.setdefault(_PENDING_KEY, [])
+
+    for obj in session.new:
+        if isinstance(obj, models.MoonBotOrder):
+            new = _snapshot_new(obj)
+            if _contributes(new):
+                changes.append((None, new))
+
+    for obj in session.dirty:
+        if isinstance(obj, models.MoonBotOrder) and session.is_modified(obj):
+            old = _snapshot_old(obj)
+            new = _snapshot_new(obj)
+            if old != new and (_contributes(old) or _contributes(new)):
+                changes.append((old if _contributes(old) else None, new))
+
+    for obj in session.deleted:
+        if isinstance(obj, models.MoonBotOrder):
+            old = _snapshot_old(obj)
+            if _contributes(old):
+                changes.append((old, None))
+
+
+def _changed_keys(conn: Connection, changes: List[Tuple[Optional[dict], Optional[dict]]]) -> set:
+    """Бакеты, которые затрагивают изменения (до и после)"""
+    keys = set()
+    for old, new in changes:
+        for snapshot in (old, new):
+            key = _bucket_key(conn, snapshot) if snapshot else None
+            if key is not None:
+                keys.add(key)
+    return keys
+
+
+def _uses_savepoint(conn: Connection) -> bool:
+    """Изолировать запросы rollup в SAVEPOINT (все БД, кроме SQLite с общим соединением)"""
+    return conn.dialect.name != "sqlite"
+
+
+def _run_isolated(conn: Connection, func, *args) -> None:
+    """Выполнить запросы rollup; при ошибке откатываются только они (см. _uses_savepoint)"""
+    if _uses_savepoint(conn):
+        with conn.begin_nested():
+            func(conn, *args)
+    else:
+        func(conn, *args)
+
+
+def _recompute_changed(conn: Connection, changes: List[Tuple[Optional[dict], Optional[dict]]]) -> None:
+    for key in _changed_keys(conn, changes):
+        _recompute_bucket(conn, key)
+
+
+def _repair_failed(session, conn: Connection) -> None:
+    """
+    Пересчитать бакеты изменений, rollup которых не применился
+
+    Бакет пересчитывается из moonbot_orders целиком, поэтому результат
+    верен, даже если сбойная дельта была применена частично.
+    До commit изменения остаются за сессией (при откате - снова в очередь).
+    """
+    with _repair_lock:
+        if not _repair_queue:
+            return
+        failed = list(_repair_queue)
+        _repair_queue.clear()
+
+    try:
+        _run_isolated(conn, _recompute_changed, failed)
+    except Exception as e:
+        with _repair_lock:
+            _repair_queue.extend(failed)
+        log(f"[ORDER-STATS] Rollup repair failed ({len(failed)} changes): {e}", level="ERROR")
+        return
+
+    session.info.setdefault(_REPAIR_KEY, []).extend(failed)
+
+
+def _after_flush(session, flush_context) -> None:
+    """Применить изменения в той же транзакции, что и ордера"""
+    changes = session.info.pop(_PENDING_KEY, None)
+    if not changes:
+        return
+
+    conn = session.connection()
+    try:
+        _run_isolated(conn, apply_order_changes, changes)
+    except Exception as e:
+        # Ордера не откатываем - бакеты пересчитаются после commit
+        session.info.setdefault(_FAILED_KEY, []).extend(changes)
+        with _repair_lock:
+            _stats['failures'] += 1
+        log(f"[ORDER-STATS] Rollup update failed ({len(changes)} changes): {e}", level="ERROR")
+    else:
+        with _repair_lock:
+            _stats['applied_changes'] += len(changes)
+
+    _repair_failed(session, conn)
+
+
+def _after_commit(session) -> None:
+    """Поставить сбойные изменения в очередь пересчёта (ордера уже в БД)"""
+    failed = session.info.pop(_FAILED_KEY, None)
+    repaired = session.info.pop(_REPAIR_KEY, None)
+    with _repair_lock:
+        if failed:
+            _repair_queue.extend(failed)
+        if repaired:
+            _stats['repaired_changes'] += len(repaired)
+
+
+def _after_rollback(session) -> None:
+    """Сбросить несохранённые снимки при откате"""
+    session.info.pop(_PENDING_KEY, None)
+    # Сбойные изменения откатились вместе с ордерами
+    session.info.pop(_FAILED_KEY, None)
+    repaired = session.info.pop(_REPAIR_KEY, None)
+    if repaired:
+        with _repair_lock:
+            _repair_queue.extend(repaired)
+
+
+# События сессии, на которых держится rollup
+_SESSION_HOOKS = (
+    ("before_flush", _before_flush),
+    ("after_flush", _after_flush),
+    ("after_commit", _after_commit),
+    ("after_rollback", _after_rollback),
+)
+
+
+def get_rollup_stats() -> Dict[str, int]:
+    """
+    Статистика инкрементального обновления rollup
+
+    Returns:
+        {"applied_changes", "failures", "repaired_changes", "pending_repair"}
+    """
+    with _repair_lock:
+        return {**_stats, 'pending_repair': len(_repair_queue)}
+
+
+def install_order_stats_hooks() -> None:
+    """Подключить обновление rollup к сессиям SessionLocal (идемпотентно)"""
+    global _hooks_installed
+    with _hooks_lock:
+        if _hooks_installed:
+            return
+        for name, hook in _SESSION_HOOKS:
+            event.listen(SessionLocal, name, hook)
+        _hooks_installed = True
+
+
+def rebuild_order_stats(conn: Connection) -> int:
+    """
+    Полностью пересобрать order_stats_daily из moonbot_orders
+
+    Ордера читаются потоком в порядке ключа и времени закрытия,
+    бакеты пишутся пачками.
+
+    Args:
+        conn: Соединение (внутри транзакции)
+
+    Returns:
+        Количество созданных бакетов
+    """
+    orders = _orders_table.c
+    servers = models.Server.__table__.c
+    strategy_col = func.coalesce(orders.strategy, "")
+    symbol_col = func.coalesce(orders.symbol, "")
+    emulator_col = func.coalesce(orders.is_emulator, False)
+
+    conn.execute(delete(_rollup_table))
+
+    result = conn.execution_options(yield_per=_REBUILD_BATCH_SIZE).execute(
+        select(
+            servers.user_id,
+            strategy_col.label('key_strategy'),
+            symbol_col.label('key_symbol'),
+            emulator_col.label('key_emulator'),
+            *[orders[name] for name in _SNAPSHOT_FIELDS]
+        ).join_from(
+            _orders_table, models.Server.__table__, orders.server_id == servers.id
+        ).where(
+            orders.status == "Closed",
+            orders.closed_at.isnot(None)
+        ).order_by(
+            servers.user_id, orders.server_id, strategy_col, symbol_col, emulator_col,
+            orders.closed_at.asc(), orders.id.asc()
+        )
+    )
+
+    buckets_created = 0
+    batch: List[dict] = []
+    current_key: Optional[BucketKey] = None
+    acc: Optional[RollupAccumulator] = None
+
+    def flush_bucket() -> None:
+        nonlocal buckets_created
+        if current_key is None:
+            return
+        values = acc.to_values()
+        values.update(_key_values(current_key))
+        values['updated_at'] = utcnow()
+        batch.append(values)
+        buckets_created += 1
+        if len(batch) >= _REBUILD_BATCH_SIZE:
+            conn.execute(insert(_rollup_table), batch)
+            batch.clear()
+
+    for row in result:
+        snapshot = dict(row._mapping)
+        key = (
+            row.user_id, row.server_id, row.key_strategy, row.key_symbol,
+            bool(row.key_emulator), row.closed_at.date(),
+        )
+        if key != current_key:
+            flush_bucket()
+            current_key = key
+            acc = RollupAccumulator()
+        acc.add(snapshot)
+
+    flush_bucket()
+    if batch:
+        conn.execute(insert(_rollup_table), batch)
+
+    return buckets_created
+
+
+def get_rollup_consistency(conn: Connection) -> Dict[str, int]:
+    """
+    Сравнить количество ордеров в rollup и в moonbot_orders
+
+    Returns:
+        {"rollup_orders": N, "closed_orders": M}
+    """
+    orders = _orders_table.c
+    rollup_orders = conn.execute(
+        select(func.coalesce(func.sum(_rollup_table.c.orders_count), 0))
+    ).scalar()
+    closed_orders = conn.execute(
+        select(func.count()).select_from(_orders_table).join(
+            models.Server.__table__, orders.server_id == models.Server.__table__.c.id
+        ).where(orders.status == "Closed", orders.closed_at.isnot(None))
+    ).scalar()
+    return {"rollup_orders": int(rollup_orders or 0), "closed_orders": int(closed_orders or 0)}
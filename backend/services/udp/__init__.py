@@ -1,8 +1,9 @@
 """
 UDP Listener Service для постоянного прослушивания MoonBot
 
-Этот модуль запускает отдельные потоки для каждого сервера,
-которые непрерывно слушают UDP сообщения от MoonBot.
+Этот модуль непрерывно слушает UDP сообщения от MoonBot:
+в SERVER режиме через один глобальный сокет, в LOCAL/AUTO режиме
+через общие reactor'ы (selector) с отдельным сокетом на сервер.
 
 Оптимизирован для высоких нагрузок (3000+ серверов):
 - Worker Pool для параллельной обработки сообщений
@@ -3,12 +3,29 @@ Batch Processor для массовых операций с БД
 
 Оптимизирует запись в БД путём группировки операций в пакеты.
 Критически важно для обработки данных от 3000+ серверов.
+
+Буферы таблиц двойные: производитель (UDP/worker поток) под коротким
+lock'ом таблицы подменяет заполненный буфер пустым и передаёт пакет
+writer потоку - запись в БД не выполняется в потоке производителя
+и не держит lock таблицы. Пакеты пишутся одним writer потоком
+в порядке передачи (порядок SQL дельт ордеров сохраняется).
+
+Память ограничена max_pending_items (элементы в буферах и в очереди
+writer'а). При переполнении - overflow_policy:
+- block: производитель ждёт освобождения места до overflow_block_timeout_ms,
+  затем элемент отбрасывается
+- drop: новый элемент сразу отбрасывается
+Отброшенные элементы считаются в статистике (overflow_dropped).
+
+Если БД недоступна или запись дольше latency_budget_ms, пакеты
+уходят в дисковый spool и воспроизводятся writer'ом по порядку
+(см. batch_processor_spool.py).
 """
 import threading
 import time
-from collections import defaultdict
+from collections import defaultdict, deque
 from dataclasses import dataclass, field
-from typing import Any, Dict, List, Optional, Type
+from typing import Any, Deque, Dict, List, Optional, Tuple, Type
 from datetime import datetime
 
 from sqlalchemy.orm import Session
@@ -19,13 +36,16 @@ from utils.config_loader import get_config_value
 from utils.logging import log
 from utils.datetime_utils import utcnow
 from .batch_processor_upsert import BatchUpsertMixin
+from .batch_processor_orders import BatchOrderSQLMixin, ORDER_SQL_OPERATION
+from .batch_processor_charts import BatchChartMixin, CHART_OPERATION
+from .batch_processor_spool import BatchSpoolMixin
 
 
 @dataclass
 class BatchItem:
     """Элемент для batch-обработки."""
     table: str
-    operation: str  # 'insert', 'update', 'upsert'
+    operation: str  # 'insert', 'update', 'upsert', 'order_sql', 'chart'
     data: Dict[str, Any]
     created_at: float = field(default_factory=time.time)
 
@@ -40,9 +60,26 @@ class BatchStats:
     total_errors: int = 0
     avg_batch_size: float = 0.0
     avg_flush_time_ms: float = 0.0
+    overflow_blocked: int = 0
+    overflow_dropped: int = 0
+
+
+# Политики переполнения (async_processing.bulk.overflow_policy)
+OVERFLOW_BLOCK = 'block'
+OVERFLOW_DROP = 'drop'
+
+# Сколько последних flush'ей учитывается в перцентилях задержки
+_LATENCY_WINDOW = 1024
 
 
-class BatchProcessor(BatchUpsertMixin):
+def _percentile(values: List[float], q: float) -> float:
+    """Перцентиль (nearest rank) отсортированного списка"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, int(round(q * len(values))) - 1))]
+
+
+class BatchProcessor(BatchOrderSQLMixin, BatchChartMixin, BatchUpsertMixin, BatchSpoolMixin):
     """
     Процессор для пакетной записи в БД.
     
@@ -62,7 +99,9 @@ class BatchProcessor(BatchUpsertMixin):
     def __init__(
         self,
         batch_size: Optional[int] = None,
-        flush_interval_ms: Optional[int] = None
+        flush_interval_ms: Optional[int] = None,
+        max_pending_items: Optional[int] = None,
+        overflow_policy: Optional[str] = None
     ):
         """
         Инициализация batch processor.
@@ -70,6 +109,8 @@ class BatchProcessor(BatchUpsertMixin):
         Args:
             batch_size: Размер пакета для flush
             flush_interval_ms: Интервал автоматического flush
+            max_pending_items: Лимит элементов в буферах и очереди writer'а
+            overflow_policy: 'block' или 'drop' (см. docstring модуля)
         """
         self.batch_size = batch_size or get_config_value(
             'high_load', 'async_processing.bulk.insert_batch_size', default=500
@@ -77,12 +118,36 @@ class BatchProcessor(BatchUpsertMixin):
         self.flush_interval_ms = flush_interval_ms or get_config_value(
             'high_load', 'async_processing.bulk.flush_interval_ms', default=100
         )
+        self.max_pending_items = max_pending_items or get_config_value(
+            'high_load', 'async_processing.bulk.max_pending_items', default=200000
+        )
+        self.overflow_policy = overflow_policy or get_config_value(
+            'high_load', 'async_processing.bulk.overflow_policy', default=OVERFLOW_BLOCK
+        )
+        if self.overflow_policy not in (OVERFLOW_BLOCK, OVERFLOW_DROP):
+            log(f"[BATCH-PROCESSOR] Unknown overflow_policy '{self.overflow_policy}', using '{OVERFLOW_BLOCK}'",
+                level="WARNING")
+            self.overflow_policy = OVERFLOW_BLOCK
+        self.overflow_block_timeout = get_config_value(
+            'high_load', 'async_processing.bulk.overflow_block_timeout_ms', default=1000
+        ) / 1000.0
         
         # Буферы для каждой таблицы
         self._buffers: Dict[str, List[BatchItem]] = defaultdict(list)
         self._locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
         self._last_flush: Dict[str, float] = defaultdict(float)
         
+        # Пакеты, переданные writer потоку: (таблица, элементы, время передачи)
+        self._handoff: Deque[Tuple[str, List[BatchItem], float]] = deque()
+        self._handoff_cond = threading.Condition()
+        self._pending_items = 0  # в буферах и в очереди writer'а (под _handoff_cond)
+        self._writing = False
+        self._last_overflow_log = 0.0
+        
+        # Задержки последних flush'ей (мс)
+        self._flush_times: Deque[float] = deque(maxlen=_LATENCY_WINDOW)
+        self._handoff_waits: Deque[float] = deque(maxlen=_LATENCY_WINDOW)
+        
         # Статистика
         self._stats = BatchStats()
         self._stats_lock = threading.Lock()
@@ -91,21 +156,26 @@ class BatchProcessor(BatchUpsertMixin):
         self._running = False
         self._flush_thread: Optional[threading.Thread] = None
         
+        # Дисковый spool на время недоступности БД
+        self._init_spool()
+        
         log(f"[BATCH-PROCESSOR] Initialized: batch_size={self.batch_size}, "
-            f"flush_interval={self.flush_interval_ms}ms")
+            f"flush_interval={self.flush_interval_ms}ms, max_pending={self.max_pending_items} "
+            f"({self.overflow_policy})")
     
     def start(self) -> None:
-        """Запустить background flush thread."""
+        """Запустить writer thread (запись пакетов и flush по таймеру)."""
         if self._running:
             return
         
         self._running = True
         self._flush_thread = threading.Thread(
-            target=self._flush_loop,
+            target=self._writer_loop,
             daemon=True,
-            name="BatchProcessorFlusher"
+            name="BatchProcessorWriter"
         )
         self._flush_thread.start()
+        self._start_spool_monitor()
         log("[BATCH-PROCESSOR] Started")
     
     def stop(self) -> None:
@@ -114,13 +184,20 @@ class BatchProcessor(BatchUpsertMixin):
             return
         
         log("[BATCH-PROCESSOR] Stopping...")
-        self._running = False
+        with self._handoff_cond:
+            self._running = False
+            self._handoff_cond.notify_all()
         
+        # Writer дописывает переданные пакеты и завершается
         if self._flush_thread:
             self._flush_thread.join(timeout=5.0)
+        if self._spool_thread:
+            self._spool_thread.join(timeout=1.0)
         
-        # Финальный flush всех буферов
+        # Финальный flush всех буферов (в этом потоке)
         self.flush_all()
+        if self._spool is not None:
+            self._spool.close()
         
         log(f"[BATCH-PROCESSOR] Stopped. Stats: {self.get_stats()}")
     
@@ -135,19 +212,24 @@ class BatchProcessor(BatchUpsertMixin):
         """
         item = BatchItem(table=table, operation=operation, data=data)
         
+        if not self._reserve(table):
+            return
+        
         with self._locks[table]:
-            self._buffers[table].append(item)
+            buffer = self._buffers[table]
+            buffer.append(item)
             
             with self._stats_lock:
                 self._stats.total_items += 1
             
-            # Проверяем, нужен ли flush
-            if len(self._buffers[table]) >= self.batch_size:
+            # Полный буфер уходит writer'у, запись - не в этом потоке
+            if len(buffer) >= self.batch_size:
                 self._flush_table(table)
     
     def add_balance(self, server_id: int, available: float, total: float,
                     bot_name: Optional[str] = None, is_running: Optional[bool] = None,
-                    version: Optional[int] = None) -> None:
+                    version: Optional[int] = None,
+                    updated_at: Optional[datetime] = None) -> None:
         """
         Добавить обновление баланса в буфер.
         
@@ -158,6 +240,7 @@ class BatchProcessor(BatchUpsertMixin):
             bot_name: Имя бота
             is_running: Запущен ли бот
             version: Версия MoonBot
+            updated_at: Момент приёма баланса (по умолчанию - сейчас)
         """
         data = {
             'server_id': server_id,
@@ -166,7 +249,7 @@ class BatchProcessor(BatchUpsertMixin):
             'bot_name': bot_name,
             'is_running': is_running,
             'version': version,
-            'updated_at': utcnow(),
+            'updated_at': updated_at or utcnow(),
         }
         self.add('server_balance', 'upsert', data)
     
@@ -245,14 +328,71 @@ class BatchProcessor(BatchUpsertMixin):
         }
         self.add('strategy_cache', 'upsert', item_data)
     
-    def _flush_loop(self) -> None:
-        """Background loop для периодического flush."""
-        while self._running:
+    def _reserve(self, table: str) -> bool:
+        """
+        Занять место под элемент (лимит max_pending_items).
+        
+        Returns:
+            False если элемент отброшен по overflow_policy
+        """
+        with self._handoff_cond:
+            if self._pending_items >= self.max_pending_items and self._running:
+                with self._stats_lock:
+                    self._stats.overflow_blocked += 1
+                if self.overflow_policy == OVERFLOW_BLOCK:
+                    deadline = time.monotonic() + self.overflow_block_timeout
+                    while self._pending_items >= self.max_pending_items and self._running:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._handoff_cond.wait(remaining)
+                
+                if self._pending_items >= self.max_pending_items and self._running:
+                    with self._stats_lock:
+                        self._stats.overflow_dropped += 1
+                        dropped = self._stats.overflow_dropped
+                    # Не чаще раза в секунду - при переполнении лог не должен тормозить производителей
+                    now = time.monotonic()
+                    if now - self._last_overflow_log >= 1.0:
+                        self._last_overflow_log = now
+                        log(f"[BATCH-PROCESSOR] Overflow: dropping {table} items "
+                            f"({self._pending_items} pending, {dropped} dropped total)", level="WARNING")
+                    return False
+            
+            self._pending_items += 1
+            return True
+    
+    def _writer_loop(self) -> None:
+        """Writer thread: запись переданных пакетов и flush буферов по таймеру."""
+        interval = self.flush_interval_ms / 1000.0
+        next_expiry_check = time.monotonic() + interval
+        
+        while True:
+            with self._handoff_cond:
+                while not self._handoff and self._running:
+                    timeout = next_expiry_check - time.monotonic()
+                    if self._spooling():
+                        # Пора повторить воспроизведение spool
+                        timeout = min(timeout, self._next_replay_at - time.monotonic())
+                    if timeout <= 0:
+                        break
+                    self._handoff_cond.wait(timeout)
+                
+                if not self._handoff and not self._running:
+                    break
+                batch = self._handoff.popleft() if self._handoff else None
+                self._writing = batch is not None
+            
             try:
-                time.sleep(self.flush_interval_ms / 1000.0)
-                self._flush_expired()
+                if batch is not None:
+                    self._write_batch(*batch)
+                if time.monotonic() >= next_expiry_check:
+                    self._flush_expired()
+                    next_expiry_check = time.monotonic() + interval
+                if self._spooling():
+                    self._replay_spool()
             except Exception as e:
-                log(f"[BATCH-PROCESSOR] Flush loop error: {e}", level="ERROR")
+                log(f"[BATCH-PROCESSOR] Writer loop error: {e}", level="ERROR")
     
     def _flush_expired(self) -> None:
         """Flush буферов, которые ждут дольше flush_interval_ms."""
@@ -266,15 +406,35 @@ class BatchProcessor(BatchUpsertMixin):
                     self._flush_table(table)
     
     def flush_all(self) -> None:
-        """Flush всех буферов."""
+        """Flush всех буферов (возвращается, когда пакеты записаны)."""
         for table in list(self._buffers.keys()):
             with self._locks[table]:
                 if self._buffers[table]:
                     self._flush_table(table)
+        
+        # Writer дописывает переданные пакеты (не ждём, если flush_all вызван им самим)
+        if threading.current_thread() is not self._flush_thread:
+            with self._handoff_cond:
+                while (self._handoff or self._writing or self._spool_unwritten) and self._running:
+                    self._handoff_cond.wait(0.1)
+        
+        # Writer остановлен - пакеты, не записанные им, пишутся в этом потоке
+        if not self._running:
+            while True:
+                with self._handoff_cond:
+                    if not self._handoff:
+                        break
+                    batch = self._handoff.popleft()
+                self._write_batch(*batch)
     
     def _flush_table(self, table: str) -> None:
         """
-        Flush буфера конкретной таблицы.
+        Передать буфер таблицы writer'у (вызывается под lock'ом таблицы).
+        
+        Буфер подменяется пустым; пакет ставится в очередь writer'а
+        под тем же lock'ом, поэтому пакеты таблицы пишутся по порядку.
+        Без запущенного writer'а (до start/после stop) пакет пишется
+        в вызывающем потоке.
         
         Args:
             table: Имя таблицы
@@ -283,12 +443,32 @@ class BatchProcessor(BatchUpsertMixin):
         if not items:
             return
         
-        start_time = time.time()
+        now = time.time()
         self._buffers[table] = []
-        self._last_flush[table] = start_time
+        self._last_flush[table] = now
+        
+        with self._handoff_cond:
+            if self._running:
+                self._handoff.append((table, items, now))
+                self._handoff_cond.notify_all()
+                return
+        
+        self._write_batch(table, items, now)
+    
+    def _write_batch(self, table: str, items: List[BatchItem], handed_off_at: float) -> None:
+        """
+        Записать пакет таблицы (writer thread).
+        
+        Args:
+            table: Имя таблицы
+            items: Элементы пакета
+            handed_off_at: Время передачи пакета writer'у
+        """
+        start_time = time.time()
         
         try:
-            self._execute_batch(table, items)
+            if self._execute_with_spool(table, items):
+                return
             
             flush_time_ms = (time.time() - start_time) * 1000
             
@@ -302,6 +482,8 @@ class BatchProcessor(BatchUpsertMixin):
                     (self._stats.avg_flush_time_ms * (self._stats.total_batches - 1) + flush_time_ms)
                     / self._stats.total_batches
                 )
+                self._flush_times.append(flush_time_ms)
+                self._handoff_waits.append((start_time - handed_off_at) * 1000)
             
             log(f"[BATCH-PROCESSOR] Flushed {len(items)} items to {table} in {flush_time_ms:.1f}ms")
             
@@ -309,6 +491,11 @@ class BatchProcessor(BatchUpsertMixin):
             with self._stats_lock:
                 self._stats.total_errors += 1
             log(f"[BATCH-PROCESSOR] Error flushing {table}: {e}", level="ERROR")
+        finally:
+            with self._handoff_cond:
+                self._pending_items -= len(items)
+                self._writing = False
+                self._handoff_cond.notify_all()
     
     def _execute_batch(self, table: str, items: List[BatchItem]) -> None:
         """
@@ -326,6 +513,26 @@ class BatchProcessor(BatchUpsertMixin):
             log(f"[BATCH-PROCESSOR] Unknown table: {table}", level="ERROR")
             return
         
+        # SQL дельты ордеров - отдельная транзакция (см. batch_processor_orders.py)
+        order_deltas = [i.data for i in items if i.operation == ORDER_SQL_OPERATION]
+        if order_deltas:
+            self._execute_order_deltas(order_deltas)
+            with self._stats_lock:
+                self._stats.total_updates += len(order_deltas)
+            items = [i for i in items if i.operation != ORDER_SQL_OPERATION]
+            if not items:
+                return
+        
+        # Графики - upsert пакетом и уведомления после commit (см. batch_processor_charts.py)
+        charts = [i.data for i in items if i.operation == CHART_OPERATION]
+        if charts:
+            self._execute_charts(charts)
+            with self._stats_lock:
+                self._stats.total_updates += len(charts)
+            items = [i for i in items if i.operation != CHART_OPERATION]
+            if not items:
+                return
+        
         db = SessionLocal()
         try:
             # Группируем по типу операции
@@ -374,7 +581,13 @@ class BatchProcessor(BatchUpsertMixin):
         Returns:
             Dict со статистикой
         """
+        with self._handoff_cond:
+            pending = self._pending_items
+            handoff_batches = len(self._handoff)
+        
         with self._stats_lock:
+            flush_times = sorted(self._flush_times)
+            handoff_waits = sorted(self._handoff_waits)
             return {
                 'total_items': self._stats.total_items,
                 'total_batches': self._stats.total_batches,
@@ -383,7 +596,17 @@ class BatchProcessor(BatchUpsertMixin):
                 'total_errors': self._stats.total_errors,
                 'avg_batch_size': round(self._stats.avg_batch_size, 1),
                 'avg_flush_time_ms': round(self._stats.avg_flush_time_ms, 2),
-                'pending': sum(len(b) for b in self._buffers.values()),
+                'flush_p50_ms': round(_percentile(flush_times, 0.50), 2),
+                'flush_p95_ms': round(_percentile(flush_times, 0.95), 2),
+                'flush_max_ms': round(flush_times[-1], 2) if flush_times else 0.0,
+                'handoff_wait_p95_ms': round(_percentile(handoff_waits, 0.95), 2),
+                'pending': pending,
+                'handoff_batches': handoff_batches,
+                'max_pending_items': self.max_pending_items,
+                'overflow_policy': self.overflow_policy,
+                'overflow_blocked': self._stats.overflow_blocked,
+                'overflow_dropped': self._stats.overflow_dropped,
+                'spool': self.get_spool_stats(),
             }
 
 
@@ -0,0 +1,135 @@
+"""
+Mixin записи графиков для BatchProcessor.
+
+Разобранные графики (services/udp/chart_pipeline.py) кладутся в буфер
+moonbot_charts и пишутся пакетом: один INSERT ... ON CONFLICT
+(server_id, order_db_id) DO UPDATE на все графики окна вместо
+SELECT + commit на график.
+
+Если commit пакета не удался, графики пишутся по одному в отдельных
+транзакциях - ошибка одного графика не теряет остальные. Ошибка
+недоступности БД пробрасывается: пакет уходит в spool
+(batch_processor_spool.py) и воспроизводится позже.
+
+WebSocket уведомления chart_update отправляются после commit.
+"""
+
+from typing import Dict, List, Optional
+
+from models.database import SessionLocal
+from models import models
+from utils.logging import log
+
+from .batch_processor_spool import is_db_unavailable
+
+
+# BatchItem.operation для графиков из ChartPipeline
+CHART_OPERATION = 'chart'
+
+
+class BatchChartMixin:
+    """
+    Mixin пакетной записи графиков.
+    """
+
+    def add_chart(self, row: Dict, user_id: Optional[int] = None) -> None:
+        """
+        Добавить график в буфер.
+
+        Args:
+            row: Строка moonbot_charts (server_id, order_db_id, chart_blob, ...)
+            user_id: Владелец сервера (для WebSocket уведомления после commit)
+        """
+        row['user_id'] = user_id
+        self.add('moonbot_charts', CHART_OPERATION, row)
+
+    def _execute_charts(self, charts: List[Dict]) -> None:
+        """
+        Записать графики одной транзакцией (с fallback по графику).
+
+        Args:
+            charts: Строки графиков в порядке поступления (+ user_id)
+        """
+        db = SessionLocal()
+        try:
+            self._bulk_upsert(db, models.MoonBotChart, 'moonbot_charts', [_chart_row(c) for c in charts])
+            db.commit()
+            committed = charts
+        except Exception as e:
+            db.rollback()
+            if is_db_unavailable(e):
+                raise
+            log(f"[BATCH-PROCESSOR] Chart batch failed ({len(charts)} charts), "
+                f"retrying one by one: {e}", level="ERROR")
+            committed = self._execute_charts_isolated(charts)
+        finally:
+            db.close()
+
+        self._notify_charts_committed(committed)
+
+    def _execute_charts_isolated(self, charts: List[Dict]) -> List[Dict]:
+        """
+        Записать каждый график в отдельной транзакции.
+
+        Returns:
+            Успешно записанные графики
+        """
+        committed = []
+        failed = 0
+        for chart in charts:
+            db = SessionLocal()
+            try:
+                self._bulk_upsert(db, models.MoonBotChart, 'moonbot_charts', [_chart_row(chart)])
+                db.commit()
+                committed.append(chart)
+            except Exception as e:
+                db.rollback()
+                failed += 1
+                log(f"[BATCH-PROCESSOR] Chart for order {chart.get('order_db_id')} "
+                    f"of server {chart.get('server_id')} failed: {e}", level="ERROR")
+            finally:
+                db.close()
+
+        if failed:
+            with self._stats_lock:
+                self._stats.total_errors += failed
+        return committed
+
+    def _notify_charts_committed(self, committed: List[Dict]) -> None:
+        """
+        WebSocket уведомления о записанных графиках и задержка приёма.
+
+        Args:
+            committed: Записанные графики
+        """
+        from services.websocket_manager import ws_manager
+        from .chart_pipeline import record_charts_committed
+
+        if not committed:
+            return
+
+        record_charts_committed(committed)
+
+        for chart in committed:
+            if not chart.get('user_id'):
+                continue
+            try:
+                ws_manager.send_message_threadsafe(
+                    {
+                        "type": "chart_update",
+                        "server_id": chart['server_id'],
+                        "order_id": chart['order_db_id'],
+                        "market_name": chart.get('market_name'),
+                        "market_currency": chart.get('market_currency'),
+                        "session_profit": chart.get('session_profit')
+                    },
+                    chart['user_id']
+                )
+            except Exception:
+                # Не блокируем flush при ошибке WS
+                pass
+
+
+def _chart_row(chart: Dict) -> Dict:
+    """Строка moonbot_charts без служебных полей буфера"""
+    return {k: v for k, v in chart.items() if k != 'user_id'}
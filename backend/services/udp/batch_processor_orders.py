@@ -0,0 +1,221 @@
+"""
+Mixin применения SQL дельт ордеров для BatchProcessor.
+
+Worker'ы разбирают SQL Orders без обращений к БД (SQLParser.parse_order_delta)
+и кладут дельты в буфер moonbot_orders. При flush все дельты окна
+применяются в одной сессии:
+- существующие ордера пакета берутся из кэша открытых ордеров
+  (open_order_cache.py), остальные загружаются одним SELECT
+- дельты одного ордера применяются последовательно к одному объекту,
+  поэтому на ордер приходится одна запись строки и один снимок
+  rollup статистики (order_stats_daily), сколько бы событий ни пришло
+- DELETE отменяет предшествующие дельты ордера в окне
+
+Если commit пакета не удался, ордера применяются по одному
+в отдельных транзакциях - ошибка одного ордера не теряет остальные.
+Ошибка недоступности БД пробрасывается без fallback: пакет целиком
+уходит в spool (batch_processor_spool.py) и воспроизводится позже.
+
+WebSocket уведомления об ордерах отправляются после commit.
+"""
+
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from models.database import SessionLocal
+from models import models
+from utils.logging import log
+
+from .batch_processor_spool import is_db_unavailable
+from .open_order_cache import get_open_order_cache
+
+
+# BatchItem.operation для дельт из SQLParser.parse_order_delta
+ORDER_SQL_OPERATION = 'order_sql'
+
+OrderKey = Tuple[int, int]  # (server_id, moonbot_order_id)
+
+
+def group_order_deltas(deltas: List[Dict]) -> Dict[OrderKey, List[Dict]]:
+    """
+    Сгруппировать дельты по ордеру в порядке поступления.
+
+    DELETE заменяет накопленные дельты ордера - применять их незачем.
+
+    Args:
+        deltas: Дельты в порядке поступления
+
+    Returns:
+        {(server_id, moonbot_order_id): [дельты]} в порядке первого появления
+    """
+    grouped: Dict[OrderKey, List[Dict]] = {}
+    for delta in deltas:
+        key = (delta['server_id'], delta['moonbot_order_id'])
+        steps = grouped.setdefault(key, [])
+        if delta['op'] == 'delete':
+            steps.clear()
+        steps.append(delta)
+    return grouped
+
+
+class BatchOrderSQLMixin:
+    """
+    Mixin пакетного применения SQL дельт ордеров.
+    """
+
+    def add_order_sql(self, delta: Dict, user_id: Optional[int] = None) -> None:
+        """
+        Добавить разобранную SQL команду Orders в буфер.
+
+        Args:
+            delta: Результат SQLParser.parse_order_delta
+            user_id: Владелец сервера (для WebSocket уведомления после commit)
+        """
+        delta['user_id'] = user_id
+        self.add('moonbot_orders', ORDER_SQL_OPERATION, delta)
+
+    def _execute_order_deltas(self, deltas: List[Dict]) -> None:
+        """
+        Применить дельты ордеров одной транзакцией (с fallback по ордеру).
+
+        Args:
+            deltas: Дельты в порядке поступления
+        """
+        from .parsers import SQLParser
+
+        grouped = group_order_deltas(deltas)
+        parsers: Dict[int, SQLParser] = {}
+
+        db = SessionLocal()
+        try:
+            orders = self._load_orders(db, grouped.keys())
+            for key, steps in grouped.items():
+                self._apply_order_steps(db, parsers, orders, key, steps)
+            db.commit()
+            committed = list(grouped.items())
+        except Exception as e:
+            db.rollback()
+            if is_db_unavailable(e):
+                raise
+            log(f"[BATCH-PROCESSOR] Order batch failed ({len(grouped)} orders), "
+                f"retrying one by one: {e}", level="ERROR")
+            committed = self._execute_order_deltas_isolated(grouped, parsers)
+        finally:
+            db.close()
+
+        self._notify_orders_committed(committed)
+
+    def _execute_order_deltas_isolated(self, grouped: Dict[OrderKey, List[Dict]],
+                                       parsers: Dict) -> List[Tuple[OrderKey, List[Dict]]]:
+        """
+        Применить дельты каждого ордера в отдельной транзакции.
+
+        Returns:
+            Успешно записанные (ключ, дельты)
+        """
+        committed = []
+        failed = 0
+        for key, steps in grouped.items():
+            db = SessionLocal()
+            try:
+                orders = self._load_orders(db, [key])
+                self._apply_order_steps(db, parsers, orders, key, steps)
+                db.commit()
+                committed.append((key, steps))
+            except Exception as e:
+                db.rollback()
+                failed += 1
+                log(f"[BATCH-PROCESSOR] Order {key[1]} of server {key[0]} failed: {e}", level="ERROR")
+            finally:
+                db.close()
+
+        if failed:
+            with self._stats_lock:
+                self._stats.total_errors += failed
+        return committed
+
+    def _apply_order_steps(self, db: Session, parsers: Dict, orders: Dict[OrderKey, models.MoonBotOrder],
+                           key: OrderKey, steps: List[Dict]) -> None:
+        """
+        Последовательно применить дельты одного ордера.
+
+        Args:
+            db: Сессия БД
+            parsers: Кэш SQLParser по server_id
+            orders: Загруженные ордера пакета (обновляется)
+            key: (server_id, moonbot_order_id)
+            steps: Дельты ордера
+        """
+        from .parsers import SQLParser
+
+        server_id, moonbot_order_id = key
+        parser = parsers.get(server_id)
+        if parser is None:
+            parser = parsers[server_id] = SQLParser(server_id)
+
+        for delta in steps:
+            order = orders.get(key)
+            # Ордер мог получить другой moonbot_order_id через fingerprint matching
+            if order is not None and order.moonbot_order_id != moonbot_order_id:
+                order = None
+
+            order = parser.apply_order_delta(db, delta, order)
+            if order is not None:
+                orders[(server_id, order.moonbot_order_id)] = order
+            else:
+                orders.pop(key, None)
+
+    def _load_orders(self, db: Session, keys) -> Dict[OrderKey, models.MoonBotOrder]:
+        """
+        Загрузить существующие ордера пакета: открытые из кэша,
+        остальные одним запросом.
+
+        Args:
+            db: Сессия БД
+            keys: Ключи (server_id, moonbot_order_id)
+
+        Returns:
+            {(server_id, moonbot_order_id): ордер}
+        """
+        orders, missing = get_open_order_cache().attach_many(db, set(keys))
+        if not missing:
+            return orders
+
+        keys = set(missing)
+        server_ids = list({k[0] for k in keys})
+        order_ids = list({k[1] for k in keys})
+
+        # Только ордера из пакета, а не все ордера серверов
+        rows = db.query(models.MoonBotOrder).filter(
+            models.MoonBotOrder.server_id.in_(server_ids),
+            models.MoonBotOrder.moonbot_order_id.in_(order_ids)
+        ).all()
+
+        for r in rows:
+            key = (r.server_id, r.moonbot_order_id)
+            if key in keys:
+                orders[key] = r
+        return orders
+
+    def _notify_orders_committed(self, committed: List[Tuple[OrderKey, List[Dict]]]) -> None:
+        """
+        WebSocket уведомления об ордерах после commit (одно на сервер за flush).
+
+        Args:
+            committed: Записанные (ключ, дельты)
+        """
+        from services.websocket_manager import notify_order_update_sync
+
+        targets: Set[Tuple[int, int]] = set()
+        for (server_id, _), steps in committed:
+            for delta in steps:
+                if delta.get('user_id'):
+                    targets.add((delta['user_id'], server_id))
+
+        for user_id, server_id in targets:
+            try:
+                notify_order_update_sync(user_id, server_id)
+            except Exception:
+                # Не блокируем flush при ошибке WS
+                pass
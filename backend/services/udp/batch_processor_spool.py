@@ -0,0 +1,649 @@
+"""
+Дисковый spool пакетов BatchProcessor
+
+Когда БД недоступна или тормозит (SQLite VACUUM/блокировка, failover
+PostgreSQL), пакеты не копятся в памяти и не теряются, а дописываются
+в локальный spool - сегментные файлы data/spool/{seq}.seg:
+    MAGIC, затем записи [длина, crc32][JSON пакета]
+
+Пакет уходит в spool, если:
+- _execute_batch упал с ошибкой недоступности БД (OperationalError,
+  InterfaceError, потеря соединения); ошибки данных - как раньше
+- запись выполняется дольше latency_budget_ms: монитор резервирует
+  место в spool под зависший пакет (он будет дописан туда, если упадёт),
+  а пакеты из очереди writer'а переносит на диск
+
+Пока spool не пуст, все новые пакеты тоже идут в spool - порядок
+записи (в том числе SQL дельт ордеров) сохраняется. Writer поток
+воспроизводит spool в БД по порядку; после ошибки недоступности -
+повтор через replay_retry_interval_ms. Когда spool опустел, запись
+снова идёт напрямую.
+
+Запись в spool (в том числе fsync) идёт вне _handoff_cond - lock'а,
+который нужен производителям (add): пакеты берутся под lock'ом
+с номером записи, а на диск пишутся после его освобождения в порядке
+номеров. Пока взятые пакеты не записаны, запись тоже идёт через spool.
+
+Позиция воспроизведения сохраняется в position.json после каждого
+пакета (at-least-once: при падении между commit и сохранением позиции
+пакет будет применён повторно). Повреждённый хвост сегмента
+(обрыв записи) пропускается с предупреждением.
+"""
+
+import base64
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+
+from utils.config_loader import get_config_value
+from utils.logging import log
+
+
+DEFAULT_SPOOL_DIR = Path("data/spool")
+
+_MAGIC = b'MBSPOOL1'
+_RECORD_HEADER = struct.Struct('<II')  # длина JSON, crc32
+_SEGMENT_SUFFIX = '.seg'
+_POSITION_FILE = 'position.json'
+
+# Сколько пакетов воспроизводится за один проход writer'а
+_REPLAY_CHUNK = 50
+
+SpoolPosition = Tuple[int, int]  # (номер сегмента, смещение следующей записи)
+
+
+def is_db_unavailable(error: BaseException) -> bool:
+    """Ошибка недоступности БД (блокировка, обрыв соединения), а не данных пакета"""
+    if isinstance(error, (OperationalError, InterfaceError)):
+        return True
+    return isinstance(error, DBAPIError) and bool(error.connection_invalidated)
+
+
+def _encode_value(value: Any) -> Dict[str, str]:
+    """JSON для типов, которых нет в JSON (datetime, date, bytes)"""
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, date):
+        return {'__date__': value.isoformat()}
+    if isinstance(value, (bytes, bytearray)):
+        return {'__bytes__': base64.b64encode(value).decode('ascii')}
+    raise TypeError(f"Unsupported spool value: {type(value).__name__}")
+
+
+def _decode_object(obj: Dict[str, Any]) -> Any:
+    if len(obj) == 1:
+        if '__datetime__' in obj:
+            return datetime.fromisoformat(obj['__datetime__'])
+        if '__date__' in obj:
+            return date.fromisoformat(obj['__date__'])
+        if '__bytes__' in obj:
+            return base64.b64decode(obj['__bytes__'])
+    return obj
+
+
+def encode_batch(table: str, items: List[Tuple[str, Dict[str, Any], float]]) -> bytes:
+    """Запись spool: заголовок + JSON пакета"""
+    payload = json.dumps(
+        {'table': table, 'items': items}, default=_encode_value, separators=(',', ':')
+    ).encode('utf-8')
+    return _RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def decode_batch(payload: bytes) -> Tuple[str, List[Tuple[str, Dict[str, Any], float]]]:
+    record = json.loads(payload.decode('utf-8'), object_hook=_decode_object)
+    return record['table'], [tuple(item) for item in record['items']]
+
+
+class BatchSpool:
+    """
+    Append-only очередь пакетов на диске (thread-safe)
+
+    Сегменты пишутся по порядку номеров; reserve() выделяет номер
+    сегмента под пакет, который ещё пишется в БД: воспроизведение
+    останавливается на нём, пока пакет не дописан (fill) или не
+    отменён (release).
+    """
+
+    def __init__(self, directory: Path, segment_max_bytes: int, max_total_bytes: int, fsync: bool = True):
+        self.directory = Path(directory)
+        self.segment_max_bytes = segment_max_bytes
+        self.max_total_bytes = max_total_bytes
+        self.fsync = fsync
+
+        self._lock = threading.Lock()
+        self._segments: List[int] = []  # номера сегментов по порядку (включая резерв)
+        self._reserved: Set[int] = set()
+        self._next_seq = 1
+        self._file = None  # сегмент, в который идёт дозапись
+        self._file_seq = 0
+        self._file_size = 0
+        self._position: SpoolPosition = (0, len(_MAGIC))
+        self._total_bytes = 0
+        self._pending_records = 0
+
+        # Метрики
+        self.appended = 0
+        self.replayed = 0
+        self.dropped = 0
+        self.corrupted = 0
+
+        self._open()
+
+    # -------------------------------------------------------------------------
+    # Файлы
+    # -------------------------------------------------------------------------
+
+    def _segment_path(self, seq: int) -> Path:
+        return self.directory / f"{seq:012d}{_SEGMENT_SUFFIX}"
+
+    def _open(self) -> None:
+        """Найти сегменты, оставшиеся с прошлого запуска"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        segments = sorted(
+            int(path.stem) for path in self.directory.glob(f"*{_SEGMENT_SUFFIX}") if path.stem.isdigit()
+        )
+
+        position_path = self.directory / _POSITION_FILE
+        if position_path.exists():
+            try:
+                saved = json.loads(position_path.read_text())
+                self._position = (int(saved['segment']), int(saved['offset']))
+            except (ValueError, KeyError, OSError) as e:
+                log(f"[BATCH-SPOOL] Bad {position_path}: {e} - replaying from start", level="WARNING")
+
+        for seq in segments:
+            if seq < self._position[0]:
+                # Воспроизведён, но не удалён до остановки
+                self._segment_path(seq).unlink(missing_ok=True)
+                continue
+            self._segments.append(seq)
+            offset = self._position[1] if seq == self._position[0] else len(_MAGIC)
+            records, size = self._scan_segment(seq, offset)
+            self._pending_records += records
+            self._total_bytes += size
+
+        if self._segments and self._position[0] not in self._segments:
+            self._position = (self._segments[0], len(_MAGIC))
+        self._next_seq = (self._segments[-1] + 1) if self._segments else max(self._position[0] + 1, 1)
+
+        if self._pending_records:
+            log(f"[BATCH-SPOOL] Found {self._pending_records} spooled batches in {len(self._segments)} "
+                f"segments ({self._total_bytes} bytes) - will replay")
+
+    def _scan_segment(self, seq: int, offset: int) -> Tuple[int, int]:
+        """Количество целых записей сегмента после offset и их размер"""
+        records = 0
+        size = 0
+        try:
+            with open(self._segment_path(seq), 'rb') as f:
+                f.seek(offset)
+                while True:
+                    header = f.read(_RECORD_HEADER.size)
+                    if len(header) < _RECORD_HEADER.size:
+                        break
+                    length, _ = _RECORD_HEADER.unpack(header)
+                    if len(f.read(length)) < length:
+                        break
+                    records += 1
+                    size += _RECORD_HEADER.size + length
+        except OSError as e:
+            log(f"[BATCH-SPOOL] Cannot read segment {seq}: {e}", level="ERROR")
+        return records, size
+
+    def _rotate(self) -> None:
+        """Закрыть текущий сегмент (под lock)"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _new_segment(self) -> None:
+        """Начать новый сегмент для дозаписи (под lock)"""
+        self._rotate()
+        seq = self._next_seq
+        self._next_seq += 1
+        self._file = open(self._segment_path(seq), 'ab')
+        self._file.write(_MAGIC)
+        self._file_seq = seq
+        self._file_size = len(_MAGIC)
+        self._segments.append(seq)
+
+    def _write(self, f, record: bytes) -> None:
+        f.write(record)
+        f.flush()
+        if self.fsync:
+            os.fsync(f.fileno())
+
+    def _save_position(self) -> None:
+        """Атомарно сохранить позицию воспроизведения (под lock)"""
+        path = self.directory / _POSITION_FILE
+        tmp = path.with_suffix('.tmp')
+        tmp.write_text(json.dumps({'segment': self._position[0], 'offset': self._position[1]}))
+        os.replace(tmp, path)
+
+    # -------------------------------------------------------------------------
+    # Запись
+    # -------------------------------------------------------------------------
+
+    @property
+    def has_pending(self) -> bool:
+        """Есть невоспроизведённые пакеты (или резерв под пишущийся пакет)"""
+        return self._pending_records > 0 or bool(self._reserved)
+
+    def append(self, table: str, items: List[Tuple[str, Dict[str, Any], float]]) -> bool:
+        """
+        Дописать пакет в конец spool
+
+        Returns:
+            False если превышен max_total_bytes (пакет отброшен)
+        """
+        record = encode_batch(table, items)
+        with self._lock:
+            if self._total_bytes + len(record) > self.max_total_bytes:
+                self.dropped += 1
+                return False
+            if self._file is None or self._file_size + len(record) > self.segment_max_bytes:
+                self._new_segment()
+            self._write(self._file, record)
+            self._file_size += len(record)
+            self._total_bytes += len(record)
+            self._pending_records += 1
+            self.appended += 1
+        return True
+
+    def reserve(self) -> int:
+        """Выделить сегмент под пакет, запись которого ещё идёт"""
+        with self._lock:
+            self._rotate()
+            seq = self._next_seq
+            self._next_seq += 1
+            self._segments.append(seq)
+            self._reserved.add(seq)
+            return seq
+
+    def fill(self, seq: int, table: str, items: List[Tuple[str, Dict[str, Any], float]]) -> bool:
+        """Записать пакет в зарезервированный сегмент"""
+        record = encode_batch(table, items)
+        with self._lock:
+            self._reserved.discard(seq)
+            if self._total_bytes + len(record) > self.max_total_bytes:
+                self._segments.remove(seq)
+                self.dropped += 1
+                return False
+            with open(self._segment_path(seq), 'wb') as f:
+                self._write(f, _MAGIC + record)
+            self._total_bytes += len(record)
+            self._pending_records += 1
+            self.appended += 1
+        return True
+
+    def release(self, seq: int) -> None:
+        """Отменить резерв (пакет записан в БД)"""
+        with self._lock:
+            if seq in self._reserved:
+                self._reserved.discard(seq)
+                self._segments.remove(seq)
+
+    # -------------------------------------------------------------------------
+    # Воспроизведение
+    # -------------------------------------------------------------------------
+
+    def peek(self) -> Optional[Tuple[str, List[Tuple[str, Dict[str, Any], float]], SpoolPosition, int]]:
+        """
+        Следующий пакет для воспроизведения
+
+        Returns:
+            (таблица, элементы, позиция после пакета, размер записи) или None
+            (spool пуст или следующий пакет ещё пишется в БД)
+        """
+        with self._lock:
+            while self._segments:
+                seq = self._segments[0]
+                if seq in self._reserved:
+                    return None
+                offset = self._position[1] if self._position[0] == seq else len(_MAGIC)
+                record, next_offset = self._read_record(seq, offset)
+                if record is not None:
+                    try:
+                        table, items = decode_batch(record)
+                    except (ValueError, KeyError, TypeError) as e:
+                        # crc сошёлся, но JSON не читается - пропускаем запись
+                        self.corrupted += 1
+                        log(f"[BATCH-SPOOL] Undecodable record in segment {seq}: {e}", level="ERROR")
+                        self._advance(seq, next_offset, _RECORD_HEADER.size + len(record))
+                        continue
+                    return table, items, (seq, next_offset), _RECORD_HEADER.size + len(record)
+
+                if seq == self._file_seq and self._file is not None:
+                    # Дочитали текущий сегмент дозаписи
+                    self._pending_records = 0
+                    return None
+                # Сегмент закончился (или хвост повреждён) - удаляем
+                self._segments.pop(0)
+                self._segment_path(seq).unlink(missing_ok=True)
+                if self._segments:
+                    self._position = (self._segments[0], len(_MAGIC))
+                else:
+                    self._position = (self._next_seq, len(_MAGIC))
+                self._save_position()
+            self._pending_records = 0
+            return None
+
+    def _read_record(self, seq: int, offset: int) -> Tuple[Optional[bytes], int]:
+        """Запись сегмента по смещению (под lock); None - конец или повреждение"""
+        path = self._segment_path(seq)
+        try:
+            with open(path, 'rb') as f:
+                if offset == len(_MAGIC) and f.read(len(_MAGIC)) != _MAGIC:
+                    self._drop_corrupted(seq, "bad magic")
+                    return None, offset
+                f.seek(offset)
+                header = f.read(_RECORD_HEADER.size)
+                if not header:
+                    return None, offset
+                if len(header) < _RECORD_HEADER.size:
+                    self._drop_corrupted(seq, "truncated header")
+                    return None, offset
+                length, checksum = _RECORD_HEADER.unpack(header)
+                payload = f.read(length)
+        except FileNotFoundError:
+            return None, offset
+
+        if len(payload) < length or zlib.crc32(payload) != checksum:
+            self._drop_corrupted(seq, "truncated record" if len(payload) < length else "checksum mismatch")
+            return None, offset
+        return payload, offset + _RECORD_HEADER.size + length
+
+    def _drop_corrupted(self, seq: int, reason: str) -> None:
+        """Хвост сегмента не читается - остаток сегмента пропускается (под lock)"""
+        if seq == self._file_seq and self._file is not None:
+            # Текущий сегмент дозаписи - закрываем, новые пакеты пойдут в следующий
+            self._rotate()
+        remaining, _ = self._scan_segment(seq, self._position[1] if self._position[0] == seq else len(_MAGIC))
+        self.corrupted += 1
+        self._pending_records = max(0, self._pending_records - max(remaining, 1))
+        log(f"[BATCH-SPOOL] Segment {seq}: {reason} - skipping the rest of the segment", level="ERROR")
+
+    def commit(self, position: SpoolPosition, size: int) -> None:
+        """Пакет до position применён к БД"""
+        with self._lock:
+            self._advance(position[0], position[1], size)
+            self.replayed += 1
+
+    def _advance(self, seq: int, offset: int, size: int) -> None:
+        """Сдвинуть позицию за прочитанную запись (под lock)"""
+        self._position = (seq, offset)
+        self._pending_records = max(0, self._pending_records - 1)
+        self._total_bytes = max(0, self._total_bytes - size)
+        self._save_position()
+
+    def close(self) -> None:
+        with self._lock:
+            self._rotate()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pending_batches": self._pending_records,
+                "reserved": len(self._reserved),
+                "segments": len(self._segments),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_total_bytes,
+                "appended": self.appended,
+                "replayed": self.replayed,
+                "dropped": self.dropped,
+                "corrupted": self.corrupted,
+            }
+
+
+class BatchSpoolMixin:
+    """
+    Mixin spool для BatchProcessor.
+
+    Использует _handoff, _handoff_cond, _pending_items, _running
+    и _execute_batch процессора.
+
+    Номер записи в spool выдаётся под _handoff_cond (_next_spool_ticket),
+    сама запись - без него (_spool_items), по порядку номеров.
+    """
+
+    def _init_spool(self) -> None:
+        """Открыть spool (если включён в конфигурации)."""
+        self._spool: Optional[BatchSpool] = None
+        self.latency_budget = get_config_value(
+            'high_load', 'async_processing.spool.latency_budget_ms', default=2000
+        ) / 1000.0
+        self.replay_retry_interval = get_config_value(
+            'high_load', 'async_processing.spool.replay_retry_interval_ms', default=1000
+        ) / 1000.0
+
+        # Запись, которую сейчас выполняет writer
+        self._inflight_since: Optional[float] = None
+        self._inflight_direct = False  # пакет из очереди (не воспроизведение spool)
+        self._inflight_slot: Optional[int] = None
+        self._next_replay_at = 0.0
+        self._last_replay_error_log = 0.0
+        self._spool_thread: Optional[threading.Thread] = None
+
+        # Порядок записи в spool: номер выдаётся под _handoff_cond,
+        # запись ждёт своей очереди под _spool_turn_cond
+        self._spool_ticket = 0
+        self._spool_turn = 0
+        self._spool_turn_cond = threading.Condition()
+        self._spool_unwritten = 0  # номер выдан, пакет ещё не в spool (под _handoff_cond)
+
+        if not get_config_value('high_load', 'async_processing.spool.enabled', default=True):
+            return
+        try:
+            self._spool = BatchSpool(
+                Path(get_config_value('high_load', 'async_processing.spool.dir', default=str(DEFAULT_SPOOL_DIR))),
+                segment_max_bytes=get_config_value(
+                    'high_load', 'async_processing.spool.segment_max_mb', default=16
+                ) * 1024 * 1024,
+                max_total_bytes=get_config_value(
+                    'high_load', 'async_processing.spool.max_total_mb', default=1024
+                ) * 1024 * 1024,
+                fsync=get_config_value('high_load', 'async_processing.spool.fsync', default=True),
+            )
+        except OSError as e:
+            log(f"[BATCH-SPOOL] Spool disabled - cannot open directory: {e}", level="ERROR")
+
+    def _start_spool_monitor(self) -> None:
+        """Запустить монитор зависшей записи."""
+        if self._spool is None:
+            return
+        self._spool_thread = threading.Thread(
+            target=self._spool_monitor_loop,
+            daemon=True,
+            name="BatchSpoolMonitor"
+        )
+        self._spool_thread.start()
+
+    def _spooling(self) -> bool:
+        """Идёт ли запись через spool (spool не пуст или пакеты ждут записи в него)."""
+        return self._spool is not None and (self._spool.has_pending or self._spool_unwritten > 0)
+
+    def _next_spool_ticket(self) -> int:
+        """Номер записи в spool (под _handoff_cond) - место пакета в spool."""
+        ticket = self._spool_ticket
+        self._spool_ticket += 1
+        self._spool_unwritten += 1
+        return ticket
+
+    def _spool_items(self, ticket: int, table: str, items: List, release_pending: bool = False) -> None:
+        """
+        Записать пакет в конец spool в порядке номеров (без _handoff_cond).
+
+        Args:
+            ticket: Номер из _next_spool_ticket
+            table: Имя таблицы
+            items: Элементы пакета
+            release_pending: Освободить место пакета в max_pending_items
+                (пакет взят из очереди writer'а монитором)
+        """
+        records = [(item.operation, item.data, item.created_at) for item in items]
+        with self._spool_turn_cond:
+            while self._spool_turn != ticket:
+                self._spool_turn_cond.wait()
+        try:
+            appended = self._spool.append(table, records)
+        finally:
+            with self._spool_turn_cond:
+                self._spool_turn += 1
+                self._spool_turn_cond.notify_all()
+            with self._handoff_cond:
+                self._spool_unwritten -= 1
+                if release_pending:
+                    self._pending_items -= len(items)
+                self._handoff_cond.notify_all()
+
+        if not appended:
+            log(f"[BATCH-SPOOL] Spool full - dropped {len(items)} {table} items", level="ERROR")
+            with self._stats_lock:
+                self._stats.total_errors += 1
+
+    def _execute_with_spool(self, table: str, items: List) -> bool:
+        """
+        Записать пакет в БД или в spool.
+
+        SQL дельты ордеров и остальные элементы пишутся отдельно
+        (разные транзакции) - в spool уходит только не записанная часть.
+
+        Returns:
+            True если пакет (или его часть) ушёл в spool
+        """
+        from .batch_processor_orders import ORDER_SQL_OPERATION
+
+        order_items = [i for i in items if i.operation == ORDER_SQL_OPERATION]
+        other_items = [i for i in items if i.operation != ORDER_SQL_OPERATION] if order_items else items
+        spooled = False
+
+        for part in (order_items, other_items):
+            if not part:
+                continue
+            with self._handoff_cond:
+                ticket = self._next_spool_ticket() if self._spooling() else None
+                if ticket is None:
+                    self._inflight_since = time.monotonic()
+                    self._inflight_direct = True
+            if ticket is not None:
+                self._spool_items(ticket, table, part)
+                spooled = True
+                continue
+
+            failed = None
+            try:
+                self._execute_batch(table, part)
+            except Exception as e:
+                if self._spool is None or not is_db_unavailable(e):
+                    raise
+                failed = e
+            finally:
+                with self._handoff_cond:
+                    slot = self._inflight_slot
+                    self._inflight_slot = None
+                    self._inflight_since = None
+                    self._inflight_direct = False
+                    # Без резерва монитора пакет встаёт в конец spool
+                    ticket = self._next_spool_ticket() if failed is not None and slot is None else None
+                # Резерв держит место пакета в spool - запись вне lock'а
+                if failed is None:
+                    if slot is not None:
+                        self._spool.release(slot)
+                elif slot is not None:
+                    self._spool.fill(slot, table, [(i.operation, i.data, i.created_at) for i in part])
+                else:
+                    self._spool_items(ticket, table, part)
+
+            if failed is not None:
+                log(f"[BATCH-SPOOL] DB unavailable, {table} batch ({len(part)} items) spooled: {getattr(failed, 'orig', failed)}",
+                    level="WARNING")
+                spooled = True
+
+        return spooled
+
+    def _replay_spool(self) -> None:
+        """Воспроизвести пакеты spool в БД (writer thread)."""
+        from .batch_processor import BatchItem
+
+        if self._spool is None or time.monotonic() < self._next_replay_at:
+            return
+
+        for _ in range(_REPLAY_CHUNK):
+            record = self._spool.peek()
+            if record is None:
+                if self._spool.has_pending:
+                    # Следующий пакет ещё пишется в БД (резерв монитора)
+                    self._next_replay_at = time.monotonic() + min(self.replay_retry_interval, 0.1)
+                return
+            table, raw_items, position, size = record
+            items = [BatchItem(table=table, operation=op, data=data, created_at=created_at)
+                     for op, data, created_at in raw_items]
+
+            with self._handoff_cond:
+                self._inflight_since = time.monotonic()
+            try:
+                self._execute_batch(table, items)
+            except Exception as e:
+                if is_db_unavailable(e):
+                    self._next_replay_at = time.monotonic() + self.replay_retry_interval
+                    now = time.monotonic()
+                    if now - self._last_replay_error_log >= 10.0:
+                        self._last_replay_error_log = now
+                        log(f"[BATCH-SPOOL] Replay postponed, DB still unavailable: {getattr(e, 'orig', e)}", level="WARNING")
+                    return
+                # Пакет не применяется из-за данных - повтор не поможет
+                log(f"[BATCH-SPOOL] Dropping spooled {table} batch ({len(items)} items): {e}", level="ERROR")
+                with self._stats_lock:
+                    self._stats.total_errors += 1
+            finally:
+                with self._handoff_cond:
+                    self._inflight_since = None
+
+            self._spool.commit(position, size)
+            if not self._spool.has_pending:
+                log(f"[BATCH-SPOOL] Spool drained ({self._spool.replayed} batches replayed) - direct writes resumed")
+
+    def _spool_monitor_loop(self) -> None:
+        """Монитор: запись дольше latency_budget - очередь writer'а уходит в spool."""
+        interval = min(0.1, self.latency_budget / 4)
+        warned = False
+        while self._running:
+            time.sleep(interval)
+            with self._handoff_cond:
+                since = self._inflight_since
+                if since is None or time.monotonic() - since < self.latency_budget:
+                    warned = False
+                    continue
+
+                if self._inflight_direct and self._inflight_slot is None:
+                    # Пакет в записи сохранит своё место в порядке, если запись упадёт
+                    self._inflight_slot = self._spool.reserve()
+                if not warned:
+                    warned = True
+                    log(f"[BATCH-SPOOL] DB write stalled > {self.latency_budget * 1000:.0f}ms - "
+                        f"spooling queued batches", level="WARNING")
+
+                # Под lock'ом - только забрать пакеты и их номера в spool
+                moved = []
+                while self._handoff:
+                    table, items, _ = self._handoff.popleft()
+                    moved.append((self._next_spool_ticket(), table, items))
+
+            for ticket, table, items in moved:
+                self._spool_items(ticket, table, items, release_pending=True)
+
+    def get_spool_stats(self) -> Dict[str, Any]:
+        if self._spool is None:
+            return {"enabled": False}
+        stats = self._spool.get_stats()
+        stats["enabled"] = True
+        stats["latency_budget_ms"] = int(self.latency_budget * 1000)
+        return stats
@@ -2,22 +2,91 @@
 Mixin с методами bulk upsert для BatchProcessor.
 
 Содержит оптимизированные методы для upsert операций
-разных типов таблиц (server_balance, strategy_cache, moonbot_orders).
+разных типов таблиц (server_balance, strategy_cache, moonbot_orders,
+moonbot_charts).
+
+На SQLite и PostgreSQL используется нативный
+INSERT ... ON CONFLICT DO UPDATE по уникальному ключу таблицы,
+поэтому стоимость flush зависит от размера пакета, а не таблицы.
+Для остальных СУБД - SELECT по ключам пакета + setattr.
 """
 
-from typing import Any, Dict, List, Optional, Type
+from typing import Any, Dict, List, Optional, Tuple, Type
 
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
 
+# Уникальные ключи для ON CONFLICT (должны совпадать с уникальными индексами):
+# - server_balance: server_balance.server_id UNIQUE
+# - strategy_cache: ix_strategy_cache_server_pack UNIQUE
+# - moonbot_orders: idx_server_order UNIQUE
+# - moonbot_charts: ix_moonbot_charts_server_order UNIQUE
+UPSERT_KEYS: Dict[str, Tuple[str, ...]] = {
+    'server_balance': ('server_id',),
+    'strategy_cache': ('server_id', 'pack_number'),
+    'moonbot_orders': ('server_id', 'moonbot_order_id'),
+    'moonbot_charts': ('server_id', 'order_db_id'),
+}
+
+# Диалекты с поддержкой INSERT ... ON CONFLICT DO UPDATE
+NATIVE_UPSERT_DIALECTS = ('sqlite', 'postgresql')
+
+
+def _get_dialect_insert(dialect_name: str):
+    """
+    Получить dialect-специфичный insert() с поддержкой on_conflict_do_update.
+    
+    Args:
+        dialect_name: Имя диалекта SQLAlchemy
+        
+    Returns:
+        Функция insert или None если диалект не поддерживается
+    """
+    if dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    return None
+
+
+def merge_rows_by_key(data_list: List[Dict], key_columns: Tuple[str, ...]) -> List[Dict]:
+    """
+    Свернуть строки пакета с одинаковым ключом в одну.
+    
+    Поля сливаются в порядке поступления: более позднее не-None значение
+    перекрывает раннее (как последовательные setattr). Нужно потому, что
+    один INSERT ... ON CONFLICT не может обновить одну строку дважды.
+    
+    Args:
+        data_list: Строки пакета в порядке поступления
+        key_columns: Колонки уникального ключа
+        
+    Returns:
+        Список строк с уникальными ключами (порядок первого появления)
+    """
+    merged: Dict[tuple, Dict] = {}
+    for data in data_list:
+        key = tuple(data.get(c) for c in key_columns)
+        existing = merged.get(key)
+        if existing is None:
+            merged[key] = {k: v for k, v in data.items() if v is not None}
+        else:
+            for k, v in data.items():
+                if v is not None:
+                    existing[k] = v
+    return list(merged.values())
+
+
 class BatchUpsertMixin:
     """
     Mixin с методами bulk upsert.
     
     Оптимизировано для 3000+ серверов:
-    - Один SELECT для получения всех существующих записей
-    - Bulk update для существующих
-    - Bulk insert для новых
+    - SQLite/PostgreSQL: INSERT ... ON CONFLICT DO UPDATE без предварительного SELECT
+    - Остальные СУБД: один SELECT по ключам пакета, bulk insert для новых
     """
     
     def _bulk_upsert(self, db: Session, model_class: Type, table: str,
@@ -34,6 +103,12 @@ class BatchUpsertMixin:
         if not data_list:
             return
         
+        key_columns = UPSERT_KEYS.get(table)
+        dialect_name = db.get_bind().dialect.name
+        if key_columns and dialect_name in NATIVE_UPSERT_DIALECTS:
+            self._bulk_upsert_native(db, model_class, key_columns, data_list, dialect_name)
+            return
+        
         # Оптимизированный upsert для разных таблиц
         if table == 'server_balance':
             self._bulk_upsert_by_server_id(db, model_class, data_list)
@@ -45,6 +120,62 @@ class BatchUpsertMixin:
             # Fallback для неизвестных таблиц
             self._bulk_upsert_fallback(db, model_class, table, data_list)
     
+    def _bulk_upsert_native(self, db: Session, model_class: Type,
+                            key_columns: Tuple[str, ...], data_list: List[Dict],
+                            dialect_name: str) -> None:
+        """
+        Нативный upsert через INSERT ... ON CONFLICT DO UPDATE.
+        
+        Семантика совпадает с SELECT+setattr: None в пакете не затирает
+        существующее значение (COALESCE(excluded.col, col)).
+        
+        Args:
+            db: Сессия БД
+            model_class: Класс модели
+            key_columns: Колонки уникального ключа
+            data_list: Список данных
+            dialect_name: Имя диалекта (sqlite / postgresql)
+        """
+        insert = _get_dialect_insert(dialect_name)
+        table = model_class.__table__
+        columns = table.c
+        
+        # Строки без полного ключа не могут конфликтовать - просто вставляем
+        keyed = []
+        unkeyed = []
+        for data in data_list:
+            if all(data.get(c) is not None for c in key_columns):
+                keyed.append(data)
+            else:
+                unkeyed.append(data)
+        
+        if unkeyed:
+            db.bulk_insert_mappings(model_class, unkeyed)
+        
+        if not keyed:
+            return
+        
+        # executemany требует одинаковый набор колонок - группируем по нему
+        groups: Dict[Tuple[str, ...], List[Dict]] = {}
+        for row in merge_rows_by_key(keyed, key_columns):
+            row = {k: v for k, v in row.items() if k in columns and k != 'id'}
+            groups.setdefault(tuple(sorted(row)), []).append(row)
+        
+        for column_names, rows in groups.items():
+            stmt = insert(table)
+            update_columns = [c for c in column_names if c not in key_columns]
+            if update_columns:
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=list(key_columns),
+                    set_={
+                        c: func.coalesce(stmt.excluded[c], columns[c])
+                        for c in update_columns
+                    }
+                )
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=list(key_columns))
+            db.execute(stmt, rows)
+    
     def _bulk_upsert_by_server_id(self, db: Session, model_class: Type, 
                                    data_list: List[Dict]) -> None:
         """
@@ -99,9 +230,12 @@ class BatchUpsertMixin:
         if not server_ids:
             return
         
-        # Получаем все записи для этих серверов
+        pack_numbers = list(set(k[1] for k in keys))
+        
+        # Получаем только записи пакетов из этого batch
         existing_records = db.query(model_class).filter(
-            model_class.server_id.in_(server_ids)
+            model_class.server_id.in_(server_ids),
+            model_class.pack_number.in_(pack_numbers)
         ).all()
         
         # Создаём словарь для быстрого поиска
@@ -137,9 +271,13 @@ class BatchUpsertMixin:
         if orders_with_id:
             server_ids = list(set(d.get('server_id') for d in orders_with_id if d.get('server_id')))
             
+            order_ids = list(set(d.get('moonbot_order_id') for d in orders_with_id))
+            
             if server_ids:
+                # Только ордера из пакета, а не все ордера серверов
                 existing_records = db.query(model_class).filter(
-                    model_class.server_id.in_(server_ids)
+                    model_class.server_id.in_(server_ids),
+                    model_class.moonbot_order_id.in_(order_ids)
                 ).all()
                 
                 existing_map = {(r.server_id, r.moonbot_order_id): r for r in existing_records}
@@ -217,6 +355,13 @@ class BatchUpsertMixin:
                     model_class.moonbot_order_id == data.get('moonbot_order_id')
                 ).first()
         
+        elif table == 'moonbot_charts':
+            # Составной ключ: server_id + order_db_id
+            return db.query(model_class).filter(
+                model_class.server_id == data.get('server_id'),
+                model_class.order_db_id == data.get('order_db_id')
+            ).first()
+        
         return None
     
     def _get_upsert_key(self, table: str) -> Optional[str]:
@@ -0,0 +1,346 @@
+"""
+Конвейер приёма графиков MoonBot
+
+Этапы:
+1. Приём - приёмный поток только кладёт пакет в очередь графиков
+   шарда Worker Pool (chart lane, см. worker_pool_lanes.py)
+2. Сборка - воркер шарда сервера собирает фрагменты графика
+   (ChartProcessor), фрагменты одного сервера - по порядку.
+   Сборщик общий на все серверы (get_chart_assembler): память
+   незавершённых графиков ограничена общим бюджетом и бюджетом
+   сервера, брошенные графики вытесняются по таймауту
+   (udp.charts.assembly)
+3. Разбор - собранный график уходит в очередь конвейера: parse
+   воркеры разбирают его (parse_chart_columnar) и кодируют в
+   компактный формат (encode_chart). Очередь шардирована по
+   server_id - графики сервера разбираются в порядке сборки
+4. Запись - строка moonbot_charts уходит в BatchProcessor
+   (batch_processor_charts.py): один upsert на пакет графиков,
+   WebSocket уведомление после commit
+
+Разбор и запись не выполняются в потоке шарда - большой график
+не задерживает ордера и балансы серверов того же шарда.
+
+Очередь разбора ограничена числом графиков и суммарным размером
+(udp.charts в high_load.yaml); график сверх лимита отбрасывается
+и считается в статистике. Задержки (ожидание в очереди, разбор,
+от сборки до commit) - в get_stats().
+
+Если конвейер не запущен, график разбирается в вызывающем потоке.
+Parse воркер 0 в простое раз в секунду вытесняет истёкшие
+незавершённые графики - и когда фрагменты не приходят совсем.
+"""
+
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+
+from utils.config_loader import get_config_value
+from utils.datetime_utils import utcnow
+from utils.logging import log
+from services.chart_parser import ChartFragmentAssembler
+from .batch_processor import _percentile, get_batch_processor
+from .processors_orders import get_cached_user_id
+
+
+# Сколько последних графиков учитывается в перцентилях задержки
+_LATENCY_WINDOW = 1024
+
+# Интервал вытеснения истёкших незавершённых графиков в простое (секунды)
+_EXPIRE_INTERVAL = 1.0
+
+
+@dataclass
+class ChartJob:
+    """Собранный график, ожидающий разбора"""
+    server_id: int
+    order_id: int
+    data: bytes
+    received_at: datetime  # UTC, момент сборки последнего фрагмента
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class ChartPipeline:
+    """
+    Очередь и parse воркеры собранных графиков.
+    """
+
+    def __init__(self):
+        self.num_workers = max(1, int(get_config_value(
+            'high_load', 'udp.charts.parse_workers', default=2
+        )))
+        self.queue_size = int(get_config_value(
+            'high_load', 'udp.charts.queue_size', default=1000
+        ))
+        self.max_queued_bytes = int(get_config_value(
+            'high_load', 'udp.charts.max_queued_mb', default=64
+        ) * 1024 * 1024)
+        self.compression_level = get_config_value('app', 'charts.compression_level', default=6)
+        self.keep_raw_files = get_config_value('app', 'charts.keep_raw_files', default=False)
+
+        # Шард воркера = server_id % num_workers; условия шардов - на общем lock'е
+        self._lock = threading.Lock()
+        self._shards: List[Deque[ChartJob]] = [deque() for _ in range(self.num_workers)]
+        self._conds = [threading.Condition(self._lock) for _ in range(self.num_workers)]
+        self._queued = 0
+        self._queued_bytes = 0
+
+        self._running = False
+        self._threads: List[threading.Thread] = []
+
+        self._submitted = 0
+        self._parsed = 0
+        self._parse_errors = 0
+        self._dropped = 0
+        self._committed = 0
+        self._queue_waits: Deque[float] = deque(maxlen=_LATENCY_WINDOW)
+        self._parse_times: Deque[float] = deque(maxlen=_LATENCY_WINDOW)
+        self._commit_latencies: Deque[float] = deque(maxlen=_LATENCY_WINDOW)
+
+    def start(self) -> None:
+        """Запустить parse воркеры"""
+        if self._running:
+            return
+
+        self._running = True
+        self._threads = []
+        for index in range(self.num_workers):
+            thread = threading.Thread(
+                target=self._worker_loop,
+                args=(index,),
+                daemon=True,
+                name=f"ChartParser-{index}"
+            )
+            thread.start()
+            self._threads.append(thread)
+        log(f"[CHART-PIPELINE] Started: {self.num_workers} parse workers, queue_size={self.queue_size}, "
+            f"max_queued={self.max_queued_bytes // (1024 * 1024)}MB")
+
+    def stop(self) -> None:
+        """Остановить воркеры (графики в очереди разбираются до выхода)"""
+        if not self._running:
+            return
+
+        with self._lock:
+            self._running = False
+            for cond in self._conds:
+                cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=10.0)
+        self._threads = []
+        log(f"[CHART-PIPELINE] Stopped. Stats: {self.get_stats()}")
+
+    def submit(self, server_id: int, order_id: int, data: bytes) -> bool:
+        """
+        Передать собранный график на разбор (не блокирует)
+
+        Args:
+            server_id: ID сервера
+            order_id: ID ордера в БД MoonBot
+            data: Собранные данные графика (без заголовков фрагментов)
+
+        Returns:
+            False если график отброшен (очередь переполнена)
+        """
+        job = ChartJob(server_id, order_id, data, utcnow())
+        if not self._running:
+            with self._lock:
+                self._submitted += 1
+            self._run_job(job)
+            return True
+
+        size = len(data)
+        with self._lock:
+            self._submitted += 1
+            if self._queued >= self.queue_size or self._queued_bytes + size > self.max_queued_bytes:
+                self._dropped += 1
+                queued, queued_bytes = self._queued, self._queued_bytes
+            else:
+                index = server_id % self.num_workers
+                self._shards[index].append(job)
+                self._queued += 1
+                self._queued_bytes += size
+                self._conds[index].notify()
+                return True
+
+        log(f"[CHART-PIPELINE] [WARN] Chart dropped (server {server_id}, order {order_id}, {size} bytes): "
+            f"queue full ({queued} charts, {queued_bytes} bytes)", level="WARNING")
+        return False
+
+    def _worker_loop(self, index: int) -> None:
+        shard = self._shards[index]
+        cond = self._conds[index]
+        while True:
+            with self._lock:
+                while self._running and not shard:
+                    if not cond.wait(_EXPIRE_INTERVAL) and index == 0:
+                        break
+                if not shard:
+                    if not self._running:
+                        return
+                    job = None
+                else:
+                    job = shard.popleft()
+                    self._queued -= 1
+                    self._queued_bytes -= len(job.data)
+                    self._queue_waits.append((time.monotonic() - job.enqueued_at) * 1000)
+
+            if job is None:
+                get_chart_assembler().expire()
+                continue
+            self._run_job(job)
+
+    def _run_job(self, job: ChartJob) -> None:
+        try:
+            self._process(job)
+        except Exception as e:
+            with self._lock:
+                self._parse_errors += 1
+            log(f"[CHART-PIPELINE] Chart processing error (server {job.server_id}, "
+                f"order {job.order_id}): {e}", level="ERROR")
+
+    def _process(self, job: ChartJob) -> None:
+        """Разобрать график и передать строку moonbot_charts в BatchProcessor"""
+        from services.chart_parser import parse_chart_columnar, encode_chart
+
+        start = time.perf_counter()
+        chart = parse_chart_columnar(job.data)
+        if not chart:
+            with self._lock:
+                self._parse_errors += 1
+            log(f"[UDP-LISTENER-{job.server_id}] ⚠️ Chart binary parse returned None for order_id={job.order_id}",
+                level="WARNING")
+            return
+
+        # Одна компактная копия графика (JSON для API собирается при чтении)
+        chart_blob = encode_chart(chart, level=self.compression_level)
+        min_price, max_price = chart.price_range()
+        parse_ms = (time.perf_counter() - start) * 1000
+
+        get_batch_processor().add_chart({
+            'server_id': job.server_id,
+            'order_db_id': job.order_id,
+            'market_name': chart.market_name,
+            'market_currency': chart.market_currency,
+            'pump_channel': chart.pump_channel,
+            'start_time': chart.start_datetime,
+            'end_time': chart.end_datetime,
+            'session_profit': chart.deltas.session_profit if chart.deltas else None,
+            'chart_blob': chart_blob,
+            'points_count': chart.point_count(),
+            'min_price': min_price,
+            'max_price': max_price,
+            'received_at': job.received_at,
+        }, user_id=get_cached_user_id(job.server_id))
+
+        with self._lock:
+            self._parsed += 1
+            self._parse_times.append(parse_ms)
+        log(f"[UDP-LISTENER-{job.server_id}] 📊 Chart parsed: market={chart.market_name}, "
+            f"prices={len(chart.history_prices)}, trades={len(chart.trades)}, "
+            f"{len(chart_blob)} bytes, {parse_ms:.1f}ms", level="DEBUG")
+
+        # Сырой .bin на диск - только для отладки (не критично)
+        if self.keep_raw_files:
+            try:
+                from services.chart_storage import get_storage
+                get_storage().save_binary(f"server_{job.server_id}", job.order_id, job.data)
+            except Exception as e:
+                log(f"[UDP-LISTENER-{job.server_id}] Chart file save warning: {e}", level="DEBUG")
+
+    def record_committed(self, charts: List[Dict]) -> None:
+        """Учесть записанные в БД графики (задержка от сборки до commit)"""
+        now = utcnow()
+        latencies = [
+            (now - chart['received_at']).total_seconds() * 1000
+            for chart in charts if chart.get('received_at') is not None
+        ]
+        with self._lock:
+            self._committed += len(charts)
+            self._commit_latencies.extend(latencies)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика конвейера"""
+        with self._lock:
+            queue_waits = sorted(self._queue_waits)
+            parse_times = sorted(self._parse_times)
+            commit_latencies = sorted(self._commit_latencies)
+            return {
+                "running": self._running,
+                "workers": self.num_workers,
+                "queued": self._queued,
+                "queued_bytes": self._queued_bytes,
+                "queue_size": self.queue_size,
+                "max_queued_bytes": self.max_queued_bytes,
+                "submitted": self._submitted,
+                "parsed": self._parsed,
+                "parse_errors": self._parse_errors,
+                "dropped": self._dropped,
+                "committed": self._committed,
+                "queue_wait_p95_ms": round(_percentile(queue_waits, 0.95), 2),
+                "parse_p50_ms": round(_percentile(parse_times, 0.50), 2),
+                "parse_p95_ms": round(_percentile(parse_times, 0.95), 2),
+                "commit_latency_p50_ms": round(_percentile(commit_latencies, 0.50), 2),
+                "commit_latency_p95_ms": round(_percentile(commit_latencies, 0.95), 2),
+                "commit_latency_max_ms": round(commit_latencies[-1], 2) if commit_latencies else 0.0,
+                "assembler": get_chart_assembler().get_stats(),
+            }
+
+
+# Глобальные экземпляры
+_chart_pipeline: Optional[ChartPipeline] = None
+_chart_pipeline_lock = threading.Lock()
+_chart_assembler: Optional[ChartFragmentAssembler] = None
+
+
+def get_chart_assembler() -> ChartFragmentAssembler:
+    """Получить общий сборщик фрагментов графиков (бюджеты - udp.charts.assembly)"""
+    global _chart_assembler
+    if _chart_assembler is None:
+        with _chart_pipeline_lock:
+            if _chart_assembler is None:
+                _chart_assembler = ChartFragmentAssembler(
+                    max_total_bytes=int(get_config_value(
+                        'high_load', 'udp.charts.assembly.max_total_mb', default=256
+                    ) * 1024 * 1024),
+                    max_server_bytes=int(get_config_value(
+                        'high_load', 'udp.charts.assembly.max_server_mb', default=16
+                    ) * 1024 * 1024),
+                    timeout_seconds=float(get_config_value(
+                        'high_load', 'udp.charts.assembly.timeout_seconds', default=30
+                    )),
+                )
+    return _chart_assembler
+
+
+def get_chart_pipeline() -> ChartPipeline:
+    """Получить глобальный конвейер графиков"""
+    global _chart_pipeline
+    if _chart_pipeline is None:
+        with _chart_pipeline_lock:
+            if _chart_pipeline is None:
+                _chart_pipeline = ChartPipeline()
+    return _chart_pipeline
+
+
+def start_chart_pipeline() -> None:
+    """Запустить parse воркеры графиков"""
+    get_chart_pipeline().start()
+
+
+def stop_chart_pipeline() -> None:
+    """Остановить конвейер, разобрав графики из очереди"""
+    global _chart_pipeline
+    if _chart_pipeline:
+        _chart_pipeline.stop()
+        _chart_pipeline = None
+
+
+def record_charts_committed(charts: List[Dict]) -> None:
+    """Учесть записанные графики (вызывается BatchProcessor после commit)"""
+    pipeline = _chart_pipeline
+    if pipeline is not None:
+        pipeline.record_committed(charts)
@@ -0,0 +1,228 @@
+"""
+Корреляция команд и ответов MoonBot (listener / глобальный сокет)
+
+MoonBot не возвращает ID запроса, поэтому ответ сопоставляется
+с ожидающей командой по серверу и виду команды (первое слово: lst, status ...):
+- ответ, узнаваемый по содержимому (REPLY_MARKERS), достаётся самой старой
+  ожидающей команде своего вида, а без таких - никому (например, ответ
+  на lst от keep-alive не попадёт команде status)
+- остальные ответы - самой старой команде вида без маркеров,
+  а если таких нет - самой старой ожидающей команде
+
+Несколько команд одному серверу могут ожидать ответа одновременно.
+У каждой свой дедлайн; не дождавшаяся ответа команда ещё
+stale_response_grace секунд остаётся в таблице и поглощает опоздавший
+ответ (по тем же правилам выбора), чтобы он не достался следующей команде.
+Если бот не ответил на команду без маркеров, её очередь может занять
+ответ на следующую такую команду - без ID запроса это неразличимо.
+
+Ответ сопоставляется в приёмном потоке без обработки пакета
+(MessageProcessor.extract_command_reply - без обращений к БД),
+сам пакет обрабатывается как обычно (Worker Pool).
+"""
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from utils.config_loader import get_config_value
+from utils.logging import log
+
+
+# Вид команды -> признаки ответа на неё
+REPLY_MARKERS: Dict[str, tuple] = {
+    'lst': ("Open Sell Orders:", "Open Buy Orders:"),
+}
+
+
+def command_kind(command: str) -> str:
+    """Вид команды - первое слово в нижнем регистре"""
+    return command.strip().split(' ', 1)[0].lower()
+
+
+def reply_kind(text: str) -> Optional[str]:
+    """Вид команды, на которую похож ответ (None - не распознан)"""
+    for kind, markers in REPLY_MARKERS.items():
+        if any(marker in text for marker in markers):
+            return kind
+    return None
+
+
+@dataclass
+class PendingCommand:
+    """Команда, ожидающая ответа"""
+    server_id: int
+    command: str
+    kind: str
+    deadline: float  # time.monotonic()
+    future: Future = field(default_factory=Future)
+
+    def expired(self, now: float) -> bool:
+        return now >= self.deadline
+
+
+class CommandCorrelator:
+    """
+    Таблица ожидающих ответа команд: server_id -> команды в порядке отправки
+
+    Thread-safe. has_pending() без блокировки - для приёмного цикла.
+    """
+
+    def __init__(self, max_pending_per_server: Optional[int] = None,
+                 stale_grace: Optional[float] = None):
+        self.max_pending_per_server = max_pending_per_server or get_config_value(
+            'high_load', 'udp.commands.max_pending_per_server', default=16
+        )
+        self.stale_grace = stale_grace if stale_grace is not None else get_config_value(
+            'high_load', 'udp.commands.stale_response_grace', default=1.0
+        )
+
+        self._pending: Dict[int, List[PendingCommand]] = {}
+        self._lock = threading.Lock()
+
+        # Метрики
+        self.registered = 0
+        self.resolved = 0
+        self.unmatched = 0
+        self.stale_dropped = 0
+        self.rejected = 0
+
+    def has_pending(self, server_id: int) -> bool:
+        """Есть ли у сервера команды в таблице (включая просроченные)"""
+        return server_id in self._pending
+
+    def register(self, server_id: int, command: str, timeout: float) -> Optional[PendingCommand]:
+        """
+        Зарегистрировать ожидание ответа (до отправки команды)
+
+        Returns:
+            PendingCommand или None если у сервера слишком много ожидающих команд
+        """
+        now = time.monotonic()
+        pending = PendingCommand(server_id, command, command_kind(command), now + timeout)
+        with self._lock:
+            entries = self._pending.setdefault(server_id, [])
+            self._purge(entries, now)
+            waiting = sum(1 for entry in entries if not entry.expired(now))
+            if waiting >= self.max_pending_per_server:
+                self.rejected += 1
+                if not entries:
+                    del self._pending[server_id]
+                return None
+            entries.append(pending)
+            self.registered += 1
+        return pending
+
+    def discard(self, pending: PendingCommand) -> None:
+        """Убрать команду из таблицы (команда не отправлена)"""
+        with self._lock:
+            entries = self._pending.get(pending.server_id)
+            if entries and pending in entries:
+                entries.remove(pending)
+                if not entries:
+                    del self._pending[pending.server_id]
+        pending.future.cancel()
+
+    def resolve(self, server_id: int, text: str) -> bool:
+        """
+        Передать ответ ожидающей команде сервера
+
+        Returns:
+            True если ответ достался ожидающей команде
+        """
+        now = time.monotonic()
+        with self._lock:
+            entries = self._pending.get(server_id)
+            if not entries:
+                return False
+            self._purge(entries, now)
+            target = self._select(entries, reply_kind(text))
+            if target is not None:
+                entries.remove(target)
+            if not entries:
+                del self._pending[server_id]
+
+            if target is None:
+                self.unmatched += 1
+                return False
+            if target.expired(now):
+                # Опоздавший ответ на команду, которая уже завершилась по таймауту
+                self.stale_dropped += 1
+                return False
+            self.resolved += 1
+
+        try:
+            target.future.set_result(text)
+        except InvalidStateError:
+            # Ожидающий уже отменил future (например, asyncio.wait_for по таймауту)
+            return False
+        return True
+
+    def _purge(self, entries: List[PendingCommand], now: float) -> None:
+        """Удалить команды, у которых истёк дедлайн и период поглощения (под lock)"""
+        limit = now - self.stale_grace
+        if entries and entries[0].deadline <= limit:
+            entries[:] = [entry for entry in entries if entry.deadline > limit]
+
+    @staticmethod
+    def _select(entries: List[PendingCommand], kind: Optional[str]) -> Optional[PendingCommand]:
+        """Самая старая подходящая команда (см. docstring модуля)"""
+        if kind is not None:
+            return next((entry for entry in entries if entry.kind == kind), None)
+        generic = next((entry for entry in entries if entry.kind not in REPLY_MARKERS), None)
+        return generic or entries[0]
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            pending = sum(len(entries) for entries in self._pending.values())
+        return {
+            "pending": pending,
+            "servers_waiting": len(self._pending),
+            "registered": self.registered,
+            "resolved": self.resolved,
+            "unmatched": self.unmatched,
+            "stale_dropped": self.stale_dropped,
+            "rejected": self.rejected,
+        }
+
+
+def match_command_reply(server_id: int, processor, data: bytes, addr: str) -> bool:
+    """
+    Сопоставить пакет с ожидающей командой сервера (приёмный поток)
+
+    Пакет не обрабатывается - вызывающий код передаёт его дальше как обычно.
+
+    Args:
+        server_id: ID сервера
+        processor: MessageProcessor сервера
+        data: Датаграмма
+        addr: IP отправителя
+
+    Returns:
+        True если пакет оказался ответом на ожидающую команду
+    """
+    correlator = get_command_correlator()
+    if not correlator.has_pending(server_id):
+        return False
+    try:
+        reply = processor.extract_command_reply(data, addr)
+    except Exception as e:
+        log(f"[UDP-COMMANDS] Reply decode error for server {server_id}: {e}")
+        return False
+    return reply is not None and correlator.resolve(server_id, reply)
+
+
+# Глобальный экземпляр
+_correlator: Optional[CommandCorrelator] = None
+_correlator_lock = threading.Lock()
+
+
+def get_command_correlator() -> CommandCorrelator:
+    """Получить глобальную таблицу ожидающих команд"""
+    global _correlator
+    if _correlator is None:
+        with _correlator_lock:
+            if _correlator is None:
+                _correlator = CommandCorrelator()
+    return _correlator
@@ -0,0 +1,174 @@
+"""
+Бенчмарк и проверка потоковой сборки фрагментов (processors_fragments.py)
+
+Запуск (из backend/):
+    python -m services.udp.fragment_benchmark [--repeat N] [--fragment-size BYTES]
+
+Сообщение - дамп стратегий (cmd=strats) в формате MoonBot, сжатый gzip
+и нарезанный на датаграммы. Сравнивается с прежней схемой: фрагменты
+копятся в один буфер, и весь буфер распаковывается заново при каждой
+попытке (квадратично по числу фрагментов).
+
+Проверки:
+- собранное сообщение совпадает с исходным
+- ни одно продолжение не декодируется как UTF-8, а обычные пакеты
+  (gzip JSON, текст lst) не принимаются за продолжение
+- битый поток не даёт сообщения, сообщение больше лимита сбрасывается
+
+Код возврата 1 при любой ошибке проверки.
+"""
+
+import argparse
+import gzip
+import json
+import random
+import time
+from typing import List, Optional, Sequence
+
+from .processors_fragments import GzipStreamAssembler, is_stream_continuation
+
+
+def strategy_dump(rnd: random.Random, strategies: int) -> bytes:
+    """JSON пакет strats с заданным числом стратегий"""
+    lines = []
+    for n in range(strategies):
+        lines.append("##Begin_Strategy")
+        lines.append(f"StrategyName=Sim strategy {n} <{rnd.choice(('Drop', 'Pump', 'Detect', 'Spread'))}>")
+        lines.append(f"SignalType={rnd.choice(('DropsDetection', 'PumpDetection', 'MoonShot', 'Manual'))}")
+        lines.append(f"Active={rnd.randint(0, 1)}")
+        lines.append(f"BuyPrice={rnd.uniform(-5, 0):.2f}")
+        lines.append(f"SellPrice={rnd.uniform(0.5, 5):.2f}")
+        lines.append(f"StopLoss={rnd.uniform(-10, -1):.2f}")
+        lines.append(f"OrderSize={rnd.choice((10, 20, 50, 100))}")
+        lines.append(f"CoinsWhiteList={','.join(rnd.sample(('BTC', 'ETH', 'SOL', 'XRP', 'DOGE', 'ADA'), 3))}")
+        lines.append(f"Comment=seed {rnd.getrandbits(32):08x}")
+        lines.append("##End_Strategy")
+    packet = {"cmd": "strats", "bot": "SimBot", "N": 1, "data": "\r\n".join(lines)}
+    return json.dumps(packet, separators=(',', ':')).encode('utf-8')
+
+
+def split_fragments(message: bytes, fragment_size: int) -> List[bytes]:
+    """gzip сообщения, нарезанный на датаграммы"""
+    compressed = gzip.compress(message)
+    return [compressed[i:i + fragment_size] for i in range(0, len(compressed), fragment_size)]
+
+
+def legacy_reassemble(fragments: Sequence[bytes]) -> Optional[bytes]:
+    """Прежняя схема: общий буфер, распаковка всего буфера на каждом фрагменте"""
+    buffer = bytearray()
+    for fragment in fragments:
+        buffer.extend(fragment)
+        try:
+            return gzip.decompress(bytes(buffer))
+        except (EOFError, OSError):
+            continue
+    return None
+
+
+def stream_reassemble(assembler: GzipStreamAssembler, fragments: Sequence[bytes]) -> Optional[bytes]:
+    """Потоковая сборка: каждый фрагмент распаковывается один раз"""
+    message = assembler.start(fragments[0])
+    for fragment in fragments[1:]:
+        message = assembler.feed(fragment)
+    return message
+
+
+# =============================================================================
+# ПРОВЕРКИ
+# =============================================================================
+
+def check(fragment_size: int) -> List[str]:
+    """Ошибки проверки корректности"""
+    errors = []
+    rnd = random.Random(1)
+    assembler = GzipStreamAssembler(server_id=0)
+
+    for strategies in (1, 50, 500, 5000):
+        message = strategy_dump(rnd, strategies)
+        fragments = split_fragments(message, fragment_size)
+        if stream_reassemble(assembler, fragments) != message:
+            errors.append(f"{strategies} strategies: reassembled message differs")
+        for index, fragment in enumerate(fragments[1:], start=1):
+            if not is_stream_continuation(fragment):
+                errors.append(f"{strategies} strategies: fragment {index} decodes as UTF-8")
+
+    regular = [
+        gzip.compress(b'{"cmd":"acc","bot":"SimBot","data":{"A":1.5,"T":2.5}}'),
+        b'{"cmd":"acc","bot":"SimBot","data":{"A":1.5,"T":2.5}}',
+        "Open Sell Orders: 2\r\nBTC 1.5%\r\nОткрытых ордеров нет".encode('utf-8'),
+        b'[SQLCommand 15] update Orders set Status=1 where ID=7',
+    ]
+    for packet in regular:
+        if not packet.startswith(b'\x1f\x8b') and is_stream_continuation(packet):
+            errors.append(f"regular packet taken for continuation: {packet[:40]!r}")
+
+    # Битый поток не даёт сообщения (сбрасывается сразу или по таймауту/новому
+    # сообщению), следующее сообщение собирается
+    message = strategy_dump(rnd, 500)
+    fragments = split_fragments(message, fragment_size)
+    corrupt = [fragments[0]] + [rnd.randbytes(len(f)) for f in fragments[1:]]
+    if stream_reassemble(assembler, corrupt) is not None:
+        errors.append("corrupt stream produced a message")
+    if stream_reassemble(assembler, fragments) != message:
+        errors.append("message after a corrupt stream differs")
+
+    limited = GzipStreamAssembler(server_id=0)
+    limited.max_message_bytes = 64 * 1024
+    if stream_reassemble(limited, split_fragments(strategy_dump(rnd, 5000), fragment_size)) is not None \
+            or limited.active:
+        errors.append("message over max_message_bytes was not dropped")
+
+    return errors
+
+
+# =============================================================================
+# ЗАМЕРЫ
+# =============================================================================
+
+def run_benchmark(fragment_size: int, repeat: int = 3) -> List[dict]:
+    """Время прежней и потоковой сборки на дампах разного размера"""
+    rnd = random.Random(2)
+    assembler = GzipStreamAssembler(server_id=0)
+    results = []
+    for strategies in (100, 1000, 5000, 20000):
+        message = strategy_dump(rnd, strategies)
+        fragments = split_fragments(message, fragment_size)
+        legacy_best = stream_best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            legacy_reassemble(fragments)
+            legacy_best = min(legacy_best, time.perf_counter() - start)
+            start = time.perf_counter()
+            stream_reassemble(assembler, fragments)
+            stream_best = min(stream_best, time.perf_counter() - start)
+        results.append({
+            "strategies": strategies,
+            "message_bytes": len(message),
+            "fragments": len(fragments),
+            "legacy_ms": legacy_best * 1000,
+            "stream_ms": stream_best * 1000,
+        })
+    return results
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Fragmented gzip reassembly benchmark")
+    parser.add_argument("--repeat", type=int, default=3, help="Повторов на случай (берётся лучший)")
+    parser.add_argument("--fragment-size", type=int, default=1400, help="Размер датаграммы (байт)")
+    args = parser.parse_args(argv)
+
+    errors = check(args.fragment_size)
+    print(f"Checks: {len(errors)} errors")
+    for error in errors[:20]:
+        print(f"  {error}")
+
+    print(f"{'strategies':>10} {'bytes':>10} {'fragments':>10} {'legacy ms':>11} {'stream ms':>10} {'speedup':>8}")
+    for r in run_benchmark(args.fragment_size, args.repeat):
+        speedup = r["legacy_ms"] / r["stream_ms"] if r["stream_ms"] else 0.0
+        print(f"{r['strategies']:>10} {r['message_bytes']:>10} {r['fragments']:>10} "
+              f"{r['legacy_ms']:>11.1f} {r['stream_ms']:>10.2f} {speedup:>7.1f}x")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -4,13 +4,15 @@
 Один сокет на фиксированном порту обслуживает все MoonBot серверы.
 Оптимизирован для 3000+ серверов с использованием Worker Pool.
 """
+import select
 import socket
 import threading
 import time
-from typing import Dict, Optional, TYPE_CHECKING
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
 from utils.logging import log
 from utils.config_loader import get_config_value
-from .utils import normalize_localhost_ip
+from .utils import normalize_localhost_ip, read_udp_kernel_drops
+from .command_correlator import get_command_correlator, match_command_reply
 from .worker_pool import UDPMessage, get_worker_pool, start_worker_pool, stop_worker_pool
 
 if TYPE_CHECKING:
@@ -26,10 +28,14 @@ class GlobalUDPSocket:
     
     Оптимизации для 3000+ серверов:
     - Worker Pool для параллельной обработки сообщений
+    - Пакетный приём: за одно пробуждение вычитываются все готовые датаграммы
     - Увеличенные системные буферы сокета
     - Метрики и мониторинг нагрузки
     """
     
+    # Максимум записей в кэше маршрутизации (защита от мусорных источников)
+    _ROUTE_CACHE_LIMIT = 10000
+    
     def __init__(self, port: int = None):
         """
         Args:
@@ -45,6 +51,8 @@ class GlobalUDPSocket:
         self.thread = None
         
         self.ip_port_to_listener: Dict[tuple, 'UDPListener'] = {}
+        # Кэш (сырой IP, порт) -> listener, сбрасывается при (раз)регистрации
+        self._route_cache: Dict[tuple, Optional['UDPListener']] = {}
         
         # Метрики
         self.total_packets = 0
@@ -53,6 +61,24 @@ class GlobalUDPSocket:
         self._packets_last_second = 0
         self._last_metrics_time = time.time()
         
+        # Метрики пакетного приёма
+        self.total_batches = 0
+        self.avg_batch_size = 0.0
+        self.max_batch_size = 0
+        # Отброшены переполненной очередью Worker Pool (не обработаны)
+        self.queue_full_dropped = 0
+        # Обработаны в приёмном потоке: Worker Pool не запущен
+        self.sync_fallbacks = 0
+        self.kernel_drops: Optional[int] = None
+        self._batches_last_second = 0
+        self._max_batch_current = 0
+        self._kernel_drops_baseline: Optional[int] = None
+        
+        # Максимум датаграмм, вычитываемых за одно пробуждение
+        self.recv_batch_size = get_config_value(
+            'high_load', 'udp.global_socket.recv_batch_size', default=256
+        )
+        
         # Настройки из конфига
         self._use_worker_pool = get_config_value(
             'high_load', 'udp.worker_pool.workers', default=16
@@ -65,6 +91,7 @@ class GlobalUDPSocket:
         normalized_host = normalize_localhost_ip(listener.host)
         key = (normalized_host, listener.port)
         self.ip_port_to_listener[key] = listener
+        self._route_cache = {}
         log(f"[GLOBAL-UDP] Registered listener for {listener.host}:{listener.port} (normalized: {normalized_host}:{listener.port}, server_id={listener.server_id})")
     
     def unregister_listener(self, listener: 'UDPListener'):
@@ -73,6 +100,7 @@ class GlobalUDPSocket:
         key = (normalized_host, listener.port)
         if key in self.ip_port_to_listener:
             del self.ip_port_to_listener[key]
+            self._route_cache = {}
             log(f"[GLOBAL-UDP] Unregistered listener for {listener.host}:{listener.port} (normalized: {normalized_host}:{listener.port}, server_id={listener.server_id})")
     
     def start(self):
@@ -114,7 +142,11 @@ class GlobalUDPSocket:
                 log(f"[GLOBAL-UDP] [WARN] Could not set SO_SNDBUF: {e}")
             
             self.sock.bind(("", self.port))
-            self.sock.settimeout(socket_timeout)
+            # Неблокирующий сокет: ожидание через select, затем вычитываем
+            # все готовые датаграммы до EAGAIN (см. _drain_socket)
+            self.sock.setblocking(False)
+            self._receive_timeout = socket_timeout
+            self._kernel_drops_baseline = read_udp_kernel_drops(self.port)
             
             log(f"[GLOBAL-UDP] [BIND] Bound to port {self.port}")
             
@@ -187,15 +219,31 @@ class GlobalUDPSocket:
                 current_time = time.time()
                 elapsed = current_time - self._last_metrics_time
                 if elapsed > 0:
-                    self.packets_per_second = int(
-                        (self.total_packets - self._packets_last_second) / elapsed
-                    )
+                    packets_delta = self.total_packets - self._packets_last_second
+                    batches_delta = self.total_batches - self._batches_last_second
+                    
+                    self.packets_per_second = int(packets_delta / elapsed)
+                    self.avg_batch_size = packets_delta / batches_delta if batches_delta > 0 else 0.0
+                    self.max_batch_size = self._max_batch_current
+                    self._max_batch_current = 0
+                    
                     self._packets_last_second = self.total_packets
+                    self._batches_last_second = self.total_batches
                     self._last_metrics_time = current_time
                     
+                    # Drops ядра считаем от момента bind (счётчик /proc общий на сокет)
+                    kernel_drops = read_udp_kernel_drops(self.port)
+                    if kernel_drops is not None:
+                        previous = self.kernel_drops or 0
+                        self.kernel_drops = kernel_drops - (self._kernel_drops_baseline or 0)
+                        if self.kernel_drops > previous:
+                            log(f"[GLOBAL-UDP] [WARN] Kernel dropped {self.kernel_drops - previous} "
+                                f"datagrams (receive buffer overflow)", level="WARNING")
+                    
                     # Логируем если нагрузка высокая
                     if self.packets_per_second > 1000:
-                        log(f"[GLOBAL-UDP] High load: {self.packets_per_second} packets/sec")
+                        log(f"[GLOBAL-UDP] High load: {self.packets_per_second} packets/sec, "
+                            f"batch avg={self.avg_batch_size:.1f} max={self.max_batch_size}")
             except Exception:
                 pass
     
@@ -204,13 +252,15 @@ class GlobalUDPSocket:
         Основной цикл прослушивания
         
         Оптимизирован для 3000+ серверов:
-        - Минимальная обработка в главном потоке
-        - Делегирование в Worker Pool
+        - Одно пробуждение (select) на пачку датаграмм вместо recvfrom на каждый пакет
+        - Маршрутизация источника кэшируется и выполняется один раз на адрес в пачке
+        - Делегирование в Worker Pool пачкой
         """
-        log(f"[GLOBAL-UDP] Listen loop started")
+        log(f"[GLOBAL-UDP] Listen loop started (recv_batch_size={self.recv_batch_size})")
         
         # Загружаем размер буфера из конфига
         buffer_size = get_config_value('udp', 'udp.socket.buffer_size', default=65535)
+        receive_timeout = getattr(self, '_receive_timeout', 1.0)
         
         # Получаем Worker Pool если включен
         worker_pool = get_worker_pool() if self._use_worker_pool else None
@@ -218,76 +268,13 @@ class GlobalUDPSocket:
         try:
             while self.running:
                 try:
-                    data, addr_tuple = self.sock.recvfrom(buffer_size)
-                    source_ip = addr_tuple[0]
-                    source_port = addr_tuple[1]
-                    
-                    self.total_packets += 1
+                    readable, _, _ = select.select([self.sock], [], [], receive_timeout)
+                    if not readable:
+                        continue
                     
-                    normalized_ip = normalize_localhost_ip(source_ip)
-                    
-                    key = (normalized_ip, source_port)
-                    listener = self.ip_port_to_listener.get(key)
-                    
-                    # Fallback для localhost
-                    if not listener and normalized_ip == '127.0.0.1':
-                        possible_listeners = [
-                            (k, l) for k, l in self.ip_port_to_listener.items() 
-                            if k[1] == source_port
-                        ]
-                        
-                        if len(possible_listeners) == 1:
-                            listener = possible_listeners[0][1]
-                        elif len(possible_listeners) > 1 and self.total_packets % 1000 == 0:
-                            # Логируем редко чтобы не спамить
-                            log(f"[GLOBAL-UDP] [WARN] Ambiguous loopback from {source_ip}:{source_port}")
-                    
-                    if listener:
-                        # ВАЖНО: Если listener ожидает ответ на команду - обрабатываем синхронно
-                        # чтобы ответ попал в command_response_queue
-                        if listener.waiting_for_response:
-                            try:
-                                result = listener.processor.process_message(data, source_ip, source_port)
-                                if result:
-                                    listener.command_response_queue.put(result)
-                            except Exception as e:
-                                log(f"[GLOBAL-UDP] Command response processing error: {e}")
-                        # ВАЖНО: Графики обрабатываем синхронно!
-                        # Они фрагментированы и ChartFragmentAssembler требует последовательной обработки
-                        elif listener.processor.chart_processor.is_chart_packet(data):
-                            try:
-                                listener.processor.chart_processor.process_chart_packet(data)
-                            except Exception as e:
-                                log(f"[GLOBAL-UDP] Chart processing error: {e}")
-                        elif worker_pool and worker_pool._running:
-                            # Делегируем в Worker Pool для параллельной обработки
-                            message = UDPMessage(
-                                server_id=listener.server_id,
-                                data=data,
-                                source_ip=source_ip,
-                                source_port=source_port,
-                                received_at=time.time(),
-                                processor=listener.processor
-                            )
-                            if not worker_pool.submit(message):
-                                # Queue full - обрабатываем синхронно как fallback
-                                try:
-                                    listener.processor.process_message(data, source_ip, source_port)
-                                except Exception as e:
-                                    log(f"[GLOBAL-UDP] Fallback processing error: {e}")
-                        else:
-                            # Синхронная обработка если Worker Pool не включен
-                            try:
-                                listener.processor.process_message(data, source_ip, source_port)
-                            except Exception as e:
-                                log(f"[GLOBAL-UDP] Error processing packet: {e}")
-                    else:
-                        # Логируем неизвестные источники редко
-                        if self.total_packets % 100 == 0:
-                            log(f"[GLOBAL-UDP] [WARN] Unknown source: {source_ip}:{source_port}")
-                
-                except socket.timeout:
-                    continue
+                    batch = self._drain_socket(buffer_size)
+                    if batch:
+                        self._dispatch_batch(batch, worker_pool)
                 
                 except Exception as e:
                     if self.running:
@@ -304,6 +291,138 @@ class GlobalUDPSocket:
                 self.sock.close()
             log(f"[GLOBAL-UDP] Listen loop ended (total packets: {self.total_packets})")
     
+    def _drain_socket(self, buffer_size: int) -> List[Tuple[bytes, tuple]]:
+        """
+        Вычитать из неблокирующего сокета все готовые датаграммы
+        
+        Читает до EAGAIN или до recv_batch_size пакетов, чтобы один
+        поток источников не задерживал диспетчеризацию остальных.
+        
+        Args:
+            buffer_size: Максимальный размер одной датаграммы
+        
+        Returns:
+            Список (data, addr_tuple) в порядке приёма
+        """
+        batch = []
+        recvfrom = self.sock.recvfrom
+        
+        for _ in range(self.recv_batch_size):
+            try:
+                batch.append(recvfrom(buffer_size))
+            except (BlockingIOError, InterruptedError):
+                break
+            except ConnectionResetError:
+                # Windows: ICMP port unreachable от предыдущего sendto - не фатально
+                continue
+        
+        count = len(batch)
+        if count:
+            self.total_packets += count
+            self.total_batches += 1
+            if count > self._max_batch_current:
+                self._max_batch_current = count
+        
+        return batch
+    
+    def _resolve_listener(self, source_ip: str, source_port: int) -> Optional['UDPListener']:
+        """
+        Найти listener для источника пакета (с кэшированием)
+        
+        Args:
+            source_ip: IP адрес отправителя (как пришёл из сокета)
+            source_port: Порт отправителя
+        
+        Returns:
+            UDPListener или None если источник неизвестен
+        """
+        route_key = (source_ip, source_port)
+        route_cache = self._route_cache
+        if route_key in route_cache:
+            return route_cache[route_key]
+        
+        normalized_ip = normalize_localhost_ip(source_ip)
+        listener = self.ip_port_to_listener.get((normalized_ip, source_port))
+        
+        # Fallback для localhost
+        if not listener and normalized_ip == '127.0.0.1':
+            possible_listeners = [
+                (k, l) for k, l in self.ip_port_to_listener.items() 
+                if k[1] == source_port
+            ]
+            
+            if len(possible_listeners) == 1:
+                listener = possible_listeners[0][1]
+            elif len(possible_listeners) > 1:
+                log(f"[GLOBAL-UDP] [WARN] Ambiguous loopback from {source_ip}:{source_port}")
+        
+        if len(route_cache) >= self._ROUTE_CACHE_LIMIT:
+            route_cache.clear()
+        route_cache[route_key] = listener
+        
+        return listener
+    
+    def _dispatch_batch(self, batch: List[Tuple[bytes, tuple]], worker_pool) -> None:
+        """
+        Распределить пачку датаграмм по listener'ам
+        
+        Ответы на команды сопоставляются с ожидающими командами без обработки,
+        все сообщения (включая графики) уходят в Worker Pool одним вызовом
+        submit_batch. Отброшенные пулом сообщения (переполнение очередей)
+        только считаются (queue_full_dropped) - приёмный поток их
+        не обрабатывает. Без Worker Pool пакеты обрабатываются синхронно
+        (sync_fallbacks).
+        
+        Args:
+            batch: Пачка (data, addr_tuple) из _drain_socket
+            worker_pool: Worker Pool или None
+        """
+        use_pool = worker_pool is not None and worker_pool._running
+        pool_messages = []
+        received_at = time.time()
+        
+        for data, addr_tuple in batch:
+            source_ip = addr_tuple[0]
+            source_port = addr_tuple[1]
+            
+            listener = self._resolve_listener(source_ip, source_port)
+            
+            if not listener:
+                # Логируем неизвестные источники редко
+                if self.total_packets % 100 == 0:
+                    log(f"[GLOBAL-UDP] [WARN] Unknown source: {source_ip}:{source_port}")
+                continue
+            
+            # Ответ на команду передаётся ожидающей команде (command_correlator),
+            # сам пакет обрабатывается дальше как обычно
+            match_command_reply(listener.server_id, listener.processor, data, source_ip)
+            
+            if use_pool:
+                # Копим для передачи в Worker Pool одной пачкой
+                # (фрагменты графика сервера идут в его шард по порядку)
+                pool_messages.append(UDPMessage(
+                    server_id=listener.server_id,
+                    data=data,
+                    source_ip=source_ip,
+                    source_port=source_port,
+                    received_at=received_at,
+                    processor=listener.processor
+                ))
+            else:
+                # Синхронная обработка если Worker Pool не включен
+                self.sync_fallbacks += 1
+                try:
+                    listener.processor.process_message(data, source_ip, source_port)
+                except Exception as e:
+                    log(f"[GLOBAL-UDP] Error processing packet: {e}")
+        
+        if not pool_messages:
+            return
+        
+        rejected = worker_pool.submit_batch(pool_messages)
+        if rejected:
+            self.queue_full_dropped += len(rejected)
+    
     def get_stats(self) -> Dict:
         """
         Получить статистику глобального сокета
@@ -319,6 +438,14 @@ class GlobalUDPSocket:
             "registered_listeners": len(self.ip_port_to_listener),
             "last_error": self.last_error,
             "use_worker_pool": self._use_worker_pool,
+            "recv_batch_size": self.recv_batch_size,
+            "total_batches": self.total_batches,
+            "avg_batch_size": round(self.avg_batch_size, 1),
+            "max_batch_size": self.max_batch_size,
+            "queue_full_dropped": self.queue_full_dropped,
+            "sync_fallbacks": self.sync_fallbacks,
+            "kernel_drops": self.kernel_drops,
+            "command_correlation": get_command_correlator().get_stats(),
         }
         
         # Добавляем статистику Worker Pool если включен
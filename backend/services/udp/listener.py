@@ -5,12 +5,12 @@ UDP Listener - основной класс для прослушивания Moo
 
 Модуль разбит на подмодули:
 - listener_loop.py - основной цикл прослушивания
+- listener_reactor.py - общий цикл событий для LOCAL/AUTO режима
 - listener_commands.py - отправка команд
 - listener_keepalive.py - keep-alive логика
 - listener_status.py - обновление статуса в БД
 """
 import os
-import queue
 import threading
 import time
 from typing import Optional
@@ -22,8 +22,12 @@ from datetime import datetime
 from .processors import MessageProcessor
 from .listener_status import update_listener_status
 from .listener_loop import run_listen_loop
-from .listener_commands import send_command_with_response, send_command_from_listener
+from .listener_commands import (
+    send_command_with_response, send_command_with_response_async, send_command_from_listener
+)
 from .listener_keepalive import start_keepalive_thread
+from .listener_reactor import is_reactor_enabled, attach_listener, detach_listener
+from .open_order_cache import warm_open_orders
 
 
 class UDPListener:
@@ -66,12 +70,10 @@ class UDPListener:
         self.running = False
         self.sock = None
         self.thread = None
+        self.reactor = None
         self.messages_received = 0
         self.last_error = None
         
-        # Очередь для ответов на команды
-        self.command_response_queue = queue.Queue()
-        self.waiting_for_response = False
         self.keepalive_timer = None
         self._initial_lst_pending = False
         
@@ -108,6 +110,9 @@ class UDPListener:
         
         self.running = True
         
+        # Открытые ордера сервера - в кэш до первых UPDATE
+        warm_open_orders(self.server_id)
+        
         if self.use_global_socket:
             return self._start_with_global_socket()
         
@@ -141,6 +146,9 @@ class UDPListener:
     
     def _start_with_own_socket(self) -> bool:
         """Запуск с собственным сокетом (LOCAL/AUTO mode)"""
+        if is_reactor_enabled():
+            return self._start_with_reactor()
+        
         self.thread = threading.Thread(
             target=run_listen_loop,
             args=(self,),
@@ -162,6 +170,27 @@ class UDPListener:
         
         return True
     
+    def _start_with_reactor(self) -> bool:
+        """
+        Запуск с собственным сокетом в общем reactor'е (LOCAL/AUTO mode)
+        
+        Сокет и keep-alive таймер обслуживаются общим циклом событий,
+        без отдельных потоков на сервер.
+        """
+        self.reactor = attach_listener(self)
+        
+        # force_db=True чтобы сразу записать в БД (важно для API)
+        update_listener_status(self.server_id, is_running=True, started_at=datetime.now(), force_db=True)
+        
+        log(f"[UDP-LISTENER-{self.server_id}] Started for {self.host}:{self.port} (reactor {self.reactor.reactor_id})")
+        
+        if self.keepalive_enabled:
+            log(f"[UDP-LISTENER-{self.server_id}] [OK] Keep-alive is ENABLED")
+        else:
+            log(f"[UDP-LISTENER-{self.server_id}] ⏸️  Keep-alive is DISABLED (server mode with fixed port)")
+        
+        return True
+    
     def stop(self):
         """Остановить listener"""
         if not self.running:
@@ -169,7 +198,11 @@ class UDPListener:
         
         self.running = False
         
-        if self.sock:
+        if self.reactor:
+            # Сокет принадлежит reactor'у - закрывается в его потоке
+            detach_listener(self, self.reactor)
+            self.reactor = None
+        elif self.sock:
             try:
                 self.sock.close()
             except OSError:
@@ -216,7 +249,20 @@ class UDPListener:
             tuple[bool, str]: (успех, ответ от MoonBot)
         """
         return send_command_with_response(self, command, timeout)
-    
+
+    async def send_command_async(self, command: str, timeout: float = None) -> tuple:
+        """
+        Отправка команды и ожидание ответа без занятия потока (для async кода)
+
+        Args:
+            command: Команда для отправки
+            timeout: Таймаут ожидания ответа
+
+        Returns:
+            tuple[bool, str]: (успех, ответ от MoonBot)
+        """
+        return await send_command_with_response_async(self, command, timeout)
+
     def _send_command_from_listener(self, command: str):
         """
         Внутренний метод для отправки команды через сокет
@@ -3,14 +3,82 @@
 
 Содержит функции для отправки команд на MoonBot сервер.
 """
+import asyncio
+import concurrent.futures
 import hmac
 import hashlib
-import queue
 import time
 
 from utils.logging import log
 from utils.config_loader import get_config_value
 
+from .command_correlator import get_command_correlator
+
+
+def submit_command(listener, command: str, timeout: float):
+    """
+    Зарегистрировать ожидание ответа и отправить команду через listener socket
+    
+    Ответ сопоставляется приёмным циклом (command_correlator), поэтому
+    несколько команд одному серверу могут ожидать ответа одновременно.
+    
+    Args:
+        listener: Экземпляр UDPListener
+        command: Команда для отправки
+        timeout: Таймаут ожидания ответа
+    
+    Returns:
+        tuple[PendingCommand | None, str | None]: (ожидающая команда, ошибка)
+    """
+    if listener.use_global_socket:
+        if not listener.global_socket or not listener.global_socket.running or not listener.global_socket.sock:
+            return None, "Global socket не готов"
+    else:
+        if not listener.sock:
+            return None, "Listener socket не создан"
+    
+    correlator = get_command_correlator()
+    # Регистрируем до отправки - ответ может прийти раньше, чем вернётся sendto
+    pending = correlator.register(listener.server_id, command, timeout)
+    if pending is None:
+        log(f"[UDP-LISTENER-{listener.server_id}] [WARN] Too many pending commands, rejected: {command}")
+        return None, "Слишком много команд ожидают ответа от сервера"
+    
+    # Формируем payload с HMAC если есть пароль
+    if listener.password:
+        h = hmac.new(
+            listener.password.encode('utf-8'),
+            command.encode('utf-8'),
+            hashlib.sha256
+        )
+        hmac_hex = h.hexdigest()
+        payload = f"{hmac_hex} {command}"
+        
+        log(f"[UDP-SEND] Server {listener.server_id}: {command} -> {listener.host}:{listener.port} (HMAC: {hmac_hex[:8]}...)")
+    else:
+        payload = command
+        log(f"[UDP-SEND] Server {listener.server_id}: {command} -> {listener.host}:{listener.port} (no auth)")
+    
+    # Отправляем через соответствующий сокет
+    try:
+        sock = listener.global_socket.sock if listener.use_global_socket else listener.sock
+        sock.sendto(payload.encode('utf-8'), (listener.host, listener.port))
+    except Exception:
+        correlator.discard(pending)
+        raise
+    
+    return pending, None
+
+
+def _command_result(listener, response: str) -> tuple:
+    """Результат команды по тексту ответа"""
+    log(f"[UDP-LISTENER-{listener.server_id}] 📥 Response received: {response[:100]}...")
+    
+    if response.startswith('ERR'):
+        return False, response
+    
+    return True, response
+
 
 def send_command_with_response(
     listener,
@@ -18,7 +86,7 @@ def send_command_with_response(
     timeout: float = None
 ) -> tuple:
     """
-    Отправка команды через listener socket и ожидание ответа через queue
+    Отправка команды через listener socket и ожидание ответа (блокирующая)
     
     Args:
         listener: Экземпляр UDPListener
@@ -33,70 +101,57 @@ def send_command_with_response(
         if timeout is None:
             timeout = get_config_value('udp', 'udp.timeouts.command', default=10.0)
         
-        if listener.use_global_socket:
-            if not listener.global_socket or not listener.global_socket.running or not listener.global_socket.sock:
-                return False, "Global socket не готов"
-        else:
-            if not listener.sock:
-                return False, "Listener socket не создан"
-        
-        # Очищаем очередь от старых ответов
-        while not listener.command_response_queue.empty():
-            try:
-                listener.command_response_queue.get_nowait()
-            except queue.Empty:
-                break
+        pending, error = submit_command(listener, command, timeout)
+        if pending is None:
+            return False, error
         
-        listener.waiting_for_response = True
+        try:
+            response = pending.future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            log(f"[UDP-LISTENER-{listener.server_id}] ⏱️ Timeout waiting for response: {command}")
+            return False, "Timeout: не получен ответ от сервера"
         
-        # Формируем payload с HMAC если есть пароль
-        if listener.password:
-            h = hmac.new(
-                listener.password.encode('utf-8'),
-                command.encode('utf-8'),
-                hashlib.sha256
-            )
-            hmac_hex = h.hexdigest()
-            payload = f"{hmac_hex} {command}"
+        return _command_result(listener, response)
             
-            password_masked = f"{listener.password[:4]}****{listener.password[-4:]}" if len(listener.password) > 8 else "****"
-            log(f"[UDP-SEND] Server {listener.server_id}: {command} -> {listener.host}:{listener.port} (HMAC: {hmac_hex[:8]}...)")
-        else:
-            payload = command
-            log(f"[UDP-SEND] Server {listener.server_id}: {command} -> {listener.host}:{listener.port} (no auth)")
-        
-        # Отправляем через соответствующий сокет
-        if listener.use_global_socket and listener.global_socket:
-            listener.global_socket.sock.sendto(
-                payload.encode('utf-8'),
-                (listener.host, listener.port)
-            )
-        else:
-            listener.sock.sendto(
-                payload.encode('utf-8'),
-                (listener.host, listener.port)
-            )
+    except Exception as e:
+        log(f"[UDP-LISTENER-{listener.server_id}] [ERROR] Failed to send command with response: {e}")
+        return False, f"Ошибка: {str(e)}"
+
+
+async def send_command_with_response_async(
+    listener,
+    command: str,
+    timeout: float = None
+) -> tuple:
+    """
+    Отправка команды через listener socket и ожидание ответа без занятия потока
+    
+    Args:
+        listener: Экземпляр UDPListener
+        command: Команда для отправки
+        timeout: Таймаут ожидания ответа
+    
+    Returns:
+        tuple[bool, str]: (успех, ответ от MoonBot)
+    """
+    try:
+        if timeout is None:
+            timeout = get_config_value('udp', 'udp.timeouts.command', default=10.0)
         
-        log(f"[UDP-LISTENER-{listener.server_id}] [OK] Command sent, waiting for response in queue...")
+        pending, error = submit_command(listener, command, timeout)
+        if pending is None:
+            return False, error
         
         try:
-            response = listener.command_response_queue.get(timeout=timeout)
-            log(f"[UDP-LISTENER-{listener.server_id}] 📥 Response received from queue: {response[:100]}...")
-            
-            if response.startswith('ERR'):
-                return False, response
-            
-            return True, response
-            
-        except queue.Empty:
-            log(f"[UDP-LISTENER-{listener.server_id}] ⏱️ Timeout waiting for response in queue")
+            response = await asyncio.wait_for(asyncio.wrap_future(pending.future), timeout=timeout)
+        except asyncio.TimeoutError:
+            log(f"[UDP-LISTENER-{listener.server_id}] ⏱️ Timeout waiting for response: {command}")
             return False, "Timeout: не получен ответ от сервера"
-        finally:
-            listener.waiting_for_response = False
+        
+        return _command_result(listener, response)
             
     except Exception as e:
         log(f"[UDP-LISTENER-{listener.server_id}] [ERROR] Failed to send command with response: {e}")
-        listener.waiting_for_response = False
         return False, f"Ошибка: {str(e)}"
 
 
@@ -15,6 +15,7 @@ from utils.config_loader import get_config_value
 from datetime import datetime
 from .listener_status import update_listener_status
 from .worker_pool import UDPMessage, get_worker_pool, start_worker_pool
+from .command_correlator import match_command_reply
 
 
 def run_listen_loop(listener):
@@ -151,40 +152,18 @@ def _process_received_data(listener, data: bytes, addr: str, port: int):
     Использует Worker Pool для параллельной обработки если доступен.
     
     ВАЖНО: 
-    - Если ожидаем ответ на команду - обрабатываем синхронно!
-    - Графики (chart packets) обрабатываем синхронно - они фрагментированы
-      и ChartFragmentAssembler требует последовательной обработки
+    - Ответы на команды сопоставляются с ожидающими командами (command_correlator)
+    - Графики (chart packets) идут в шард сервера в Worker Pool - фрагменты
+      одного сервера обрабатываются одним воркером по порядку
+    - При переполнении очередей пула сообщение отбрасывается, а не
+      обрабатывается на приёмном потоке
     """
-    # Если ожидаем ответ на команду (lst, etc) - обрабатываем синхронно
-    # чтобы ответ попал в command_response_queue
-    if listener.waiting_for_response:
-        try:
-            result = listener.processor.process_message(data, addr, port)
-            if result:
-                listener.command_response_queue.put(result)
-        except EOFError:
-            pass
-        except Exception as e:
-            log(f"[UDP-LISTENER-{listener.server_id}] [ERROR] Command response processing error: {e}")
-        
-        listener.messages_received += 1
-        _update_status_periodically(listener)
-        return
-    
-    # ВАЖНО: Графики обрабатываем синхронно!
-    # Они фрагментированы и ChartFragmentAssembler не thread-safe
-    # Также это гарантирует что все фрагменты одного графика обрабатываются последовательно
-    if listener.processor.chart_processor.is_chart_packet(data):
-        try:
-            listener.processor.chart_processor.process_chart_packet(data)
-        except Exception as e:
-            log(f"[UDP-LISTENER-{listener.server_id}] [ERROR] Chart processing error: {e}")
-        
-        listener.messages_received += 1
-        _update_status_periodically(listener)
-        return
+    # Ответ на команду (lst, etc) передаётся ожидающей команде,
+    # сам пакет обрабатывается дальше как обычно
+    match_command_reply(listener.server_id, listener.processor, data, addr)
     
-    # Проверяем, есть ли Worker Pool для обычных сообщений
+    # Проверяем, есть ли Worker Pool (графики тоже идут в него: фрагменты
+    # сервера обрабатываются воркером его шарда по порядку)
     use_worker_pool = get_config_value('high_load', 'udp.worker_pool.enabled', default=True)
     
     if use_worker_pool:
@@ -200,15 +179,16 @@ def _process_received_data(listener, data: bytes, addr: str, port: int):
                     received_at=time.time(),
                     processor=listener.processor
                 )
-                if worker_pool.submit(message):
-                    listener.messages_received += 1
-                    _update_status_periodically(listener)
-                    return
-                # Queue full - fallback to direct processing
-        except Exception:
-            pass  # Fallback to direct processing
+                # Переполнение очереди - сообщение отброшено (учтено в метриках пула),
+                # приёмный поток не обрабатывает его сам
+                worker_pool.submit(message)
+                listener.messages_received += 1
+                _update_status_periodically(listener)
+                return
+        except Exception as e:
+            log(f"[UDP-LISTENER-{listener.server_id}] [ERROR] Worker pool submit error: {e}")
     
-    # Direct processing (fallback or if Worker Pool disabled)
+    # Direct processing (Worker Pool disabled or not running)
     try:
         listener.processor.process_message(data, addr, port)
     except EOFError:
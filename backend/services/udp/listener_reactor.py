@@ -0,0 +1,537 @@
+"""
+Мультиплексированный приём для LOCAL/AUTO режима
+
+Вместо пары потоков на сервер (run_listen_loop + keep-alive) один поток
+с selector (epoll/kqueue/select) обслуживает сокеты многих listener'ов
+и их таймеры: начальные команды, переподписку на графики и смену
+эфемерного порта (keep-alive).
+
+Оптимизировано для 3000+ серверов:
+- Количество потоков не растёт линейно с числом серверов
+- На Windows select ограничен 512 сокетами, поэтому listener'ы
+  распределяются по нескольким reactor'ам (max_sockets_per_reactor)
+- Обработка пакетов та же, что и в run_listen_loop (_process_received_data)
+"""
+import errno
+import heapq
+import itertools
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.logging import log
+from utils.config_loader import get_config_value
+from .listener_status import update_listener_status
+from .listener_loop import _configure_receive_buffer, _process_received_data
+from .worker_pool import start_worker_pool
+
+
+class ListenerReactor:
+    """
+    Цикл событий для сокетов нескольких UDPListener
+
+    Все операции с сокетами и таймерами выполняются в потоке reactor'а.
+    Другие потоки ставят операции в очередь (call_soon) и будят цикл
+    через socketpair.
+    """
+
+    def __init__(self, reactor_id: int, max_sockets: int):
+        """
+        Args:
+            reactor_id: Номер reactor'а (для логов и имени потока)
+            max_sockets: Максимум listener'ов на этот reactor
+        """
+        self.reactor_id = reactor_id
+        self.max_sockets = max_sockets
+
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._wakeup_recv.setblocking(False)
+        self._wakeup_send.setblocking(False)
+        self._selector.register(self._wakeup_recv, selectors.EVENT_READ, None)
+
+        self._pending: deque = deque()
+        self._timers: List[tuple] = []
+        self._timer_seq = itertools.count()
+
+        # server_id -> listener (только в потоке reactor'а)
+        self._listeners: Dict[int, Any] = {}
+        # Резерв мест учитывается сразу при attach (до открытия сокета)
+        self._reserved = 0
+        self._reserved_lock = threading.Lock()
+
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+        # Настройки
+        self._buffer_size = get_config_value('udp', 'udp.socket.buffer_size', default=65535)
+        self._reuse_address = get_config_value('udp', 'udp.socket.reuse_address', default=True)
+        self._keepalive_interval = get_config_value('udp', 'udp.listener.heartbeat_interval', default=60)
+        self._recv_batch_size = get_config_value(
+            'udp', 'udp.listener.recv_batch_size', default=64
+        )
+
+        # Метрики
+        self.packets_received = 0
+        self.socket_rotations = 0
+        self.last_error: Optional[str] = None
+
+    # ==================== ЖИЗНЕННЫЙ ЦИКЛ ====================
+
+    def start(self) -> None:
+        """Запустить поток reactor'а"""
+        if self._running:
+            return
+
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._run,
+            daemon=True,
+            name=f"UDPListenerReactor-{self.reactor_id}"
+        )
+        self._thread.start()
+        log(f"[UDP-REACTOR-{self.reactor_id}] Started (max_sockets={self.max_sockets})")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Остановить reactor и закрыть все сокеты"""
+        if not self._running:
+            return
+
+        self._running = False
+        self._wakeup()
+
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=timeout)
+
+        log(f"[UDP-REACTOR-{self.reactor_id}] Stopped (packets: {self.packets_received})")
+
+    @property
+    def load(self) -> int:
+        """Количество listener'ов, закреплённых за reactor'ом"""
+        return self._reserved
+
+    def has_capacity(self) -> bool:
+        """Есть ли место для ещё одного listener'а"""
+        return self._running and self._reserved < self.max_sockets
+
+    # ==================== API ДЛЯ ДРУГИХ ПОТОКОВ ====================
+
+    def add_listener(self, listener) -> None:
+        """
+        Поставить listener на обслуживание
+
+        Сокет создаётся асинхронно в потоке reactor'а; listener.sock
+        появляется после этого (UDPListener.send_command это ожидает).
+        """
+        with self._reserved_lock:
+            self._reserved += 1
+        self.call_soon(self._open_listener, listener)
+
+    def remove_listener(self, listener, timeout: float = 5.0) -> None:
+        """
+        Снять listener с обслуживания и закрыть его сокет
+
+        Блокирует до закрытия сокета (как join потока в старой схеме).
+        """
+        done = threading.Event()
+        self.call_soon(self._close_listener, listener, done)
+        if threading.current_thread() is not self._thread and self._thread.is_alive():
+            done.wait(timeout=timeout)
+
+    def call_soon(self, callback: Callable, *args) -> None:
+        """Выполнить callback в потоке reactor'а"""
+        self._pending.append((callback, args))
+        self._wakeup()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика reactor'а"""
+        return {
+            "reactor_id": self.reactor_id,
+            "running": self._running,
+            "listeners": self._reserved,
+            "max_sockets": self.max_sockets,
+            "pending_timers": len(self._timers),
+            "packets_received": self.packets_received,
+            "socket_rotations": self.socket_rotations,
+            "last_error": self.last_error,
+        }
+
+    # ==================== ЦИКЛ СОБЫТИЙ ====================
+
+    def _wakeup(self) -> None:
+        try:
+            self._wakeup_send.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass  # Буфер полон - цикл и так проснётся
+
+    def _call_later(self, delay: float, callback: Callable, *args) -> None:
+        """Запланировать callback (только из потока reactor'а)"""
+        heapq.heappush(self._timers, (time.monotonic() + delay, next(self._timer_seq), callback, args))
+
+    def _run(self) -> None:
+        """Основной цикл reactor'а"""
+        try:
+            while self._running:
+                timeout = 1.0
+                if self._timers:
+                    timeout = max(0.0, min(timeout, self._timers[0][0] - time.monotonic()))
+
+                try:
+                    events = self._selector.select(timeout)
+                except OSError as e:
+                    log(f"[UDP-REACTOR-{self.reactor_id}] Select error: {e}", level="ERROR")
+                    self.last_error = str(e)
+                    time.sleep(0.1)
+                    continue
+
+                for key, _ in events:
+                    if key.data is None:
+                        self._drain_wakeup()
+                    else:
+                        self._drain_socket(key.fileobj, key.data)
+
+                self._run_pending()
+                self._run_timers()
+
+        except Exception as e:
+            log(f"[UDP-REACTOR-{self.reactor_id}] Fatal error, reactor stopped: {e}", level="ERROR")
+            self.last_error = str(e)
+
+        finally:
+            orphans = self._retire()
+            self._shutdown()
+            # Listener'ы упавшего reactor'а переезжают на рабочий
+            for listener in orphans:
+                _rehome_listener(listener, self.reactor_id)
+
+    def _drain_wakeup(self) -> None:
+        try:
+            while self._wakeup_recv.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _run_pending(self) -> None:
+        while self._pending:
+            callback, args = self._pending.popleft()
+            try:
+                callback(*args)
+            except Exception as e:
+                log(f"[UDP-REACTOR-{self.reactor_id}] Callback error: {e}", level="ERROR")
+
+    def _run_timers(self) -> None:
+        now = time.monotonic()
+        while self._timers and self._timers[0][0] <= now:
+            _, _, callback, args = heapq.heappop(self._timers)
+            try:
+                callback(*args)
+            except Exception as e:
+                log(f"[UDP-REACTOR-{self.reactor_id}] Timer error: {e}", level="ERROR")
+
+    def _drain_socket(self, sock: socket.socket, listener) -> None:
+        """Вычитать готовые датаграммы сокета listener'а"""
+        for _ in range(self._recv_batch_size):
+            try:
+                data, addr_tuple = sock.recvfrom(self._buffer_size)
+            except (BlockingIOError, InterruptedError):
+                return
+            except ConnectionResetError:
+                # Windows: ICMP port unreachable от предыдущего sendto
+                continue
+            except OSError as e:
+                if listener.running:
+                    self._handle_os_error(listener, sock, e)
+                return
+
+            self.packets_received += 1
+            _process_received_data(listener, data, addr_tuple[0], addr_tuple[1])
+
+    def _handle_os_error(self, listener, sock: socket.socket, e: OSError) -> None:
+        """Обработка OSError при приёме (без sleep - цикл общий)"""
+        error_code = getattr(e, 'winerror', None) or getattr(e, 'errno', None)
+
+        # WinError 10040 - пакет больше буфера
+        if error_code == 10040 or 'buffer' in str(e).lower():
+            log(f"[UDP-LISTENER-{listener.server_id}] ⚠️ Large packet received (likely chart data) - packet was truncated")
+            try:
+                current_buf = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+                new_buf = min(current_buf * 2, 8 * 1024 * 1024)  # Максимум 8MB
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, new_buf)
+                log(f"[UDP-LISTENER-{listener.server_id}] 📈 Increased SO_RCVBUF from {current_buf} to {new_buf}")
+            except Exception:
+                pass
+        else:
+            log(f"[UDP-LISTENER-{listener.server_id}] Receive error: {e}")
+            listener.last_error = str(e)
+
+    def _retire(self) -> List[Any]:
+        """
+        Перестать принимать listener'ы (в том числе после ошибки цикла)
+
+        Returns:
+            Listener'ы, оставшиеся без reactor'а (пусто при штатной остановке)
+        """
+        # Под _reactors_lock: attach_listener больше не выберет этот reactor
+        with _reactors_lock:
+            stopped = not self._running
+            self._running = False
+            if self in _reactors:
+                _reactors.remove(self)
+
+        if stopped:
+            return []
+
+        orphans = list(self._listeners.values())
+        while self._pending:
+            callback, args = self._pending.popleft()
+            if callback == self._open_listener:
+                orphans.append(args[0])
+            elif callback == self._close_listener and len(args) > 1 and args[1] is not None:
+                args[1].set()  # Сокет закроет _shutdown - не держим stop()
+        return [listener for listener in orphans if listener.running]
+
+    def _shutdown(self) -> None:
+        """Закрыть все сокеты при остановке reactor'а"""
+        for listener in list(self._listeners.values()):
+            self._unregister_socket(listener.sock)
+            listener.sock = None
+        self._listeners.clear()
+
+        try:
+            self._selector.close()
+        except Exception:
+            pass
+        for sock in (self._wakeup_recv, self._wakeup_send):
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    # ==================== ОПЕРАЦИИ С LISTENER'АМИ ====================
+
+    def _is_active(self, listener) -> bool:
+        return listener.running and self._listeners.get(listener.server_id) is listener
+
+    def _create_socket(self, listener, port: int) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if self._reuse_address:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+        try:
+            sock.bind(("", port))
+        except OSError as e:
+            if port and e.errno in (10048, errno.EADDRINUSE):
+                log(f"[UDP-LISTENER-{listener.server_id}] [WARN]  Port {port} already in use, using ephemeral port")
+                sock.bind(("", 0))
+            else:
+                sock.close()
+                raise
+
+        sock.setblocking(False)
+        return sock
+
+    def _unregister_socket(self, sock: Optional[socket.socket]) -> None:
+        if sock is None:
+            return
+        try:
+            self._selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+        try:
+            sock.close()
+        except OSError:
+            pass
+
+    def _open_listener(self, listener) -> None:
+        """Создать сокет listener'а и запланировать начальные команды"""
+        if not listener.running:
+            with self._reserved_lock:
+                self._reserved -= 1
+            return
+
+        listen_port = listener.local_port if listener.local_port > 0 else 0
+
+        try:
+            sock = self._create_socket(listener, listen_port)
+        except Exception as e:
+            with self._reserved_lock:
+                self._reserved -= 1
+            log(f"[UDP-LISTENER-{listener.server_id}] Fatal error: {e}")
+            listener.last_error = str(e)
+            update_listener_status(listener.server_id, is_running=False, last_error=str(e))
+            return
+
+        listener.sock = sock
+        # Увеличиваем системный буфер приёма для больших пакетов
+        _configure_receive_buffer(listener)
+
+        self._selector.register(sock, selectors.EVENT_READ, listener)
+        self._listeners[listener.server_id] = listener
+
+        local_addr = sock.getsockname()
+        if listen_port == 0:
+            log(f"[UDP-LISTENER-{listener.server_id}] [BIND] Listening on EPHEMERAL port {local_addr[1]} (reactor {self.reactor_id})")
+        else:
+            log(f"[UDP-LISTENER-{listener.server_id}] [BIND] Listening on FIXED port {local_addr[1]} (reactor {self.reactor_id})")
+        log(f"[UDP-LISTENER-{listener.server_id}] Will send commands to {listener.host}:{listener.port}")
+
+        self._call_later(0.5, self._send_initial_lst, listener)
+
+        if listener.keepalive_enabled:
+            self._call_later(self._keepalive_interval, self._rotate_socket, listener)
+            log(f"[UDP-LISTENER-{listener.server_id}] [KEEPALIVE] Keep-alive scheduled (port rotation every {self._keepalive_interval} sec)")
+
+    def _close_listener(self, listener, done: Optional[threading.Event] = None) -> None:
+        """Закрыть сокет listener'а и снять его с обслуживания"""
+        try:
+            if self._listeners.get(listener.server_id) is listener:
+                del self._listeners[listener.server_id]
+                self._unregister_socket(listener.sock)
+                listener.sock = None
+                with self._reserved_lock:
+                    self._reserved -= 1
+                log(f"[UDP-LISTENER-{listener.server_id}] Loop ended")
+        finally:
+            if done is not None:
+                done.set()
+
+    def _send_initial_lst(self, listener) -> None:
+        """Начальная команда lst после привязки сокета"""
+        if not self._is_active(listener):
+            return
+
+        log(f"[UDP-LISTENER-{listener.server_id}] 📡 Sending initial 'lst' to establish UDP connection...")
+        listener._initial_lst_pending = True
+        listener._send_command_from_listener("lst")
+
+        # Автоматически подписываемся на графики
+        self._call_later(0.2, self._subscribe_charts, listener)
+
+    def _subscribe_charts(self, listener) -> None:
+        if not self._is_active(listener):
+            return
+
+        listener._send_command_from_listener("SubscribeCharts")
+        log(f"[UDP-LISTENER-{listener.server_id}] 📊 Subscribed to charts")
+
+    def _rotate_socket(self, listener) -> None:
+        """
+        Keep-alive: пересоздать сокет на новом эфемерном порту
+
+        Сохраняет NAT mapping так же, как start_keepalive_thread,
+        но без отдельного потока на сервер.
+        """
+        if not self._is_active(listener):
+            return
+
+        try:
+            new_sock = self._create_socket(listener, 0)
+            # Устанавливаем буфер для больших пакетов (графики)
+            try:
+                new_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024 * 1024)
+            except Exception:
+                pass
+
+            self._unregister_socket(listener.sock)
+            listener.sock = new_sock
+            self._selector.register(new_sock, selectors.EVENT_READ, listener)
+            self.socket_rotations += 1
+
+            log(f"[UDP-LISTENER-{listener.server_id}] [KEEPALIVE] Switched to NEW port {new_sock.getsockname()[1]}")
+
+            listener._send_command_from_listener("lst")
+            # Переподписываемся на графики (новый порт = новая подписка)
+            self._call_later(0.2, self._subscribe_charts, listener)
+        except Exception as e:
+            log(f"[UDP-LISTENER-{listener.server_id}] [ERROR] Keep-alive error: {e}")
+            listener.last_error = str(e)
+        finally:
+            self._call_later(self._keepalive_interval, self._rotate_socket, listener)
+
+
+# ==================== ПУЛ REACTOR'ОВ ====================
+
+_reactors: List[ListenerReactor] = []
+_reactors_lock = threading.Lock()
+_reactor_ids = itertools.count()
+
+
+def is_reactor_enabled() -> bool:
+    """Включён ли мультиплексированный приём для LOCAL/AUTO режима"""
+    return bool(get_config_value('udp', 'udp.listener.multiplexed', default=True))
+
+
+def attach_listener(listener) -> ListenerReactor:
+    """
+    Закрепить listener за reactor'ом со свободным местом
+
+    Args:
+        listener: Экземпляр UDPListener
+
+    Returns:
+        ListenerReactor, обслуживающий listener
+    """
+    # Worker Pool нужен для обработки так же, как в run_listen_loop
+    if get_config_value('high_load', 'udp.worker_pool.enabled', default=True):
+        try:
+            start_worker_pool()
+        except Exception as e:
+            log(f"[UDP-LISTENER-{listener.server_id}] Worker Pool init failed, using direct processing: {e}")
+
+    with _reactors_lock:
+        reactor = next((r for r in _reactors if r.has_capacity()), None)
+        if reactor is None:
+            max_sockets = get_config_value(
+                'udp', 'udp.listener.max_sockets_per_reactor', default=500
+            )
+            reactor = ListenerReactor(next(_reactor_ids), max_sockets)
+            reactor.start()
+            _reactors.append(reactor)
+        reactor.add_listener(listener)
+
+    return reactor
+
+
+def _rehome_listener(listener, dead_reactor_id: int) -> None:
+    """Закрепить listener упавшего reactor'а за другим reactor'ом"""
+    try:
+        listener.reactor = attach_listener(listener)
+        log(
+            f"[UDP-LISTENER-{listener.server_id}] Moved from failed reactor {dead_reactor_id} "
+            f"to reactor {listener.reactor.reactor_id}",
+            level="WARNING"
+        )
+    except Exception as e:
+        log(f"[UDP-LISTENER-{listener.server_id}] Failed to move from reactor {dead_reactor_id}: {e}", level="ERROR")
+        listener.last_error = str(e)
+        update_listener_status(listener.server_id, is_running=False, last_error=str(e))
+
+
+def detach_listener(listener, reactor: ListenerReactor) -> None:
+    """
+    Снять listener с reactor'а и закрыть его сокет
+
+    Args:
+        listener: Экземпляр UDPListener
+        reactor: Reactor, за которым закреплён listener
+    """
+    reactor.remove_listener(listener)
+
+
+def stop_all_reactors() -> None:
+    """Остановить все reactor'ы"""
+    with _reactors_lock:
+        reactors = list(_reactors)
+        _reactors.clear()
+
+    for reactor in reactors:
+        reactor.stop()
+
+
+def get_reactor_stats() -> List[Dict[str, Any]]:
+    """Статистика всех reactor'ов"""
+    with _reactors_lock:
+        return [r.get_stats() for r in _reactors]
@@ -4,21 +4,30 @@
 Содержит функции для обновления статуса listener в базе данных.
 
 Оптимизировано для 3000+ серверов:
-- In-memory кэширование статуса
-- Батчевое обновление в БД
-- Минимизация запросов к БД
+- In-memory кэширование статуса, шардированное по server_id:
+  обновления разных серверов не конкурируют за один lock
+- Батчевое обновление в БД: все изменённые статусы - одним
+  INSERT ... ON CONFLICT DO UPDATE за цикл flush (O(1) запросов,
+  а не запрос на сервер)
+- Запись в БД - вне lock'ов кэша; записи сериализованы, поэтому
+  более старый снимок статуса не перезапишет более новый
 """
 import threading
 import time
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from dataclasses import dataclass, field
 from datetime import datetime
 
+from sqlalchemy import bindparam, select
+
 from models.database import SessionLocal
 from models import models
 from utils.logging import log
-from datetime import datetime
 from utils.config_loader import get_config_value
+from .batch_processor_upsert import NATIVE_UPSERT_DIALECTS, _get_dialect_insert
+from .server_state import get_server_state
+from .chart_pipeline import get_chart_assembler
+from .open_order_cache import get_open_order_cache
 
 
 @dataclass
@@ -34,9 +43,16 @@ class ListenerStatusCache:
     dirty: bool = False  # Требуется ли обновление в БД
 
 
-# Глобальный кэш статусов (thread-safe)
-_status_cache: Dict[int, ListenerStatusCache] = {}
-_cache_lock = threading.Lock()
+# Колонки udp_listener_status, которые пишутся из кэша
+_STATUS_COLUMNS = ('is_running', 'started_at', 'messages_received', 'last_message_at', 'last_error')
+
+# Глобальный кэш статусов (thread-safe): шард = server_id % _SHARD_COUNT
+_SHARD_COUNT = 16
+_status_shards: List[Dict[int, ListenerStatusCache]] = [{} for _ in range(_SHARD_COUNT)]
+_shard_locks: List[threading.Lock] = [threading.Lock() for _ in range(_SHARD_COUNT)]
+
+# Запись в БД (снимок + запрос) - по одной за раз
+_write_lock = threading.Lock()
 
 # Настройки
 _db_update_interval = 30.0  # Обновлять БД не чаще чем раз в N секунд
@@ -55,13 +71,13 @@ def update_listener_status(server_id: int, force_db: bool = False, **kwargs):
         force_db: Если True, немедленно записать в БД (для важных изменений типа start/stop)
         **kwargs: Поля для обновления (is_running, started_at, messages_received, etc.)
     """
-    global _status_cache
+    index = server_id % _SHARD_COUNT
     
-    with _cache_lock:
-        if server_id not in _status_cache:
-            _status_cache[server_id] = ListenerStatusCache(server_id=server_id)
-        
-        cache = _status_cache[server_id]
+    with _shard_locks[index]:
+        shard = _status_shards[index]
+        cache = shard.get(server_id)
+        if cache is None:
+            cache = shard[server_id] = ListenerStatusCache(server_id=server_id)
         
         # Обновляем кэш
         for key, value in kwargs.items():
@@ -73,49 +89,124 @@ def update_listener_status(server_id: int, force_db: bool = False, **kwargs):
         # Немедленно записываем в БД если:
         # - force_db=True (важные изменения: start/stop)
         # - изменился is_running (критический статус)
-        # - прошло достаточно времени с последнего обновления
-        current_time = time.time()
+        # - поток flush не запущен и прошло достаточно времени с последнего обновления
+        #   (с потоком остальные изменения пишутся его пакетом)
         should_flush = (
             force_db or 
             'is_running' in kwargs or
-            current_time - cache.last_db_update >= _db_update_interval
+            (not _running and time.time() - cache.last_db_update >= _db_update_interval)
         )
-        
-        if should_flush:
-            _flush_status_to_db(server_id, cache)
-            cache.last_db_update = current_time
-            cache.dirty = False
+    
+    if should_flush:
+        _flush_servers([server_id])
 
 
-def _flush_status_to_db(server_id: int, cache: ListenerStatusCache):
+def _status_row(cache: ListenerStatusCache) -> Dict[str, Any]:
+    """Строка udp_listener_status из кэша"""
+    row = {column: getattr(cache, column) for column in _STATUS_COLUMNS}
+    row['server_id'] = cache.server_id
+    return row
+
+
+def _flush_servers(server_ids: Optional[List[int]] = None) -> int:
     """
-    Записать статус в БД.
+    Записать dirty статусы в БД одним пакетом.
+    
+    Снимок берётся под lock'ами шардов, запись - вне их. При ошибке
+    статусы снова помечаются dirty и пишутся следующим flush.
     
     Args:
-        server_id: ID сервера
-        cache: Кэш статуса
+        server_ids: Только эти серверы (None - все dirty)
+        
+    Returns:
+        Количество записанных статусов
     """
-    db = SessionLocal()
-    try:
-        status = db.query(models.UDPListenerStatus).filter(
-            models.UDPListenerStatus.server_id == server_id
-        ).first()
+    with _write_lock:
+        now = time.time()
+        rows: List[Dict[str, Any]] = []
+        if server_ids is None:
+            indexes = range(_SHARD_COUNT)
+        else:
+            indexes = sorted({server_id % _SHARD_COUNT for server_id in server_ids})
         
-        if not status:
-            status = models.UDPListenerStatus(server_id=server_id)
-            db.add(status)
+        for index in indexes:
+            with _shard_locks[index]:
+                shard = _status_shards[index]
+                caches = shard.values() if server_ids is None else [
+                    shard[server_id] for server_id in server_ids
+                    if server_id % _SHARD_COUNT == index and server_id in shard
+                ]
+                for cache in caches:
+                    if cache.dirty:
+                        rows.append(_status_row(cache))
+                        cache.dirty = False
+                        cache.last_db_update = now
         
-        # Копируем поля из кэша
-        status.is_running = cache.is_running
-        status.started_at = cache.started_at
-        status.messages_received = cache.messages_received
-        status.last_message_at = cache.last_message_at
-        status.last_error = cache.last_error
+        if not rows:
+            return 0
         
+        try:
+            _upsert_statuses(rows)
+        except Exception as e:
+            for row in rows:
+                index = row['server_id'] % _SHARD_COUNT
+                with _shard_locks[index]:
+                    cache = _status_shards[index].get(row['server_id'])
+                    if cache is not None:
+                        cache.dirty = True
+            log(f"[LISTENER-STATUS] Batch flush error ({len(rows)} statuses): "
+                f"{getattr(e, 'orig', e)}", level="ERROR")
+            return 0
+        
+        return len(rows)
+
+
+def _upsert_statuses(rows: List[Dict[str, Any]]) -> None:
+    """
+    Bulk upsert строк udp_listener_status (уникальный ключ - server_id).
+    
+    SQLite/PostgreSQL: один INSERT ... ON CONFLICT DO UPDATE (executemany).
+    Остальные СУБД: SELECT существующих + INSERT новых + UPDATE остальных.
+    Значения из кэша перезаписывают строку целиком (в т.ч. last_error = NULL).
+    
+    Args:
+        rows: Строки статусов (server_id + _STATUS_COLUMNS)
+    """
+    table = models.UDPListenerStatus.__table__
+    db = SessionLocal()
+    try:
+        dialect_name = db.get_bind().dialect.name
+        if dialect_name in NATIVE_UPSERT_DIALECTS:
+            stmt = _get_dialect_insert(dialect_name)(table)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['server_id'],
+                set_={column: stmt.excluded[column] for column in _STATUS_COLUMNS}
+            )
+            db.execute(stmt, rows)
+        else:
+            existing = set(db.execute(
+                select(table.c.server_id).where(
+                    table.c.server_id.in_([row['server_id'] for row in rows])
+                )
+            ).scalars())
+            inserts = [row for row in rows if row['server_id'] not in existing]
+            updates = [
+                {f'b_{key}': value for key, value in row.items()}
+                for row in rows if row['server_id'] in existing
+            ]
+            if inserts:
+                db.execute(table.insert(), inserts)
+            if updates:
+                db.execute(
+                    table.update()
+                    .where(table.c.server_id == bindparam('b_server_id'))
+                    .values({column: bindparam(f'b_{column}') for column in _STATUS_COLUMNS}),
+                    updates
+                )
         db.commit()
-    except Exception as e:
+    except Exception:
         db.rollback()
-        # Не логируем каждую ошибку - только критические
+        raise
     finally:
         db.close()
 
@@ -130,8 +221,9 @@ def get_listener_status_cached(server_id: int) -> Optional[Dict[str, Any]]:
     Returns:
         Dict со статусом или None
     """
-    with _cache_lock:
-        cache = _status_cache.get(server_id)
+    index = server_id % _SHARD_COUNT
+    with _shard_locks[index]:
+        cache = _status_shards[index].get(server_id)
         if cache:
             return {
                 "server_id": cache.server_id,
@@ -186,53 +278,12 @@ def _flush_loop():
 
 
 def _flush_all_dirty():
-    """Записать все dirty статусы в БД."""
-    with _cache_lock:
-        dirty_servers = [
-            (server_id, cache) 
-            for server_id, cache in _status_cache.items() 
-            if cache.dirty
-        ]
-    
-    if not dirty_servers:
-        return
-    
-    db = SessionLocal()
-    try:
-        for server_id, cache in dirty_servers:
-            status = db.query(models.UDPListenerStatus).filter(
-                models.UDPListenerStatus.server_id == server_id
-            ).first()
-            
-            if not status:
-                status = models.UDPListenerStatus(server_id=server_id)
-                db.add(status)
-            
-            status.is_running = cache.is_running
-            status.started_at = cache.started_at
-            status.messages_received = cache.messages_received
-            status.last_message_at = cache.last_message_at
-            status.last_error = cache.last_error
-            
-            with _cache_lock:
-                cache.dirty = False
-                cache.last_db_update = time.time()
-        
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        log(f"[LISTENER-STATUS] Batch flush error: {e}", level="ERROR")
-    finally:
-        db.close()
+    """Записать все dirty статусы в БД (один bulk upsert)."""
+    _flush_servers()
 
 
 # ==================== SERVER ONLINE STATUS ====================
 
-# Кэш времени последнего обновления online статуса (чтобы не обновлять слишком часто)
-_online_status_cache: Dict[int, float] = {}
-_online_status_lock = threading.Lock()
-_online_update_interval = 10.0  # Обновлять не чаще чем раз в 10 секунд
-
 
 def cleanup_server_caches(server_id: int):
     """
@@ -243,15 +294,13 @@ def cleanup_server_caches(server_id: int):
     Args:
         server_id: ID сервера
     """
-    global _status_cache, _online_status_cache
-    
-    with _cache_lock:
-        if server_id in _status_cache:
-            del _status_cache[server_id]
+    index = server_id % _SHARD_COUNT
+    with _shard_locks[index]:
+        _status_shards[index].pop(server_id, None)
     
-    with _online_status_lock:
-        if server_id in _online_status_cache:
-            del _online_status_cache[server_id]
+    get_server_state().forget(server_id)
+    get_chart_assembler().forget_server(server_id)
+    get_open_order_cache().forget_server(server_id)
     
     log(f"[LISTENER-STATUS] Cleaned up caches for server {server_id}")
 
@@ -261,53 +310,11 @@ def update_server_online_status(server_id: int):
     Обновить статус сервера как online при получении данных.
     
     Вызывается при успешном получении баланса или других данных от MoonBot.
-    Оптимизировано для 3000+ серверов - обновляет не чаще чем раз в 10 сек.
+    Оптимизировано для 3000+ серверов: отметка только в памяти,
+    server_status обновляется одним UPDATE на все серверы
+    не чаще online_update_interval на сервер (см. server_state.py).
     
     Args:
         server_id: ID сервера
     """
-    current_time = time.time()
-    
-    # Проверяем, нужно ли обновлять (не чаще чем раз в N секунд)
-    with _online_status_lock:
-        last_update = _online_status_cache.get(server_id, 0)
-        if current_time - last_update < _online_update_interval:
-            return  # Слишком рано для обновления
-        _online_status_cache[server_id] = current_time
-    
-    # Обновляем в БД
-    db = SessionLocal()
-    try:
-        server_status = db.query(models.ServerStatus).filter(
-            models.ServerStatus.server_id == server_id
-        ).first()
-        
-        if not server_status:
-            # Создаём запись если не существует
-            # Используем ЛОКАЛЬНОЕ время для корректного отображения на frontend
-            server_status = models.ServerStatus(
-                server_id=server_id,
-                is_online=True,
-                last_ping=datetime.now(),
-                uptime_percentage=100.0,
-                consecutive_failures=0
-            )
-            db.add(server_status)
-        else:
-            # Обновляем существующую
-            # Используем ЛОКАЛЬНОЕ время для корректного отображения на frontend
-            server_status.is_online = True
-            server_status.last_ping = datetime.now()
-            server_status.last_error = None
-            server_status.consecutive_failures = 0
-            # Улучшаем uptime
-            current_uptime = server_status.uptime_percentage or 100.0
-            server_status.uptime_percentage = min(100.0, current_uptime * 0.99 + 100.0 * 0.01)
-        
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        # Не логируем каждую ошибку для производительности
-    finally:
-        db.close()
-
+    get_server_state().mark_online(server_id)
@@ -8,6 +8,7 @@ from utils.logging import log
 from utils.config_loader import get_config_value
 from .listener import UDPListener
 from .global_socket import GlobalUDPSocket
+from .listener_reactor import stop_all_reactors
 import os
 
 
@@ -185,6 +186,8 @@ def stop_all_listeners():
         global_udp_socket.stop()
         global_udp_socket = None
     
+    stop_all_reactors()
+    
     log("[UDP-LISTENER] All listeners stopped")
 
 
@@ -0,0 +1,359 @@
+"""
+Кэш открытых ордеров MoonBot для применения SQL Orders
+
+Занятый бот шлёт много UPDATE на каждый открытый ордер, и каждый раз
+ордер выбирался из БД по (server_id, moonbot_order_id) - ключу
+idx_server_order. Кэш хранит снимки колонок открытых ордеров по тому же
+ключу; при попадании ордер собирается из снимка и присоединяется
+к сессии как только что загруженный (make_transient_to_detached) -
+без SELECT. UPDATE пишет только изменённые колонки, а история атрибутов
+(rollup order_stats_daily) считается от снимка, как от загруженной строки.
+
+Кэш обновляется событиями сессий SessionLocal:
+- after_flush: снимки записанных MoonBotOrder (закрытые/удалённые - на удаление)
+- after_commit: снимки попадают в кэш
+- откат транзакции: ордера, взятые из кэша в этой сессии, удаляются
+  из кэша (следующее обращение перечитает строку из БД)
+- массовые UPDATE/DELETE moonbot_orders через ORM (удаление ордеров
+  сервера, сброс системы) очищают кэш
+
+Прогрев - при старте listener'а (последние открытые ордера сервера).
+На сервер хранится не больше max_orders_per_server ордеров (LRU).
+
+Ордера одного сервера пишет один поток (шард Worker Pool или flush
+BatchProcessor), поэтому снимок в кэше не отстаёт от БД между commit
+и обновлением кэша.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from models import models
+from models.database import SessionLocal
+from utils.config_loader import get_config_value
+from utils.logging import log
+
+
+OrderKey = Tuple[int, int]  # (server_id, moonbot_order_id) - как idx_server_order
+
+# Колонки MoonBotOrder в порядке хранения снимка
+_COLUMNS = tuple(attr.key for attr in inspect(models.MoonBotOrder).column_attrs)
+_ID_INDEX = _COLUMNS.index('id')
+_MISSING = object()
+
+_PENDING_KEY = 'open_order_cache_pending'
+_TOUCHED_KEY = 'open_order_cache_touched'
+_CLEAR_KEY = 'open_order_cache_clear'
+
+_hooks_installed = False
+_hooks_lock = threading.Lock()
+
+
+def _snapshot(order: models.MoonBotOrder) -> tuple:
+    """Загруженные значения колонок ордера (не загруженные - _MISSING)"""
+    loaded = inspect(order).dict
+    return tuple(loaded.get(name, _MISSING) for name in _COLUMNS)
+
+
+def _is_open(order: models.MoonBotOrder) -> bool:
+    return order.status == "Open"
+
+
+class OpenOrderCache:
+    """
+    Снимки открытых ордеров: server_id -> OrderedDict(moonbot_order_id -> снимок)
+
+    Thread-safe.
+    """
+
+    def __init__(self, max_orders_per_server: Optional[int] = None, enabled: Optional[bool] = None):
+        self.enabled = enabled if enabled is not None else get_config_value(
+            'high_load', 'udp.open_order_cache.enabled', default=True
+        )
+        self.max_orders_per_server = max_orders_per_server or get_config_value(
+            'high_load', 'udp.open_order_cache.max_orders_per_server', default=256
+        )
+
+        self._servers: Dict[int, OrderedDict] = {}
+        # Счётчик записей по серверу - прогрев не перезаписывает более свежие снимки
+        self._epochs: Dict[int, int] = {}
+        self._generation = 0  # растёт при clear()
+        self._lock = threading.Lock()
+
+        # Метрики
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.evicted = 0
+        self.lru_evicted = 0
+        self.warmed = 0
+
+    def attach(self, db: Session, server_id: int, moonbot_order_id: int) -> Optional[models.MoonBotOrder]:
+        """
+        Ордер из кэша, присоединённый к сессии (без SELECT)
+
+        Returns:
+            Ордер или None (промах - ордер нужно выбрать из БД)
+        """
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            orders = self._servers.get(server_id)
+            values = orders.get(moonbot_order_id) if orders else None
+            if values is None:
+                self.misses += 1
+                return None
+            orders.move_to_end(moonbot_order_id)
+            self.hits += 1
+
+        db.info.setdefault(_TOUCHED_KEY, set()).add((server_id, moonbot_order_id))
+
+        # Ордер уже в сессии (например, взят ранее в этой транзакции)
+        identity = db.identity_map.get(db.identity_key(models.MoonBotOrder, values[_ID_INDEX]))
+        if identity is not None:
+            return identity
+
+        order = models.MoonBotOrder(**{
+            name: value for name, value in zip(_COLUMNS, values) if value is not _MISSING
+        })
+        make_transient_to_detached(order)
+        db.add(order)
+        return order
+
+    def attach_many(self, db: Session, keys: Iterable[OrderKey]) -> Tuple[Dict[OrderKey, models.MoonBotOrder], List[OrderKey]]:
+        """
+        Ордера пакета из кэша
+
+        Returns:
+            ({ключ: ордер} для попаданий, ключи промахов)
+        """
+        found: Dict[OrderKey, models.MoonBotOrder] = {}
+        missing: List[OrderKey] = []
+        for key in keys:
+            order = self.attach(db, *key)
+            if order is not None:
+                found[key] = order
+            else:
+                missing.append(key)
+        return found, missing
+
+    def store(self, changes: Dict[OrderKey, Optional[tuple]]) -> None:
+        """
+        Применить записанные изменения (после commit)
+
+        Args:
+            changes: {ключ: снимок открытого ордера или None - убрать из кэша}
+        """
+        with self._lock:
+            for (server_id, moonbot_order_id), values in changes.items():
+                self._epochs[server_id] = self._epochs.get(server_id, 0) + 1
+                if values is None:
+                    self._remove(server_id, moonbot_order_id)
+                else:
+                    self._put(server_id, moonbot_order_id, values)
+                    self.stored += 1
+
+    def evict(self, keys: Iterable[OrderKey]) -> None:
+        """Убрать ордера из кэша (следующее обращение - из БД)"""
+        with self._lock:
+            for server_id, moonbot_order_id in keys:
+                self._epochs[server_id] = self._epochs.get(server_id, 0) + 1
+                self._remove(server_id, moonbot_order_id)
+
+    def forget_server(self, server_id: int) -> None:
+        """Убрать все ордера сервера (сервер удалён)"""
+        with self._lock:
+            orders = self._servers.pop(server_id, None)
+            self._epochs.pop(server_id, None)
+            # Прогрев, начатый до удаления, не вернёт снимки сервера
+            self._generation += 1
+            if orders:
+                self.evicted += len(orders)
+
+    def clear(self) -> None:
+        """Очистить кэш (массовое изменение moonbot_orders)"""
+        with self._lock:
+            self._generation += 1
+            self._servers.clear()
+
+    def warm(self, server_id: int) -> int:
+        """
+        Загрузить последние открытые ордера сервера
+
+        Returns:
+            Количество добавленных ордеров
+        """
+        if not self.enabled:
+            return 0
+
+        with self._lock:
+            epoch = (self._generation, self._epochs.get(server_id, 0))
+
+        db = SessionLocal()
+        try:
+            rows = db.query(models.MoonBotOrder).filter(
+                models.MoonBotOrder.server_id == server_id,
+                models.MoonBotOrder.status == "Open"
+            ).order_by(models.MoonBotOrder.id.desc()).limit(self.max_orders_per_server).all()
+            snapshots = [(row.moonbot_order_id, _snapshot(row)) for row in reversed(rows)]
+        finally:
+            db.close()
+
+        added = 0
+        with self._lock:
+            # Пока шёл SELECT, ордера сервера записывались - снимки могли устареть
+            if (self._generation, self._epochs.get(server_id, 0)) != epoch:
+                return 0
+            orders = self._servers.get(server_id)
+            for moonbot_order_id, values in snapshots:
+                if orders is None or moonbot_order_id not in orders:
+                    self._put(server_id, moonbot_order_id, values)
+                    orders = self._servers[server_id]
+                    added += 1
+            self.warmed += added
+        return added
+
+    def _put(self, server_id: int, moonbot_order_id: int, values: tuple) -> None:
+        """Добавить снимок (под lock)"""
+        orders = self._servers.get(server_id)
+        if orders is None:
+            orders = self._servers[server_id] = OrderedDict()
+        orders[moonbot_order_id] = values
+        orders.move_to_end(moonbot_order_id)
+        if len(orders) > self.max_orders_per_server:
+            orders.popitem(last=False)
+            self.lru_evicted += 1
+
+    def _remove(self, server_id: int, moonbot_order_id: int) -> None:
+        """Удалить снимок (под lock)"""
+        orders = self._servers.get(server_id)
+        if orders and orders.pop(moonbot_order_id, None) is not None:
+            self.evicted += 1
+            if not orders:
+                del self._servers[server_id]
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            size = sum(len(orders) for orders in self._servers.values())
+            servers = len(self._servers)
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": size,
+            "servers": servers,
+            "max_orders_per_server": self.max_orders_per_server,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups * 100, 1) if lookups else 0.0,
+            "stored": self.stored,
+            "evicted": self.evicted,
+            "lru_evicted": self.lru_evicted,
+            "warmed": self.warmed,
+        }
+
+
+# =============================================================================
+# СОБЫТИЯ СЕССИИ
+# =============================================================================
+
+def _after_flush(session: Session, flush_context) -> None:
+    """Снимки записанных ордеров до commit"""
+    if not get_open_order_cache().enabled:
+        return
+    pending = session.info.get(_PENDING_KEY)
+    for obj in session.deleted:
+        if isinstance(obj, models.MoonBotOrder):
+            if pending is None:
+                pending = session.info[_PENDING_KEY] = {}
+            pending[(obj.server_id, obj.moonbot_order_id)] = None
+
+    for obj in (*session.new, *session.dirty):
+        if not isinstance(obj, models.MoonBotOrder):
+            continue
+        if pending is None:
+            pending = session.info[_PENDING_KEY] = {}
+
+        # Fingerprint matching меняет moonbot_order_id - старый ключ больше не действителен
+        history = inspect(obj).attrs.moonbot_order_id.history
+        for old_id in history.deleted or ():
+            pending[(obj.server_id, old_id)] = None
+
+        key = (obj.server_id, obj.moonbot_order_id)
+        pending[key] = _snapshot(obj) if _is_open(obj) else None
+
+
+def _after_commit(session: Session) -> None:
+    cache = get_open_order_cache()
+    session.info.pop(_TOUCHED_KEY, None)
+    if session.info.pop(_CLEAR_KEY, False):
+        session.info.pop(_PENDING_KEY, None)
+        cache.clear()
+        return
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        cache.store(pending)
+
+
+def _after_transaction_end(session: Session, transaction) -> None:
+    """Транзакция завершилась без commit - взятые из кэша ордера перечитываются из БД"""
+    if transaction.parent is not None:
+        return
+    session.info.pop(_PENDING_KEY, None)
+    touched = session.info.pop(_TOUCHED_KEY, None)
+    if session.info.pop(_CLEAR_KEY, False):
+        get_open_order_cache().clear()
+    elif touched:
+        get_open_order_cache().evict(touched)
+
+
+def _do_orm_execute(orm_execute_state) -> None:
+    """Массовые UPDATE/DELETE moonbot_orders в обход снимков"""
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    if any(mapper.class_ is models.MoonBotOrder for mapper in orm_execute_state.all_mappers):
+        get_open_order_cache().clear()
+        # И ещё раз после commit - снимки, записанные до завершения этой транзакции
+        orm_execute_state.session.info[_CLEAR_KEY] = True
+
+
+def install_open_order_cache_hooks() -> None:
+    """Подключить обновление кэша к сессиям SessionLocal (идемпотентно)"""
+    global _hooks_installed
+    with _hooks_lock:
+        if _hooks_installed:
+            return
+        event.listen(SessionLocal, "after_flush", _after_flush)
+        event.listen(SessionLocal, "after_commit", _after_commit)
+        event.listen(SessionLocal, "after_transaction_end", _after_transaction_end)
+        event.listen(SessionLocal, "do_orm_execute", _do_orm_execute)
+        _hooks_installed = True
+
+
+def warm_open_orders(server_id: int) -> None:
+    """Прогреть кэш открытыми ордерами сервера (ошибки не мешают старту listener'а)"""
+    try:
+        added = get_open_order_cache().warm(server_id)
+        if added:
+            log(f"[OPEN-ORDER-CACHE] Server {server_id}: warmed {added} open orders")
+    except Exception as e:
+        log(f"[OPEN-ORDER-CACHE] Warm error for server {server_id}: {e}", level="WARNING")
+
+
+# Глобальный экземпляр
+_cache: Optional[OpenOrderCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_open_order_cache() -> OpenOrderCache:
+    """Получить глобальный кэш открытых ордеров"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = OpenOrderCache()
+    return _cache
@@ -5,6 +5,7 @@
 
 Модуль разбит на подмодули:
 - processors_utils.py - утилитарные функции
+- processors_fragments.py - потоковая сборка фрагментированных gzip сообщений
 - processors_balance.py - обработка балансов
 - processors_orders.py - обработка ордеров
 - processors_strategies.py - обработка стратегий
@@ -15,13 +16,11 @@
 - Уменьшенное логирование
 - Быстрая обработка без блокировок
 """
-import time
-
 from services import udp_protocol
 from utils.logging import log
 from utils.datetime_utils import utcnow
 
-from .processors_utils import try_decompress_buffer
+from .processors_fragments import GzipStreamAssembler, is_stream_continuation
 from .processors_balance import BalanceProcessor
 from .processors_orders import OrderProcessor
 from .processors_strategies import StrategyProcessor
@@ -56,9 +55,7 @@ class MessageProcessor:
         self.server_id = server_id
         self.host = host
         self.port = port
-        self.fragment_buffer = bytearray()
-        self.last_fragment_time = 0
-        self.fragment_timeout_ms = 50
+        self.fragments = GzipStreamAssembler(server_id)
         
         # Инициализация специализированных процессоров
         self.balance_processor = BalanceProcessor(server_id)
@@ -98,61 +95,101 @@ class MessageProcessor:
         packet = udp_protocol.decode_udp_packet(data)
         
         if packet.decompress_error:
-            return self._handle_fragment(data, addr, port)
-        
-        if self.fragment_buffer:
-            self._process_fragment_buffer(addr, port)
+            return self._handle_fragment(data, addr, port, first=True)
         
-        if not packet.payload:
-            return self.process_legacy_message(packet.raw_text, addr, port)
+        # Продолжение без начатого сообщения сборщик отбрасывает -
+        # сырые байты deflate не обрабатываются как текст
+        if not packet.is_gzip and packet.payload is None and is_stream_continuation(data):
+            return self._handle_fragment(data, addr, port, first=False)
         
-        cmd = udp_protocol.get_packet_command(packet)
+        self.fragments.expire()
         
-        return self._dispatch_command(cmd, packet)
+        return self._process_packet(packet, addr, port)
     
-    def _handle_fragment(self, data: bytes, addr: str, port: int):
+    def _process_packet(self, packet, addr: str, port: int):
         """
-        Обработка фрагментированного пакета
+        Обработка декодированного (целого или собранного) пакета
         
         Args:
-            data: Данные фрагмента
+            packet: Декодированный пакет
             addr: IP адрес отправителя
             port: Порт отправителя
+        
+        Returns:
+            Результат обработки или None
         """
-        current_time_ms = time.time() * 1000
+        if not packet.payload:
+            return self.process_legacy_message(packet.raw_text, addr, port)
         
-        if self.fragment_buffer and (current_time_ms - self.last_fragment_time) > 2000:
-            self._try_decompress()
-            self.fragment_buffer = bytearray()
+        cmd = udp_protocol.get_packet_command(packet)
         
-        self.fragment_buffer.extend(data)
-        self.last_fragment_time = current_time_ms
-    
-    def _process_fragment_buffer(self, addr: str, port: int):
+        return self._dispatch_command(cmd, packet)
+
+    def extract_command_reply(self, data: bytes, addr: str):
         """
-        Обработка накопленного буфера фрагментов
-        
+        Текст ответа на команду без обработки пакета (без обращений к БД)
+
+        Используется приёмным потоком для сопоставления с ожидающими командами
+        (command_correlator), сам пакет затем обрабатывается process_message.
+
         Args:
+            data: Бинарные данные сообщения
             addr: IP адрес отправителя
-            port: Порт отправителя
+
+        Returns:
+            Текст ответа или None если пакет не является ответом на команду
         """
-        self._try_decompress()
-        self.fragment_buffer = bytearray()
-    
-    def _try_decompress(self) -> bool:
+        if normalize_localhost_ip(addr) != normalize_localhost_ip(self.host):
+            return None
+
+        if self.chart_processor.is_chart_packet(data):
+            return None
+
+        packet = udp_protocol.decode_udp_packet(data)
+        if packet.decompress_error:
+            return None
+
+        if not packet.payload:
+            message_clean = packet.raw_text.strip()
+            if not message_clean or (ord(message_clean[0]) < 32 and message_clean[0] not in '\n\r\t'):
+                return None
+            # SQLCommand приходит по инициативе бота, а не в ответ на команду
+            if "[SQLCommand" in packet.raw_text:
+                return None
+            return packet.raw_text
+
+        cmd = udp_protocol.get_packet_command(packet)
+        if cmd in ("order", "acc", "strats", "errors"):
+            return None
+        if cmd != "replay" and "sql" in packet.payload:
+            return None
+        return udp_protocol.extract_preferred_text(packet)
+
+    def _handle_fragment(self, data: bytes, addr: str, port: int, first: bool):
         """
-        Попытка декомпрессировать буфер фрагментов
+        Обработка фрагмента gzip сообщения
+        
+        Фрагмент сразу распаковывается потоково; когда gzip поток
+        завершён, сообщение обрабатывается как целый пакет.
+        
+        Args:
+            data: Данные фрагмента
+            addr: IP адрес отправителя
+            port: Порт отправителя
+            first: Первый фрагмент (с заголовком gzip)
         
         Returns:
-            True если декомпрессия успешна
+            Результат обработки собранного сообщения или None
         """
-        return try_decompress_buffer(
-            self.fragment_buffer,
-            self.server_id,
-            self.strategy_processor.process_strategies_response,
-            self.order_processor.process_order_update,
-            self.balance_processor.process_balance_update
-        )
+        if first:
+            message = self.fragments.start(data)
+        else:
+            message = self.fragments.feed(data)
+        
+        if message is None:
+            return None
+        
+        return self._process_packet(udp_protocol.decode_udp_packet(message), addr, port)
     
     def _dispatch_command(self, cmd: str, packet):
         """
@@ -2,7 +2,8 @@
 Обработка балансов для UDP Listener
 
 Парсинг и сохранение данных о балансах от MoonBot.
-Оптимизировано для 3000+ серверов с использованием Batch Processor.
+Оптимизировано для 3000+ серверов: последний баланс сервера хранится
+в памяти (server_state.py) и пишется в БД периодически пакетом.
 """
 import re
 from typing import Tuple, Optional
@@ -13,7 +14,7 @@ from utils.logging import log
 from utils.datetime_utils import utcnow
 from utils.config_loader import get_config_value
 from .processors_utils import clean_currency_value
-from .batch_processor import get_batch_processor
+from .server_state import get_server_state
 from .listener_status import update_server_online_status
 
 
@@ -27,7 +28,8 @@ class BalanceProcessor:
     Процессор обновлений баланса
     
     Оптимизирован для высоких нагрузок:
-    - Использует Batch Processor для группировки записей в БД
+    - Последний баланс сервера - в хранилище состояния (latest wins),
+      в БД - периодическим upsert через Batch Processor
     - Минимизирует количество DB commits
     - Минимизирует логирование
     """
@@ -161,11 +163,10 @@ class BalanceProcessor:
             is_running: Флаг работы бота
             version: Версия MoonBot
         """
-        # Используем Batch Processor для высоких нагрузок
+        # Хранилище состояния: в БД попадёт только последний баланс за flush
         if self._use_batch:
             try:
-                batch_processor = get_batch_processor()
-                batch_processor.add_balance(
+                get_server_state().update_balance(
                     server_id=self.server_id,
                     available=available,
                     total=total,
@@ -179,7 +180,7 @@ class BalanceProcessor:
                         f"last: server={self.server_id}, {available:.2f}/{total:.2f}")
                 return
             except Exception as e:
-                log(f"[UDP-LISTENER-{self.server_id}] Batch processor error, falling back: {e}")
+                log(f"[UDP-LISTENER-{self.server_id}] Server state error, falling back: {e}")
         
         # Fallback: прямая запись в БД
         self._save_balance_to_db_direct(available, total, bot_name, is_running, version)
@@ -0,0 +1,165 @@
+"""
+Потоковая сборка фрагментированных gzip сообщений MoonBot
+
+Большой ответ (strats, lst) приходит несколькими датаграммами: первая
+начинается с заголовка gzip, продолжения - сырые байты deflate потока.
+Каждый фрагмент сразу подаётся в zlib.decompressobj сервера, поэтому
+работа пропорциональна размеру сообщения (без повторной распаковки
+накопленного буфера), а сообщение готово на фрагменте, где закончился
+gzip поток, а не при следующем пакете сервера.
+
+Продолжение отличается от обычного пакета тем, что не является
+ни gzip, ни UTF-8 текстом (сжатые данные практически никогда
+не декодируются как UTF-8) - обычные пакеты между фрагментами
+обрабатываются как обычно и поток не прерывают.
+
+Порядок фрагментов не гарантирован (потеря, перестановка). Поток
+проверяется zlib и CRC32 gzip: переставленный или пропущенный
+фрагмент даёт ошибку распаковки, и сообщение сбрасывается - битое
+сообщение не выдаётся. Продолжение без начатого сообщения (первый
+фрагмент потерян или пришёл позже) отбрасывается и считается в orphaned.
+
+Память ограничена на сервер: распакованное сообщение не больше
+max_message_mb, незавершённый поток сбрасывается через timeout_ms
+без фрагментов (udp.fragments в high_load.yaml).
+"""
+
+import time
+import zlib
+from typing import Any, Dict, List, Optional
+
+from utils.config_loader import get_config_value
+from utils.logging import log
+
+
+def is_stream_continuation(data: bytes) -> bool:
+    """Похожа ли датаграмма (не gzip) на продолжение сжатого потока"""
+    try:
+        data.decode('utf-8')
+    except UnicodeDecodeError:
+        return True
+    return False
+
+
+class GzipStreamAssembler:
+    """
+    Сборка одного фрагментированного gzip сообщения сервера.
+
+    Используется из потока, обрабатывающего пакеты сервера (шард
+    Worker Pool или приёмный поток) - без блокировок.
+    """
+
+    def __init__(self, server_id: int):
+        self.server_id = server_id
+        self.max_message_bytes = int(get_config_value(
+            'high_load', 'udp.fragments.max_message_mb', default=16
+        ) * 1024 * 1024)
+        self.timeout = get_config_value(
+            'high_load', 'udp.fragments.timeout_ms', default=2000
+        ) / 1000.0
+
+        self._decompressor = None
+        self._chunks: List[bytes] = []
+        self._size = 0
+        self._fragments = 0
+        self._last_fragment_at = 0.0
+
+        self.completed = 0
+        self.aborted = 0
+        self.orphaned = 0  # Продолжения без начатого сообщения
+
+    @property
+    def active(self) -> bool:
+        """Есть незавершённое сообщение"""
+        return self._decompressor is not None
+
+    def start(self, data: bytes) -> Optional[bytes]:
+        """
+        Начать сообщение с первого фрагмента (начинается с заголовка gzip)
+
+        Незавершённое предыдущее сообщение сбрасывается.
+
+        Returns:
+            Распакованное сообщение, если поток уже завершён, иначе None
+        """
+        if self.active:
+            self._abort(f"new message started after {self._fragments} fragments")
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._last_fragment_at = time.monotonic()
+        return self.feed(data)
+
+    def feed(self, data: bytes) -> Optional[bytes]:
+        """
+        Подать следующий фрагмент
+
+        Returns:
+            Распакованное сообщение, когда gzip поток завершён, иначе None
+            (и для продолжения без начатого или уже сброшенного сообщения)
+        """
+        if not self.active:
+            self.orphaned += 1
+            log(f"[UDP-LISTENER-{self.server_id}] Fragment without a started message dropped "
+                f"({len(data)} bytes)", level="DEBUG")
+            return None
+
+        now = time.monotonic()
+        if now - self._last_fragment_at > self.timeout:
+            self._abort(f"timed out after {self._fragments} fragments")
+            return None
+
+        decompressor = self._decompressor
+        try:
+            # +1 байт сверх лимита - чтобы отличить "ровно лимит" от "больше"
+            out = decompressor.decompress(data, self.max_message_bytes - self._size + 1)
+        except zlib.error as e:
+            self._abort(f"corrupt stream after {self._fragments} fragments: {e}")
+            return None
+
+        self._size += len(out)
+        if self._size > self.max_message_bytes:
+            self._abort(f"message exceeds {self.max_message_bytes} bytes")
+            return None
+
+        self._chunks.append(out)
+        self._fragments += 1
+        self._last_fragment_at = now
+
+        if not decompressor.eof:
+            return None
+
+        message = b''.join(self._chunks)
+        fragments = self._fragments
+        self._reset()
+        self.completed += 1
+        log(f"[UDP-LISTENER-{self.server_id}] Reassembled {fragments} fragments -> {len(message)} bytes",
+            level="DEBUG")
+        return message
+
+    def expire(self) -> bool:
+        """Сбросить сообщение, если фрагментов нет дольше timeout_ms"""
+        if self.active and time.monotonic() - self._last_fragment_at > self.timeout:
+            self._abort(f"timed out after {self._fragments} fragments")
+            return True
+        return False
+
+    def _abort(self, reason: str) -> None:
+        log(f"[UDP-LISTENER-{self.server_id}] [WARN] Fragmented message dropped: {reason}",
+            level="WARNING")
+        self._reset()
+        self.aborted += 1
+
+    def _reset(self) -> None:
+        self._decompressor = None
+        self._chunks = []
+        self._size = 0
+        self._fragments = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика сборки сервера"""
+        return {
+            "active": self.active,
+            "pending_bytes": self._size,
+            "completed": self.completed,
+            "aborted": self.aborted,
+            "orphaned": self.orphaned,
+        }
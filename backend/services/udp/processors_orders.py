@@ -5,11 +5,11 @@
 
 Оптимизировано для 3000+ серверов:
 - Кэширование user_id для серверов (единый глобальный кэш)
-- Batch processing для SQL логов
+- Batch processing для SQL логов и ордеров (разбор SQL в worker'е,
+  запись пачкой в BatchProcessor, уведомления после commit)
 - Асинхронные WebSocket уведомления
 - Уменьшенное логирование
 """
-import re
 from typing import Optional
 
 from models.database import SessionLocal
@@ -19,6 +19,8 @@ from utils.datetime_utils import utcnow, format_iso
 from utils.config_loader import get_config_value
 from services.user_id_cache import get_user_id_for_server, set_user_id_for_server
 
+from .sql_tokenizer import SQL_COMMAND_RE
+
 
 def get_cached_user_id(server_id: int) -> Optional[int]:
     """
@@ -72,6 +74,7 @@ class OrderProcessor:
         self._use_batch = get_config_value(
             'high_load', 'udp.batch.enabled', default=True
         )
+        self._parser = None
     
     def process_order_update(self, packet: dict):
         """
@@ -101,11 +104,10 @@ class OrderProcessor:
             moonbot_order_id: ID ордера от MoonBot
             bot_name: Имя бота
         """
-        from .parsers import SQLParser
         from .batch_processor import get_batch_processor
         
         try:
-            match = re.search(r'\[SQLCommand (\d+)\]', sql_text)
+            match = SQL_COMMAND_RE.search(sql_text)
             if match:
                 command_id = int(match.group(1))
                 sql_body = sql_text[match.end():].strip()
@@ -126,13 +128,19 @@ class OrderProcessor:
                         sql_text=sql_body
                     )
                     
-                    # Для ордеров всё ещё нужна синхронная обработка (парсинг SQL)
+                    # Ордера: разбор здесь, запись в БД и уведомление - при flush
                     if "Orders" in sql_body:
-                        self._process_order_sql(sql_body, command_id, moonbot_order_id, bot_name)
+                        delta = self._get_parser().parse_order_delta(
+                            sql_body, command_id, moonbot_order_id, bot_name=bot_name
+                        )
+                        if delta:
+                            batch_processor.add_order_sql(delta, user_id=user_id)
                     
                     # Отправляем WebSocket уведомления асинхронно
                     if user_id:
-                        self._send_websocket_notifications_async(user_id, command_id, sql_body)
+                        self._send_websocket_notifications_async(
+                            user_id, command_id, sql_body, notify_orders=False
+                        )
                     
                     return
                 except Exception as e:
@@ -144,28 +152,12 @@ class OrderProcessor:
         except Exception as e:
             log(f"[UDP-LISTENER-{self.server_id}] Parse error: {e}", level="ERROR")
     
-    def _process_order_sql(self, sql_body: str, command_id: int, moonbot_order_id: int, bot_name: str):
-        """
-        Обработка SQL для ордеров (парсинг и сохранение)
-        
-        Args:
-            sql_body: Тело SQL
-            command_id: ID команды
-            moonbot_order_id: ID ордера от MoonBot
-            bot_name: Имя бота
-        """
-        from .parsers import SQLParser
-        
-        db = SessionLocal()
-        try:
-            parser = SQLParser(self.server_id)
-            parser.parse_and_save_order(db, sql_body, command_id, moonbot_order_id, bot_name=bot_name)
-            db.commit()
-        except Exception as e:
-            log(f"[UDP-LISTENER-{self.server_id}] Order parse error: {e}", level="ERROR")
-            db.rollback()
-        finally:
-            db.close()
+    def _get_parser(self):
+        """SQLParser сервера (разбор SQL без обращений к БД)"""
+        if self._parser is None:
+            from .parsers import SQLParser
+            self._parser = SQLParser(self.server_id)
+        return self._parser
     
     def _process_sql_direct(self, sql_body: str, command_id: int, moonbot_order_id: int, 
                            bot_name: str, user_id: Optional[int]):
@@ -207,7 +199,8 @@ class OrderProcessor:
         finally:
             db.close()
     
-    def _send_websocket_notifications_async(self, user_id: int, sql_log_id: int, sql_body: str):
+    def _send_websocket_notifications_async(self, user_id: int, sql_log_id: int, sql_body: str,
+                                            notify_orders: bool = True):
         """
         Асинхронная отправка WebSocket уведомлений (не блокирует UDP поток)
         
@@ -215,6 +208,8 @@ class OrderProcessor:
             user_id: ID пользователя
             sql_log_id: ID лога SQL (или command_id)
             sql_body: Тело SQL команды
+            notify_orders: Уведомить об обновлении ордеров (False - уведомит
+                BatchProcessor после commit)
         """
         from services.websocket_manager import notify_sql_log_sync, notify_order_update_sync
         
@@ -232,7 +227,7 @@ class OrderProcessor:
         try:
             notify_sql_log_sync(user_id, self.server_id, log_data)
             
-            if "Orders" in sql_body:
+            if notify_orders and "Orders" in sql_body:
                 notify_order_update_sync(user_id, self.server_id)
         except Exception as e:
             # Не блокируем обработку при ошибке WS
@@ -0,0 +1,336 @@
+"""
+Последнее состояние серверов: баланс и online статус
+
+Каждый acc сервера раньше уходил в БД отдельной строкой пакета,
+а update_server_online_status открывал свою сессию на сервер. Для
+/api/servers/balances и /api/servers-with-status важно только последнее
+значение, поэтому процессоры пишут его в память (latest wins), а БД
+обновляется периодически одним пакетом на все изменившиеся серверы:
+- балансы - upsert server_balance через BatchProcessor
+  (одна строка на сервер за flush, а не на каждый acc)
+- online статус - один executemany UPDATE server_status, не чаще
+  online_update_interval на сервер (как раньше)
+
+Запись из процессоров - присваивание в dict и отметка в множестве
+изменённых под коротким lock'ом, без обращения к БД. API читает
+состояние из памяти; сервер, от которого ещё ничего не пришло
+(после рестарта), читается из БД.
+
+Если запись online статуса не удалась, серверы остаются изменёнными
+и пишутся следующим flush'ем.
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import bindparam, func, select
+
+from models import models
+from models.database import SessionLocal
+from utils.config_loader import get_config_value
+from utils.datetime_utils import utcnow
+from utils.logging import log
+from .batch_processor import get_batch_processor
+
+
+@dataclass
+class BalanceState:
+    """Последний баланс сервера (поля как в server_balance)"""
+    available: float
+    total: float
+    bot_name: Optional[str]
+    is_running: Optional[bool]
+    version: Optional[int]
+    updated_at: datetime  # UTC, момент приёма acc
+
+
+class ServerStateStore:
+    """
+    Последние балансы и online статусы серверов с периодической записью в БД.
+    """
+
+    def __init__(self):
+        self.flush_interval = get_config_value(
+            'high_load', 'udp.server_state.flush_interval_ms', default=1000
+        ) / 1000.0
+        self.online_update_interval = float(get_config_value(
+            'high_load', 'udp.server_state.online_update_interval', default=10.0
+        ))
+
+        self._lock = threading.Lock()
+        self._balances: Dict[int, BalanceState] = {}
+        # Момент последних данных сервера (ЛОКАЛЬНОЕ время, как last_ping)
+        self._last_seen: Dict[int, datetime] = {}
+        self._dirty_balances: Set[int] = set()
+        self._dirty_online: Set[int] = set()
+        # Когда online статус сервера последний раз записан в БД (monotonic)
+        self._online_persisted_at: Dict[int, float] = {}
+        # Серверы, у которых строка server_status точно есть
+        self._status_rows: Set[int] = set()
+
+        self._running = False
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._balance_updates = 0
+        self._balances_persisted = 0
+        self._online_updates = 0
+        self._online_persisted = 0
+        self._flushes = 0
+        self._errors = 0
+
+    # ==================== ЗАПИСЬ (процессоры) ====================
+
+    def update_balance(self, server_id: int, available: float, total: float,
+                       bot_name: Optional[str] = None, is_running: Optional[bool] = None,
+                       version: Optional[int] = None) -> None:
+        """Запомнить последний баланс сервера (в БД - следующим flush)"""
+        state = BalanceState(available, total, bot_name, is_running, version, utcnow())
+        with self._lock:
+            self._balances[server_id] = state
+            self._dirty_balances.add(server_id)
+            self._balance_updates += 1
+
+    def mark_online(self, server_id: int) -> None:
+        """Отметить, что от сервера пришли данные (он online)"""
+        now = datetime.now()
+        with self._lock:
+            self._last_seen[server_id] = now
+            self._dirty_online.add(server_id)
+            self._online_updates += 1
+
+    def forget(self, server_id: int) -> None:
+        """Удалить состояние сервера (сервер удалён)"""
+        with self._lock:
+            self._balances.pop(server_id, None)
+            self._last_seen.pop(server_id, None)
+            self._dirty_balances.discard(server_id)
+            self._dirty_online.discard(server_id)
+            self._online_persisted_at.pop(server_id, None)
+            self._status_rows.discard(server_id)
+
+    def clear(self) -> None:
+        """Удалить состояние всех серверов (сброс системы)"""
+        with self._lock:
+            self._balances.clear()
+            self._last_seen.clear()
+            self._dirty_balances.clear()
+            self._dirty_online.clear()
+            self._online_persisted_at.clear()
+            self._status_rows.clear()
+
+    # ==================== ЧТЕНИЕ (API) ====================
+
+    def get_balances(self, server_ids: Iterable[int]) -> Dict[int, BalanceState]:
+        """Последние балансы серверов (только тех, от кого был acc)"""
+        with self._lock:
+            balances = self._balances
+            return {sid: balances[sid] for sid in server_ids if sid in balances}
+
+    def get_last_seen(self, server_ids: Iterable[int]) -> Dict[int, datetime]:
+        """Момент последних данных серверов (ЛОКАЛЬНОЕ время)"""
+        with self._lock:
+            last_seen = self._last_seen
+            return {sid: last_seen[sid] for sid in server_ids if sid in last_seen}
+
+    # ==================== ЗАПИСЬ В БД ====================
+
+    def start(self) -> None:
+        """Запустить поток периодической записи в БД"""
+        if self._running:
+            return
+
+        self._running = True
+        self._wakeup.clear()
+        self._thread = threading.Thread(
+            target=self._flush_loop,
+            daemon=True,
+            name="ServerStateFlusher"
+        )
+        self._thread.start()
+        log(f"[SERVER-STATE] Started: flush_interval={self.flush_interval * 1000:.0f}ms, "
+            f"online_update_interval={self.online_update_interval}s")
+
+    def stop(self) -> None:
+        """Остановить поток и записать всё накопленное"""
+        if not self._running:
+            return
+
+        self._running = False
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=5.0)
+        self.flush(force=True)
+        log(f"[SERVER-STATE] Stopped. Stats: {self.get_stats()}")
+
+    def _flush_loop(self) -> None:
+        while self._running:
+            self._wakeup.wait(self.flush_interval)
+            if not self._running:
+                break
+            try:
+                self.flush()
+            except Exception as e:
+                log(f"[SERVER-STATE] Flush error: {e}", level="ERROR")
+
+    def flush(self, force: bool = False) -> None:
+        """
+        Записать изменившиеся балансы и online статусы
+
+        Args:
+            force: Записать online статусы без учёта online_update_interval
+        """
+        self._flush_balances()
+        self._flush_online(force)
+        with self._lock:
+            self._flushes += 1
+
+    def _flush_balances(self) -> None:
+        with self._lock:
+            if not self._dirty_balances:
+                return
+            dirty, self._dirty_balances = self._dirty_balances, set()
+            balances = [(sid, self._balances[sid]) for sid in dirty if sid in self._balances]
+
+        batch_processor = get_batch_processor()
+        for server_id, state in balances:
+            batch_processor.add_balance(
+                server_id=server_id,
+                available=state.available,
+                total=state.total,
+                bot_name=state.bot_name,
+                is_running=state.is_running,
+                version=state.version,
+                updated_at=state.updated_at
+            )
+
+        with self._lock:
+            self._balances_persisted += len(balances)
+
+    def _flush_online(self, force: bool) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if not self._dirty_online:
+                return
+            due = [
+                sid for sid in self._dirty_online
+                if force or now - self._online_persisted_at.get(sid, 0.0) >= self.online_update_interval
+            ]
+            if not due:
+                return
+            self._dirty_online.difference_update(due)
+            rows = [(sid, self._last_seen[sid]) for sid in due if sid in self._last_seen]
+            unknown = [sid for sid, _ in rows if sid not in self._status_rows]
+
+        try:
+            self._write_online(rows, unknown)
+        except Exception as e:
+            with self._lock:
+                self._dirty_online.update(sid for sid, _ in rows if sid in self._last_seen)
+                self._errors += 1
+            log(f"[SERVER-STATE] Online status flush failed ({len(rows)} servers): "
+                f"{getattr(e, 'orig', e)}", level="WARNING")
+            return
+
+        with self._lock:
+            for sid, _ in rows:
+                self._online_persisted_at[sid] = now
+            self._status_rows.update(sid for sid, _ in rows if sid in self._last_seen)
+            self._online_persisted += len(rows)
+
+    def _write_online(self, rows: List[tuple], unknown: List[int]) -> None:
+        """Один UPDATE server_status на все серверы пакета (+ INSERT недостающих строк)"""
+        if not rows:
+            return
+
+        table = models.ServerStatus.__table__
+        db = SessionLocal()
+        try:
+            missing: Set[int] = set()
+            if unknown:
+                existing = set(db.execute(
+                    select(table.c.server_id).where(table.c.server_id.in_(unknown))
+                ).scalars())
+                missing = set(unknown) - existing
+            if missing:
+                db.execute(table.insert(), [
+                    {
+                        'server_id': sid,
+                        'is_online': True,
+                        'last_ping': last_seen,
+                        'uptime_percentage': 100.0,
+                        'consecutive_failures': 0,
+                    }
+                    for sid, last_seen in rows if sid in missing
+                ])
+
+            updates = [
+                {'b_server_id': sid, 'b_last_ping': last_seen}
+                for sid, last_seen in rows if sid not in missing
+            ]
+            if updates:
+                # uptime <= 100, поэтому uptime * 0.99 + 1 тоже не больше 100
+                db.execute(
+                    table.update()
+                    .where(table.c.server_id == bindparam('b_server_id'))
+                    .values(
+                        is_online=True,
+                        last_ping=bindparam('b_last_ping'),
+                        last_error=None,
+                        consecutive_failures=0,
+                        uptime_percentage=func.coalesce(table.c.uptime_percentage, 100.0) * 0.99 + 1.0,
+                    ),
+                    updates
+                )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика хранилища"""
+        with self._lock:
+            return {
+                "servers": len(self._balances),
+                "dirty_balances": len(self._dirty_balances),
+                "dirty_online": len(self._dirty_online),
+                "balance_updates": self._balance_updates,
+                "balances_persisted": self._balances_persisted,
+                "online_updates": self._online_updates,
+                "online_persisted": self._online_persisted,
+                "flushes": self._flushes,
+                "errors": self._errors,
+            }
+
+
+# Глобальный экземпляр
+_server_state: Optional[ServerStateStore] = None
+_server_state_lock = threading.Lock()
+
+
+def get_server_state() -> ServerStateStore:
+    """Получить глобальное хранилище состояния серверов"""
+    global _server_state
+    if _server_state is None:
+        with _server_state_lock:
+            if _server_state is None:
+                _server_state = ServerStateStore()
+    return _server_state
+
+
+def start_server_state() -> None:
+    """Запустить периодическую запись состояния серверов"""
+    get_server_state().start()
+
+
+def stop_server_state() -> None:
+    """Остановить запись и сохранить накопленное состояние"""
+    global _server_state
+    if _server_state:
+        _server_state.stop()
+        _server_state = None
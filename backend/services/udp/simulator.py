@@ -0,0 +1,425 @@
+"""
+Симулятор флота MoonBot для нагрузочного тестирования
+
+N ботов на loopback UDP, каждый ведёт себя как MoonBot:
+- принимает команды в формате listener_commands.py ("<HMAC-SHA256 hex> <команда>"
+  или просто команда без пароля), пакеты с неверной подписью игнорирует
+- отвечает на lst текстом "Open Sell Orders: ...", SubscribeCharts
+  включает рассылку графиков (без ответа, как настоящий MoonBot)
+- шлёт на Commander gzip JSON пакеты order (SQL insert/update), acc и errors
+  и фрагментированные графики (TMoonCmdHeader + GZIP) с заданной частотой
+
+Каждый пакет несёт порядковый номер, по которому бенчмарк сопоставляет
+отправку с записью в БД (services/udp_benchmark.py):
+- order: [SQLCommand N] - command_id
+- acc: V - номер пакета баланса
+- errors: "#N" в тексте ошибки
+- график: order_id заголовка
+
+Запуск (из backend/) против работающего Commander:
+    python -m services.udp.simulator --servers 100 --base-port 3000 --target 127.0.0.1:2500
+
+Серверы 127.0.0.1:<base-port + i> с паролем "<password-prefix>-<i>"
+нужно заранее добавить в Commander.
+"""
+
+import argparse
+import asyncio
+import gzip
+import hmac
+import json
+import logging
+import random
+import struct
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from services.chart_parser.benchmark import build_chart_payload
+from services.chart_parser.constants import CHART_FLAG, CHART_KIND
+from .hmac_helper import generate_hmac
+
+# Виды пакетов (ключи SendLog)
+KIND_ORDER = "order"
+KIND_BALANCE = "acc"
+KIND_ERROR = "errors"
+KIND_CHART = "chart"
+KINDS = (KIND_ORDER, KIND_BALANCE, KIND_ERROR, KIND_CHART)
+
+# Тик планировщика отправки
+_TICK_SECONDS = 0.005
+
+# Вариантов графиков (собираются один раз, отличаются order_id в заголовке)
+_CHART_VARIANTS = 4
+
+_COINS = ("BTC", "ETH", "SOL", "TON", "XRP", "DOGE", "ADA", "LINK")
+
+
+@dataclass
+class FleetConfig:
+    """Параметры флота (частоты - пакетов в секунду на одного бота)"""
+    servers: int = 100
+    host: str = "127.0.0.1"
+    base_port: int = 0  # 0 - порты выбирает ОС
+    password_prefix: str = "sim"  # пустая строка - боты без пароля
+    order_rate: float = 2.0
+    balance_rate: float = 1.0
+    error_rate: float = 0.2
+    chart_rate: float = 0.02  # только после SubscribeCharts
+    chart_fragment_size: int = 8192
+    chart_points: int = 2000  # трейдов в синтетическом графике
+    seed: int = 0
+
+    def password_for(self, index: int) -> Optional[str]:
+        """UDP пароль бота index (None - без HMAC)"""
+        return f"{self.password_prefix}-{index}" if self.password_prefix else None
+
+    def rate_for(self, kind: str) -> float:
+        return {
+            KIND_ORDER: self.order_rate,
+            KIND_BALANCE: self.balance_rate,
+            KIND_ERROR: self.error_rate,
+            KIND_CHART: self.chart_rate,
+        }[kind]
+
+
+@dataclass
+class SendLog:
+    """
+    Журнал отправки флота
+
+    sent[kind] - список (индекс бота, ключ пакета, time.time() отправки)
+    """
+    sent: Dict[str, List[Tuple[int, int, float]]] = field(
+        default_factory=lambda: {kind: [] for kind in KINDS}
+    )
+    packets: int = 0
+    bytes: int = 0
+    commands: Dict[str, int] = field(default_factory=dict)
+    auth_failures: int = 0
+    orders_created: int = 0
+    orders_closed: int = 0
+    started_at: float = 0.0
+    finished_at: float = 0.0
+
+
+def verify_command(data: bytes, password: Optional[str]) -> Optional[str]:
+    """
+    Проверить подпись команды
+
+    Returns:
+        Команда без HMAC префикса или None если подпись неверна
+    """
+    text = data.decode('utf-8', errors='replace').strip()
+    if not password:
+        return text
+    signature, _, command = text.partition(' ')
+    if not hmac.compare_digest(signature, generate_hmac(command, password)):
+        return None
+    return command
+
+
+def _gzip_json(packet: dict) -> bytes:
+    return gzip.compress(json.dumps(packet, separators=(',', ':')).encode('utf-8'), compresslevel=1)
+
+
+def build_chart_fragments(order_id: int, payload: bytes, fragment_size: int) -> List[bytes]:
+    """Разбить график на UDP фрагменты (каждый блок сжат GZIP отдельно)"""
+    chunks = [payload[i:i + fragment_size] for i in range(0, len(payload), fragment_size)] or [b'']
+    if len(chunks) > 255:
+        raise ValueError(f"Chart of {len(payload)} bytes needs more than 255 fragments")
+    return [
+        struct.pack('<BBiBB', CHART_FLAG, CHART_KIND, order_id, block_num, len(chunks))
+        + gzip.compress(chunk, compresslevel=1)
+        for block_num, chunk in enumerate(chunks)
+    ]
+
+
+class SimulatedMoonBot(asyncio.DatagramProtocol):
+    """Один эмулируемый MoonBot"""
+
+    def __init__(self, index: int, config: FleetConfig, log: SendLog, rnd: random.Random):
+        self.index = index
+        self.name = f"SimBot-{index}"
+        self.password = config.password_for(index)
+        self.config = config
+        self.log = log
+        self.rnd = rnd
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self.target: Optional[Tuple[str, int]] = None
+
+        self.subscribed = False
+        self._command_id = 0
+        self._balance_seq = 0
+        self._error_seq = 0
+        self._next_order_id = 1000 * (index + 1)
+        # moonbot order id -> (монета, цена покупки, количество)
+        self._open_orders: Dict[int, Tuple[str, float, float]] = {}
+        self._closed_orders: List[int] = []
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self.transport.get_extra_info('sockname')[:2]
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def error_received(self, exc):
+        # ICMP port unreachable, пока Commander не запущен - не фатально
+        pass
+
+    def datagram_received(self, data: bytes, addr):
+        command = verify_command(data, self.password)
+        if command is None:
+            self.log.auth_failures += 1
+            return
+
+        name = command.split(' ', 1)[0]
+        self.log.commands[name] = self.log.commands.get(name, 0) + 1
+        if name == "SubscribeCharts":
+            self.subscribed = True
+        elif name == "lst":
+            self.transport.sendto(self._lst_text().encode('utf-8'), addr)
+        else:
+            self.transport.sendto(f"{name}: OK".encode('utf-8'), addr)
+
+    def _lst_text(self) -> str:
+        lines = [f"Open Sell Orders: {len(self._open_orders)}", "Open Buy Orders: 0"]
+        for coin, price, quantity in self._open_orders.values():
+            lines.append(f"{coin} {quantity:.2f} ${price * quantity:.2f} 0.00% (0.00 USDT)")
+        return "\n".join(lines)
+
+    def _send(self, data: bytes) -> None:
+        self.transport.sendto(data, self.target)
+        self.log.packets += 1
+        self.log.bytes += len(data)
+
+    # =========================================================================
+    # ГЕНЕРАЦИЯ ПАКЕТОВ
+    # =========================================================================
+
+    def send_order(self) -> None:
+        """INSERT нового ордера или UPDATE (закрытие) открытого"""
+        self._command_id += 1
+        now = int(time.time())
+        if self._open_orders and (len(self._open_orders) > 20 or self.rnd.random() < 0.5):
+            oid = self.rnd.choice(list(self._open_orders))
+            coin, buy_price, quantity = self._open_orders.pop(oid)
+            sell_price = round(buy_price * self.rnd.uniform(0.98, 1.03), 6)
+            gained = round(sell_price * quantity, 8)
+            sql = (f"[SQLCommand {self._command_id}] update Orders set CloseDate={now}, "
+                   f"SellPrice={sell_price}, GainedBTC={gained}, "
+                   f"ProfitBTC={round(gained - buy_price * quantity, 8)}, "
+                   f"SellReason='Auto Price Down', Status=1 where ID={oid}")
+            self._closed_orders.append(oid)
+            self.log.orders_closed += 1
+        else:
+            oid = self._next_order_id
+            self._next_order_id += 1
+            coin = self.rnd.choice(_COINS)
+            buy_price = round(self.rnd.uniform(0.1, 100.0), 6)
+            quantity = round(self.rnd.uniform(1.0, 50.0), 4)
+            self._open_orders[oid] = (coin, buy_price, quantity)
+            self.log.orders_created += 1
+            sql = (f"[SQLCommand {self._command_id}] insert into Orders (exOrderID, Coin, BuyDate, "
+                   f"SellSetDate, CloseDate, BuyPrice, Quantity, SpentBTC, Source, Channel, "
+                   f"Comment, StrategyID, BaseCurrency, Emulator) values ('{oid}', '{coin}', "
+                   f"{now}, {now}, 0, {buy_price}, {quantity}, {round(buy_price * quantity, 8)}, "
+                   f"'Simulator', 'sim', 'strategy <Sim {self.index}>', {self.index % 10 + 1}, "
+                   f"'USDT', 0)")
+        self._send(_gzip_json({"cmd": "order", "oid": oid, "bot": self.name, "sql": sql}))
+        self.log.sent[KIND_ORDER].append((self.index, self._command_id, time.time()))
+
+    def send_balance(self) -> None:
+        self._balance_seq += 1
+        self._send(_gzip_json({
+            "cmd": "acc",
+            "bot": self.name,
+            "data": {
+                "A": round(self.rnd.uniform(100, 1000), 2),
+                "T": round(self.rnd.uniform(1000, 2000), 2),
+                "S": True,
+                "V": self._balance_seq,
+            }
+        }))
+        self.log.sent[KIND_BALANCE].append((self.index, self._balance_seq, time.time()))
+
+    def send_errors(self) -> None:
+        stamp = time.strftime("%d.%m %H:%M:%S", time.gmtime()) + ".000"
+        errors = []
+        keys = []
+        for _ in range(self.rnd.randint(1, 3)):
+            self._error_seq += 1
+            coin = self.rnd.choice(_COINS)
+            errors.append(f"{stamp}: {coin} [400] Simulated API error #{self._error_seq}")
+            keys.append(self._error_seq)
+        self._send(_gzip_json({"cmd": "errors", "bot": self.name, "data": {"E": errors}}))
+        sent_at = time.time()
+        self.log.sent[KIND_ERROR].extend((self.index, key, sent_at) for key in keys)
+
+    def send_chart(self, fragments_for) -> bool:
+        """График закрытого ордера (False - нет закрытых ордеров)"""
+        if not self._closed_orders:
+            return False
+        oid = self._closed_orders.pop(0)
+        for fragment in fragments_for(oid):
+            self._send(fragment)
+        self.log.sent[KIND_CHART].append((self.index, oid, time.time()))
+        return True
+
+
+class SimulatedFleet:
+    """
+    Флот SimulatedMoonBot в одном asyncio цикле
+
+    Отправка равномерная: каждый тик досылается столько пакетов каждого
+    вида, сколько положено по частоте к текущему моменту (боты по кругу).
+    """
+
+    def __init__(self, config: FleetConfig):
+        self.config = config
+        self.log = SendLog()
+        self.bots: List[SimulatedMoonBot] = []
+        self._rnd = random.Random(config.seed)
+        self._chart_payloads: List[bytes] = []
+
+    async def start(self) -> List[Tuple[str, int]]:
+        """Открыть сокеты ботов; возвращает их адреса (host, port)"""
+        loop = asyncio.get_running_loop()
+        for i in range(self.config.servers):
+            port = self.config.base_port + i if self.config.base_port else 0
+            bot = SimulatedMoonBot(i, self.config, self.log, random.Random(self._rnd.random()))
+            await loop.create_datagram_endpoint(lambda bot=bot: bot, local_addr=(self.config.host, port))
+            self.bots.append(bot)
+
+        # Синтетические графики (~chart_points трейдов), фрагменты собираются при отправке
+        n = self.config.chart_points
+        self._chart_payloads = [
+            build_chart_payload(n // 4, n, n // 10, 120, market_name=_COINS[i], seed=i)
+            for i in range(_CHART_VARIANTS)
+        ]
+        return [bot.address for bot in self.bots]
+
+    def close(self) -> None:
+        for bot in self.bots:
+            if bot.transport:
+                bot.transport.close()
+
+    def _chart_fragments(self, order_id: int) -> List[bytes]:
+        payload = self._chart_payloads[order_id % len(self._chart_payloads)]
+        return build_chart_fragments(order_id, payload, self.config.chart_fragment_size)
+
+    async def run(self, target: Tuple[str, int], duration: float) -> SendLog:
+        """
+        Слать пакеты на target в течение duration секунд
+
+        Боты продолжают отвечать на команды и после окончания отправки
+        (до close()).
+        """
+        for bot in self.bots:
+            bot.target = target
+
+        senders = {
+            KIND_ORDER: lambda bot: bot.send_order() or True,
+            KIND_BALANCE: lambda bot: bot.send_balance() or True,
+            KIND_ERROR: lambda bot: bot.send_errors() or True,
+            KIND_CHART: lambda bot: bot.send_chart(self._chart_fragments),
+        }
+        sent_counts = {kind: 0 for kind in KINDS}
+        cursors = {kind: self._rnd.randrange(len(self.bots)) for kind in KINDS}
+
+        self.log.started_at = time.time()
+        start = time.monotonic()
+        while True:
+            elapsed = time.monotonic() - start
+            if elapsed >= duration:
+                break
+            for kind in KINDS:
+                rate = self.config.rate_for(kind)
+                if rate <= 0:
+                    continue
+                eligible = self.bots if kind != KIND_CHART else [b for b in self.bots if b.subscribed]
+                if not eligible:
+                    continue
+                due = int(rate * len(eligible) * elapsed) - sent_counts[kind]
+                # Не больше одного круга за тик - иначе бот без данных (график) крутит цикл
+                for _ in range(min(due, len(eligible))):
+                    cursors[kind] = (cursors[kind] + 1) % len(eligible)
+                    senders[kind](eligible[cursors[kind]])
+                    sent_counts[kind] += 1
+            await asyncio.sleep(_TICK_SECONDS)
+        self.log.finished_at = time.time()
+        return self.log
+
+
+def run_fleet_process(conn, config: FleetConfig) -> None:
+    """
+    Точка входа процесса флота (multiprocessing, используется бенчмарком)
+
+    Протокол через conn:
+        -> [(host, port), ...]         адреса ботов
+        <- ("run", (host, port), sec)  начать отправку
+        -> SendLog                     журнал после окончания
+        <- ("stop",)                   закрыть сокеты
+    """
+    async def serve():
+        fleet = SimulatedFleet(config)
+        conn.send(await fleet.start())
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                message = await loop.run_in_executor(None, conn.recv)
+                if message[0] == "run":
+                    _, target, duration = message
+                    conn.send(await fleet.run(tuple(target), duration))
+                elif message[0] == "stop":
+                    break
+        finally:
+            fleet.close()
+
+    asyncio.run(serve())
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="MoonBot fleet simulator")
+    parser.add_argument("--servers", type=int, default=100)
+    parser.add_argument("--host", default="127.0.0.1", help="Адрес ботов")
+    parser.add_argument("--base-port", type=int, default=3000, help="Порт первого бота")
+    parser.add_argument("--password-prefix", default="sim", help="'' - без HMAC")
+    parser.add_argument("--target", default="127.0.0.1:2500", help="Адрес Commander (host:port)")
+    parser.add_argument("--duration", type=float, default=60.0)
+    parser.add_argument("--order-rate", type=float, default=2.0)
+    parser.add_argument("--balance-rate", type=float, default=1.0)
+    parser.add_argument("--error-rate", type=float, default=0.2)
+    parser.add_argument("--chart-rate", type=float, default=0.02)
+    args = parser.parse_args(argv)
+
+    logging.getLogger("services.chart_parser").setLevel(logging.WARNING)
+
+    config = FleetConfig(
+        servers=args.servers, host=args.host, base_port=args.base_port,
+        password_prefix=args.password_prefix, order_rate=args.order_rate,
+        balance_rate=args.balance_rate, error_rate=args.error_rate, chart_rate=args.chart_rate,
+    )
+    target_host, _, target_port = args.target.rpartition(':')
+
+    async def run():
+        fleet = SimulatedFleet(config)
+        addresses = await fleet.start()
+        auth = f"password '{config.password_prefix}-<i>'" if config.password_prefix else "no password"
+        print(f"{len(addresses)} bots: {addresses[0][0]}:{addresses[0][1]}..{addresses[-1][1]}, {auth}")
+        try:
+            return await fleet.run((target_host, int(target_port)), args.duration)
+        finally:
+            fleet.close()
+
+    log = asyncio.run(run())
+    elapsed = (log.finished_at - log.started_at) or 1.0
+    counts = ", ".join(f"{kind}={len(items)}" for kind, items in log.sent.items())
+    print(f"Sent {log.packets} packets ({log.packets / elapsed:.0f}/s, {log.bytes / 1024:.0f} KB): {counts}")
+    print(f"Commands received: {log.commands or '-'}, bad HMAC: {log.auth_failures}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
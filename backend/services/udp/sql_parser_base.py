@@ -1,13 +1,14 @@
 """
 Базовый класс SQL парсера
 """
-import re
 from datetime import datetime
 from typing import Optional
 from sqlalchemy.orm import Session
 from models import models
 from utils.logging import log
 from . import utils
+from .open_order_cache import get_open_order_cache
+from .sql_tokenizer import DIGITS_RE, set_clause_dict, tokenize_values
 
 
 class SQLParserBase:
@@ -40,95 +41,98 @@ class SQLParserBase:
         except Exception as e:
             log(f"[UDP-LISTENER-{self.server_id}] Order parse error: {e}")
     
-    def _parse_set_clause(self, set_clause: str) -> dict:
-        """Парсинг SET clause из UPDATE"""
-        updates = {}
-        current_key = ""
-        current_value = ""
-        in_quotes = False
-        escape_next = False
-        state = "key"
+    def parse_order_delta(self, sql: str, command_id: int, moonbot_order_id: int = None,
+                          bot_name: str = None) -> Optional[dict]:
+        """
+        Разбор SQL команды Orders без обращений к БД
+        
+        Результат - дельта ордера для BatchProcessor (moonbot_orders),
+        применяется при flush через apply_order_delta.
         
-        for i, char in enumerate(set_clause):
-            if escape_next:
-                current_value += char
-                escape_next = False
-                continue
+        Args:
+            sql: SQL команда
+            command_id: ID команды из пакета
+            moonbot_order_id: ID ордера от MoonBot
+            bot_name: Имя бота
+        
+        Returns:
+            dict (server_id, op, moonbot_order_id, command_id, bot_name, fields) или None
+        """
+        try:
+            sql_lower = sql.lower()
+            fields = None
             
-            if char == '\\':
-                escape_next = True
-                current_value += char
-                continue
+            if sql_lower.startswith('update orders'):
+                op = 'update'
+                parsed = self.parse_update_sql(sql, moonbot_order_id)
+            elif sql_lower.startswith('insert into orders'):
+                op = 'insert'
+                parsed = self.parse_insert_sql(sql, command_id, moonbot_order_id)
+            elif sql_lower.startswith('delete from orders'):
+                op = 'delete'
+                order_id = self.parse_delete_sql(sql, moonbot_order_id)
+                parsed = (order_id, fields) if order_id else None
+            else:
+                return None
             
-            if char == "'":
-                in_quotes = not in_quotes
-                continue
+            if not parsed:
+                return None
             
-            if state == "key":
-                if char == '=':
-                    state = "value"
-                elif char not in [' ', '\n', '\t']:
-                    current_key += char
-            elif state == "value":
-                if char == ',' and not in_quotes:
-                    key = current_key.strip().strip('[]')
-                    value = current_value.strip()
-                    if key:
-                        updates[key] = value
-                    current_key = ""
-                    current_value = ""
-                    state = "key"
-                else:
-                    current_value += char
+            moonbot_order_id, fields = parsed
+            return {
+                'server_id': self.server_id,
+                'op': op,
+                'moonbot_order_id': moonbot_order_id,
+                'command_id': command_id,
+                'bot_name': bot_name,
+                'fields': fields,
+            }
         
-        if current_key:
-            key = current_key.strip().strip('[]')
-            value = current_value.strip()
-            if key:
-                updates[key] = value
-        
-        return updates
+        except Exception as e:
+            log(f"[UDP-LISTENER-{self.server_id}] Order parse error: {e}")
+            return None
     
-    def _parse_values_clause(self, values_str: str) -> list:
-        """Парсинг VALUES clause из INSERT"""
-        values = []
-        current_value = ""
-        in_quotes = False
-        escape_next = False
-        paren_depth = 0
+    def apply_order_delta(self, db: Session, delta: dict,
+                          order: Optional[models.MoonBotOrder]) -> Optional[models.MoonBotOrder]:
+        """
+        Применение дельты из parse_order_delta
         
-        for i, char in enumerate(values_str):
-            if escape_next:
-                current_value += char
-                escape_next = False
-                continue
-            
-            if char == '\\':
-                escape_next = True
-                current_value += char
-                continue
-            
-            if char == "'" and (i == 0 or values_str[i-1] != '\\'):
-                in_quotes = not in_quotes
-                continue
-            
-            if char == '(' and not in_quotes:
-                paren_depth += 1
-            elif char == ')' and not in_quotes:
-                paren_depth -= 1
-            
-            if char == ',' and not in_quotes and paren_depth == 0:
-                val = current_value.strip()
-                values.append(val)
-                current_value = ""
-            else:
-                current_value += char
+        Args:
+            db: Сессия базы данных
+            delta: Дельта ордера
+            order: Ордер с delta['moonbot_order_id'] или None
+        
+        Returns:
+            Ордер после применения (None - удалён или не найден)
+        """
+        op = delta['op']
+        moonbot_order_id = delta['moonbot_order_id']
         
-        if current_value.strip():
-            values.append(current_value.strip())
+        if op == 'update':
+            return self.apply_update_order(db, order, moonbot_order_id, delta['fields'], bot_name=delta['bot_name'])
+        if op == 'insert':
+            return self.apply_insert_order(db, order, moonbot_order_id, delta['fields'], bot_name=delta['bot_name'])
+        self.apply_delete_order(db, order, moonbot_order_id)
+        return None
+    
+    def _get_order(self, db: Session, moonbot_order_id: int) -> Optional[models.MoonBotOrder]:
+        """Ордер сервера по moonbot_order_id (открытые - из кэша, без SELECT)"""
+        order = get_open_order_cache().attach(db, self.server_id, moonbot_order_id)
+        if order is not None:
+            return order
         
-        return values
+        return db.query(models.MoonBotOrder).filter(
+            models.MoonBotOrder.server_id == self.server_id,
+            models.MoonBotOrder.moonbot_order_id == moonbot_order_id
+        ).first()
+    
+    def _parse_set_clause(self, set_clause: str) -> dict:
+        """Парсинг SET clause из UPDATE (см. sql_tokenizer.py)"""
+        return set_clause_dict(set_clause)
     
+    def _parse_values_clause(self, values_str: str) -> list:
+        """Парсинг VALUES clause из INSERT (см. sql_tokenizer.py)"""
+        return [value.text for value in tokenize_values(values_str)]
     
     def _extract_task_id(self, data: dict) -> Optional[int]:
         """Извлечение TaskID из данных INSERT"""
@@ -138,7 +142,7 @@ class SQLParserBase:
                 if task_id_raw.isdigit():
                     return int(task_id_raw)
                 else:
-                    task_id_match = re.search(r'(\d+)', task_id_raw)
+                    task_id_match = DIGITS_RE.search(task_id_raw)
                     if task_id_match:
                         return int(task_id_match.group(1))
             except (ValueError, TypeError):
@@ -1,10 +1,11 @@
 """
 Обработка DELETE команд для SQL парсера
 """
-import re
+from typing import Optional
 from sqlalchemy.orm import Session
 from models import models
 from utils.logging import log
+from .sql_tokenizer import ORDER_ID_RE
 
 
 class SQLParserDeleteMixin:
@@ -13,29 +14,33 @@ class SQLParserDeleteMixin:
     def parse_delete_order(self, db: Session, sql: str, moonbot_order_id: int = None):
         """Обработка DELETE Orders команды"""
         try:
+            moonbot_order_id = self.parse_delete_sql(sql, moonbot_order_id)
             if not moonbot_order_id:
-                id_match = re.search(r'\[?ID\]?\s*=\s*(\d+)', sql, re.IGNORECASE)
-                if not id_match:
-                    log(f"[UDP-LISTENER-{self.server_id}] DELETE без ID: {sql[:80]}")
-                    return
-                moonbot_order_id = int(id_match.group(1))
-
-            order = db.query(models.MoonBotOrder).filter(
-                models.MoonBotOrder.server_id == self.server_id,
-                models.MoonBotOrder.moonbot_order_id == moonbot_order_id
-            ).first()
-
-            if not order:
-                log(f"[UDP-LISTENER-{self.server_id}] DELETE: ордер {moonbot_order_id} не найден")
                 return
 
-            log(f"[UDP-LISTENER-{self.server_id}] DELETE: удаляем ордер {moonbot_order_id}")
-            db.delete(order)
+            self.apply_delete_order(db, self._get_order(db, moonbot_order_id), moonbot_order_id)
 
         except Exception as e:
             log(f"[UDP-LISTENER-{self.server_id}] DELETE parse error: {e}")
             import traceback
             traceback.print_exc()
 
-
-
+    def parse_delete_sql(self, sql: str, moonbot_order_id: int = None) -> Optional[int]:
+        """Разбор DELETE Orders без обращений к БД - ID ордера или None"""
+        if moonbot_order_id:
+            return moonbot_order_id
+
+        id_match = ORDER_ID_RE.search(sql)
+        if not id_match:
+            log(f"[UDP-LISTENER-{self.server_id}] DELETE без ID: {sql[:80]}")
+            return None
+        return int(id_match.group(1))
+
+    def apply_delete_order(self, db: Session, order: Optional[models.MoonBotOrder], moonbot_order_id: int) -> None:
+        """Удаление ордера (order - ордер с этим moonbot_order_id или None)"""
+        if not order:
+            log(f"[UDP-LISTENER-{self.server_id}] DELETE: ордер {moonbot_order_id} не найден")
+            return
+
+        log(f"[UDP-LISTENER-{self.server_id}] DELETE: удаляем ордер {moonbot_order_id}")
+        db.delete(order)
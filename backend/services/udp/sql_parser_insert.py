@@ -1,15 +1,15 @@
 """
 Обработка INSERT команд для SQL парсера
 """
-import re
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Tuple
 from sqlalchemy.orm import Session
 from models import models
 from utils.logging import log
 from utils.datetime_utils import utcnow, timestamp_to_datetime
 from . import utils
 from .strategy_normalizer import StrategyNormalizer
+from .sql_tokenizer import DIGITS_RE, INSERT_FIELDS_RE, INSERT_VALUES_RE
 
 
 class SQLParserInsertMixin:
@@ -29,103 +29,130 @@ class SQLParserInsertMixin:
     def parse_insert_order(self, db: Session, sql: str, command_id: int, moonbot_order_id: int = None, bot_name: str = None):
         """Парсинг INSERT INTO Orders команды"""
         try:
-            fields_match = re.search(r'insert\s+into\s+Orders\s*\(([^)]+)\)', sql, re.IGNORECASE)
-            if not fields_match:
-                log(f"[UDP-LISTENER-{self.server_id}] INSERT без полей: {sql[:100]}")
+            parsed = self.parse_insert_sql(sql, command_id, moonbot_order_id)
+            if not parsed:
                 return
             
-            fields_str = fields_match.group(1)
-            fields = [f.strip().strip('[]').strip() for f in fields_str.split(',')]
-            
-            values_match = re.search(r'values\s*\((.*)\)', sql, re.IGNORECASE | re.DOTALL)
-            if not values_match:
-                log(f"[UDP-LISTENER-{self.server_id}] INSERT без values: {sql[:100]}")
-                return
-            
-            values_str = values_match.group(1).strip()
-            values = self._parse_values_clause(values_str)
-            
-            if len(fields) != len(values):
-                log(f"[UDP-LISTENER-{self.server_id}] INSERT mismatch: {len(fields)} fields vs {len(values)} values")
-                min_len = min(len(fields), len(values))
-                if min_len > 0:
-                    log(f"[UDP-LISTENER-{self.server_id}] Using first {min_len} fields/values")
-                    data = dict(zip(fields[:min_len], values[:min_len]))
-                else:
-                    return
-            else:
-                data = dict(zip(fields, values))
-            
-            task_id = self._extract_task_id(data)
-            
-            if moonbot_order_id is None:
-                if task_id and task_id > 0:
-                    moonbot_order_id = task_id
-                    log(f"[UDP-LISTENER-{self.server_id}] 🧠 Using TaskID as moonbot_order_id: {task_id}")
-                else:
-                    moonbot_order_id = command_id
-            
-            # Дополнительная попытка извлечь ID из exOrderID
-            if not moonbot_order_id or moonbot_order_id == 0:
-                log(f"[UDP-LISTENER-{self.server_id}] [WARN] No valid order ID available for INSERT (ID={moonbot_order_id}), trying to extract...")
-                if 'exOrderID' in data:
-                    try:
-                        ex_order_id = data['exOrderID'].strip().strip("'\"")
-                        if ex_order_id.isdigit():
-                            moonbot_order_id = int(ex_order_id)
-                            log(f"[UDP-LISTENER-{self.server_id}] ✅ Using exOrderID as moonbot_order_id: {moonbot_order_id}")
-                        else:
-                            ex_id_match = re.search(r'(\d+)', ex_order_id)
-                            if ex_id_match:
-                                moonbot_order_id = int(ex_id_match.group(1))
-                                log(f"[UDP-LISTENER-{self.server_id}] ✅ Extracted ID from exOrderID: {moonbot_order_id}")
-                    except Exception as e:
-                        log(f"[UDP-LISTENER-{self.server_id}] [WARN] Error extracting ID from exOrderID: {e}")
-            
-            if not moonbot_order_id or moonbot_order_id == 0:
-                log(f"[UDP-LISTENER-{self.server_id}] [WARN] Cannot determine order ID for INSERT, skipping...")
-                return
-            
-            existing_order = db.query(models.MoonBotOrder).filter(
-                models.MoonBotOrder.server_id == self.server_id,
-                models.MoonBotOrder.moonbot_order_id == moonbot_order_id
-            ).first()
-            
-            if existing_order:
-                if getattr(existing_order, 'created_from_update', False):
-                    log(f"[UDP-LISTENER-{self.server_id}] [OK] INSERT arrived for UPDATE-created order (ID={moonbot_order_id})")
-                    existing_order.created_from_update = False
-                order = existing_order
-            else:
-                order = models.MoonBotOrder(
-                    server_id=self.server_id,
-                    moonbot_order_id=moonbot_order_id,
-                    symbol="UNKNOWN",  # Будет обновлено из данных INSERT
-                    status="Open"
-                )
-                db.add(order)
-                db.flush()  # Получаем ID сразу
-            
-            self._apply_insert_fields(order, data, db)
-            order.updated_at = utcnow()
-            
-            # Сохраняем bot_name - из пакета или fallback на имя сервера
-            if bot_name:
-                order.bot_name = bot_name
-            elif not order.bot_name:
-                # Fallback: используем имя сервера из БД
-                server = db.query(models.Server).filter(models.Server.id == self.server_id).first()
-                if server and server.name:
-                    order.bot_name = server.name
-                    log(f"[UDP-LISTENER-{self.server_id}] 💾 Set bot_name from server name for order {moonbot_order_id}: {server.name}")
-            
-            log(f"[UDP-LISTENER-{self.server_id}] {'Updated' if existing_order else 'Created'} order {moonbot_order_id}: {order.symbol} (Qty:{order.quantity}, Strategy:{order.strategy})")
+            moonbot_order_id, data = parsed
+            order = self._get_order(db, moonbot_order_id)
+            self.apply_insert_order(db, order, moonbot_order_id, data, bot_name=bot_name)
             
         except Exception as e:
             log(f"[UDP-LISTENER-{self.server_id}] INSERT parse error: {e}")
             import traceback
             traceback.print_exc()
     
+    def parse_insert_sql(self, sql: str, command_id: int, moonbot_order_id: int = None) -> Optional[Tuple[int, dict]]:
+        """
+        Разбор INSERT INTO Orders без обращений к БД
+        
+        Returns:
+            (moonbot_order_id, поля INSERT) или None
+        """
+        fields_match = INSERT_FIELDS_RE.search(sql)
+        if not fields_match:
+            log(f"[UDP-LISTENER-{self.server_id}] INSERT без полей: {sql[:100]}")
+            return None
+        
+        fields_str = fields_match.group(1)
+        fields = [f.strip().strip('[]').strip() for f in fields_str.split(',')]
+        
+        values_match = INSERT_VALUES_RE.search(sql)
+        if not values_match:
+            log(f"[UDP-LISTENER-{self.server_id}] INSERT без values: {sql[:100]}")
+            return None
+        
+        values_str = values_match.group(1).strip()
+        values = self._parse_values_clause(values_str)
+        
+        if len(fields) != len(values):
+            log(f"[UDP-LISTENER-{self.server_id}] INSERT mismatch: {len(fields)} fields vs {len(values)} values")
+            min_len = min(len(fields), len(values))
+            if min_len > 0:
+                log(f"[UDP-LISTENER-{self.server_id}] Using first {min_len} fields/values")
+                data = dict(zip(fields[:min_len], values[:min_len]))
+            else:
+                return None
+        else:
+            data = dict(zip(fields, values))
+        
+        task_id = self._extract_task_id(data)
+        
+        if moonbot_order_id is None:
+            if task_id and task_id > 0:
+                moonbot_order_id = task_id
+                log(f"[UDP-LISTENER-{self.server_id}] 🧠 Using TaskID as moonbot_order_id: {task_id}")
+            else:
+                moonbot_order_id = command_id
+        
+        # Дополнительная попытка извлечь ID из exOrderID
+        if not moonbot_order_id or moonbot_order_id == 0:
+            log(f"[UDP-LISTENER-{self.server_id}] [WARN] No valid order ID available for INSERT (ID={moonbot_order_id}), trying to extract...")
+            if 'exOrderID' in data:
+                try:
+                    ex_order_id = data['exOrderID'].strip().strip("'\"")
+                    if ex_order_id.isdigit():
+                        moonbot_order_id = int(ex_order_id)
+                        log(f"[UDP-LISTENER-{self.server_id}] ✅ Using exOrderID as moonbot_order_id: {moonbot_order_id}")
+                    else:
+                        ex_id_match = DIGITS_RE.search(ex_order_id)
+                        if ex_id_match:
+                            moonbot_order_id = int(ex_id_match.group(1))
+                            log(f"[UDP-LISTENER-{self.server_id}] ✅ Extracted ID from exOrderID: {moonbot_order_id}")
+                except Exception as e:
+                    log(f"[UDP-LISTENER-{self.server_id}] [WARN] Error extracting ID from exOrderID: {e}")
+        
+        if not moonbot_order_id or moonbot_order_id == 0:
+            log(f"[UDP-LISTENER-{self.server_id}] [WARN] Cannot determine order ID for INSERT, skipping...")
+            return None
+        
+        return moonbot_order_id, data
+    
+    def apply_insert_order(self, db: Session, order: Optional[models.MoonBotOrder], moonbot_order_id: int,
+                           data: dict, bot_name: str = None) -> models.MoonBotOrder:
+        """
+        Применение разобранного INSERT (создание ордера или обновление существующего)
+        
+        Args:
+            db: Сессия базы данных
+            order: Ордер с этим moonbot_order_id или None
+            moonbot_order_id: ID ордера от MoonBot
+            data: Поля INSERT
+            bot_name: Имя бота
+        
+        Returns:
+            Созданный или обновлённый ордер
+        """
+        existing_order = order
+        if existing_order:
+            if getattr(existing_order, 'created_from_update', False):
+                log(f"[UDP-LISTENER-{self.server_id}] [OK] INSERT arrived for UPDATE-created order (ID={moonbot_order_id})")
+                existing_order.created_from_update = False
+        else:
+            order = models.MoonBotOrder(
+                server_id=self.server_id,
+                moonbot_order_id=moonbot_order_id,
+                symbol="UNKNOWN",  # Будет обновлено из данных INSERT
+                status="Open"
+            )
+            db.add(order)
+        
+        self._apply_insert_fields(order, data, db)
+        order.updated_at = utcnow()
+        
+        # Сохраняем bot_name - из пакета или fallback на имя сервера
+        if bot_name:
+            order.bot_name = bot_name
+        elif not order.bot_name:
+            # Fallback: используем имя сервера из БД
+            server = db.get(models.Server, self.server_id)
+            if server and server.name:
+                order.bot_name = server.name
+                log(f"[UDP-LISTENER-{self.server_id}] 💾 Set bot_name from server name for order {moonbot_order_id}: {server.name}")
+        
+        log(f"[UDP-LISTENER-{self.server_id}] {'Updated' if existing_order else 'Created'} order {moonbot_order_id}: {order.symbol} (Qty:{order.quantity}, Strategy:{order.strategy})")
+        return order
+    
     def _apply_insert_fields(self, order: models.MoonBotOrder, data: dict, db: Session):
         """Применение полей к ордеру из INSERT"""
         # Полный маппинг всех 54 полей из проекта A
@@ -309,7 +336,7 @@ class SQLParserInsertMixin:
         
         # Если валюта не указана, берём из сервера
         if not insert_currency:
-            server = db.query(models.Server).filter(models.Server.id == self.server_id).first()
+            server = db.get(models.Server, self.server_id)
             if server:
                 insert_currency = server.default_currency or 'USDT'
         
@@ -1,15 +1,15 @@
 """
 Обработка UPDATE команд для SQL парсера
 """
-import re
 from datetime import timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from models import models
 from utils.logging import log
 from utils.datetime_utils import utcnow
 from . import utils
+from .sql_tokenizer import ORDER_ID_RE, STRATEGY_ANGLE_RE, STRATEGY_PAREN_RE, UPDATE_SET_RE
 
 
 class SQLParserUpdateMixin:
@@ -36,7 +36,7 @@ class SQLParserUpdateMixin:
         if 'SellReason' in updates:
             sellreason_value = str(updates['SellReason']).strip()
             # Ищем стратегию ТОЛЬКО в формате (strategy <StrategyName>)
-            strategy_match = re.search(r'\(strategy\s*<([^>]+)>\)', sellreason_value, re.IGNORECASE)
+            strategy_match = STRATEGY_PAREN_RE.search(sellreason_value)
             if strategy_match:
                 strategy_from_text = strategy_match.group(1).strip()
                 log(f"[UDP-LISTENER-{self.server_id}] Found strategy in SellReason: '{strategy_from_text}'")
@@ -46,13 +46,13 @@ class SQLParserUpdateMixin:
             channel_value = str(updates['ChannelName']).strip()
             channel_value = channel_value.strip("'\"")
             # Сначала ищем в формате (strategy <StrategyName>)
-            strategy_match = re.search(r'\(strategy\s*<([^>]+)>\)', channel_value, re.IGNORECASE)
+            strategy_match = STRATEGY_PAREN_RE.search(channel_value)
             if strategy_match:
                 strategy_from_text = strategy_match.group(1).strip()
                 log(f"[UDP-LISTENER-{self.server_id}] Found strategy in ChannelName: '{strategy_from_text}'")
             else:
                 # Если не нашли, ищем просто <StrategyName>
-                strategy_match = re.search(r'<([^<>]+)>', channel_value)
+                strategy_match = STRATEGY_ANGLE_RE.search(channel_value)
                 if strategy_match:
                     strategy_from_text = strategy_match.group(1).strip()
                     log(f"[UDP-LISTENER-{self.server_id}] Found strategy in ChannelName: '{strategy_from_text}'")
@@ -70,12 +70,12 @@ class SQLParserUpdateMixin:
                 return None
             
             # Сначала ищем в формате (strategy <StrategyName>)
-            strategy_match = re.search(r'\(strategy\s*<([^>]+)>\)', comment_value, re.IGNORECASE)
+            strategy_match = STRATEGY_PAREN_RE.search(comment_value)
             if strategy_match:
                 strategy_from_text = strategy_match.group(1).strip()
             else:
                 # Если не нашли, ищем просто <StrategyName>
-                strategy_match = re.search(r'<([^<>]+)>', comment_value)
+                strategy_match = STRATEGY_ANGLE_RE.search(comment_value)
                 if strategy_match:
                     strategy_from_text = strategy_match.group(1).strip()
         
@@ -84,54 +84,80 @@ class SQLParserUpdateMixin:
     def parse_update_order(self, db: Session, sql: str, moonbot_order_id: int = None, bot_name: str = None):
         """Парсинг UPDATE Orders команды"""
         try:
-            if not moonbot_order_id:
-                id_match = re.search(r'\[?ID\]?\s*=\s*(\d+)', sql, re.IGNORECASE)
-                if not id_match:
-                    log(f"[UDP-LISTENER-{self.server_id}] UPDATE без ID и без oid: {sql[:100]}")
-                    return
-                
-                moonbot_order_id = int(id_match.group(1))
-                log(f"[UDP-LISTENER-{self.server_id}] [INFO] Using ID from SQL WHERE: {moonbot_order_id}")
-            else:
-                log(f"[UDP-LISTENER-{self.server_id}] [INFO] Using oid from packet: {moonbot_order_id}")
-            
-            set_match = re.search(r'set\s+(.+?)\s+where', sql, re.IGNORECASE | re.DOTALL)
-            if not set_match:
+            parsed = self.parse_update_sql(sql, moonbot_order_id)
+            if not parsed:
                 return
             
-            set_clause = set_match.group(1)
-            updates = self._parse_set_clause(set_clause)
-            
-            order = db.query(models.MoonBotOrder).filter(
-                models.MoonBotOrder.server_id == self.server_id,
-                models.MoonBotOrder.moonbot_order_id == moonbot_order_id
-            ).first()
-            
-            if not order:
-                order = self._find_order_by_fingerprint(db, updates, moonbot_order_id)
-                if not order:
-                    return
-            
-            self._apply_update_fields(order, updates)
-            order.updated_at = utcnow()
-            
-            # Сохраняем bot_name - из пакета или fallback на имя сервера
-            if bot_name:
-                order.bot_name = bot_name
-            elif not order.bot_name:
-                # Fallback: используем имя сервера из БД
-                server = db.query(models.Server).filter(models.Server.id == self.server_id).first()
-                if server and server.name:
-                    order.bot_name = server.name
-                    log(f"[UDP-LISTENER-{self.server_id}] 💾 Set bot_name from server name for order {moonbot_order_id}: {server.name}")
-            
-            log(f"[UDP-LISTENER-{self.server_id}] Updated order {moonbot_order_id}: {len(updates)} fields")
+            moonbot_order_id, updates = parsed
+            order = self._get_order(db, moonbot_order_id)
+            self.apply_update_order(db, order, moonbot_order_id, updates, bot_name=bot_name)
         
         except Exception as e:
             log(f"[UDP-LISTENER-{self.server_id}] UPDATE parse error: {e}")
             import traceback
             traceback.print_exc()
     
+    def parse_update_sql(self, sql: str, moonbot_order_id: int = None) -> Optional[Tuple[int, dict]]:
+        """
+        Разбор UPDATE Orders без обращений к БД
+        
+        Returns:
+            (moonbot_order_id, поля SET) или None
+        """
+        if not moonbot_order_id:
+            id_match = ORDER_ID_RE.search(sql)
+            if not id_match:
+                log(f"[UDP-LISTENER-{self.server_id}] UPDATE без ID и без oid: {sql[:100]}")
+                return None
+            
+            moonbot_order_id = int(id_match.group(1))
+            log(f"[UDP-LISTENER-{self.server_id}] [INFO] Using ID from SQL WHERE: {moonbot_order_id}")
+        else:
+            log(f"[UDP-LISTENER-{self.server_id}] [INFO] Using oid from packet: {moonbot_order_id}")
+        
+        set_match = UPDATE_SET_RE.search(sql)
+        if not set_match:
+            return None
+        
+        set_clause = set_match.group(1)
+        return moonbot_order_id, self._parse_set_clause(set_clause)
+    
+    def apply_update_order(self, db: Session, order: Optional[models.MoonBotOrder], moonbot_order_id: int,
+                           updates: dict, bot_name: str = None) -> Optional[models.MoonBotOrder]:
+        """
+        Применение разобранного UPDATE к ордеру
+        
+        Args:
+            db: Сессия базы данных
+            order: Ордер с этим moonbot_order_id или None (тогда fingerprint matching)
+            moonbot_order_id: ID ордера от MoonBot
+            updates: Поля SET
+            bot_name: Имя бота
+        
+        Returns:
+            Обновлённый ордер или None если ордер не найден
+        """
+        if not order:
+            order = self._find_order_by_fingerprint(db, updates, moonbot_order_id)
+            if not order:
+                return None
+        
+        self._apply_update_fields(order, updates)
+        order.updated_at = utcnow()
+        
+        # Сохраняем bot_name - из пакета или fallback на имя сервера
+        if bot_name:
+            order.bot_name = bot_name
+        elif not order.bot_name:
+            # Fallback: используем имя сервера из БД
+            server = db.get(models.Server, self.server_id)
+            if server and server.name:
+                order.bot_name = server.name
+                log(f"[UDP-LISTENER-{self.server_id}] 💾 Set bot_name from server name for order {moonbot_order_id}: {server.name}")
+        
+        log(f"[UDP-LISTENER-{self.server_id}] Updated order {moonbot_order_id}: {len(updates)} fields")
+        return order
+    
     def _find_order_by_fingerprint(self, db: Session, updates: dict, moonbot_order_id: int) -> Optional[models.MoonBotOrder]:
         """Поиск ордера по fingerprint (quantity + spent_btc)"""
         log(f"[UDP-LISTENER-{self.server_id}] ⚠️ UPDATE для несуществующего ордера ID={moonbot_order_id}")
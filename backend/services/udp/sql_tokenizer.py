@@ -0,0 +1,291 @@
+"""
+Токенизатор SQL команд MoonBot (INSERT/UPDATE Orders)
+
+Разбирает VALUES (...) и SET ... за один линейный проход без посимвольной
+конкатенации:
+- без экранирования (обычный случай) - str.split по запятым, кавычки
+  и скобки считаются по кускам (count/find на уровне C)
+- с \\ - регулярное выражение находит следующий значимый символ,
+  текст между ними добавляется срезом
+
+Правила кавычек и экранирования - как у MoonBot (и прежнего парсера):
+- ' открывает/закрывает строку, сама кавычка в значение не попадает
+  ('' внутри строки просто закрывает и снова открывает её)
+- \\ экранирует следующий символ, оба символа остаются в значении
+- в VALUES кавычка сразу после \\ (например, после \\\\) - обычный символ
+- запятая внутри кавычек (и в VALUES - внутри скобок) не разделяет значения
+- в SET пробелы в имени колонки игнорируются, [] вокруг имени снимаются
+
+Значение - SQLValue(text, quoted): text совпадает с результатом прежнего
+парсера, quoted - была ли в значении строка в кавычках.
+"""
+import re
+from typing import Dict, List, NamedTuple, Tuple
+
+
+class SQLValue(NamedTuple):
+    """Значение из VALUES / SET"""
+    text: str
+    quoted: bool
+
+
+# Общие предкомпилированные шаблоны для sql_parser_*.py и processors_orders.py
+SQL_COMMAND_RE = re.compile(r'\[SQLCommand (\d+)\]')
+INSERT_FIELDS_RE = re.compile(r'insert\s+into\s+Orders\s*\(([^)]+)\)', re.IGNORECASE)
+INSERT_VALUES_RE = re.compile(r'values\s*\((.*)\)', re.IGNORECASE | re.DOTALL)
+UPDATE_SET_RE = re.compile(r'set\s+(.+?)\s+where', re.IGNORECASE | re.DOTALL)
+ORDER_ID_RE = re.compile(r'\[?ID\]?\s*=\s*(\d+)', re.IGNORECASE)
+DIGITS_RE = re.compile(r'(\d+)')
+STRATEGY_PAREN_RE = re.compile(r'\(strategy\s*<([^>]+)>\)', re.IGNORECASE)
+STRATEGY_ANGLE_RE = re.compile(r'<([^<>]+)>')
+
+_VALUES_SPECIAL = re.compile(r"[\\'(),]")
+# Внутри кавычек значимы только кавычка и экранирование
+_QUOTED_SPECIAL = re.compile(r"[\\']")
+_SET_KEY_SPECIAL = re.compile(r"[\\'= \n\t]")
+_SET_VALUE_SPECIAL = re.compile(r"[\\',]")
+# Символы, не попадающие в имя колонки SET
+_SET_KEY_DROP = str.maketrans('', '', "' \n\t")
+
+
+def tokenize_values(values_str: str) -> List[SQLValue]:
+    """
+    Разбить содержимое VALUES (...) на значения
+
+    Args:
+        values_str: Текст между скобками VALUES
+
+    Returns:
+        Значения по порядку (пустые между запятыми сохраняются,
+        пустое последнее - нет)
+    """
+    if '\\' in values_str:
+        return _scan_values(values_str)
+    return _split_values(values_str)
+
+
+def tokenize_set_clause(set_clause: str) -> List[Tuple[str, SQLValue]]:
+    """
+    Разбить SET clause на пары (колонка, значение)
+
+    Args:
+        set_clause: Текст между SET и WHERE
+
+    Returns:
+        Пары в порядке следования (колонка может повторяться)
+    """
+    if '\\' in set_clause:
+        return _scan_set_clause(set_clause)
+    return _split_set_clause(set_clause)
+
+
+def _split_values(values_str: str) -> List[SQLValue]:
+    """VALUES без экранирования: split по запятым, кавычки и скобки считаются по кускам"""
+    values: List[SQLValue] = []
+    parts: List[str] = []
+    quoted = False
+    in_quotes = False
+    depth = 0
+    pieces = values_str.split(',')
+    last = len(pieces) - 1
+
+    for n, piece in enumerate(pieces):
+        if "'" in piece:
+            quoted = True
+            segments = piece.split("'")
+            if '(' in piece or ')' in piece:
+                # Нечётные сегменты - по другую сторону кавычки от начала куска
+                for k, segment in enumerate(segments):
+                    if (k % 2 == 1) == in_quotes:
+                        depth += segment.count('(') - segment.count(')')
+            if len(segments) % 2 == 0:
+                in_quotes = not in_quotes
+            parts.append(''.join(segments))
+        else:
+            if not in_quotes and ('(' in piece or ')' in piece):
+                depth += piece.count('(') - piece.count(')')
+            parts.append(piece)
+
+        if n == last:
+            break
+        if in_quotes or depth:
+            parts.append(',')
+        else:
+            values.append(SQLValue(''.join(parts).strip(), quoted))
+            parts = []
+            quoted = False
+
+    text = ''.join(parts).strip()
+    if text:
+        values.append(SQLValue(text, quoted))
+    return values
+
+
+def _scan_values(values_str: str) -> List[SQLValue]:
+    """VALUES с экранированием: поиск следующего значимого символа"""
+    values: List[SQLValue] = []
+    parts: List[str] = []
+    quoted = False
+    in_quotes = False
+    depth = 0
+    pos = 0
+    plain_search = _VALUES_SPECIAL.search
+    quoted_search = _QUOTED_SPECIAL.search
+
+    while True:
+        match = (quoted_search if in_quotes else plain_search)(values_str, pos)
+        if match is None:
+            parts.append(values_str[pos:])
+            break
+
+        i = match.start()
+        if i > pos:
+            parts.append(values_str[pos:i])
+        char = values_str[i]
+        pos = i + 1
+
+        if char == '\\':
+            # Экранированный символ попадает в значение как есть
+            parts.append(values_str[i:i + 2])
+            pos = i + 2
+        elif char == "'":
+            if i and values_str[i - 1] == '\\':
+                parts.append(char)
+            else:
+                in_quotes = not in_quotes
+                quoted = True
+        elif char == ',':
+            if depth == 0:
+                values.append(SQLValue(''.join(parts).strip(), quoted))
+                parts = []
+                quoted = False
+            else:
+                parts.append(char)
+        else:
+            depth += 1 if char == '(' else -1
+            parts.append(char)
+
+    text = ''.join(parts).strip()
+    if text:
+        values.append(SQLValue(text, quoted))
+    return values
+
+
+def _split_set_clause(set_clause: str) -> List[Tuple[str, SQLValue]]:
+    """SET без экранирования: split по запятым, '=' ищется только в имени колонки"""
+    pairs: List[Tuple[str, SQLValue]] = []
+    key_parts: List[str] = []
+    value_parts: List[str] = []
+    quoted = False
+    in_quotes = False
+    in_value = False
+    pieces = set_clause.split(',')
+    last = len(pieces) - 1
+
+    for n, piece in enumerate(pieces):
+        value = None
+        if in_value:
+            value = piece
+        else:
+            eq = piece.find('=')
+            key = piece if eq < 0 else piece[:eq]
+            if eq >= 0:
+                value = piece[eq + 1:]
+                in_value = True
+            quotes = key.count("'")
+            if quotes:
+                quoted = True
+                in_quotes ^= quotes % 2 == 1
+            key_parts.append(key.translate(_SET_KEY_DROP))
+
+        if value is not None:
+            quotes = value.count("'")
+            if quotes:
+                quoted = True
+                in_quotes ^= quotes % 2 == 1
+                value = value.replace("'", '')
+            value_parts.append(value)
+
+        if n == last:
+            break
+        if not in_value:
+            # Запятая до '=' - часть имени колонки
+            key_parts.append(',')
+        elif in_quotes:
+            value_parts.append(',')
+        else:
+            key = ''.join(key_parts).strip().strip('[]')
+            if key:
+                pairs.append((key, SQLValue(''.join(value_parts).strip(), quoted)))
+            key_parts = []
+            value_parts = []
+            quoted = False
+            in_value = False
+
+    key = ''.join(key_parts)
+    if key:
+        key = key.strip().strip('[]')
+        if key:
+            pairs.append((key, SQLValue(''.join(value_parts).strip(), quoted)))
+    return pairs
+
+
+def _scan_set_clause(set_clause: str) -> List[Tuple[str, SQLValue]]:
+    """SET с экранированием: поиск следующего значимого символа по состоянию"""
+    pairs: List[Tuple[str, SQLValue]] = []
+    key_parts: List[str] = []
+    value_parts: List[str] = []
+    quoted = False
+    in_quotes = False
+    in_value = False
+    pos = 0
+    key_search = _SET_KEY_SPECIAL.search
+    value_search = _SET_VALUE_SPECIAL.search
+    quoted_search = _QUOTED_SPECIAL.search
+
+    def finish() -> None:
+        key = ''.join(key_parts).strip().strip('[]')
+        if key:
+            pairs.append((key, SQLValue(''.join(value_parts).strip(), quoted)))
+
+    while True:
+        if not in_value:
+            match = key_search(set_clause, pos)
+        else:
+            match = (quoted_search if in_quotes else value_search)(set_clause, pos)
+        if match is None:
+            (value_parts if in_value else key_parts).append(set_clause[pos:])
+            break
+
+        i = match.start()
+        if i > pos:
+            (value_parts if in_value else key_parts).append(set_clause[pos:i])
+        char = set_clause[i]
+        pos = i + 1
+
+        if char == '\\':
+            # Экранирование всегда пишет в значение (даже до '=')
+            value_parts.append(set_clause[i:i + 2])
+            pos = i + 2
+        elif char == "'":
+            in_quotes = not in_quotes
+            quoted = True
+        elif char == '=':
+            in_value = True
+        elif char == ',':
+            # В значении вне кавычек (в кавычках и в имени ищутся другие символы)
+            finish()
+            key_parts = []
+            value_parts = []
+            quoted = False
+            in_value = False
+        # пробелы в имени колонки пропускаются
+
+    if ''.join(key_parts):
+        finish()
+    return pairs
+
+
+def set_clause_dict(set_clause: str) -> Dict[str, str]:
+    """SET clause как {колонка: текст} (последнее присваивание колонки побеждает)"""
+    return {key: value.text for key, value in tokenize_set_clause(set_clause)}
@@ -0,0 +1,194 @@
+"""
+Бенчмарк токенизатора SQL (sql_tokenizer.py) против прежнего парсера
+
+Запуск (из backend/):
+    python -m services.udp.sql_tokenizer_benchmark [--repeat N]
+
+Прежний посимвольный парсер (эталон ниже) замеряется на значениях
+разной длины, с экранированием и без. Совпадение результатов
+с эталоном проверяет tests/test_sql_tokenizer.py.
+"""
+
+import argparse
+import random
+import time
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from .sql_tokenizer import set_clause_dict, tokenize_values
+
+
+# =============================================================================
+# ЭТАЛОН: ПРЕЖНИЙ ПАРСЕР (SQLParserBase до перехода на sql_tokenizer)
+# =============================================================================
+
+def legacy_parse_set_clause(set_clause: str) -> dict:
+    """Прежний посимвольный разбор SET clause (эталон)"""
+    updates = {}
+    current_key = ""
+    current_value = ""
+    in_quotes = False
+    escape_next = False
+    state = "key"
+
+    for i, char in enumerate(set_clause):
+        if escape_next:
+            current_value += char
+            escape_next = False
+            continue
+
+        if char == '\\':
+            escape_next = True
+            current_value += char
+            continue
+
+        if char == "'":
+            in_quotes = not in_quotes
+            continue
+
+        if state == "key":
+            if char == '=':
+                state = "value"
+            elif char not in [' ', '\n', '\t']:
+                current_key += char
+        elif state == "value":
+            if char == ',' and not in_quotes:
+                key = current_key.strip().strip('[]')
+                value = current_value.strip()
+                if key:
+                    updates[key] = value
+                current_key = ""
+                current_value = ""
+                state = "key"
+            else:
+                current_value += char
+
+    if current_key:
+        key = current_key.strip().strip('[]')
+        value = current_value.strip()
+        if key:
+            updates[key] = value
+
+    return updates
+
+def legacy_parse_values_clause(values_str: str) -> list:
+    """Прежний посимвольный разбор VALUES clause (эталон)"""
+    values = []
+    current_value = ""
+    in_quotes = False
+    escape_next = False
+    paren_depth = 0
+
+    for i, char in enumerate(values_str):
+        if escape_next:
+            current_value += char
+            escape_next = False
+            continue
+
+        if char == '\\':
+            escape_next = True
+            current_value += char
+            continue
+
+        if char == "'" and (i == 0 or values_str[i-1] != '\\'):
+            in_quotes = not in_quotes
+            continue
+
+        if char == '(' and not in_quotes:
+            paren_depth += 1
+        elif char == ')' and not in_quotes:
+            paren_depth -= 1
+
+        if char == ',' and not in_quotes and paren_depth == 0:
+            val = current_value.strip()
+            values.append(val)
+            current_value = ""
+        else:
+            current_value += char
+
+    if current_value.strip():
+        values.append(current_value.strip())
+
+    return values
+
+
+# =============================================================================
+# КОМАНДЫ MOONBOT
+# =============================================================================
+
+def moonbot_sql(rnd: random.Random, long_value: int = 0, escapes: bool = True) -> Tuple[str, str]:
+    """
+    Пара (VALUES, SET) в формате MoonBot
+
+    Args:
+        long_value: Длина длинного комментария (0 - обычный короткий)
+        escapes: Добавлять в комментарий слова с \\
+    """
+    coin = rnd.choice(("BTC", "ETH", "SOL", "DOGE"))
+    comment = "strategy <Sim {}>".format(rnd.randint(1, 9))
+    if long_value:
+        # Текст с редкими спецсимволами, как в реальных комментариях
+        vocabulary = ("pump", "dump", "BTC", "(x)", "vol,", "it's", "delta=5") + (("a\\b",) if escapes else ())
+        words = []
+        length = 0
+        while length < long_value:
+            words.append(rnd.choice(vocabulary))
+            length += len(words[-1]) + 1
+        comment += " " + " ".join(words)
+        comment = comment.replace("'", "''")
+    values = (f"'{rnd.randint(1, 10**9)}', '{coin}', {rnd.randint(1, 2**31)}, 0, 0, "
+              f"{rnd.uniform(0, 100):.6f}, {rnd.uniform(1, 50):.4f}, {rnd.uniform(0, 5000):.8f}, "
+              f"'Simulator', 'sim', '{comment}', {rnd.randint(1, 10)}, 'USDT', 0")
+    set_clause = (f"CloseDate={rnd.randint(1, 2**31)}, SellPrice={rnd.uniform(0, 100):.6f}, "
+                  f"GainedBTC={rnd.uniform(0, 100):.8f}, ProfitBTC={rnd.uniform(-5, 5):.8f}, "
+                  f"SellReason='Auto Price Down', Comment='{comment}', Status=1")
+    return values, set_clause
+
+
+# =============================================================================
+# ЗАМЕРЫ
+# =============================================================================
+
+def _best_time(parse: Callable[[str], object], data: str, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(data)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_benchmark(repeat: int = 5) -> List[dict]:
+    """Время прежнего парсера и токенизатора на значениях разной длины"""
+    rnd = random.Random(1)
+    results = []
+    cases = [(0, False)] + [(n, escapes) for n in (1000, 10000, 100000) for escapes in (False, True)]
+    for long_value, escapes in cases:
+        values, set_clause = moonbot_sql(rnd, long_value, escapes)
+        for kind, data, legacy, tokenizer in (
+            ("VALUES", values, legacy_parse_values_clause, tokenize_values),
+            ("SET", set_clause, legacy_parse_set_clause, set_clause_dict),
+        ):
+            results.append({
+                "name": f"{kind} {long_value}{' esc' if escapes else ''}",
+                "size": len(data),
+                "legacy_us": _best_time(legacy, data, repeat) * 1e6,
+                "tokenizer_us": _best_time(tokenizer, data, repeat) * 1e6,
+            })
+    return results
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="MoonBot SQL tokenizer benchmark")
+    parser.add_argument("--repeat", type=int, default=5, help="Повторов на случай (берётся лучший)")
+    args = parser.parse_args(argv)
+
+    print(f"{'case':<16} {'bytes':>8} {'legacy us':>11} {'tokenizer us':>13} {'speedup':>8}")
+    for r in run_benchmark(args.repeat):
+        speedup = r["legacy_us"] / r["tokenizer_us"] if r["tokenizer_us"] else 0.0
+        print(f"{r['name']:<16} {r['size']:>8} {r['legacy_us']:>11.1f} {r['tokenizer_us']:>13.1f} "
+              f"{speedup:>7.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -6,6 +6,10 @@ from typing import Optional
 from utils.logging import log
 
 
+# В отличие от UPDATE (sql_tokenizer.STRATEGY_PAREN_RE) - с учётом регистра
+_STRATEGY_PAREN_RE = re.compile(r'\(strategy\s*<([^>]+)>\)')
+_STRATEGY_ANGLE_RE = re.compile(r'<([^<>]+)>')
+
 class StrategyNormalizer:
     """Класс для нормализации и извлечения названий стратегий"""
     
@@ -22,7 +26,7 @@ class StrategyNormalizer:
         # 1. Проверяем SellReason ТОЛЬКО на наличие (strategy <Name>)
         if 'SellReason' in data:
             sellreason_value = str(data['SellReason'])
-            strategy_match = re.search(r'\(strategy\s*<([^>]+)>\)', sellreason_value)
+            strategy_match = _STRATEGY_PAREN_RE.search(sellreason_value)
             if strategy_match:
                 strategy = strategy_match.group(1).strip()
                 log(f"[UDP-LISTENER-{self.server_id}] 🎯 Found strategy in SellReason: '{strategy}'")
@@ -32,14 +36,14 @@ class StrategyNormalizer:
         if 'ChannelName' in data:
             channel_value = str(data['ChannelName'])
             # Сначала ищем в формате (strategy <StrategyName>)
-            strategy_match = re.search(r'\(strategy\s*<([^>]+)>\)', channel_value)
+            strategy_match = _STRATEGY_PAREN_RE.search(channel_value)
             if strategy_match:
                 strategy = strategy_match.group(1).strip()
                 log(f"[UDP-LISTENER-{self.server_id}] 🎯 Found strategy in ChannelName: '{strategy}'")
                 return strategy
             else:
                 # Если не нашли, ищем просто <StrategyName>
-                strategy_match = re.search(r'<([^<>]+)>', channel_value)
+                strategy_match = _STRATEGY_ANGLE_RE.search(channel_value)
                 if strategy_match:
                     strategy = strategy_match.group(1).strip()
                     log(f"[UDP-LISTENER-{self.server_id}] 🎯 Found strategy in ChannelName: '{strategy}'")
@@ -56,14 +60,14 @@ class StrategyNormalizer:
                 return None
             
             # Сначала ищем в формате (strategy <StrategyName>)
-            strategy_match = re.search(r'\(strategy\s*<([^>]+)>\)', comment_value)
+            strategy_match = _STRATEGY_PAREN_RE.search(comment_value)
             if strategy_match:
                 strategy = strategy_match.group(1).strip()
                 log(f"[UDP-LISTENER-{self.server_id}] 🎯 Found strategy in Comment: '{strategy}'")
                 return strategy
             else:
                 # Если не нашли, ищем просто <StrategyName>
-                strategy_match = re.search(r'<([^<>]+)>', comment_value)
+                strategy_match = _STRATEGY_ANGLE_RE.search(comment_value)
                 if strategy_match:
                     strategy = strategy_match.group(1).strip()
                     log(f"[UDP-LISTENER-{self.server_id}] 🎯 Found strategy in Comment: '{strategy}'")
@@ -179,3 +179,37 @@ def extract_currency(message: str, server_id: int) -> str:
 
 
 
+
+
+def read_udp_kernel_drops(port: int) -> Optional[int]:
+    """
+    Количество датаграмм, отброшенных ядром для UDP сокета на порту
+    
+    Читает колонку drops из /proc/net/udp и /proc/net/udp6 (только Linux).
+    Растущее значение означает переполнение SO_RCVBUF - приём не успевает
+    вычитывать пакеты.
+    
+    Args:
+        port: Локальный UDP порт
+    
+    Returns:
+        Суммарное число drops или None если счётчик недоступен (не Linux)
+    """
+    port_hex = f"{port:04X}"
+    total = None
+    
+    for path in ('/proc/net/udp', '/proc/net/udp6'):
+        try:
+            with open(path, 'r') as f:
+                next(f, None)  # Заголовок
+                for line in f:
+                    fields = line.split()
+                    if len(fields) < 13:
+                        continue
+                    if fields[1].rsplit(':', 1)[-1] != port_hex:
+                        continue
+                    total = (total or 0) + int(fields[-1])
+        except (OSError, ValueError):
+            continue
+    
+    return total
@@ -2,19 +2,30 @@
 UDP Worker Pool для высоконагруженной обработки сообщений
 
 Пул воркеров для параллельной обработки UDP сообщений от 3000+ серверов.
-Использует очередь для буферизации и batch-обработку для оптимизации БД операций.
+Сообщения распределяются по шардам по server_id: у каждого шарда своя
+очередь и свой воркер, поэтому пакеты одного бота обрабатываются строго
+в порядке приёма, а воркеры не конкурируют за одну очередь.
+
+Очередь шарда разделена на ограниченные очереди по классам сообщений
+(ответы на команды, ордера, балансы, стратегии, ошибки, графики) со
+взвешенной очерёдностью и вытеснением малоценных сообщений при
+переполнении (см. worker_pool_lanes.py). Порядок сохраняется внутри
+класса. Не поместившееся сообщение отбрасывается и считается в метриках -
+синхронной обработки на приёмном потоке нет.
 """
 import asyncio
-import queue
 import threading
 import time
 from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from typing import Callable, Dict, List, Optional, Any
-from collections import defaultdict
+from collections import defaultdict, deque
 
 from utils.config_loader import get_config_value
 from utils.logging import log
+from .worker_pool_lanes import (
+    LANE_COMMAND, PUT_ACCEPTED, PUT_COALESCED, LaneShard, classify_packet, lane_settings, merge_lane_stats,
+)
 
 
 @dataclass
@@ -26,6 +37,7 @@ class UDPMessage:
     source_port: int
     received_at: float
     processor: Any  # MessageProcessor
+    lane: str = LANE_COMMAND  # класс сообщения (определяется при submit)
 
 
 class WorkerPoolMetrics:
@@ -36,16 +48,17 @@ class WorkerPoolMetrics:
         self.messages_received: int = 0
         self.messages_processed: int = 0
         self.messages_dropped: int = 0
+        self.messages_coalesced: int = 0
         self.processing_errors: int = 0
         self.queue_high_watermark: int = 0
         self.avg_processing_time_ms: float = 0.0
         self._processing_times: List[float] = []
         self._max_samples: int = 1000
     
-    def record_received(self) -> None:
-        """Записать получение сообщения."""
+    def record_received(self, count: int = 1) -> None:
+        """Записать получение сообщения (или пачки сообщений)."""
         with self._lock:
-            self.messages_received += 1
+            self.messages_received += count
     
     def record_processed(self, processing_time_ms: float) -> None:
         """Записать обработку сообщения."""
@@ -56,10 +69,15 @@ class WorkerPoolMetrics:
                 self._processing_times.pop(0)
             self.avg_processing_time_ms = sum(self._processing_times) / len(self._processing_times)
     
-    def record_dropped(self) -> None:
-        """Записать отброшенное сообщение."""
+    def record_dropped(self, count: int = 1) -> None:
+        """Записать отброшенное сообщение (или пачку сообщений)."""
+        with self._lock:
+            self.messages_dropped += count
+    
+    def record_coalesced(self, count: int = 1) -> None:
+        """Записать сообщение, заменённое более новым того же сервера (latest wins)."""
         with self._lock:
-            self.messages_dropped += 1
+            self.messages_coalesced += count
     
     def record_error(self) -> None:
         """Записать ошибку обработки."""
@@ -79,10 +97,57 @@ class WorkerPoolMetrics:
                 "messages_received": self.messages_received,
                 "messages_processed": self.messages_processed,
                 "messages_dropped": self.messages_dropped,
+                "messages_coalesced": self.messages_coalesced,
                 "processing_errors": self.processing_errors,
                 "queue_high_watermark": self.queue_high_watermark,
                 "avg_processing_time_ms": round(self.avg_processing_time_ms, 2),
-                "pending": self.messages_received - self.messages_processed - self.messages_dropped,
+                "pending": (self.messages_received - self.messages_processed
+                            - self.messages_dropped - self.messages_coalesced),
+            }
+
+
+class ShardMetrics:
+    """Метрики одного шарда (очередь + закреплённый воркер)."""
+    
+    def __init__(self, shard_id: int, max_samples: int = 1000):
+        self._lock = threading.Lock()
+        self.shard_id = shard_id
+        self.messages_processed: int = 0
+        self.queue_high_watermark: int = 0
+        # Задержка от приёма пакета до завершения обработки
+        self._latencies_ms: deque = deque(maxlen=max_samples)
+        self._latency_sum_ms: float = 0.0
+        self.max_latency_ms: float = 0.0
+    
+    def record_processed(self, latency_ms: float) -> None:
+        """Записать обработанное сообщение и его сквозную задержку."""
+        with self._lock:
+            self.messages_processed += 1
+            if len(self._latencies_ms) == self._latencies_ms.maxlen:
+                self._latency_sum_ms -= self._latencies_ms[0]
+            self._latencies_ms.append(latency_ms)
+            self._latency_sum_ms += latency_ms
+            if latency_ms > self.max_latency_ms:
+                self.max_latency_ms = latency_ms
+    
+    def update_queue_watermark(self, queue_size: int) -> None:
+        """Обновить высшую отметку глубины очереди шарда."""
+        if queue_size > self.queue_high_watermark:
+            with self._lock:
+                if queue_size > self.queue_high_watermark:
+                    self.queue_high_watermark = queue_size
+    
+    def get_stats(self, depth: int) -> Dict[str, Any]:
+        """Получить статистику шарда."""
+        with self._lock:
+            samples = len(self._latencies_ms)
+            return {
+                "shard": self.shard_id,
+                "depth": depth,
+                "queue_high_watermark": self.queue_high_watermark,
+                "messages_processed": self.messages_processed,
+                "avg_latency_ms": round(self._latency_sum_ms / samples, 2) if samples else 0.0,
+                "max_latency_ms": round(self.max_latency_ms, 2),
             }
 
 
@@ -92,7 +157,9 @@ class UDPWorkerPool:
     
     Особенности:
     - Многопоточная обработка сообщений
-    - Очередь с ограниченным размером
+    - Шардирование по server_id: порядок сообщений одного сервера сохраняется
+    - Очередь с ограниченным размером на каждый шард, разделённая
+      на очереди классов сообщений с весами и вытеснением
     - Batch-обработка для оптимизации БД
     - Graceful shutdown
     """
@@ -109,7 +176,7 @@ class UDPWorkerPool:
         
         Args:
             num_workers: Количество воркеров (по умолчанию из конфига)
-            queue_size: Размер очереди (по умолчанию из конфига)
+            queue_size: Суммарный размер очередей всех шардов (по умолчанию из конфига)
             batch_size: Размер пакета для batch-обработки
             batch_wait_ms: Максимальное время ожидания пакета
         """
@@ -127,8 +194,20 @@ class UDPWorkerPool:
             'high_load', 'udp.batch.max_batch_wait_ms', default=50
         )
         
-        # Очередь сообщений
-        self._queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        # Очереди классов сообщений на каждый шард (один шард = один воркер)
+        self.num_shards = self.num_workers
+        self.shard_queue_size = max(1, self.queue_size // self.num_shards)
+        settings = lane_settings()
+        self._shards: List[LaneShard] = [
+            LaneShard(self.shard_queue_size, settings) for _ in range(self.num_shards)
+        ]
+        # Очередь, в которой началось фрагментированное сообщение сервера
+        # (туда же идут продолжения)
+        self._stream_lane: Dict[int, str] = {}
+        self._last_drop_log = 0.0
+        self.shard_metrics: List[ShardMetrics] = [
+            ShardMetrics(i) for i in range(self.num_shards)
+        ]
         
         # Пул потоков
         self._executor: Optional[ThreadPoolExecutor] = None
@@ -147,7 +226,8 @@ class UDPWorkerPool:
         self._last_flush: Dict[str, float] = defaultdict(float)
         
         log(f"[UDP-WORKER-POOL] Initialized: workers={self.num_workers}, "
-            f"queue_size={self.queue_size}, batch_size={self.batch_size}")
+            f"queue_size={self.queue_size} ({self.shard_queue_size} per shard), "
+            f"batch_size={self.batch_size}")
     
     def start(self) -> None:
         """Запустить пул воркеров."""
@@ -192,6 +272,8 @@ class UDPWorkerPool:
         log("[UDP-WORKER-POOL] Stopping...")
         self._running = False
         self._shutdown_event.set()
+        for shard in self._shards:
+            shard.notify_all()
         
         # Ждём завершения воркеров
         for worker in self._workers:
@@ -205,6 +287,59 @@ class UDPWorkerPool:
         
         log(f"[UDP-WORKER-POOL] Stopped. Final stats: {self.metrics.get_stats()}")
     
+    def shard_for(self, server_id: int) -> int:
+        """
+        Номер шарда для сервера.
+        
+        Args:
+            server_id: ID сервера
+            
+        Returns:
+            Индекс шарда (все сообщения сервера попадают в один шард)
+        """
+        return hash(server_id) % self.num_shards
+    
+    def _enqueue(self, message: UDPMessage) -> bool:
+        """
+        Положить сообщение в очередь его класса в шарде (без блокировки).
+        
+        Returns:
+            False если сообщение отброшено (вытесненные и заменённые
+            сообщения учитываются в метриках здесь же)
+        """
+        lane, opens_stream = classify_packet(message.data)
+        fragment = lane is None or opens_stream
+        if lane is None:
+            lane = self._stream_lane.get(message.server_id, LANE_COMMAND)
+        elif opens_stream:
+            self._stream_lane[message.server_id] = lane
+        message.lane = lane
+        
+        shard = self.shard_for(message.server_id)
+        lane_shard = self._shards[shard]
+        status, shed = lane_shard.put(message, lane, coalesce=not fragment)
+        if shed:
+            self.metrics.record_dropped(shed)
+        if status == PUT_COALESCED:
+            self.metrics.record_coalesced()
+            return True
+        if status != PUT_ACCEPTED:
+            return False
+        self.shard_metrics[shard].update_queue_watermark(lane_shard.depth)
+        return True
+    
+    def _total_queue_size(self) -> int:
+        """Суммарная глубина очередей всех шардов."""
+        return sum(shard.depth for shard in self._shards)
+    
+    def _log_dropped(self, dropped: int, total: int) -> None:
+        """Предупреждение об отброшенных сообщениях (не чаще раза в секунду)."""
+        now = time.monotonic()
+        if now - self._last_drop_log >= 1.0:
+            self._last_drop_log = now
+            log(f"[UDP-WORKER-POOL] Queue full, dropping {dropped} of {total} messages "
+                f"({self.metrics.messages_dropped} dropped total)", level="WARNING")
+    
     def submit(self, message: UDPMessage) -> bool:
         """
         Добавить сообщение в очередь на обработку.
@@ -213,49 +348,82 @@ class UDPWorkerPool:
             message: Сообщение для обработки
             
         Returns:
-            True если сообщение добавлено, False если очередь переполнена
+            True если сообщение принято, False если отброшено (очередь его класса переполнена)
         """
         self.metrics.record_received()
         
-        try:
-            self._queue.put_nowait(message)
-            self.metrics.update_queue_watermark(self._queue.qsize())
+        if self._enqueue(message):
+            self.metrics.update_queue_watermark(self._total_queue_size())
             return True
-        except queue.Full:
-            self.metrics.record_dropped()
-            log(f"[UDP-WORKER-POOL] Queue full, dropping message from server {message.server_id}",
-                level="WARNING")
-            return False
+        
+        self.metrics.record_dropped()
+        self._log_dropped(1, 1)
+        return False
+    
+    def submit_batch(self, messages: List[UDPMessage]) -> List[UDPMessage]:
+        """
+        Добавить пачку сообщений в очереди шардов за один вызов.
+        
+        Используется приёмным циклом, который вычитывает из сокета
+        несколько датаграмм за одно пробуждение: метрики и watermark
+        обновляются один раз на пачку, а не на каждый пакет.
+        
+        Args:
+            messages: Сообщения для обработки (в порядке приёма)
+            
+        Returns:
+            Список отброшенных сообщений (пустой если все приняты)
+        """
+        if not messages:
+            return []
+        
+        self.metrics.record_received(len(messages))
+        
+        rejected = [message for message in messages if not self._enqueue(message)]
+        
+        self.metrics.update_queue_watermark(self._total_queue_size())
+        
+        if rejected:
+            self.metrics.record_dropped(len(rejected))
+            self._log_dropped(len(rejected), len(messages))
+        
+        return rejected
     
     def _worker_loop(self, worker_id: int) -> None:
         """
         Основной цикл воркера.
         
+        Воркер закреплён за шардом с тем же номером и обрабатывает
+        его очереди по весам классов.
+        
         Args:
-            worker_id: ID воркера
+            worker_id: ID воркера (= номер шарда)
         """
         log(f"[UDP-WORKER-{worker_id}] Started")
         
-        while self._running or not self._queue.empty():
+        lane_shard = self._shards[worker_id]
+        shard_metrics = self.shard_metrics[worker_id]
+        
+        while self._running or lane_shard.depth:
             try:
                 # Получаем сообщение с таймаутом
-                try:
-                    message = self._queue.get(timeout=0.1)
-                except queue.Empty:
+                message = lane_shard.get(timeout=0.1)
+                if message is None:
                     continue
                 
                 # Обрабатываем
                 start_time = time.time()
                 try:
                     self._process_message(message)
-                    processing_time_ms = (time.time() - start_time) * 1000
-                    self.metrics.record_processed(processing_time_ms)
+                    end_time = time.time()
+                    latency_ms = (end_time - message.received_at) * 1000
+                    self.metrics.record_processed((end_time - start_time) * 1000)
+                    shard_metrics.record_processed(latency_ms)
+                    lane_shard.record_processed(message.lane, latency_ms)
                 except Exception as e:
                     self.metrics.record_error()
                     log(f"[UDP-WORKER-{worker_id}] Error processing message: {e}",
                         level="ERROR")
-                finally:
-                    self._queue.task_done()
                     
             except Exception as e:
                 log(f"[UDP-WORKER-{worker_id}] Worker error: {e}", level="ERROR")
@@ -346,10 +514,27 @@ class UDPWorkerPool:
             Dict со статистикой
         """
         stats = self.metrics.get_stats()
-        stats["queue_size"] = self._queue.qsize()
+        shards = self.get_shard_stats()
+        stats["queue_size"] = sum(shard["depth"] for shard in shards)
         stats["workers"] = self.num_workers
         stats["running"] = self._running
+        stats["shard_queue_size"] = self.shard_queue_size
+        stats["max_shard_depth"] = max((shard["depth"] for shard in shards), default=0)
+        stats["lanes"] = merge_lane_stats(self._shards)
+        stats["shards"] = shards
         return stats
+    
+    def get_shard_stats(self) -> List[Dict[str, Any]]:
+        """
+        Получить статистику по шардам (глубина очереди и задержка).
+        
+        Returns:
+            Список словарей, по одному на шард
+        """
+        return [
+            metrics.get_stats(self._shards[i].depth)
+            for i, metrics in enumerate(self.shard_metrics)
+        ]
 
 
 # Глобальный экземпляр пула
@@ -0,0 +1,334 @@
+"""
+Классы сообщений (lanes) для UDP Worker Pool
+
+У каждого шарда пула - отдельная ограниченная очередь на класс сообщений:
+    command  - ответы на команды (lst, текстовые ответы, replay)
+    order    - SQL ордеров (order, [SQLCommand])
+    balance  - балансы (acc)
+    strategy - стратегии (strats)
+    error    - ошибки API (errors)
+    chart    - бинарные фрагменты графиков
+
+Воркер шарда выбирает следующую очередь взвешенным round-robin (smooth
+weighted round-robin, как в nginx): при нагрузке ордера и ответы на
+команды получают больше времени воркера, но ни одна очередь не голодает.
+Внутри очереди порядок приёма сохраняется (сервер всегда в одном шарде).
+
+Класс определяется на приёмном потоке по первым байтам пакета
+(у gzip - по первым _PREFIX_BYTES распакованных байт). Класс влияет
+только на очерёдность: обработка пакета не зависит от того, в какой
+очереди он ждал.
+
+Фрагментированный ответ: первый фрагмент - gzip, поток которого
+не заканчивается в датаграмме, продолжения - сырые байты deflate
+(класс не определяется). Продолжения идут в очередь, где началось
+сообщение - иначе фрагменты одного сообщения обрабатываются не по
+порядку. Обычные пакеты между фрагментами очередь потока не меняют.
+
+Конец gzip потока приёмный поток ищет только в первых
+_STREAM_CHECK_BYTES распакованных байт: пакет, который распаковывается
+в большее сообщение, считается началом потока, даже если он целый.
+Ошибка безопасна - такой пакет только не заменяет ожидающий acc,
+а незавершённое сообщение сервера сбрасывает любой gzip пакет
+(GzipStreamAssembler.start), так что его продолжения никуда не собираются.
+
+При переполнении (сначала теряется наименее ценное):
+- balance: новый acc сервера заменяет ещё не обработанный (latest wins);
+  заменяются только пакеты, определённые как acc (не фрагменты), и только
+  если после них в очередь балансов не вставал фрагмент сервера;
+  переполненная очередь балансов вытесняет самый старый
+- шард заполнен: вытесняется самое старое сообщение из наименее ценной
+  непустой очереди (SHED_ORDER), если она менее ценна, чем новое
+- очередь класса заполнена (или вытеснить нечего): новое сообщение
+  отбрасывается
+"""
+
+import codecs
+import re
+import threading
+import zlib
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from utils.config_loader import get_config_value
+
+
+LANE_COMMAND = 'command'
+LANE_ORDER = 'order'
+LANE_BALANCE = 'balance'
+LANE_STRATEGY = 'strategy'
+LANE_ERROR = 'error'
+LANE_CHART = 'chart'
+
+LANES = (LANE_COMMAND, LANE_ORDER, LANE_BALANCE, LANE_STRATEGY, LANE_ERROR, LANE_CHART)
+
+# Вес в round-robin и доля ёмкости шарда, которую может занять очередь
+_LANE_DEFAULTS: Dict[str, Tuple[int, float]] = {
+    LANE_COMMAND: (8, 0.25),
+    LANE_ORDER: (8, 0.6),
+    LANE_BALANCE: (2, 0.25),
+    LANE_STRATEGY: (2, 0.25),
+    LANE_ERROR: (1, 0.25),
+    LANE_CHART: (1, 0.5),
+}
+
+# Порядок вытеснения при заполненном шарде: от наименее ценного
+SHED_ORDER = (LANE_BALANCE, LANE_CHART, LANE_ERROR, LANE_STRATEGY, LANE_COMMAND, LANE_ORDER)
+
+# Результат LaneShard.put
+PUT_ACCEPTED = 'accepted'
+PUT_COALESCED = 'coalesced'
+PUT_REJECTED = 'rejected'
+
+_GZIP_MAGIC = b'\x1f\x8b'
+_PREFIX_BYTES = 256
+# Сколько распакованных байт приёмный поток проверяет на конец gzip потока
+_STREAM_CHECK_BYTES = 16 * 1024
+_CMD_RE = re.compile(rb'"cmd"\s*:\s*"([A-Za-z]+)"')
+_CMD_LANES = {
+    b'order': LANE_ORDER,
+    b'acc': LANE_BALANCE,
+    b'strats': LANE_STRATEGY,
+    b'errors': LANE_ERROR,
+}
+
+
+def classify_packet(data: bytes) -> Tuple[Optional[str], bool]:
+    """
+    Класс сообщения по первым байтам датаграммы
+
+    Returns:
+        (имя очереди, начинает ли пакет фрагментированное сообщение).
+        Имя очереди None - бинарное продолжение фрагмента (очередь
+        определяет начало сообщения)
+    """
+    # Заголовок графика: Flag = 0, Kind = 1 (см. ChartProcessor.is_chart_packet)
+    if len(data) >= 8 and data[0] == 0 and data[1] == 1:
+        return LANE_CHART, False
+
+    opens_stream = False
+    if data[:2] == _GZIP_MAGIC:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            head = decompressor.decompress(data, _PREFIX_BYTES)
+        except zlib.error:
+            return None, False
+        opens_stream = not _gzip_complete(decompressor)
+    else:
+        head = data[:_PREFIX_BYTES]
+        try:
+            # Обрезанный на границе символ UTF-8 не ошибка
+            codecs.getincrementaldecoder('utf-8')().decode(head)
+        except UnicodeDecodeError:
+            return None, False
+
+    match = _CMD_RE.search(head)
+    if match:
+        lane = _CMD_LANES.get(match.group(1).lower())
+        if lane:
+            return lane, opens_stream
+    if b'"sql"' in head or b'[SQLCommand' in head:
+        return LANE_ORDER, opens_stream
+    return LANE_COMMAND, opens_stream
+
+
+def _gzip_complete(decompressor) -> bool:
+    """
+    Заканчивается ли gzip поток в первых _STREAM_CHECK_BYTES распакованных байт.
+
+    Сообщение больше лимита и битый поток считаются незавершёнными -
+    MessageProcessor тоже начинает с битого пакета фрагментированное сообщение.
+    """
+    try:
+        if not decompressor.eof and decompressor.unconsumed_tail:
+            decompressor.decompress(decompressor.unconsumed_tail, _STREAM_CHECK_BYTES)
+    except zlib.error:
+        return False
+    return decompressor.eof
+
+
+def lane_settings() -> Dict[str, Tuple[int, float]]:
+    """Вес и доля ёмкости шарда по очередям (udp.worker_pool.lanes)"""
+    settings = {}
+    for name, (weight, share) in _LANE_DEFAULTS.items():
+        settings[name] = (
+            max(1, int(get_config_value('high_load', f'udp.worker_pool.lanes.{name}.weight', default=weight))),
+            float(get_config_value('high_load', f'udp.worker_pool.lanes.{name}.share', default=share)),
+        )
+    return settings
+
+
+class Lane:
+    """Очередь одного класса сообщений в шарде (под lock'ом шарда)."""
+
+    def __init__(self, name: str, weight: int, limit: int):
+        self.name = name
+        self.weight = weight
+        self.limit = limit
+        self.rank = SHED_ORDER.index(name)
+        self.coalesce = name == LANE_BALANCE
+        self.queue: Deque[Any] = deque()
+        self.current = 0  # текущий вес smooth weighted round-robin
+        # Ожидающее сообщение сервера (только для coalesce)
+        self.by_server: Dict[int, Any] = {}
+
+        self.enqueued = 0
+        self.processed = 0
+        self.coalesced = 0
+        self.shed = 0
+        self.rejected = 0
+        self.high_watermark = 0
+        self.latency_sum_ms = 0.0
+        self.max_latency_ms = 0.0
+
+    def append(self, message, coalesce: bool) -> None:
+        self.queue.append(message)
+        self.enqueued += 1
+        if coalesce:
+            self.by_server[message.server_id] = message
+        elif self.coalesce:
+            # Следующий acc сервера не должен обогнать этот пакет
+            self.by_server.pop(message.server_id, None)
+        if len(self.queue) > self.high_watermark:
+            self.high_watermark = len(self.queue)
+
+    def popleft(self):
+        message = self.queue.popleft()
+        if self.coalesce and self.by_server.get(message.server_id) is message:
+            del self.by_server[message.server_id]
+        return message
+
+
+class LaneShard:
+    """
+    Очереди одного шарда пула: put с приёмного потока, get - воркер шарда.
+    """
+
+    def __init__(self, capacity: int, settings: Dict[str, Tuple[int, float]]):
+        self.capacity = capacity
+        self.cond = threading.Condition()
+        self.lanes: Dict[str, Lane] = {
+            name: Lane(name, weight, max(1, int(capacity * share)))
+            for name, (weight, share) in settings.items()
+        }
+        self._lanes: List[Lane] = list(self.lanes.values())
+        self._shed_order: List[Lane] = [self.lanes[name] for name in SHED_ORDER]
+        self.depth = 0
+
+    def put(self, message, lane_name: str, coalesce: bool = True) -> Tuple[str, int]:
+        """
+        Поставить сообщение в очередь класса
+
+        Args:
+            message: Сообщение
+            lane_name: Очередь
+            coalesce: Может ли сообщение заменять ожидающее (и быть заменено)
+                в очереди с latest wins - False для фрагментов
+
+        Returns:
+            (PUT_*, сколько сообщений вытеснено)
+        """
+        with self.cond:
+            lane = self.lanes[lane_name]
+            coalesce = coalesce and lane.coalesce
+            if coalesce:
+                pending = lane.by_server.get(message.server_id)
+                if pending is not None:
+                    # Место в очереди и время приёма - от старого пакета
+                    pending.data = message.data
+                    pending.source_ip = message.source_ip
+                    pending.source_port = message.source_port
+                    lane.coalesced += 1
+                    return PUT_COALESCED, 0
+
+            shed = 0
+            if len(lane.queue) >= lane.limit:
+                if not lane.coalesce:
+                    lane.rejected += 1
+                    return PUT_REJECTED, 0
+                lane.popleft()
+                lane.shed += 1
+                self.depth -= 1
+                shed = 1
+            elif self.depth >= self.capacity:
+                victim = next((l for l in self._shed_order if l.queue and l.rank < lane.rank), None)
+                if victim is None:
+                    lane.rejected += 1
+                    return PUT_REJECTED, 0
+                victim.popleft()
+                victim.shed += 1
+                self.depth -= 1
+                shed = 1
+
+            lane.append(message, coalesce)
+            self.depth += 1
+            self.cond.notify()
+            return PUT_ACCEPTED, shed
+
+    def get(self, timeout: float):
+        """Следующее сообщение по весам очередей (None по таймауту)."""
+        with self.cond:
+            if not self.depth:
+                self.cond.wait(timeout)
+                if not self.depth:
+                    return None
+
+            total = 0
+            best = None
+            for lane in self._lanes:
+                if lane.queue:
+                    lane.current += lane.weight
+                    total += lane.weight
+                    if best is None or lane.current > best.current:
+                        best = lane
+            best.current -= total
+            self.depth -= 1
+            return best.popleft()
+
+    def record_processed(self, lane_name: str, latency_ms: float) -> None:
+        with self.cond:
+            lane = self.lanes[lane_name]
+            lane.processed += 1
+            lane.latency_sum_ms += latency_ms
+            if latency_ms > lane.max_latency_ms:
+                lane.max_latency_ms = latency_ms
+
+    def notify_all(self) -> None:
+        with self.cond:
+            self.cond.notify_all()
+
+
+def merge_lane_stats(shards: List[LaneShard]) -> Dict[str, Dict[str, Any]]:
+    """Статистика очередей по классам, суммированная по шардам"""
+    stats: Dict[str, Dict[str, Any]] = {}
+    for name in LANES:
+        depth = enqueued = processed = coalesced = shed = rejected = high_watermark = 0
+        latency_sum = max_latency = 0.0
+        weight = limit = 0
+        for shard in shards:
+            with shard.cond:
+                lane = shard.lanes[name]
+                depth += len(lane.queue)
+                enqueued += lane.enqueued
+                processed += lane.processed
+                coalesced += lane.coalesced
+                shed += lane.shed
+                rejected += lane.rejected
+                high_watermark = max(high_watermark, lane.high_watermark)
+                latency_sum += lane.latency_sum_ms
+                max_latency = max(max_latency, lane.max_latency_ms)
+                weight, limit = lane.weight, lane.limit
+        stats[name] = {
+            "weight": weight,
+            "limit_per_shard": limit,
+            "depth": depth,
+            "high_watermark": high_watermark,
+            "enqueued": enqueued,
+            "processed": processed,
+            "coalesced": coalesced,
+            "shed": shed,
+            "rejected": rejected,
+            "avg_latency_ms": round(latency_sum / processed, 2) if processed else 0.0,
+            "max_latency_ms": round(max_latency, 2),
+        }
+    return stats
@@ -0,0 +1,601 @@
+"""
+Бенчмарк приёма UDP: GlobalUDPSocket + UDPWorkerPool + BatchProcessor
+
+Флот симулятора (services/udp/simulator.py) работает в отдельном процессе,
+чтобы не делить GIL с приёмом, и шлёт пакеты на GlobalUDPSocket. Данные
+пишутся в отдельную чистую SQLite БД (рабочая БД не затрагивается).
+
+Запуск (из backend/):
+    python -m services.udp_benchmark [--servers N] [--duration SEC] [--save-baseline | --no-compare]
+
+Отчёт:
+- пропускная способность (отправлено / записано в БД, пакетов на сокете)
+- задержка отправка -> commit в БД (p50/p95/p99/max) по видам пакетов
+- потери: не записанные пакеты, queue/kernel drops, ошибки flush
+  (acc, заменённый в очереди более новым acc того же бота, не потерян:
+  его момент commit - commit первой более новой версии)
+- RTT команд lst через глобальный сокет во время нагрузки
+- с --lock-db SEC: эксклюзивная блокировка SQLite в середине прогона,
+  пакеты уходят в spool BatchProcessor и воспроизводятся после неё
+
+Результат сравнивается с baseline (data/benchmarks/udp_ingest_baseline.json).
+Baseline зависит от машины и в репозиторий не входит: первый прогон
+на машине - с --save-baseline. Код выхода 1 при регрессии, а также если
+baseline нет или он записан для другого сценария; --no-compare - только
+отчёт, без сравнения (например, для прогонов с --lock-db).
+"""
+
+import argparse
+import bisect
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import re
+import socket
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from utils.config_loader import get_config_value
+
+DEFAULT_BASELINE = Path("data/benchmarks/udp_ingest_baseline.json")
+
+# Допустимое ухудшение относительно baseline
+DEFAULT_TOLERANCE = 0.15
+# Рост задержки меньше этого не считается регрессией (шум таймеров)
+LATENCY_NOISE_MS = 5.0
+
+# Сколько ждать, пока пул и batch processor допишут хвост после отправки
+DRAIN_TIMEOUT_SECONDS = 60.0
+
+_ERROR_SEQ_RE = re.compile(r'#(\d+)$')
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/max (nearest rank) в миллисекундах"""
+    if not values:
+        return {"count": 0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    ordered = sorted(values)
+
+    def rank(q: float) -> float:
+        return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))]
+
+    return {
+        "count": len(ordered),
+        "p50": round(rank(0.50), 2),
+        "p95": round(rank(0.95), 2),
+        "p99": round(rank(0.99), 2),
+        "max": round(ordered[-1], 2),
+    }
+
+
+def _free_udp_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("", 0))
+        return sock.getsockname()[1]
+
+
+def _use_database(path: Path) -> None:
+    """
+    Направить приложение в отдельную SQLite БД
+
+    models.database создаёт engine при импорте, поэтому вызывать нужно
+    до первого импорта services.udp / models.
+    """
+    url = f"sqlite:///{path}"
+    if "models.database" in sys.modules:
+        if sys.modules["models.database"].DATABASE_URL != url:
+            raise RuntimeError("models.database already imported - run the benchmark in a fresh process")
+        return
+    os.environ[get_config_value('app', 'database.url_env', default='DATABASE_URL')] = url
+
+
+class _BenchListener:
+    """
+    Минимальный listener для GlobalUDPSocket (атрибуты, которые читают
+    global_socket.py и listener_commands.py)
+    """
+
+    use_global_socket = True
+    sock = None
+
+    def __init__(self, server_id: int, host: str, port: int, password: Optional[str], global_socket):
+        from services.udp.processors import MessageProcessor
+
+        self.server_id = server_id
+        self.host = host
+        self.port = port
+        self.password = password
+        self.global_socket = global_socket
+        self.processor = MessageProcessor(server_id, host, port)
+
+
+def _make_tracing_batch_processor():
+    """
+    BatchProcessor, запоминающий момент commit каждого пакета симулятора
+
+    Ключи - (вид, server_id, номер пакета), см. services/udp/simulator.py.
+    """
+    from services.udp.batch_processor import BatchProcessor
+    from services.udp.batch_processor_spool import BatchSpool
+    from services.udp.simulator import KIND_ORDER, KIND_BALANCE, KIND_CHART, KIND_ERROR
+
+    class TracingBatchProcessor(BatchProcessor):
+        def __init__(self):
+            super().__init__()
+            self.committed: Dict[Tuple[str, int, int], float] = {}
+            if self._spool is not None:
+                # Spool прогона - во временной директории, не в data/spool
+                self._spool = BatchSpool(
+                    Path(tempfile.mkdtemp(prefix="moonbot_spool_")),
+                    segment_max_bytes=self._spool.segment_max_bytes,
+                    max_total_bytes=self._spool.max_total_bytes,
+                    fsync=self._spool.fsync,
+                )
+
+        def _execute_batch(self, table, items):
+            super()._execute_batch(table, items)
+            now = time.time()
+            committed = self.committed
+            for item in items:
+                data = item.data
+                if table == 'moonbot_orders':
+                    key = (KIND_ORDER, data['server_id'], data.get('command_id'))
+                elif table == 'server_balance':
+                    key = (KIND_BALANCE, data['server_id'], data.get('version'))
+                elif table == 'moonbot_api_errors':
+                    match = _ERROR_SEQ_RE.search(data['error_text'])
+                    if not match:
+                        continue
+                    key = (KIND_ERROR, data['server_id'], int(match.group(1)))
+                elif table == 'moonbot_charts':
+                    key = (KIND_CHART, data['server_id'], data['order_db_id'])
+                else:
+                    continue
+                committed.setdefault(key, now)
+
+    return TracingBatchProcessor()
+
+
+def _wait_drained(global_socket, batch_processor, server_state, chart_pipeline, timeout: float) -> bool:
+    """Дождаться, пока сокет, пул, хранилище состояния, конвейер графиков и batch processor
+    обработают всё полученное"""
+    deadline = time.monotonic() + timeout
+    last_packets = -1
+    while time.monotonic() < deadline:
+        time.sleep(0.2)
+        stats = global_socket.get_stats()
+        pool = stats.get("worker_pool") or {}
+        batch_stats = batch_processor.get_stats()
+        state_stats = server_state.get_stats()
+        chart_stats = chart_pipeline.get_stats()
+        idle = (stats["total_packets"] == last_packets
+                and not pool.get("queue_size") and not pool.get("pending")
+                and not state_stats["dirty_balances"]
+                and not chart_stats["queued"] and chart_stats["parsed"] + chart_stats["parse_errors"]
+                + chart_stats["dropped"] >= chart_stats["submitted"]
+                and not batch_stats["pending"] and not batch_stats["spool"].get("pending_batches"))
+        if idle:
+            return True
+        last_packets = stats["total_packets"]
+    return False
+
+
+def _balance_commits(committed: Dict[Tuple[str, int, int], float],
+                     balance_kind: str) -> Dict[int, Tuple[List[int], List[float]]]:
+    """
+    Версии acc по серверам и минимальный момент commit версии >= каждой
+
+    Worker Pool заменяет необработанный acc сервера более новым (latest wins),
+    поэтому версия считается записанной, когда записана она или более новая.
+    """
+    by_server: Dict[int, List[Tuple[int, float]]] = {}
+    for (kind, server_id, version), committed_at in committed.items():
+        if kind == balance_kind and version is not None:
+            by_server.setdefault(server_id, []).append((version, committed_at))
+
+    result = {}
+    for server_id, items in by_server.items():
+        items.sort()
+        suffix_min = [0.0] * len(items)
+        earliest = float('inf')
+        for i in range(len(items) - 1, -1, -1):
+            earliest = min(earliest, items[i][1])
+            suffix_min[i] = earliest
+        result[server_id] = ([version for version, _ in items], suffix_min)
+    return result
+
+
+def _probe_commands(listeners: List[_BenchListener], interval: float, stop: threading.Event,
+                    rtts: List[float], failures: List[str]) -> None:
+    """Команды lst случайным серверам во время нагрузки (корреляция ответов в приёмном цикле)"""
+    from services.udp.listener_commands import send_command_with_response
+
+    rnd = random.Random(1)
+    while not stop.wait(interval):
+        listener = rnd.choice(listeners)
+        start = time.perf_counter()
+        success, response = send_command_with_response(listener, "lst", timeout=2.0)
+        if success and "Open Sell Orders:" in response:
+            rtts.append((time.perf_counter() - start) * 1000)
+        else:
+            failures.append(response[:80])
+
+
+def _lock_database(db_path: Path, delay: float, seconds: float, held: List[float]) -> None:
+    """Держать эксклюзивную блокировку SQLite (имитация VACUUM/зависшей БД)"""
+    time.sleep(delay)
+    conn = sqlite3.connect(str(db_path), isolation_level=None)
+    try:
+        start = time.monotonic()
+        conn.execute("BEGIN EXCLUSIVE")
+        time.sleep(seconds)
+        conn.execute("COMMIT")
+        held.append(time.monotonic() - start)
+    finally:
+        conn.close()
+
+
+def run_benchmark(config, duration: float, db_path: Path, command_interval: float = 0.5,
+                  lock_db: float = 0.0) -> Dict[str, Any]:
+    """
+    Прогнать флот через приём и собрать метрики
+
+    Должна вызываться в свежем процессе (см. _use_database).
+
+    Args:
+        config: FleetConfig симулятора
+        duration: Длительность отправки (секунды)
+        db_path: Файл SQLite БД для прогона (перезаписывается)
+        command_interval: Интервал команд lst (0 - без команд)
+        lock_db: Длительность эксклюзивной блокировки БД в середине отправки (0 - без неё)
+
+    Returns:
+        Отчёт (JSON-совместимый dict)
+    """
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+    _use_database(db_path)
+
+    from models import models
+    from models.database import Base, SessionLocal, engine
+    from services.udp import batch_processor as batch_module
+    from services.udp.chart_pipeline import get_chart_pipeline
+    from services.udp.global_socket import GlobalUDPSocket
+    from services.udp.server_state import get_server_state
+    from services.order_stats_rollup import install_order_stats_hooks
+    from services.udp.open_order_cache import install_open_order_cache_hooks
+    from services.udp.simulator import KINDS, KIND_BALANCE, run_fleet_process
+
+    Base.metadata.create_all(bind=engine)
+    # Как при старте приложения (core/events.py)
+    install_order_stats_hooks()
+    install_open_order_cache_hooks()
+
+    # Флот в отдельном процессе
+    context = multiprocessing.get_context("spawn")
+    parent_conn, child_conn = context.Pipe()
+    fleet = context.Process(target=run_fleet_process, args=(child_conn, config), daemon=True)
+    fleet.start()
+    addresses = parent_conn.recv()
+
+    db = SessionLocal()
+    try:
+        user = models.User(username="benchmark", email="benchmark@localhost", hashed_password="-")
+        db.add(user)
+        db.flush()
+        servers = [
+            models.Server(name=f"SimBot-{i}", host=host, port=port, user_id=user.id, is_localhost=True)
+            for i, (host, port) in enumerate(addresses)
+        ]
+        db.add_all(servers)
+        db.commit()
+        server_ids = [server.id for server in servers]
+    finally:
+        db.close()
+
+    tracer = _make_tracing_batch_processor()
+    batch_module._batch_processor = tracer
+    tracer.start()
+    server_state = get_server_state()
+    server_state.start()
+    chart_pipeline = get_chart_pipeline()
+    chart_pipeline.start()
+
+    global_socket = GlobalUDPSocket(port=_free_udp_port())
+    if not global_socket.start():
+        raise RuntimeError(f"Global socket failed to start: {global_socket.last_error}")
+
+    listeners = []
+    for i, (host, port) in enumerate(addresses):
+        listener = _BenchListener(server_ids[i], host, port, config.password_for(i), global_socket)
+        global_socket.register_listener(listener)
+        listeners.append(listener)
+        global_socket.send_command("SubscribeCharts", host, port, listener.password)
+    time.sleep(0.2)
+
+    stop_probe = threading.Event()
+    rtts: List[float] = []
+    failures: List[str] = []
+    probe = None
+    if command_interval > 0:
+        probe = threading.Thread(
+            target=_probe_commands, args=(listeners, command_interval, stop_probe, rtts, failures),
+            daemon=True, name="BenchmarkCommands"
+        )
+        probe.start()
+
+    lock_held: List[float] = []
+    locker = None
+    if lock_db > 0:
+        locker = threading.Thread(
+            target=_lock_database, args=(db_path, duration / 3, lock_db, lock_held),
+            daemon=True, name="BenchmarkDBLock"
+        )
+        locker.start()
+
+    parent_conn.send(("run", ("127.0.0.1", global_socket.port), duration))
+    send_log = parent_conn.recv()
+    stop_probe.set()
+    if probe:
+        probe.join()
+    if locker:
+        locker.join()
+
+    drained = _wait_drained(global_socket, tracer, server_state, chart_pipeline, DRAIN_TIMEOUT_SECONDS)
+    tracer.flush_all()
+    finished_at = time.time()
+
+    socket_stats = global_socket.get_stats()
+    pool_stats = socket_stats.get("worker_pool") or {}
+    spool_stats = tracer.get_stats()["spool"]
+    chart_stats = chart_pipeline.get_stats()
+    global_socket.stop()
+    chart_pipeline.stop()
+    server_state.stop()
+    tracer.stop()
+    parent_conn.send(("stop",))
+    fleet.join(timeout=5)
+
+    db = SessionLocal()
+    try:
+        committed = dict(tracer.committed)
+        orders_in_db = db.query(models.MoonBotOrder).count()
+        orders_closed = db.query(models.MoonBotOrder).filter(models.MoonBotOrder.status == "Closed").count()
+    finally:
+        db.close()
+
+    balance_commits = _balance_commits(committed, KIND_BALANCE)
+    latencies: Dict[str, List[float]] = {}
+    sent: Dict[str, int] = {}
+    lost: Dict[str, int] = {}
+    last_commit = send_log.started_at
+    for kind in KINDS:
+        values = latencies[kind] = []
+        for bot_index, key, sent_at in send_log.sent[kind]:
+            committed_at = committed.get((kind, server_ids[bot_index], key))
+            if committed_at is None and kind == KIND_BALANCE:
+                versions, suffix_min = balance_commits.get(server_ids[bot_index], ((), ()))
+                index = bisect.bisect_left(versions, key)
+                if index < len(versions):
+                    committed_at = suffix_min[index]
+            if committed_at is not None:
+                values.append((committed_at - sent_at) * 1000)
+                last_commit = max(last_commit, committed_at)
+        sent[kind] = len(send_log.sent[kind])
+        lost[kind] = sent[kind] - len(values)
+
+    send_seconds = max(send_log.finished_at - send_log.started_at, 1e-6)
+    ingest_seconds = max(last_commit - send_log.started_at, 1e-6)
+    persisted = sum(len(values) for values in latencies.values())
+
+    return {
+        "scenario": {
+            "servers": config.servers,
+            "duration": duration,
+            "order_rate": config.order_rate,
+            "balance_rate": config.balance_rate,
+            "error_rate": config.error_rate,
+            "chart_rate": config.chart_rate,
+            "workers": get_config_value('high_load', 'udp.worker_pool.workers', default=16),
+            "batch_size": tracer.batch_size,
+            "flush_interval_ms": tracer.flush_interval_ms,
+            # Прогон с блокировкой не сравнивается с обычным baseline
+            **({"lock_db": lock_db} if lock_db else {}),
+        },
+        "throughput": {
+            "sent_msg_s": round(sum(sent.values()) / send_seconds, 1),
+            "persisted_msg_s": round(persisted / ingest_seconds, 1),
+            "packets_s": round(send_log.packets / send_seconds, 1),
+        },
+        "sent": sent,
+        "lost": lost,
+        "latency_ms": {
+            **{kind: _percentiles(values) for kind, values in latencies.items()},
+            "all": _percentiles([v for values in latencies.values() for v in values]),
+        },
+        "drops": {
+            "queue_full_dropped": socket_stats["queue_full_dropped"],
+            "sync_fallbacks": socket_stats["sync_fallbacks"],
+            "kernel_drops": socket_stats["kernel_drops"],
+            "worker_dropped": pool_stats.get("messages_dropped", 0),
+            "worker_coalesced": pool_stats.get("messages_coalesced", 0),
+            "worker_errors": pool_stats.get("processing_errors", 0),
+            "batch_errors": tracer.get_stats()["total_errors"],
+            "chart_dropped": chart_stats["dropped"],
+            "chart_parse_errors": chart_stats["parse_errors"],
+            "bad_hmac": send_log.auth_failures,
+            "drained": drained,
+        },
+        "orders": {
+            "created": send_log.orders_created,
+            "in_db": orders_in_db,
+            "closed": send_log.orders_closed,
+            "closed_in_db": orders_closed,
+        },
+        "spool": {
+            "lock_held_s": round(lock_held[0], 2) if lock_held else 0.0,
+            "spooled_batches": spool_stats.get("appended", 0),
+            "replayed_batches": spool_stats.get("replayed", 0),
+            "dropped_batches": spool_stats.get("dropped", 0),
+            "pending_batches": spool_stats.get("pending_batches", 0),
+        },
+        "commands": {
+            "lst_ok": len(rtts),
+            "lst_failed": len(failures),
+            "rtt_ms": _percentiles(rtts),
+        },
+        "socket": {
+            "packets_received": socket_stats["total_packets"],
+            "packets_sent": send_log.packets,
+            "avg_batch_size": socket_stats["avg_batch_size"],
+            "queue_high_watermark": pool_stats.get("queue_high_watermark", 0),
+        },
+        "elapsed_seconds": round(finished_at - send_log.started_at, 2),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+    }
+
+
+def compare_with_baseline(result: Dict[str, Any], baseline: Dict[str, Any],
+                          tolerance: float = DEFAULT_TOLERANCE) -> Tuple[List[str], List[str]]:
+    """
+    Сравнить прогон с baseline
+
+    Returns:
+        (регрессии, предупреждения)
+    """
+    if result["scenario"] != baseline.get("scenario"):
+        return ["scenario differs from baseline - record a baseline for it with --save-baseline"], []
+
+    regressions = []
+    base_rate = baseline["throughput"]["persisted_msg_s"]
+    rate = result["throughput"]["persisted_msg_s"]
+    if rate < base_rate * (1 - tolerance):
+        regressions.append(f"throughput {rate:.0f} msg/s < baseline {base_rate:.0f} msg/s")
+
+    for kind, stats in result["latency_ms"].items():
+        base = baseline["latency_ms"].get(kind)
+        if not base or not base["count"]:
+            continue
+        limit = max(base["p95"] * (1 + tolerance), base["p95"] + LATENCY_NOISE_MS)
+        if stats["p95"] > limit:
+            regressions.append(f"{kind} p95 latency {stats['p95']:.1f} ms > baseline {base['p95']:.1f} ms")
+
+    lost = sum(result["lost"].values())
+    base_lost = sum(baseline["lost"].values())
+    if lost > base_lost:
+        regressions.append(f"lost {lost} messages (baseline {base_lost})")
+    return regressions, []
+
+
+def print_report(result: Dict[str, Any]) -> None:
+    throughput = result["throughput"]
+    print(f"Throughput: sent {throughput['sent_msg_s']:.0f} msg/s, persisted {throughput['persisted_msg_s']:.0f} msg/s, "
+          f"{throughput['packets_s']:.0f} packets/s")
+    print(f"{'kind':<8} {'sent':>8} {'lost':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for kind, stats in result["latency_ms"].items():
+        sent = result["sent"].get(kind, sum(result["sent"].values()))
+        lost = result["lost"].get(kind, sum(result["lost"].values()))
+        print(f"{kind:<8} {sent:>8} {lost:>6} {stats['p50']:>8.1f} {stats['p95']:>8.1f} "
+              f"{stats['p99']:>8.1f} {stats['max']:>8.1f}")
+    drops = result["drops"]
+    print(f"Drops: queue_full={drops['queue_full_dropped']} sync_fallbacks={drops['sync_fallbacks']} "
+          f"kernel={drops['kernel_drops']} "
+          f"worker={drops['worker_dropped']} coalesced={drops.get('worker_coalesced', 0)} "
+          f"worker_errors={drops['worker_errors']} "
+          f"batch_errors={drops['batch_errors']} chart_dropped={drops.get('chart_dropped', 0)} "
+          f"bad_hmac={drops['bad_hmac']}"
+          f"{'' if drops['drained'] else ' (NOT DRAINED)'}")
+    orders = result["orders"]
+    print(f"Orders: {orders['in_db']}/{orders['created']} in DB, {orders['closed_in_db']}/{orders['closed']} closed")
+    spool = result["spool"]
+    if spool["lock_held_s"] or spool["spooled_batches"]:
+        print(f"Spool: DB locked {spool['lock_held_s']:.1f}s, {spool['spooled_batches']} batches spooled, "
+              f"{spool['replayed_batches']} replayed, {spool['dropped_batches']} dropped, "
+              f"{spool['pending_batches']} pending")
+    commands = result["commands"]
+    print(f"lst: {commands['lst_ok']} ok, {commands['lst_failed']} failed, "
+          f"RTT p50={commands['rtt_ms']['p50']:.1f} ms p95={commands['rtt_ms']['p95']:.1f} ms")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="UDP ingest benchmark (fleet simulator -> SQLite)")
+    parser.add_argument("--servers", type=int, help="Ботов во флоте")
+    parser.add_argument("--duration", type=float, default=10.0, help="Длительность отправки (секунды)")
+    parser.add_argument("--order-rate", type=float, help="order/сек на бота")
+    parser.add_argument("--balance-rate", type=float, help="acc/сек на бота")
+    parser.add_argument("--error-rate", type=float, help="errors/сек на бота")
+    parser.add_argument("--chart-rate", type=float, help="графиков/сек на бота")
+    parser.add_argument("--command-interval", type=float, default=0.5, help="Интервал команд lst (0 - выкл)")
+    parser.add_argument("--db", type=Path, help="Файл SQLite (по умолчанию во временной директории)")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Записать результат как baseline")
+    parser.add_argument("--no-compare", action="store_true", help="Только отчёт, без сравнения с baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--json", type=Path, help="Сохранить отчёт в JSON")
+    parser.add_argument("--lock-db", type=float, default=0.0,
+                        help="Заблокировать БД на SEC секунд в середине прогона (проверка spool)")
+    args = parser.parse_args(argv)
+
+    # До импорта services.udp (он подключает models.database)
+    db_path = args.db or Path(tempfile.gettempdir()) / "moonbot_udp_benchmark.db"
+    _use_database(db_path)
+
+    from services.udp.simulator import FleetConfig
+
+    # Не заданные частоты - значения FleetConfig по умолчанию
+    config = FleetConfig(**{
+        name: value for name, value in (
+            ("servers", args.servers), ("order_rate", args.order_rate),
+            ("balance_rate", args.balance_rate), ("error_rate", args.error_rate),
+            ("chart_rate", args.chart_rate),
+        ) if value is not None
+    })
+
+    # Процессоры логируют каждый пакет графика
+    logging.getLogger("moonbot").setLevel(logging.WARNING)
+    logging.getLogger("services.chart_parser").setLevel(logging.WARNING)
+
+    result = run_benchmark(config, args.duration, db_path, args.command_interval, args.lock_db)
+    print_report(result)
+
+    if args.json:
+        args.json.write_text(json.dumps(result, indent=2))
+
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(result, indent=2))
+        print(f"Baseline saved: {args.baseline}")
+        return 0
+
+    if args.no_compare:
+        return 0
+
+    if not args.baseline.exists():
+        print(f"FAIL: no baseline at {args.baseline} - record one on this machine with --save-baseline "
+              f"(or pass --no-compare)")
+        return 1
+
+    regressions, warnings = compare_with_baseline(result, json.loads(args.baseline.read_text()), args.tolerance)
+    for warning in warnings:
+        print(f"WARNING: {warning}")
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    if not regressions and not warnings:
+        print("No regressions against baseline")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
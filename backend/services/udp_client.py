@@ -1,11 +1,16 @@
 """
 UDP Client для отправки команд и получения ответов
+
+Асинхронные методы (send_command, send_command_multi_response) работают через
+пул asyncio datagram endpoint'ов (services/udp_endpoint_pool.py) и не блокируют
+event loop. Синхронные *_sync версии - для scheduler и фоновых потоков.
 """
 import socket
 import asyncio
 import time
 from typing import Optional, Tuple
 from services.udp_pool import udp_socket_pool
+from services.udp_endpoint_pool import get_endpoint_pool
 from services.udp.hmac_helper import generate_hmac, build_message_with_hmac, decode_udp_message, mask_password
 from utils.logging import log
 
@@ -139,17 +144,7 @@ class UDPClient:
         if len(command) > self.MAX_COMMAND_SIZE:
             return False, f"Команда слишком большая: {len(command)} байт (макс {self.MAX_COMMAND_SIZE})"
 
-        sock = None
         try:
-            # Создаем UDP сокет
-            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            sock.settimeout(timeout)
-
-            # Если указан bind_port, привязываемся к нему
-            if bind_port:
-                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-                sock.bind(("", bind_port))
-
             # Формируем сообщение с HMAC если есть пароль
             message = build_message_with_hmac(command, password)
 
@@ -157,13 +152,10 @@ class UDPClient:
             try:
                 encoded_message = message.encode('utf-8')
             except UnicodeEncodeError as e:
-                if sock:
-                    sock.close()
                 return False, f"Ошибка кодирования команды: {str(e)}"
 
             # Финальная проверка размера
             if len(encoded_message) > self.MAX_UDP_SIZE:
-                sock.close()
                 return False, f"Сообщение слишком большое: {len(encoded_message)} байт (макс {self.MAX_UDP_SIZE})"
 
             # ДИАГНОСТИКА: Логируем отправку
@@ -173,48 +165,37 @@ class UDPClient:
             else:
                 log(f"[UDP-CLIENT] Sending: {command} -> {host}:{port} (no auth)")
 
-            # Отправляем команду
-            sock.sendto(encoded_message, (host, port))
-
-            # Получаем ответ (SQL отчеты от MoonBot могут быть большими)
-            try:
-                data, (response_addr, response_port) = sock.recvfrom(204800)  # Буфер 200KB для больших SQL отчетов
-                response = decode_udp_message(data)
+            # Отправляем через asyncio endpoint - event loop не блокируется
+            packets = await get_endpoint_pool().request(
+                host, port, encoded_message, timeout=timeout, bind_port=bind_port
+            )
+            if not packets:
+                return False, "Timeout: не получен ответ от сервера"
 
-                # ДИАГНОСТИКА: Логируем ответ
-                log(f"[UDP-CLIENT] Received from {response_addr}:{response_port}: {response[:80]}...")
+            response = decode_udp_message(packets[0])
 
-                sock.close()
+            # ДИАГНОСТИКА: Логируем ответ
+            log(f"[UDP-CLIENT] Received from {host}:{port}: {response[:80]}...")
 
-                # Проверяем на ошибки MoonBot
-                if response.startswith('ERR'):
-                    log(f"[UDP-CLIENT] ❌ ERROR from MoonBot: {response}")
-                    return False, response
+            # Проверяем на ошибки MoonBot
+            if response.startswith('ERR'):
+                log(f"[UDP-CLIENT] ❌ ERROR from MoonBot: {response}")
+                return False, response
 
-                log(f"[UDP-CLIENT] ✅ SUCCESS")
-                return True, response
-            except socket.timeout:
-                sock.close()
-                return False, "Timeout: не получен ответ от сервера"
-            except UnicodeDecodeError as e:
-                sock.close()
-                return False, f"Ошибка декодирования ответа: {str(e)}"
+            log(f"[UDP-CLIENT] ✅ SUCCESS")
+            return True, response
 
+        except UnicodeDecodeError as e:
+            return False, f"Ошибка декодирования ответа: {str(e)}"
         except socket.gaierror as e:
-            if sock:
-                sock.close()
             return False, f"Ошибка DNS: {str(e)}"
         except ConnectionRefusedError:
-            if sock:
-                sock.close()
             return False, "Соединение отклонено: проверьте адрес и порт сервера"
+        except asyncio.TimeoutError:
+            return False, "Timeout: все UDP endpoint'ы заняты запросами к этому серверу"
         except OSError as e:
-            if sock:
-                sock.close()
             return False, f"Сетевая ошибка: {str(e)}"
         except Exception as e:
-            if sock:
-                sock.close()
             return False, f"Неизвестная ошибка: {str(e)}"
 
     async def send_command_multi_response(
@@ -250,39 +231,17 @@ class UDPClient:
             timeout = self.timeout
 
         try:
-            # Создаем UDP сокет
-            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            sock.settimeout(packet_timeout)  # Timeout между пакетами
-
             # Формируем сообщение с HMAC если есть пароль
             message = build_message_with_hmac(command, password)
 
             # Кодируем команду в UTF-8
             encoded_message = message.encode('utf-8')
 
-            # Отправляем команду
-            sock.sendto(encoded_message, (host, port))
-
-            responses = []
-            start_time = time.time()
-
-            # Собираем все пакеты пока не истечет общий timeout
-            while time.time() - start_time < timeout:
-                try:
-                    data, _ = sock.recvfrom(204800)  # Буфер 200KB
-                    response = decode_udp_message(data)
-                    responses.append(response)
-
-                except socket.timeout:
-                    # Если пауза между пакетами > packet_timeout - считаем что все получили
-                    if responses:
-                        break
-                    # Если еще не получили ни одного пакета - продолжаем ждать
-                    if time.time() - start_time >= timeout:
-                        break
-                    continue
-
-            sock.close()
+            # Собираем все пакеты пока не истечет общий timeout или пауза между пакетами
+            packets = await get_endpoint_pool().request(
+                host, port, encoded_message, timeout=timeout, packet_timeout=packet_timeout
+            )
+            responses = [decode_udp_message(data) for data in packets]
 
             if responses:
                 # Объединяем все пакеты через перенос строки
@@ -300,6 +259,8 @@ class UDPClient:
             return False, f"Ошибка DNS: {str(e)}"
         except ConnectionRefusedError:
             return False, "Соединение отклонено: проверьте адрес и порт сервера"
+        except asyncio.TimeoutError:
+            return False, "Timeout: все UDP endpoint'ы заняты запросами к этому серверу"
         except OSError as e:
             return False, f"Сетевая ошибка: {str(e)}"
         except Exception as e:
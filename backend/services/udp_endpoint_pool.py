@@ -0,0 +1,359 @@
+"""
+Пул asyncio UDP endpoint'ов для отправки команд
+
+UDPClient.send_command / send_command_multi_response работают через
+asyncio datagram endpoint'ы и не блокируют event loop FastAPI.
+
+Мультиплексирование:
+- Небольшой пул endpoint'ов (локальных UDP портов) на event loop
+- MoonBot не передаёт ID запроса в ответе, поэтому ответ сопоставляется
+  по паре (endpoint, IP сервера): на одном endpoint'е одновременно может
+  быть только один запрос к одному IP
+- Команды к разным серверам идут параллельно через один endpoint,
+  к одному серверу - через разные endpoint'ы пула
+- После таймаута пара (endpoint, IP) на короткое время в карантине:
+  опоздавший ответ отбрасывается, а не достаётся следующей команде
+
+Запрос с bind_port использует временный endpoint на этом порту
+(закрывается сразу после ответа, как и прежний блокирующий сокет -
+порт не удерживается и не конфликтует с listener'ом).
+"""
+import asyncio
+import ipaddress
+import socket
+import time
+import weakref
+from typing import Dict, List, Optional, Tuple
+
+from utils.config_loader import get_config_value
+from utils.logging import log
+
+
+class _EndpointProtocol(asyncio.DatagramProtocol):
+    """Протокол asyncio - передаёт события в UDPEndpoint"""
+
+    def __init__(self, endpoint: 'UDPEndpoint'):
+        self.endpoint = endpoint
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        self.endpoint._on_datagram(data, addr)
+
+    def error_received(self, exc: Exception) -> None:
+        self.endpoint._on_error(exc)
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self.endpoint._on_closed(exc)
+
+
+class UDPEndpoint:
+    """
+    Один локальный UDP порт с ожидающими ответа запросами
+
+    Ожидающий запрос - очередь датаграмм по IP сервера.
+    """
+
+    def __init__(self, name: str, stale_grace: float):
+        self.name = name
+        self.stale_grace = stale_grace
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self.closed = False
+
+        # IP сервера -> очередь ответов текущего запроса
+        self._waiters: Dict[str, asyncio.Queue] = {}
+        # IP сервера -> время окончания карантина (monotonic)
+        self._quarantine: Dict[str, float] = {}
+
+        self.sent = 0
+        self.received = 0
+        self.stale_dropped = 0
+        self.errors = 0
+
+    def is_free(self, ip: str, now: float) -> bool:
+        """Можно ли отправить запрос к IP через этот endpoint"""
+        if self.closed or ip in self._waiters:
+            return False
+        until = self._quarantine.get(ip)
+        if until is not None:
+            if now < until:
+                return False
+            del self._quarantine[ip]
+        return True
+
+    def acquire(self, ip: str) -> asyncio.Queue:
+        """Зарегистрировать ожидание ответа от IP"""
+        queue: asyncio.Queue = asyncio.Queue()
+        self._waiters[ip] = queue
+        return queue
+
+    def release(self, ip: str, quarantine: bool) -> None:
+        """Снять ожидание; quarantine=True - возможен опоздавший ответ"""
+        self._waiters.pop(ip, None)
+        if quarantine and self.stale_grace > 0:
+            self._quarantine[ip] = time.monotonic() + self.stale_grace
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._waiters)
+
+    def send(self, data: bytes, addr: Tuple[str, int]) -> None:
+        """Отправить датаграмму (не блокирует)"""
+        self.transport.sendto(data, addr)
+        self.sent += 1
+
+    def close(self) -> None:
+        """Закрыть endpoint"""
+        self.closed = True
+        if self.transport is not None:
+            self.transport.close()
+
+    def _on_datagram(self, data: bytes, addr) -> None:
+        queue = self._waiters.get(addr[0])
+        if queue is None:
+            # Ответ на запрос, который уже завершился по таймауту
+            self.stale_dropped += 1
+            return
+        self.received += 1
+        queue.put_nowait(data)
+
+    def _on_error(self, exc: Exception) -> None:
+        # ICMP (например, port unreachable) не содержит адреса -
+        # можно однозначно передать ошибку только единственному ожидающему
+        self.errors += 1
+        if len(self._waiters) == 1:
+            next(iter(self._waiters.values())).put_nowait(exc)
+
+    def _on_closed(self, exc: Optional[Exception]) -> None:
+        self.closed = True
+        error = exc or ConnectionError("UDP endpoint closed")
+        for queue in self._waiters.values():
+            queue.put_nowait(error)
+
+    def get_stats(self) -> dict:
+        return {
+            "name": self.name,
+            "in_flight": self.in_flight,
+            "sent": self.sent,
+            "received": self.received,
+            "stale_dropped": self.stale_dropped,
+            "errors": self.errors,
+            "closed": self.closed,
+        }
+
+
+class UDPEndpointPool:
+    """
+    Пул UDP endpoint'ов одного event loop
+
+    Все методы вызываются только из своего event loop.
+    """
+
+    def __init__(self, size: int, recv_buffer_size: int, stale_grace: float):
+        self.size = max(1, size)
+        self.recv_buffer_size = recv_buffer_size
+        self.stale_grace = stale_grace
+
+        self._endpoints: List[UDPEndpoint] = []
+        self._start_lock = asyncio.Lock()
+        self._released = asyncio.Condition()
+
+        self.requests = 0
+        self.timeouts = 0
+        self.waits_for_endpoint = 0
+
+    async def _create_endpoint(self, name: str, bind_port: int = 0) -> UDPEndpoint:
+        """Создать endpoint на локальном порту (0 - эфемерный)"""
+        loop = asyncio.get_running_loop()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            if bind_port:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.recv_buffer_size)
+            except OSError:
+                pass  # Система может ограничивать размер буфера
+            sock.bind(("", bind_port))
+            sock.setblocking(False)
+
+            endpoint = UDPEndpoint(name, self.stale_grace)
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda: _EndpointProtocol(endpoint), sock=sock
+            )
+        except Exception:
+            sock.close()
+            raise
+
+        endpoint.transport = transport
+        return endpoint
+
+    async def _ensure_started(self) -> None:
+        """Создать endpoint'ы пула (лениво, при первом запросе)"""
+        if len(self._endpoints) >= self.size and not any(e.closed for e in self._endpoints):
+            return
+        async with self._start_lock:
+            self._endpoints = [e for e in self._endpoints if not e.closed]
+            while len(self._endpoints) < self.size:
+                endpoint = await self._create_endpoint(f"pool-{len(self._endpoints)}")
+                self._endpoints.append(endpoint)
+
+    async def _acquire(self, ip: str, deadline: float) -> Tuple[UDPEndpoint, asyncio.Queue]:
+        """Занять endpoint пула, свободный для IP, ожидая не дольше deadline"""
+        await self._ensure_started()
+        candidates = self._endpoints
+
+        waited = False
+        async with self._released:
+            while True:
+                now = time.monotonic()
+                for endpoint in candidates:
+                    if endpoint.is_free(ip, now):
+                        return endpoint, endpoint.acquire(ip)
+
+                remaining = deadline - now
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                if not waited:
+                    self.waits_for_endpoint += 1
+                    waited = True
+                # Ждём освобождения или окончания карантина
+                try:
+                    await asyncio.wait_for(
+                        self._released.wait(), timeout=min(remaining, max(self.stale_grace, 0.05))
+                    )
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _release(self, endpoint: UDPEndpoint, ip: str, quarantine: bool) -> None:
+        endpoint.release(ip, quarantine)
+        async with self._released:
+            self._released.notify_all()
+
+    async def request(
+        self,
+        host: str,
+        port: int,
+        payload: bytes,
+        timeout: float,
+        packet_timeout: Optional[float] = None,
+        bind_port: Optional[int] = None
+    ) -> List[bytes]:
+        """
+        Отправить датаграмму и дождаться ответа
+
+        Args:
+            host: IP или имя хоста
+            port: UDP порт
+            payload: Данные для отправки
+            timeout: Общий таймаут (секунды)
+            packet_timeout: None - вернуть первый пакет;
+                иначе собирать пакеты, пока пауза между ними меньше packet_timeout
+            bind_port: Локальный порт (None - пул)
+
+        Returns:
+            Список полученных пакетов (пустой - таймаут)
+
+        Raises:
+            socket.gaierror: не удалось разрешить имя хоста
+            OSError: сетевая ошибка (в т.ч. ConnectionRefusedError)
+        """
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + timeout
+        ip = await _resolve_host(loop, host, port)
+
+        if bind_port:
+            endpoint = await self._create_endpoint(f"bind-{bind_port}", bind_port)
+            queue = endpoint.acquire(ip)
+        else:
+            endpoint, queue = await self._acquire(ip, deadline)
+        self.requests += 1
+        packets: List[bytes] = []
+        completed = False
+        try:
+            endpoint.send(payload, (ip, port))
+
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                wait = remaining if not packets else min(remaining, packet_timeout)
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=wait)
+                except asyncio.TimeoutError:
+                    break
+
+                if isinstance(item, Exception):
+                    raise item
+                packets.append(item)
+                if packet_timeout is None:
+                    break
+
+            # Многопакетный ответ завершается паузой - сервер мог успеть
+            # отправить ещё пакет, поэтому пару тоже кладём в карантин
+            completed = bool(packets) and packet_timeout is None
+            if not packets:
+                self.timeouts += 1
+            return packets
+        finally:
+            if bind_port:
+                endpoint.close()
+            else:
+                await self._release(endpoint, ip, quarantine=not completed)
+
+    def close(self) -> None:
+        """Закрыть все endpoint'ы"""
+        for endpoint in self._endpoints:
+            endpoint.close()
+        self._endpoints = []
+
+    def get_stats(self) -> dict:
+        endpoints = self._endpoints
+        return {
+            "size": self.size,
+            "requests": self.requests,
+            "timeouts": self.timeouts,
+            "waits_for_endpoint": self.waits_for_endpoint,
+            "in_flight": sum(e.in_flight for e in endpoints),
+            "endpoints": [e.get_stats() for e in endpoints],
+        }
+
+
+async def _resolve_host(loop: asyncio.AbstractEventLoop, host: str, port: int) -> str:
+    """IP адрес хоста (IP литерал без обращения к DNS)"""
+    try:
+        return str(ipaddress.IPv4Address(host))
+    except ValueError:
+        pass
+    infos = await loop.getaddrinfo(host, port, family=socket.AF_INET, type=socket.SOCK_DGRAM)
+    return infos[0][4][0]
+
+
+# Пулы по event loop (FastAPI + asyncio.run в фоновых потоках)
+_pools: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, UDPEndpointPool]' = weakref.WeakKeyDictionary()
+
+
+def get_endpoint_pool() -> UDPEndpointPool:
+    """Получить пул endpoint'ов текущего event loop"""
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        pool = UDPEndpointPool(
+            size=get_config_value('high_load', 'udp.client.endpoint_pool_size', default=4),
+            recv_buffer_size=get_config_value('high_load', 'udp.client.recv_buffer_size', default=4194304),
+            stale_grace=get_config_value('high_load', 'udp.client.stale_response_grace', default=1.0),
+        )
+        _pools[loop] = pool
+    return pool
+
+
+def close_endpoint_pools() -> None:
+    """Закрыть пулы всех event loop'ов (при остановке приложения)"""
+    for pool in list(_pools.values()):
+        try:
+            pool.close()
+        except Exception as e:
+            log(f"[UDP-CLIENT] Error closing endpoint pool: {e}", level="WARNING")
+    _pools.clear()
+
+
+def get_endpoint_pool_stats() -> List[dict]:
+    """Статистика всех пулов"""
+    return [pool.get_stats() for pool in list(_pools.values())]
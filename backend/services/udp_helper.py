@@ -40,10 +40,8 @@ async def send_command_unified(
     if listener and listener.running:
         log(f"[UDP-HELPER] Sending command to server {server.id} through listener")
         try:
-            success, response = listener.send_command_with_response(
-                command,
-                timeout=timeout
-            )
+            # Ответ ожидается через future корреляции - поток не занимается
+            success, response = await listener.send_command_async(command, timeout=timeout)
             log(f"[UDP-HELPER] Listener response: success={success}")
             return success, response
         except Exception as e:
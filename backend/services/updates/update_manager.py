@@ -42,6 +42,7 @@ class UpdateManager(GitHubAPIMixin):
         "backups",
         "logs",
         "data/charts",
+        "data/spool",
     ]
     
     def __init__(self):
@@ -0,0 +1,293 @@
+"""
+Тесты дискового spool BatchProcessor (batch_processor_spool.py)
+
+Пока БД заблокирована, пакеты дописываются в сегменты spool
+(запись с crc32, переход на новый сегмент по segment_max_bytes).
+После разблокировки writer воспроизводит их по порядку, без повторов;
+повреждённый хвост сегмента пропускается, остальные пакеты не теряются.
+"""
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from models import models
+from services.udp import batch_processor as batch_processor_module
+from services.udp.batch_processor import BatchProcessor
+from services.udp.batch_processor_spool import BatchSpool, decode_batch
+
+MAGIC = b'MBSPOOL1'
+RECORD_HEADER = struct.Struct('<II')
+
+TABLE = 'sql_command_log'
+BATCHES = 40
+ITEMS_PER_BATCH = 3
+SEGMENT_MAX_BYTES = 2048
+
+
+class DatabaseLock:
+    """Имитация заблокированной SQLite: любой запрос - 'database is locked'"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.locked = False
+        event.listen(engine, "before_cursor_execute", self._check)
+
+    def _check(self, conn, cursor, statement, parameters, context, executemany):
+        if self.locked:
+            raise OperationalError(statement, parameters, sqlite3.OperationalError("database is locked"))
+
+    def remove(self):
+        event.remove(self.engine, "before_cursor_execute", self._check)
+
+
+@pytest.fixture
+def db_lock(test_db):
+    lock = DatabaseLock(test_db.get_bind())
+    yield lock
+    lock.remove()
+
+
+@pytest.fixture
+def server_id(test_db) -> int:
+    user = models.User(username="spool", email="spool@example.com", hashed_password="-")
+    test_db.add(user)
+    test_db.flush()
+    server = models.Server(name="Spool", host="127.0.0.1", port=5005, user_id=user.id)
+    test_db.add(server)
+    test_db.commit()
+    return server.id
+
+
+@pytest.fixture
+def processor(test_db, tmp_path, monkeypatch):
+    """BatchProcessor без writer потока: пакеты пишутся в вызывающем потоке"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(
+        batch_processor_module, "SessionLocal",
+        sessionmaker(autocommit=False, autoflush=False, bind=test_db.get_bind())
+    )
+    processor = BatchProcessor(batch_size=1000, flush_interval_ms=100)
+    if processor._spool is not None:
+        processor._spool.close()
+    processor._spool = BatchSpool(
+        tmp_path / "spool", segment_max_bytes=SEGMENT_MAX_BYTES, max_total_bytes=10 * 1024 * 1024, fsync=False
+    )
+    yield processor
+    processor._spool.close()
+
+
+def command(server_id: int, batch: int, n: int) -> dict:
+    return {
+        'server_id': server_id,
+        'command_id': batch * ITEMS_PER_BATCH + n,
+        'sql_text': f"update Orders set Status=1 where ID={batch}",
+    }
+
+
+def write_batches(processor: BatchProcessor, server_id: int, batches: range) -> None:
+    for batch in batches:
+        for n in range(ITEMS_PER_BATCH):
+            processor.add(TABLE, 'insert', command(server_id, batch, n))
+        processor.flush_all()
+
+
+def read_segments(directory):
+    """Пакеты из файлов сегментов: [(номер сегмента, таблица, command_id)]"""
+    records = []
+    for path in sorted(directory.glob("*.seg")):
+        data = path.read_bytes()
+        assert data[:len(MAGIC)] == MAGIC
+        offset = len(MAGIC)
+        while offset < len(data):
+            length, checksum = RECORD_HEADER.unpack_from(data, offset)
+            payload = data[offset + RECORD_HEADER.size:offset + RECORD_HEADER.size + length]
+            assert len(payload) == length
+            assert zlib.crc32(payload) == checksum
+            table, items = decode_batch(payload)
+            records.append((int(path.stem), table, [item[1]['command_id'] for item in items]))
+            offset += RECORD_HEADER.size + length
+    return records
+
+
+def replay_all(processor: BatchProcessor) -> None:
+    for _ in range(BATCHES):
+        if not processor._spooling():
+            return
+        processor._next_replay_at = 0.0
+        processor._replay_spool()
+    assert not processor._spooling()
+
+
+def stored_command_ids(test_db) -> list:
+    test_db.expire_all()
+    return [row.command_id for row in test_db.query(models.SQLCommandLog).order_by(models.SQLCommandLog.id)]
+
+
+def test_locked_db_spools_and_replays_in_order(processor, db_lock, server_id, test_db, tmp_path):
+    write_batches(processor, server_id, range(0, 2))
+
+    db_lock.locked = True
+    write_batches(processor, server_id, range(2, BATCHES))
+
+    stats = processor.get_spool_stats()
+    assert stats["pending_batches"] == BATCHES - 2
+    assert stats["appended"] == BATCHES - 2
+    assert processor.get_stats()["total_errors"] == 0
+
+    # Записи целые (crc), порядок сохранён, сегменты переключаются по размеру
+    records = read_segments(tmp_path / "spool")
+    assert [ids for _, _, ids in records] == [
+        [command(server_id, batch, n)['command_id'] for n in range(ITEMS_PER_BATCH)]
+        for batch in range(2, BATCHES)
+    ]
+    assert {table for _, table, _ in records} == {TABLE}
+    segments = sorted({seq for seq, _, _ in records})
+    assert len(segments) > 1
+    for seq in segments:
+        assert (tmp_path / "spool" / f"{seq:012d}.seg").stat().st_size <= SEGMENT_MAX_BYTES
+
+    # Пока БД заблокирована, воспроизведение откладывается без потерь
+    processor._replay_spool()
+    assert processor.get_spool_stats()["pending_batches"] == BATCHES - 2
+
+    db_lock.locked = False
+    replay_all(processor)
+
+    expected = [command(server_id, batch, n)['command_id'] for batch in range(BATCHES) for n in range(ITEMS_PER_BATCH)]
+    assert stored_command_ids(test_db) == expected
+    stats = processor.get_spool_stats()
+    assert stats["replayed"] == BATCHES - 2
+    assert stats["pending_batches"] == 0
+    assert stats["corrupted"] == 0
+
+    # После опустошения spool запись снова идёт напрямую
+    write_batches(processor, server_id, range(BATCHES, BATCHES + 1))
+    assert stored_command_ids(test_db)[-ITEMS_PER_BATCH:] == [
+        command(server_id, BATCHES, n)['command_id'] for n in range(ITEMS_PER_BATCH)
+    ]
+    assert processor.get_spool_stats()["appended"] == BATCHES - 2
+
+
+def test_restart_resumes_without_duplicates(processor, db_lock, server_id, test_db, tmp_path):
+    db_lock.locked = True
+    write_batches(processor, server_id, range(BATCHES))
+    db_lock.locked = False
+
+    # Часть пакетов воспроизведена до остановки
+    for _ in range(5):
+        record = processor._spool.peek()
+        table, items, position, size = record
+        processor._execute_batch(table, [
+            batch_processor_module.BatchItem(table=table, operation=op, data=data, created_at=created_at)
+            for op, data, created_at in items
+        ])
+        processor._spool.commit(position, size)
+    processor._spool.close()
+
+    processor._spool = BatchSpool(
+        tmp_path / "spool", segment_max_bytes=SEGMENT_MAX_BYTES, max_total_bytes=10 * 1024 * 1024, fsync=False
+    )
+    assert processor.get_spool_stats()["pending_batches"] == BATCHES - 5
+    replay_all(processor)
+
+    expected = [command(server_id, batch, n)['command_id'] for batch in range(BATCHES) for n in range(ITEMS_PER_BATCH)]
+    assert stored_command_ids(test_db) == expected
+
+
+@pytest.mark.parametrize("damage", ["truncate", "flip"])
+def test_corrupt_segment_tail_is_skipped(tmp_path, damage):
+    spool = BatchSpool(tmp_path, segment_max_bytes=SEGMENT_MAX_BYTES, max_total_bytes=10 * 1024 * 1024, fsync=False)
+    for batch in range(BATCHES):
+        assert spool.append(TABLE, [('insert', {'command_id': batch, 'sql_text': 'x' * 100}, 0.0)])
+    spool.close()
+
+    records = read_segments(tmp_path)
+    first_segment = records[0][0]
+    in_first = [ids[0] for seq, _, ids in records if seq == first_segment]
+    assert len(in_first) >= 3
+    path = tmp_path / f"{first_segment:012d}.seg"
+    data = bytearray(path.read_bytes())
+    if damage == "truncate":
+        # Обрыв записи посреди последнего пакета сегмента
+        del data[-10:]
+        lost = in_first[-1:]
+    else:
+        # Испорченный байт во втором пакете - остаток сегмента не читается
+        offset = len(MAGIC)
+        length, _ = RECORD_HEADER.unpack_from(data, offset)
+        offset += RECORD_HEADER.size + length
+        data[offset + RECORD_HEADER.size + 5] ^= 0xFF
+        lost = in_first[1:]
+    path.write_bytes(bytes(data))
+
+    spool = BatchSpool(tmp_path, segment_max_bytes=SEGMENT_MAX_BYTES, max_total_bytes=10 * 1024 * 1024, fsync=False)
+    replayed = []
+    while True:
+        record = spool.peek()
+        if record is None:
+            break
+        table, items, position, size = record
+        assert table == TABLE
+        replayed.extend(item[1]['command_id'] for item in items)
+        spool.commit(position, size)
+
+    assert replayed == [batch for batch in range(BATCHES) if batch not in lost]
+    assert spool.get_stats()["corrupted"] == 1
+    assert not spool.has_pending
+    assert list(tmp_path.glob("*.seg")) == []
+
+
+def hand_off_batches(processor: BatchProcessor, server_id: int, batches: range) -> None:
+    """Передать пакеты в очередь writer'а (writer не запущен - пакеты ждут в _handoff)"""
+    for batch in batches:
+        for n in range(ITEMS_PER_BATCH):
+            processor.add(TABLE, 'insert', command(server_id, batch, n))
+        with processor._locks[TABLE]:
+            processor._flush_table(TABLE)
+
+
+def test_monitor_spools_queue_outside_handoff_lock(processor, server_id, tmp_path):
+    # Writer "завис" на пакете из spool; монитор переносит очередь на диск
+    processor._running = True
+    hand_off_batches(processor, server_id, range(0, 3))
+    assert len(processor._handoff) == 3
+
+    entered = threading.Event()
+    release = threading.Event()
+    append = processor._spool.append
+
+    def slow_append(table, records):
+        entered.set()
+        assert release.wait(5)
+        return append(table, records)
+
+    processor._spool.append = slow_append
+    processor.latency_budget = 0.01
+    processor._inflight_since = time.monotonic() - 1.0
+    monitor = threading.Thread(target=processor._spool_monitor_loop, daemon=True)
+    monitor.start()
+    try:
+        assert entered.wait(5)
+        # Пока монитор пишет на диск, производители не ждут _handoff_cond
+        started = time.monotonic()
+        hand_off_batches(processor, server_id, range(3, 4))
+        assert time.monotonic() - started < 1.0
+        assert processor._spooling()
+    finally:
+        release.set()
+        processor._inflight_since = None
+        processor._running = False
+        monitor.join(5)
+
+    assert [ids for _, _, ids in read_segments(tmp_path / "spool")][:3] == [
+        [command(server_id, batch, n)['command_id'] for n in range(ITEMS_PER_BATCH)]
+        for batch in range(3)
+    ]
+    assert processor._spool_unwritten == 0
@@ -0,0 +1,34 @@
+"""
+Тесты списка графиков ChartStorage (индекс chart_storage_index.py)
+
+Keyset пагинация по (created_at, path) с курсором из ответа должна
+вернуть каждый график ровно один раз - в том числе графики,
+сохранённые в одну и ту же секунду.
+"""
+from datetime import datetime, timedelta
+
+from services.chart_storage import ChartStorage
+
+
+def test_list_charts_pages_through_same_second(tmp_path):
+    storage = ChartStorage(tmp_path / "charts")
+    base = datetime.now().replace(microsecond=0) - timedelta(minutes=5)
+    saved = set()
+    for order_id in range(1, 23):
+        # По 7-8 графиков в секунду, время с микросекундами как у живых сохранений
+        ts = base + timedelta(seconds=order_id // 8, microseconds=order_id * 1000 % 3000)
+        path = storage.save_json(f"server_{order_id % 2}", order_id, {"order_id": order_id}, ts)
+        saved.add(str(path))
+
+    seen = []
+    before = before_path = None
+    while True:
+        page = storage.list_charts(limit=5, before=before, before_path=before_path)
+        seen.extend(chart['path'] for chart in page)
+        if len(page) < 5:
+            break
+        before, before_path = page[-1]['created_at'], page[-1]['relpath']
+
+    assert len(seen) == len(saved)
+    assert set(seen) == saved
+    storage.index.close()
@@ -0,0 +1,113 @@
+"""
+Тесты мультиплексированного приёма (listener_reactor.py)
+
+Если цикл reactor'а падает, reactor перестаёт принимать listener'ы,
+а его listener'ы переезжают на рабочий reactor с новым сокетом.
+"""
+import time
+
+import pytest
+
+from services.udp import listener_reactor
+
+
+class FakeListener:
+    """Минимальный UDPListener для reactor'а (без отправки команд)"""
+
+    def __init__(self, server_id: int):
+        self.server_id = server_id
+        self.host = "127.0.0.1"
+        self.port = 5005
+        self.local_port = 0
+        self.keepalive_enabled = False
+        self.running = True
+        self.sock = None
+        self.reactor = None
+        self.last_error = None
+        self.commands = []
+
+    def _send_command_from_listener(self, command: str) -> None:
+        self.commands.append(command)
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+@pytest.fixture(autouse=True)
+def reactors(monkeypatch):
+    monkeypatch.setattr(listener_reactor, "start_worker_pool", lambda: None)
+    listener_reactor.stop_all_reactors()
+    yield
+    listener_reactor.stop_all_reactors()
+
+
+def crash(reactor: listener_reactor.ListenerReactor) -> None:
+    """Ошибка вне callback'ов - цикл reactor'а завершается"""
+    def broken_timers():
+        raise RuntimeError("reactor is broken")
+
+    reactor._run_timers = broken_timers
+    reactor._wakeup()
+    reactor._thread.join(timeout=5)
+    assert not reactor._thread.is_alive()
+
+
+def test_failed_reactor_rehomes_listeners():
+    listeners = [FakeListener(server_id) for server_id in (1, 2)]
+    for listener in listeners:
+        listener.reactor = listener_reactor.attach_listener(listener)
+    dead = listeners[0].reactor
+    assert all(listener.reactor is dead for listener in listeners)
+    assert wait_for(lambda: all(listener.sock is not None for listener in listeners))
+    old_socks = [listener.sock for listener in listeners]
+
+    crash(dead)
+
+    assert not dead.has_capacity()
+    assert dead.get_stats()["running"] is False
+    assert dead.last_error == "reactor is broken"
+    assert dead not in listener_reactor._reactors
+
+    for listener, old_sock in zip(listeners, old_socks):
+        assert listener.reactor is not dead
+        assert listener.reactor.has_capacity()
+        assert old_sock.fileno() == -1
+    assert wait_for(lambda: all(listener.sock is not None for listener in listeners))
+
+    # Новые listener'ы не попадают на упавший reactor
+    newcomer = FakeListener(3)
+    newcomer.reactor = listener_reactor.attach_listener(newcomer)
+    assert newcomer.reactor is listeners[0].reactor
+    assert wait_for(lambda: newcomer.sock is not None)
+
+
+def test_stopped_listener_is_not_rehomed():
+    listener = FakeListener(1)
+    listener.reactor = listener_reactor.attach_listener(listener)
+    dead = listener.reactor
+    assert wait_for(lambda: listener.sock is not None)
+    listener.running = False
+
+    crash(dead)
+
+    assert listener.reactor is dead
+    assert listener.sock is None
+    assert listener_reactor.get_reactor_stats() == []
+
+
+def test_remove_listener_from_failed_reactor_does_not_block():
+    listener = FakeListener(1)
+    reactor = listener_reactor.attach_listener(listener)
+    assert wait_for(lambda: listener.sock is not None)
+    listener.running = False
+    crash(reactor)
+
+    started = time.monotonic()
+    listener_reactor.detach_listener(listener, reactor)
+    assert time.monotonic() - started < 1.0
@@ -0,0 +1,26 @@
+"""
+Тесты кэша открытых ордеров (open_order_cache.py)
+
+Удаление сервера (cleanup_server_caches) убирает снимки его ордеров,
+не трогая другие серверы.
+"""
+from services.udp import open_order_cache
+from services.udp.listener_status import cleanup_server_caches
+from services.udp.open_order_cache import OpenOrderCache
+
+
+def snapshot(moonbot_order_id: int) -> tuple:
+    return tuple(moonbot_order_id if name == 'moonbot_order_id' else None for name in open_order_cache._COLUMNS)
+
+
+def test_cleanup_server_caches_evicts_server_orders(monkeypatch):
+    cache = OpenOrderCache(max_orders_per_server=10, enabled=True)
+    monkeypatch.setattr(open_order_cache, "_cache", cache)
+    cache.store({(1, 10): snapshot(10), (1, 11): snapshot(11), (2, 20): snapshot(20)})
+
+    cleanup_server_caches(1)
+
+    assert 1 not in cache._servers
+    assert list(cache._servers[2]) == [20]
+    stats = cache.get_stats()
+    assert (stats["size"], stats["servers"], stats["evicted"]) == (1, 1, 2)
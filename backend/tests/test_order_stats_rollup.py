@@ -0,0 +1,240 @@
+"""
+Тесты инкрементального rollup статистики ордеров (order_stats_rollup.py)
+
+Ошибка rollup не должна откатывать ордера: изменения встают в очередь,
+бакеты пересчитываются в следующей транзакции с ордерами,
+а сбой виден в get_rollup_stats().
+"""
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+from api.trading_stats.calculators import are_buckets_sequential, calculate_max_drawdown, calculate_streaks
+from api.trading_stats.queries import get_equity_buckets
+from models import models
+from services import order_stats_rollup as rollup
+
+CLOSED_AT = datetime(2026, 3, 2, 12, 0, 0)
+
+
+@pytest.fixture
+def test_server(test_db) -> models.Server:
+    """Сервер без хеширования пароля владельца (rollup нужен только user_id)"""
+    user = models.User(username="rollup", email="rollup@example.com", hashed_password="-")
+    test_db.add(user)
+    test_db.flush()
+    server = models.Server(name="Rollup", host="127.0.0.1", port=5005, user_id=user.id)
+    test_db.add(server)
+    test_db.commit()
+    return server
+
+
+@pytest.fixture
+def session_factory(test_db, test_server):
+    """Фабрика сессий тестовой БД с хуками rollup"""
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=test_db.get_bind())
+    for name, hook in rollup._SESSION_HOOKS:
+        event.listen(factory, name, hook)
+
+    rollup._repair_queue.clear()
+    for name in rollup._stats:
+        rollup._stats[name] = 0
+
+    yield factory
+
+    for name, hook in rollup._SESSION_HOOKS:
+        event.remove(factory, name, hook)
+    rollup._repair_queue.clear()
+
+
+def close_order(factory, server: models.Server, order_id: int, profit: float) -> None:
+    """Записать закрытый ордер отдельной транзакцией"""
+    db = factory()
+    try:
+        db.add(models.MoonBotOrder(
+            server_id=server.id,
+            moonbot_order_id=order_id,
+            symbol="BTC",
+            strategy="Drop",
+            status="Closed",
+            profit_btc=profit,
+            opened_at=CLOSED_AT - timedelta(minutes=5),
+            closed_at=CLOSED_AT + timedelta(minutes=order_id),
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+
+def rollup_rows(test_db):
+    test_db.expire_all()
+    return test_db.query(models.OrderStatsDaily).all()
+
+
+def orders_count(test_db) -> int:
+    return test_db.query(models.MoonBotOrder).filter_by(status="Closed").count()
+
+
+def fail_once(monkeypatch):
+    """Первое применение дельты падает, следующие - как обычно"""
+    original = rollup.apply_order_changes
+    calls = []
+
+    def apply(conn, changes):
+        calls.append(len(changes))
+        if len(calls) == 1:
+            raise RuntimeError("rollup is broken")
+        original(conn, changes)
+
+    monkeypatch.setattr(rollup, "apply_order_changes", apply)
+
+
+def test_rollup_applied_in_order_transaction(session_factory, test_db, test_server):
+    close_order(session_factory, test_server, 1, 0.5)
+    close_order(session_factory, test_server, 2, -0.2)
+
+    [row] = rollup_rows(test_db)
+    assert row.orders_count == 2
+    assert (row.wins, row.losses) == (1, 1)
+    assert rollup.get_rollup_stats() == {
+        "applied_changes": 2, "failures": 0, "repaired_changes": 0, "pending_repair": 0,
+    }
+
+
+def test_failed_rollup_keeps_orders_and_is_repaired(session_factory, test_db, test_server, monkeypatch):
+    fail_once(monkeypatch)
+
+    close_order(session_factory, test_server, 1, 0.5)
+
+    assert orders_count(test_db) == 1
+    assert rollup_rows(test_db) == []
+    stats = rollup.get_rollup_stats()
+    assert stats["failures"] == 1
+    assert stats["pending_repair"] == 1
+
+    close_order(session_factory, test_server, 2, 0.3)
+
+    [row] = rollup_rows(test_db)
+    assert row.orders_count == 2
+    assert row.gross_profit == pytest.approx(0.8)
+    stats = rollup.get_rollup_stats()
+    assert stats["repaired_changes"] == 1
+    assert stats["pending_repair"] == 0
+
+
+def test_repair_rolled_back_goes_back_to_queue(session_factory, test_db, test_server, monkeypatch):
+    fail_once(monkeypatch)
+    close_order(session_factory, test_server, 1, 0.5)
+
+    db = session_factory()
+    try:
+        db.add(models.MoonBotOrder(
+            server_id=test_server.id, moonbot_order_id=2, status="Closed",
+            profit_btc=0.1, closed_at=CLOSED_AT,
+        ))
+        db.flush()
+        assert rollup.get_rollup_stats()["pending_repair"] == 0
+        db.rollback()
+    finally:
+        db.close()
+
+    assert rollup.get_rollup_stats()["pending_repair"] == 1
+    assert orders_count(test_db) == 1
+
+
+def test_savepoint_discards_partial_rollup(session_factory, test_db, test_server, monkeypatch):
+    # Путь PostgreSQL: дельта в SAVEPOINT, частично записанный rollup откатывается
+    monkeypatch.setattr(rollup, "_uses_savepoint", lambda conn: True)
+    original = rollup.apply_order_changes
+    calls = []
+
+    def apply_then_fail(conn, changes):
+        calls.append(len(changes))
+        original(conn, changes)
+        if len(calls) == 1:
+            raise RuntimeError("rollup is broken")
+
+    monkeypatch.setattr(rollup, "apply_order_changes", apply_then_fail)
+
+    close_order(session_factory, test_server, 1, 0.5)
+
+    assert orders_count(test_db) == 1
+    assert rollup_rows(test_db) == []
+    assert rollup.get_rollup_stats()["pending_repair"] == 1
+
+    close_order(session_factory, test_server, 2, 0.3)
+
+    [row] = rollup_rows(test_db)
+    assert row.orders_count == 2
+    assert rollup.get_rollup_stats()["pending_repair"] == 0
+
+
+def add_closed_orders(factory, server: models.Server, orders) -> None:
+    """Записать закрытые ордера: [(moonbot_order_id, strategy, closed_at, profit)]"""
+    db = factory()
+    try:
+        for order_id, strategy, closed_at, profit in orders:
+            db.add(models.MoonBotOrder(
+                server_id=server.id, moonbot_order_id=order_id, symbol="BTC", strategy=strategy,
+                status="Closed", profit_btc=profit, closed_at=closed_at,
+            ))
+            db.commit()
+    finally:
+        db.close()
+
+
+def drawdown_and_streaks(profits):
+    """Эталон: просадка и серии по сделкам в порядке закрытия"""
+    equity = peak = drawdown = 0.0
+    wins = losses = max_wins = max_losses = 0
+    for profit in profits:
+        equity += profit
+        peak = max(peak, equity)
+        drawdown = max(drawdown, peak - equity)
+        if profit > 0:
+            wins, losses = wins + 1, 0
+        elif profit < 0:
+            wins, losses = 0, losses + 1
+        max_wins, max_losses = max(max_wins, wins), max(max_losses, losses)
+    return drawdown, max_wins, max_losses
+
+
+def bucket_metrics(test_db, server: models.Server):
+    test_db.expire_all()
+    buckets = get_equity_buckets(test_db, server.user_id, "all", "all", None, "all", None, None)
+    return buckets, calculate_max_drawdown(buckets), *calculate_streaks(buckets)
+
+
+def test_drawdown_and_streaks_from_buckets(session_factory, test_db, test_server):
+    rnd = random.Random(5)
+    orders = []
+    for n in range(60):
+        # Разные стратегии - в разные дни: бакеты не пересекаются по времени
+        day = n // 10
+        closed_at = CLOSED_AT + timedelta(days=day, minutes=n)
+        orders.append((n + 1, f"S{day % 2}", closed_at, rnd.choice((-1, 1, 0)) * rnd.uniform(0.1, 1.0)))
+    add_closed_orders(session_factory, test_server, orders)
+
+    buckets, drawdown, max_wins, max_losses = bucket_metrics(test_db, test_server)
+
+    assert len(buckets) == 6
+    assert are_buckets_sequential(buckets)
+    expected = drawdown_and_streaks([profit for *_, profit in orders])
+    assert drawdown == pytest.approx(expected[0])
+    assert (max_wins, max_losses) == expected[1:]
+
+
+def test_interleaved_buckets_are_reported(session_factory, test_db, test_server):
+    add_closed_orders(session_factory, test_server, [
+        (1, "A", CLOSED_AT, 1.0),
+        (2, "B", CLOSED_AT + timedelta(minutes=1), -1.0),
+        (3, "A", CLOSED_AT + timedelta(minutes=2), 1.0),
+    ])
+
+    buckets, *_ = bucket_metrics(test_db, test_server)
+
+    assert len(buckets) == 2
+    assert not are_buckets_sequential(buckets)
@@ -0,0 +1,153 @@
+"""
+Тесты потоковой сборки фрагментированных gzip сообщений (processors_fragments.py)
+
+Фрагменты сервера могут прийти не по порядку, с потерями или вперемешку
+с другим сообщением: сборщик должен сбросить поток, не выдав битое
+сообщение и не бросив исключение, и собрать следующее целое сообщение.
+"""
+import random
+
+import pytest
+
+from services.udp.fragment_benchmark import split_fragments, strategy_dump
+from services.udp.processors_fragments import GzipStreamAssembler
+
+
+def make_message(seed: int, strategies: int = 500):
+    message = strategy_dump(random.Random(seed), strategies)
+    fragments = split_fragments(message, 1400)
+    assert len(fragments) >= 4
+    return message, fragments
+
+
+def feed_all(assembler: GzipStreamAssembler, fragments):
+    """Подать фрагменты как MessageProcessor: gzip - start, остальное - feed"""
+    results = []
+    for fragment in fragments:
+        if fragment[:2] == b'\x1f\x8b':
+            results.append(assembler.start(fragment))
+        else:
+            results.append(assembler.feed(fragment))
+    return [r for r in results if r is not None]
+
+
+@pytest.fixture
+def assembler() -> GzipStreamAssembler:
+    return GzipStreamAssembler(server_id=1)
+
+
+def assert_recovers(assembler: GzipStreamAssembler, seed: int = 99):
+    """После сбоя следующее сообщение собирается целиком"""
+    message, fragments = make_message(seed)
+    assert feed_all(assembler, fragments) == [message]
+    assert not assembler.active
+
+
+def test_in_order(assembler):
+    message, fragments = make_message(1)
+
+    assert feed_all(assembler, fragments) == [message]
+    assert assembler.completed == 1
+    assert assembler.aborted == 0
+
+
+@pytest.mark.parametrize("first, second", [(1, 2), (2, 3), (1, 3)])
+def test_out_of_order(assembler, first, second):
+    message, fragments = make_message(2)
+    swapped = list(fragments)
+    swapped[first], swapped[second] = swapped[second], swapped[first]
+
+    assert feed_all(assembler, swapped) == []
+    assert assembler.completed == 0
+    assert_recovers(assembler)
+
+
+@pytest.mark.parametrize("missing", [1, 2])
+def test_dropped_middle_fragment(assembler, missing):
+    message, fragments = make_message(3)
+    del fragments[missing]
+
+    assert feed_all(assembler, fragments) == []
+    assert assembler.aborted == 1
+    assert not assembler.active
+    assert_recovers(assembler)
+
+
+def test_dropped_last_fragment_expires(assembler):
+    message, fragments = make_message(4)
+
+    assert feed_all(assembler, fragments[:-1]) == []
+    assert assembler.active
+    assembler.timeout = 0.0
+    assert assembler.expire()
+    assert not assembler.active
+    assert assembler.aborted == 1
+    assembler.timeout = 2.0
+    assert_recovers(assembler)
+
+
+def test_dropped_first_fragment(assembler):
+    message, fragments = make_message(5)
+
+    assert feed_all(assembler, fragments[1:]) == []
+    assert assembler.orphaned == len(fragments) - 1
+    assert not assembler.active
+    assert_recovers(assembler)
+
+
+def test_continuation_before_first_fragment(assembler):
+    message, fragments = make_message(6)
+    reordered = [fragments[1], fragments[0], *fragments[2:]]
+
+    assert feed_all(assembler, reordered) == []
+    # Первое продолжение - без сообщения, после сброса потока - остальные
+    assert assembler.orphaned == len(fragments) - 2
+    assert assembler.aborted == 1
+    assert not assembler.active
+    assert_recovers(assembler)
+
+
+def test_continuation_of_next_message_resets_active_stream(assembler):
+    # Продолжение нового сообщения раньше его первого фрагмента
+    # попадает в ещё не завершённый поток предыдущего
+    old_message, old_fragments = make_message(7)
+    new_message, new_fragments = make_message(8)
+    sequence = old_fragments[:2] + [new_fragments[1], new_fragments[0]] + new_fragments[2:]
+
+    assert feed_all(assembler, sequence) == []
+    assert assembler.completed == 0
+    assert not assembler.active
+    assert_recovers(assembler)
+
+
+def test_interleaved_messages(assembler):
+    first_message, first = make_message(9)
+    second_message, second = make_message(10)
+    interleaved = [f for pair in zip(first, second) for f in pair]
+
+    assert feed_all(assembler, interleaved) == []
+    assert assembler.completed == 0
+    assert not assembler.active
+    assert_recovers(assembler)
+
+
+def test_random_garbage_continuations_never_raise(assembler):
+    rnd = random.Random(11)
+    message, fragments = make_message(12)
+    for _ in range(50):
+        sequence = [fragments[0]] + [rnd.randbytes(rnd.randint(1, 1400)) for _ in range(5)]
+        assert feed_all(assembler, sequence) == []
+    assert_recovers(assembler)
+
+
+def test_processor_drops_orphan_continuation(monkeypatch):
+    from services.udp.processors import MessageProcessor
+
+    processor = MessageProcessor(server_id=1, host="127.0.0.1", port=5005)
+    legacy = []
+    monkeypatch.setattr(processor, "process_legacy_message", lambda *args: legacy.append(args))
+    message, fragments = make_message(13)
+
+    assert processor.process_message(fragments[1], "127.0.0.1", 5005) is None
+    assert legacy == []
+    assert processor.fragments.orphaned == 1
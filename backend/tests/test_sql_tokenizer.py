@@ -0,0 +1,152 @@
+"""
+Тесты токенизатора SQL команд MoonBot (sql_tokenizer.py)
+
+Токенизатор должен разбирать VALUES и SET так же, как прежний
+посимвольный парсер (эталон - services/udp/sql_tokenizer_benchmark.py):
+ручные случаи кавычек, экранирования, скобок и пробелов, NULL и числа,
+команды в формате MoonBot и случайные строки из спецсимволов.
+"""
+import random
+
+import pytest
+
+from services.udp.sql_tokenizer import (
+    INSERT_FIELDS_RE, INSERT_VALUES_RE, UPDATE_SET_RE,
+    SQLValue, set_clause_dict, tokenize_set_clause, tokenize_values,
+)
+from services.udp.sql_tokenizer_benchmark import (
+    legacy_parse_set_clause, legacy_parse_values_clause, moonbot_sql,
+)
+
+SET_CASES = [
+    "SellPrice=1.5, Status=1",
+    "Comment='a, b', Status=1",
+    "Comment='It''s', Status=0",
+    "Comment='back\\'slash', x=1",
+    "[Comment] = 'x' , [Status]=1",
+    "Comment='(strategy <A>)', SellReason='Auto Price Down'",
+    "a\\b=1",
+    "a, b=1, c",
+    "x='unterminated, y=2",
+    "k\r=1",
+    "  ",
+    "=5",
+    "a='='",
+    "a=1,,b=2",
+    "Comment='\\\\', b='\\', c=3",
+    "DailyVol='1,2,3', hVol=0.5",
+    "Comment=NULL, SellReason='NULL'",
+    "ProfitBTC=-0.00012, Rate=1e-08, Vol=2.5E+10, Delta=-3E-2",
+    "Comment='f(x, y)', Reason=')('",
+    "Comment='a\\'b, c', Status=1",
+    "Comment='''quoted''', Status=1",
+]
+
+VALUES_CASES = [
+    "'1', 'BTC', 1700000000, 0, 1.5",
+    "'a, b', (1, 2), 3",
+    "'It''s', 'x'",
+    "'\\\\', 'y'",
+    "'a\\'b', c",
+    "f(1,(2,3)), 4",
+    "1, , 3,",
+    "')', '(', 3",
+    "1))), 2, (3",
+    "",
+    "   ",
+    "'unterminated, 1, 2",
+    "\\",
+    "NULL, 'NULL', null",
+    "-1.5, 1e-8, 2.5E+10, -3E-2, -0",
+    "'f(x, y)', ')(', 'a, (b, c)'",
+    "'a\\'b, c', 2",
+    "'''quoted''', 1",
+]
+
+FUZZ_ALPHABET = "ab =,'\\()[] \t\n\r1"
+
+
+def fuzz_case(rnd: random.Random, escapes: bool) -> str:
+    alphabet = FUZZ_ALPHABET if escapes else FUZZ_ALPHABET.replace("\\", "")
+    return "".join(rnd.choice(alphabet) for _ in range(rnd.randint(0, 40)))
+
+
+@pytest.mark.parametrize("case", VALUES_CASES)
+def test_values_match_legacy(case):
+    assert [value.text for value in tokenize_values(case)] == legacy_parse_values_clause(case)
+
+
+@pytest.mark.parametrize("case", SET_CASES)
+def test_set_clause_matches_legacy(case):
+    assert set_clause_dict(case) == legacy_parse_set_clause(case)
+
+
+def test_values_edge_cases():
+    assert tokenize_values("NULL, 'NULL', -1.5, 1e-8, 2.5E+10") == [
+        SQLValue("NULL", False),
+        SQLValue("NULL", True),
+        SQLValue("-1.5", False),
+        SQLValue("1e-8", False),
+        SQLValue("2.5E+10", False),
+    ]
+    assert tokenize_values("'a, b', 'f(x, y)', ')(', (1, 2), 3") == [
+        SQLValue("a, b", True),
+        SQLValue("f(x, y)", True),
+        SQLValue(")(", True),
+        SQLValue("(1, 2)", False),
+        SQLValue("3", False),
+    ]
+    # '' закрывает и снова открывает строку, \ остаётся в значении
+    assert tokenize_values("'It''s', 'a\\'b, c'") == [
+        SQLValue("Its", True),
+        SQLValue("a\\'b, c", True),
+    ]
+
+
+def test_set_clause_edge_cases():
+    assert tokenize_set_clause(
+        "[ProfitBTC] = -0.5, Rate=1e-08, Comment=NULL, Reason='x, (y)', Name='a\\'b'"
+    ) == [
+        ("ProfitBTC", SQLValue("-0.5", False)),
+        ("Rate", SQLValue("1e-08", False)),
+        ("Comment", SQLValue("NULL", False)),
+        ("Reason", SQLValue("x, (y)", True)),
+        ("Name", SQLValue("a\\'b", True)),
+    ]
+
+
+@pytest.mark.parametrize("escapes", [False, True])
+@pytest.mark.parametrize("long_value", [0, 200, 5000])
+def test_moonbot_clauses_match_legacy(long_value, escapes):
+    rnd = random.Random(long_value * 2 + escapes)
+    for _ in range(20):
+        values, set_clause = moonbot_sql(rnd, long_value, escapes)
+        assert [v.text for v in tokenize_values(values)] == legacy_parse_values_clause(values)
+        assert set_clause_dict(set_clause) == legacy_parse_set_clause(set_clause)
+
+
+def test_statements_match_legacy():
+    """Целые INSERT/UPDATE через общие шаблоны - как в sql_parser_*.py"""
+    rnd = random.Random(2)
+    for _ in range(200):
+        values, set_clause = moonbot_sql(rnd, rnd.choice((0, 50)), rnd.random() < 0.5)
+        insert = (f"insert into Orders (exOrderID, Coin, BuyDate, SellSetDate, CloseDate, BuyPrice, "
+                  f"Quantity, SpentBTC, Source, Channel, Comment, StrategyID, BaseCurrency, Emulator) "
+                  f"values ({values})")
+        update = f"update Orders set {set_clause} where ID={rnd.randint(1, 10**6)}"
+
+        assert INSERT_FIELDS_RE.search(insert)
+        values_str = INSERT_VALUES_RE.search(insert).group(1).strip()
+        assert [v.text for v in tokenize_values(values_str)] == legacy_parse_values_clause(values_str)
+        clause = UPDATE_SET_RE.search(update).group(1)
+        assert set_clause_dict(clause) == legacy_parse_set_clause(clause)
+
+
+@pytest.mark.parametrize("escapes", [False, True])
+def test_fuzz_matches_legacy(escapes):
+    # Без \ разбор идёт отдельным путём (str.split) - проверяются оба
+    rnd = random.Random(int(escapes))
+    for _ in range(2500):
+        case = fuzz_case(rnd, escapes)
+        assert [v.text for v in tokenize_values(case)] == legacy_parse_values_clause(case), case
+        assert set_clause_dict(case) == legacy_parse_set_clause(case), case
@@ -0,0 +1,160 @@
+"""
+Тесты очередей классов сообщений UDP Worker Pool (worker_pool_lanes.py)
+
+Фрагменты одного сообщения должны обрабатываться по порядку, даже если
+между ними приходят пакеты других классов, и не должны заменять
+ожидающий acc (latest wins - только для настоящих acc).
+"""
+import gzip
+import json
+import random
+
+import pytest
+
+from services.udp.fragment_benchmark import split_fragments, strategy_dump
+from services.udp.processors_fragments import GzipStreamAssembler
+from services.udp.worker_pool import UDPMessage, UDPWorkerPool
+from services.udp.worker_pool_lanes import (
+    _STREAM_CHECK_BYTES, LANE_BALANCE, LANE_COMMAND, LANE_STRATEGY, classify_packet,
+)
+
+SERVER_ID = 7
+
+
+def acc_packet(available: float) -> bytes:
+    return json.dumps({"cmd": "acc", "bot": "SimBot", "data": {"A": available, "T": 100.0}}).encode()
+
+
+def strats_fragments(count: int = 500, seed: int = 1):
+    message = strategy_dump(random.Random(seed), count)
+    fragments = split_fragments(message, 1400)
+    assert len(fragments) >= 3
+    return message, fragments
+
+
+@pytest.fixture
+def pool() -> UDPWorkerPool:
+    """Пул без запущенных воркеров - очереди разбираются тестом"""
+    return UDPWorkerPool(num_workers=1, queue_size=1000)
+
+
+def submit_all(pool: UDPWorkerPool, packets):
+    for data in packets:
+        assert pool.submit(UDPMessage(
+            server_id=SERVER_ID, data=data, source_ip="127.0.0.1",
+            source_port=5005, received_at=0.0, processor=None
+        ))
+
+
+def drain(pool: UDPWorkerPool):
+    """Сообщения шарда в порядке обработки воркером"""
+    shard = pool._shards[pool.shard_for(SERVER_ID)]
+    messages = []
+    while True:
+        message = shard.get(timeout=0)
+        if message is None:
+            return messages
+        messages.append(message)
+
+
+def reassemble(messages):
+    """Собрать фрагментированное сообщение в порядке обработки (как MessageProcessor)"""
+    assembler = GzipStreamAssembler(server_id=SERVER_ID)
+    result = None
+    for message in messages:
+        lane, opens_stream = classify_packet(message.data)
+        if opens_stream:
+            result = assembler.start(message.data) or result
+        elif lane is None:
+            result = assembler.feed(message.data) or result
+    return result
+
+
+def test_classify_packet():
+    message, fragments = strats_fragments()
+
+    assert classify_packet(fragments[0]) == (LANE_STRATEGY, True)
+    assert classify_packet(fragments[1]) == (None, False)
+    assert classify_packet(gzip.compress(strategy_dump(random.Random(2), 5))) == (LANE_STRATEGY, False)
+    # Целый gzip больше _STREAM_CHECK_BYTES не распаковывается до конца
+    assert len(message) > _STREAM_CHECK_BYTES
+    assert classify_packet(gzip.compress(message)) == (LANE_STRATEGY, True)
+    assert classify_packet(acc_packet(1.0)) == (LANE_BALANCE, False)
+    assert classify_packet(gzip.compress(acc_packet(1.0))) == (LANE_BALANCE, False)
+    assert classify_packet("Open Sell Orders: 2".encode()) == (LANE_COMMAND, False)
+
+
+def test_interleaved_fragment_acc_fragment(pool):
+    message, fragments = strats_fragments()
+    acc = acc_packet(1.5)
+
+    submit_all(pool, [fragments[0], acc, *fragments[1:]])
+    processed = drain(pool)
+
+    # acc не заменён фрагментом
+    balance = [m for m in processed if m.lane == LANE_BALANCE]
+    assert [m.data for m in balance] == [acc]
+    # Фрагменты - в очереди начала сообщения, по порядку
+    stream = [m.data for m in processed if m.lane == LANE_STRATEGY]
+    assert stream == fragments
+    assert reassemble(processed) == message
+
+
+def test_acc_between_every_fragment(pool):
+    message, fragments = strats_fragments()
+    packets = []
+    for n, fragment in enumerate(fragments):
+        packets.append(fragment)
+        packets.append(acc_packet(float(n)))
+
+    submit_all(pool, packets)
+    processed = drain(pool)
+
+    assert [m.data for m in processed if m.lane == LANE_STRATEGY] == fragments
+    balance = [m.data for m in processed if m.lane == LANE_BALANCE]
+    assert all(classify_packet(data) == (LANE_BALANCE, False) for data in balance)
+    # latest wins: последний acc сервера не потерян
+    assert balance[-1] == acc_packet(float(len(fragments) - 1))
+    assert reassemble(processed) == message
+    assert pool.metrics.get_stats()["messages_dropped"] == 0
+
+
+def test_fragments_in_coalescing_lane_keep_order(pool):
+    # Фрагментированный acc: продолжения идут в очередь балансов,
+    # но не заменяют ожидающий acc и не заменяются следующим
+    big_acc = json.dumps({
+        "cmd": "acc", "bot": "SimBot",
+        "data": {"A": 1.0, "pad": random.Random(3).randbytes(20000).hex()}
+    }).encode()
+    fragments = split_fragments(big_acc, 1400)
+    assert classify_packet(fragments[0]) == (LANE_BALANCE, True)
+    small_a, small_b = acc_packet(2.0), acc_packet(3.0)
+
+    submit_all(pool, [small_a, fragments[0], fragments[1], small_b, *fragments[2:]])
+    processed = drain(pool)
+
+    assert [m.data for m in processed] == [small_a, fragments[0], fragments[1], small_b, *fragments[2:]]
+    assert reassemble(processed) == big_acc
+
+
+def test_acc_still_coalesces(pool):
+    submit_all(pool, [acc_packet(1.0), acc_packet(2.0), acc_packet(3.0)])
+    processed = drain(pool)
+
+    assert [m.data for m in processed] == [acc_packet(3.0)]
+    assert pool.metrics.get_stats()["messages_coalesced"] == 2
+
+
+def test_large_complete_gzip_between_streams(pool):
+    # Большой целый пакет считается началом потока: не заменяет acc,
+    # а следующее фрагментированное сообщение собирается как обычно
+    acc = acc_packet(1.0)
+    big = gzip.compress(strategy_dump(random.Random(4), 500))
+    message, fragments = strats_fragments(seed=5)
+
+    submit_all(pool, [acc, big, acc_packet(2.0), *fragments])
+    processed = drain(pool)
+
+    assert [m.data for m in processed if m.lane == LANE_BALANCE] == [acc_packet(2.0)]
+    assert [m.data for m in processed if m.lane == LANE_STRATEGY] == [big, *fragments]
+    assert reassemble(processed) == message
@@ -0,0 +1,122 @@
+"""
+Миграция: Сводка графиков для списков (moonbot_charts.points_count / min_price / max_price)
+
+Новые графики получают сводку при разборе (services/udp/chart_pipeline.py).
+Миграция добавляет колонки и считает сводку для уже записанных графиков
+(компактный формат или старый JSON) пачками - списки графиков читают
+только колонки метаданных, без данных графика.
+
+Графики, которые не удалось разобрать, получают points_count = 0
+(чтобы не разбирать их при каждом запуске).
+Работает на SQLite и PostgreSQL (через SQLAlchemy engine приложения).
+"""
+import json
+
+from sqlalchemy import inspect, text, Float, Integer
+
+from models.database import engine
+from utils.logging import log
+
+
+MIGRATION_ID = "add_moonbot_charts_summary"
+MIGRATION_VERSION = "3.2.0"
+
+# Графиков за одну транзакцию
+BATCH_SIZE = 200
+
+SUMMARY_COLUMNS = (
+    ("points_count", Integer()),
+    ("min_price", Float()),
+    ("max_price", Float()),
+)
+
+
+def _missing_columns():
+    columns = {c["name"] for c in inspect(engine).get_columns("moonbot_charts")}
+    return [(name, column_type) for name, column_type in SUMMARY_COLUMNS if name not in columns]
+
+
+def check_migration_needed() -> bool:
+    """
+    Проверить, нужна ли миграция.
+
+    Returns:
+        True если нет колонок сводки или остались графики без сводки
+    """
+    if "moonbot_charts" not in inspect(engine).get_table_names():
+        return False
+    if _missing_columns():
+        return True
+
+    with engine.connect() as conn:
+        pending = conn.execute(text(
+            "SELECT 1 FROM moonbot_charts WHERE points_count IS NULL "
+            "AND (chart_blob IS NOT NULL OR chart_data IS NOT NULL) LIMIT 1"
+        )).first()
+    return pending is not None
+
+
+def run_migration() -> bool:
+    """
+    Выполнить миграцию - добавить колонки и посчитать сводку пачками.
+
+    Returns:
+        True если успешно
+    """
+    from services.chart_parser import CompactFormatError, decode_chart, chart_from_dict
+
+    log(f"[MIGRATION] Starting {MIGRATION_ID}...")
+
+    for name, column_type in _missing_columns():
+        with engine.begin() as conn:
+            conn.execute(text(
+                f"ALTER TABLE moonbot_charts ADD COLUMN {name} {column_type.compile(dialect=engine.dialect)}"
+            ))
+        log(f"[MIGRATION] Added column: moonbot_charts.{name}")
+
+    summarized = corrupted = 0
+    last_id = 0
+
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(text(
+                "SELECT id, chart_blob, chart_data FROM moonbot_charts "
+                "WHERE points_count IS NULL AND (chart_blob IS NOT NULL OR chart_data IS NOT NULL) "
+                "AND id > :last_id ORDER BY id LIMIT :limit"
+            ), {"last_id": last_id, "limit": BATCH_SIZE}).fetchall()
+            if not rows:
+                break
+
+            updates = []
+            for chart_id, chart_blob, chart_data in rows:
+                last_id = chart_id
+                try:
+                    if chart_blob:
+                        chart = decode_chart(bytes(chart_blob))
+                    else:
+                        chart = chart_from_dict(json.loads(chart_data))
+                except (CompactFormatError, ValueError, TypeError, AttributeError) as e:
+                    log(f"[MIGRATION] Chart {chart_id}: cannot summarize ({e})", level="WARNING")
+                    updates.append({"id": chart_id, "points": 0, "low": None, "high": None})
+                    corrupted += 1
+                    continue
+                low, high = chart.price_range()
+                updates.append({"id": chart_id, "points": chart.point_count(), "low": low, "high": high})
+                summarized += 1
+
+            conn.execute(
+                text("UPDATE moonbot_charts SET points_count = :points, min_price = :low, max_price = :high "
+                     "WHERE id = :id"),
+                updates
+            )
+
+    log(f"[MIGRATION] Summarized {summarized} charts, {corrupted} could not be decoded")
+    log(f"[MIGRATION] {MIGRATION_ID} completed")
+    return True
+
+
+if __name__ == "__main__":
+    if check_migration_needed():
+        run_migration()
+    else:
+        log(f"[MIGRATION] {MIGRATION_ID} already applied")
@@ -0,0 +1,72 @@
+"""
+Миграция: Уникальный ключ (server_id, order_db_id) для moonbot_charts
+
+Графики пишутся через BatchProcessor upsert'ом
+INSERT ... ON CONFLICT (server_id, order_db_id) DO UPDATE, а для этого
+индекс ix_moonbot_charts_server_order должен быть уникальным.
+
+Перед созданием индекса удаляются дубликаты (остаётся самая новая запись).
+Работает на SQLite и PostgreSQL (через SQLAlchemy engine приложения).
+"""
+from sqlalchemy import inspect, text
+
+from models.database import engine
+from utils.logging import log
+
+
+MIGRATION_ID = "add_moonbot_charts_unique_key"
+MIGRATION_VERSION = "3.1.0"
+
+INDEX_NAME = "ix_moonbot_charts_server_order"
+
+
+def check_migration_needed() -> bool:
+    """
+    Проверить, нужна ли миграция.
+    
+    Returns:
+        True если индекс отсутствует или не уникальный
+    """
+    inspector = inspect(engine)
+    if 'moonbot_charts' not in inspector.get_table_names():
+        return False
+    
+    for index in inspector.get_indexes('moonbot_charts'):
+        if index['name'] == INDEX_NAME:
+            return not index.get('unique', False)
+    
+    return True
+
+
+def run_migration() -> bool:
+    """
+    Выполнить миграцию - удалить дубликаты и пересоздать индекс уникальным.
+    
+    Returns:
+        True если успешно
+    """
+    log(f"[MIGRATION] Starting {MIGRATION_ID}...")
+    
+    with engine.begin() as conn:
+        result = conn.execute(text("""
+            DELETE FROM moonbot_charts
+            WHERE id NOT IN (
+                SELECT MAX(id) FROM moonbot_charts GROUP BY server_id, order_db_id
+            )
+        """))
+        log(f"[MIGRATION] Removed {result.rowcount} duplicate moonbot_charts rows")
+        
+        conn.execute(text(f"DROP INDEX IF EXISTS {INDEX_NAME}"))
+        conn.execute(text(
+            f"CREATE UNIQUE INDEX {INDEX_NAME} ON moonbot_charts (server_id, order_db_id)"
+        ))
+    
+    log(f"[MIGRATION] {MIGRATION_ID} completed")
+    return True
+
+
+if __name__ == "__main__":
+    if check_migration_needed():
+        run_migration()
+    else:
+        log(f"[MIGRATION] {MIGRATION_ID} already applied")
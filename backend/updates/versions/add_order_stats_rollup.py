@@ -0,0 +1,70 @@
+"""
+Миграция: Rollup статистики ордеров (order_stats_daily)
+
+Создаёт таблицу дневных агрегатов закрытых ордеров и заполняет её
+из moonbot_orders. Дальше таблица обновляется инкрементально
+(services/order_stats_rollup.py).
+
+Миграция считается нужной, если количество ордеров в rollup не совпадает
+с количеством закрытых ордеров - это же восстанавливает rollup после
+массовых удалений в обход сессий (system reset, ручные правки БД).
+Работает на SQLite и PostgreSQL (через SQLAlchemy engine приложения).
+"""
+from sqlalchemy import inspect
+
+from models import models
+from models.database import engine
+from utils.logging import log
+
+
+MIGRATION_ID = "add_order_stats_rollup"
+MIGRATION_VERSION = "3.1.0"
+
+
+def check_migration_needed() -> bool:
+    """
+    Проверить, нужна ли миграция.
+
+    Returns:
+        True если таблицы нет или rollup расходится с moonbot_orders
+    """
+    from services.order_stats_rollup import get_rollup_consistency
+
+    inspector = inspect(engine)
+    tables = inspector.get_table_names()
+    if 'moonbot_orders' not in tables:
+        return False
+    if models.OrderStatsDaily.__tablename__ not in tables:
+        return True
+
+    with engine.connect() as conn:
+        consistency = get_rollup_consistency(conn)
+    return consistency["rollup_orders"] != consistency["closed_orders"]
+
+
+def run_migration() -> bool:
+    """
+    Выполнить миграцию - создать таблицу и пересобрать агрегаты.
+
+    Returns:
+        True если успешно
+    """
+    from services.order_stats_rollup import rebuild_order_stats
+
+    log(f"[MIGRATION] Starting {MIGRATION_ID}...")
+
+    models.OrderStatsDaily.__table__.create(bind=engine, checkfirst=True)
+
+    with engine.begin() as conn:
+        buckets = rebuild_order_stats(conn)
+
+    log(f"[MIGRATION] Rebuilt order_stats_daily: {buckets} buckets")
+    log(f"[MIGRATION] {MIGRATION_ID} completed")
+    return True
+
+
+if __name__ == "__main__":
+    if check_migration_needed():
+        run_migration()
+    else:
+        log(f"[MIGRATION] {MIGRATION_ID} already applied")
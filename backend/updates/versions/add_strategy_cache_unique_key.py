@@ -0,0 +1,72 @@
+"""
+Миграция: Уникальный ключ (server_id, pack_number) для strategy_cache
+
+BatchProcessor выполняет upsert кэша стратегий через
+INSERT ... ON CONFLICT (server_id, pack_number) DO UPDATE, а для этого
+индекс ix_strategy_cache_server_pack должен быть уникальным.
+
+Перед созданием индекса удаляются дубликаты (остаётся самая новая запись).
+Работает на SQLite и PostgreSQL (через SQLAlchemy engine приложения).
+"""
+from sqlalchemy import inspect, text
+
+from models.database import engine
+from utils.logging import log
+
+
+MIGRATION_ID = "add_strategy_cache_unique_key"
+MIGRATION_VERSION = "3.1.0"
+
+INDEX_NAME = "ix_strategy_cache_server_pack"
+
+
+def check_migration_needed() -> bool:
+    """
+    Проверить, нужна ли миграция.
+    
+    Returns:
+        True если индекс отсутствует или не уникальный
+    """
+    inspector = inspect(engine)
+    if 'strategy_cache' not in inspector.get_table_names():
+        return False
+    
+    for index in inspector.get_indexes('strategy_cache'):
+        if index['name'] == INDEX_NAME:
+            return not index.get('unique', False)
+    
+    return True
+
+
+def run_migration() -> bool:
+    """
+    Выполнить миграцию - удалить дубликаты и пересоздать индекс уникальным.
+    
+    Returns:
+        True если успешно
+    """
+    log(f"[MIGRATION] Starting {MIGRATION_ID}...")
+    
+    with engine.begin() as conn:
+        result = conn.execute(text("""
+            DELETE FROM strategy_cache
+            WHERE id NOT IN (
+                SELECT MAX(id) FROM strategy_cache GROUP BY server_id, pack_number
+            )
+        """))
+        log(f"[MIGRATION] Removed {result.rowcount} duplicate strategy_cache rows")
+        
+        conn.execute(text(f"DROP INDEX IF EXISTS {INDEX_NAME}"))
+        conn.execute(text(
+            f"CREATE UNIQUE INDEX {INDEX_NAME} ON strategy_cache (server_id, pack_number)"
+        ))
+    
+    log(f"[MIGRATION] {MIGRATION_ID} completed")
+    return True
+
+
+if __name__ == "__main__":
+    if check_migration_needed():
+        run_migration()
+    else:
+        log(f"[MIGRATION] {MIGRATION_ID} already applied")
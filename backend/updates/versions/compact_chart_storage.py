@@ -0,0 +1,154 @@
+"""
+Миграция: Компактное хранение графиков (moonbot_charts.chart_blob)
+
+Добавляет колонки chart_blob, storage_error и переводит графики из JSON
+(chart_data) в компактный колоночный формат (services/chart_parser/compact.py).
+Каждый blob декодируется и сравнивается с графиком из JSON - только после
+этого chart_data очищается, и график хранится один раз.
+
+Записи, которые не разбираются или не совпали после декодирования,
+не удаляются: chart_data остаётся, причина пишется в storage_error
+(повторно такие записи не обрабатываются), в лог - WARNING.
+Работает на SQLite и PostgreSQL (через SQLAlchemy engine приложения).
+На SQLite место освобождается после VACUUM (выполняется вручную).
+"""
+import json
+import struct
+
+from sqlalchemy import inspect, text, LargeBinary, String
+
+from models.database import engine
+from utils.logging import log
+
+
+MIGRATION_ID = "compact_chart_storage"
+MIGRATION_VERSION = "3.1.0"
+
+# Графиков за одну транзакцию
+BATCH_SIZE = 200
+
+
+# Новые колонки: (имя, тип)
+NEW_COLUMNS = (
+    ("chart_blob", LargeBinary()),
+    ("storage_error", String()),
+)
+
+# Максимальная длина причины в storage_error
+ERROR_MAX_LENGTH = 200
+
+
+def _missing_columns():
+    columns = {c["name"] for c in inspect(engine).get_columns("moonbot_charts")}
+    return [(name, column_type) for name, column_type in NEW_COLUMNS if name not in columns]
+
+
+def _canonical(chart: dict) -> str:
+    """JSON для сравнения графиков (NaN в JSON сравнивается как текст)"""
+    return json.dumps(chart, sort_keys=True)
+
+
+def check_migration_needed() -> bool:
+    """
+    Проверить, нужна ли миграция.
+
+    Returns:
+        True если нет новых колонок или остались непроверенные графики в JSON
+    """
+    if "moonbot_charts" not in inspect(engine).get_table_names():
+        return False
+    if _missing_columns():
+        return True
+
+    with engine.connect() as conn:
+        pending = conn.execute(text(
+            "SELECT 1 FROM moonbot_charts WHERE chart_data IS NOT NULL AND storage_error IS NULL LIMIT 1"
+        )).first()
+    return pending is not None
+
+
+def run_migration() -> bool:
+    """
+    Выполнить миграцию - добавить колонку и сконвертировать графики пачками.
+
+    Returns:
+        True если успешно
+    """
+    from services.chart_parser import CompactFormatError, chart_from_dict, chart_to_dict, decode_chart, encode_chart
+    from utils.config_loader import get_config_value
+
+    log(f"[MIGRATION] Starting {MIGRATION_ID}...")
+
+    for name, column_type in _missing_columns():
+        with engine.begin() as conn:
+            conn.execute(text(
+                f"ALTER TABLE moonbot_charts ADD COLUMN {name} {column_type.compile(dialect=engine.dialect)}"
+            ))
+        log(f"[MIGRATION] Added column: moonbot_charts.{name}")
+
+    level = get_config_value('app', 'charts.compression_level', default=6)
+    converted = failed = 0
+    json_bytes = blob_bytes = 0
+    last_id = 0
+
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(text(
+                "SELECT id, chart_data FROM moonbot_charts "
+                "WHERE chart_data IS NOT NULL AND storage_error IS NULL AND id > :last_id "
+                "ORDER BY id LIMIT :limit"
+            ), {"last_id": last_id, "limit": BATCH_SIZE}).fetchall()
+            if not rows:
+                break
+
+            updates = []
+            errors = []
+            for chart_id, chart_data in rows:
+                last_id = chart_id
+                try:
+                    source = json.loads(chart_data)
+                    chart = chart_from_dict(source)
+                except (ValueError, TypeError, AttributeError) as e:
+                    error = f"invalid JSON: {e}"
+                else:
+                    try:
+                        blob = encode_chart(chart, level=level)
+                        matches = _canonical(chart_to_dict(decode_chart(blob))) == _canonical(source)
+                        error = None if matches else "decoded chart differs from JSON"
+                    except (CompactFormatError, ValueError, TypeError, OverflowError, struct.error) as e:
+                        error = f"compact encoding failed: {e}"
+
+                if error is not None:
+                    log(f"[MIGRATION] Chart {chart_id}: kept as JSON - {error}", level="WARNING")
+                    errors.append({"id": chart_id, "error": error[:ERROR_MAX_LENGTH]})
+                    failed += 1
+                    continue
+                converted += 1
+                json_bytes += len(chart_data)
+                blob_bytes += len(blob)
+                updates.append({"id": chart_id, "blob": blob})
+
+            if updates:
+                conn.execute(
+                    text("UPDATE moonbot_charts SET chart_blob = :blob, chart_data = NULL WHERE id = :id"),
+                    updates
+                )
+            if errors:
+                conn.execute(
+                    text("UPDATE moonbot_charts SET storage_error = :error WHERE id = :id"),
+                    errors
+                )
+
+    ratio = f", {json_bytes / blob_bytes:.1f}x smaller" if blob_bytes else ""
+    log(f"[MIGRATION] Converted {converted} charts ({json_bytes} -> {blob_bytes} bytes{ratio})")
+    if failed:
+        log(f"[MIGRATION] {failed} charts kept as JSON, see moonbot_charts.storage_error", level="WARNING")
+    log(f"[MIGRATION] {MIGRATION_ID} completed")
+    return True
+
+
+if __name__ == "__main__":
+    if check_migration_needed():
+        run_migration()
+    else:
+        log(f"[MIGRATION] {MIGRATION_ID} already applied")